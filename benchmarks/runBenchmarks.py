@@ -0,0 +1,250 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Run the lazyflow benchmark suite and compare results between commits
+
+The benchmarks live in benchmarks/suite. They follow the conventions of
+airspeed velocity (asv): every class in a bench_*.py module with methods
+named time_* is a benchmark, the optional class attributes params and
+param_names define a parameter grid, and setup(*params)/teardown(*params)
+are called around the measurements for each parameter combination.
+setup() may raise NotImplementedError to skip a combination.
+
+Usage:
+    # run everything, results go to benchmarks/results/<commit>.json
+    python benchmarks/runBenchmarks.py run
+
+    # run a subset, with more samples
+    python benchmarks/runBenchmarks.py run --filter "bench_caches|bench_request" --repeat 10
+
+    # compare two commits (or two result files), exits with 1 on regressions
+    python benchmarks/runBenchmarks.py compare 1a2b3c4 5d6e7f8 --threshold 1.2
+"""
+import argparse
+import datetime
+import importlib
+import inspect
+import itertools
+import json
+import os
+import pkgutil
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import timeit
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+SUITE_PACKAGE = "suite"
+
+
+def current_commit():
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR, stderr=subprocess.DEVNULL, text=True
+        )
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD"], cwd=BENCHMARK_DIR) != 0
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit.strip() + ("-dirty" if dirty else "")
+
+
+def discover(pattern=None):
+    """
+    yield (name, benchmark class, method name) for all benchmarks whose
+    name (module.Class.method) matches the regular expression pattern
+    """
+    sys.path.insert(0, BENCHMARK_DIR)
+    suite = importlib.import_module(SUITE_PACKAGE)
+    for module_info in sorted(pkgutil.iter_modules(suite.__path__), key=lambda m: m.name):
+        if not module_info.name.startswith("bench_"):
+            continue
+        module = importlib.import_module("{}.{}".format(SUITE_PACKAGE, module_info.name))
+        for class_name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__:
+                continue
+            for method_name in sorted(m for m in dir(cls) if m.startswith("time_")):
+                name = "{}.{}.{}".format(module_info.name, class_name, method_name)
+                if pattern is None or re.search(pattern, name):
+                    yield name, cls, method_name
+
+
+def parameter_combinations(cls):
+    params = getattr(cls, "params", [])
+    if params and not isinstance(params[0], (list, tuple)):
+        params = [params]
+    param_names = getattr(cls, "param_names", ["param{}".format(i) for i in range(len(params))])
+    for combination in itertools.product(*params):
+        label = ", ".join("{}={}".format(n, p) for n, p in zip(param_names, combination))
+        yield combination, label
+
+
+def measure(func, repeat, min_sample_time):
+    """
+    @return tuple (list of seconds per call, one entry per sample;
+                   number of calls per sample)
+    """
+    func()  # warm up
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_sample_time:
+        number *= 2
+    return [t / number for t in timer.repeat(repeat=repeat, number=number)], number
+
+
+def run(args):
+    results = {}
+    for name, cls, method_name in discover(args.filter):
+        for combination, label in parameter_combinations(cls):
+            key = "{}({})".format(name, label)
+            instance = cls()
+            try:
+                if hasattr(instance, "setup"):
+                    instance.setup(*combination)
+            except NotImplementedError:
+                print("{:<90} skipped".format(key))
+                continue
+            try:
+                samples, number = measure(
+                    lambda: getattr(instance, method_name)(*combination), args.repeat, args.min_time
+                )
+            finally:
+                if hasattr(instance, "teardown"):
+                    instance.teardown(*combination)
+            results[key] = {
+                "median": statistics.median(samples),
+                "min": min(samples),
+                "mean": statistics.mean(samples),
+                "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+                "number": number,
+                "samples": samples,
+            }
+            print("{:<90} {}".format(key, format_seconds(results[key]["median"])))
+
+    commit = current_commit()
+    output = args.output or os.path.join(RESULTS_DIR, "{}.json".format(commit))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "commit": commit,
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "machine": {
+                    "platform": platform.platform(),
+                    "python": platform.python_version(),
+                    "cpu_count": os.cpu_count(),
+                },
+                "results": results,
+            },
+            f,
+            indent=2,
+            sort_keys=True,
+        )
+    print("Results written to {}".format(output))
+    return 0
+
+
+def load_results(commit_or_path):
+    path = commit_or_path
+    if not os.path.exists(path):
+        candidates = sorted(f for f in os.listdir(RESULTS_DIR) if f.startswith(commit_or_path))
+        if not candidates:
+            raise SystemExit("No results for {} in {}".format(commit_or_path, RESULTS_DIR))
+        path = os.path.join(RESULTS_DIR, candidates[0])
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_results(base, new, threshold):
+    """
+    @return list of (benchmark, base median, new median, ratio, flag) for
+            the benchmarks present in both result sets; flag is
+            "regression" or "improvement" if the ratio of the medians
+            exceeds the threshold in either direction and the change is
+            larger than the noise (the sum of both standard deviations)
+    """
+    rows = []
+    for key in sorted(set(base) & set(new)):
+        b, n = base[key], new[key]
+        ratio = n["median"] / b["median"] if b["median"] > 0 else float("inf")
+        significant = abs(n["median"] - b["median"]) > b["stdev"] + n["stdev"]
+        flag = ""
+        if significant and ratio > threshold:
+            flag = "regression"
+        elif significant and ratio < 1.0 / threshold:
+            flag = "improvement"
+        rows.append((key, b["median"], n["median"], ratio, flag))
+    return rows
+
+
+def compare(args):
+    base = load_results(args.base)
+    new = load_results(args.new)
+    if base["machine"] != new["machine"]:
+        print("Warning: results were recorded on different machines")
+    rows = compare_results(base["results"], new["results"], args.threshold)
+    print("{:<90} {:>10} {:>10} {:>7}".format("benchmark", base["commit"][:10], new["commit"][:10], "ratio"))
+    for key, b, n, ratio, flag in rows:
+        if args.only_changed and not flag:
+            continue
+        print("{:<90} {:>10} {:>10} {:>7.2f} {}".format(key, format_seconds(b), format_seconds(n), ratio, flag))
+    regressions = [row for row in rows if row[4] == "regression"]
+    print("{} benchmarks compared, {} regressions".format(len(rows), len(regressions)))
+    return 1 if regressions else 0
+
+
+def format_seconds(seconds):
+    for unit, factor in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= factor:
+            return "{:.3g}{}".format(seconds / factor, unit)
+    return "{:.3g}ns".format(seconds / 1e-9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser("run", help="run the benchmark suite")
+    run_parser.add_argument("--filter", help="only run benchmarks whose name matches this regular expression")
+    run_parser.add_argument("--repeat", type=int, default=5, help="number of samples per benchmark")
+    run_parser.add_argument("--min-time", type=float, default=0.05, help="minimum duration of a sample in seconds")
+    run_parser.add_argument("--output", help="result file (default: benchmarks/results/<commit>.json)")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser("compare", help="compare the results of two commits")
+    compare_parser.add_argument("base", help="commit (prefix) or result file")
+    compare_parser.add_argument("new", help="commit (prefix) or result file")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=1.1, help="flag changes of the median by more than this factor"
+    )
+    compare_parser.add_argument("--only-changed", action="store_true", help="only list flagged benchmarks")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""
+lazyflow benchmark suite, run with benchmarks/runBenchmarks.py
+
+All data is synthetic and generated in setup(), see data.py.
+"""
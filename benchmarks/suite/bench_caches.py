@@ -0,0 +1,61 @@
+"""
+Hits and misses of the array caches
+"""
+import numpy
+
+from lazyflow.graph import Graph
+from lazyflow.operators import OpArrayPiper
+from lazyflow.operators.opBlockedArrayCache import OpBlockedArrayCache
+from lazyflow.operators.opCompressedCache import OpCompressedCache
+from lazyflow.operators.opSimpleBlockedArrayCache import OpSimpleBlockedArrayCache
+from lazyflow.operators.opSlicedBlockedArrayCache import OpSlicedBlockedArrayCache
+from lazyflow.operators.opUnblockedArrayCache import OpUnblockedArrayCache
+
+from .data import random_volume
+
+SHAPE = (128, 128, 128)
+BLOCKSHAPE = (32, 32, 32)
+
+CACHES = {
+    "unblocked": OpUnblockedArrayCache,
+    "simple_blocked": OpSimpleBlockedArrayCache,
+    "blocked": OpBlockedArrayCache,
+    "compressed": OpCompressedCache,
+    "sliced_blocked": OpSlicedBlockedArrayCache,
+}
+
+
+class CacheAccess(object):
+    params = [sorted(CACHES), ["block", "unaligned", "volume"]]
+    param_names = ["cache", "roi"]
+
+    def setup(self, cache, roi):
+        graph = Graph()
+        self.source = OpArrayPiper(graph=graph)
+        self.source.Input.setValue(random_volume(SHAPE, "zyx"))
+        self.op = CACHES[cache](graph=graph)
+        self.op.Input.connect(self.source.Output)
+        if cache == "sliced_blocked":
+            self.op.BlockShape.setValue([BLOCKSHAPE])
+        elif cache != "unblocked":
+            self.op.BlockShape.setValue(BLOCKSHAPE)
+
+        if roi == "block":
+            self.roi = ((32, 32, 32), (64, 64, 64))
+        elif roi == "unaligned":
+            self.roi = ((10, 20, 30), (70, 80, 90))
+        else:
+            self.roi = ((0, 0, 0), SHAPE)
+        self.result = numpy.empty(numpy.subtract(self.roi[1], self.roi[0]), dtype=numpy.float32)
+        # fill the cache for the hit benchmarks
+        self.op.Output(*self.roi).writeInto(self.result).wait()
+
+    def teardown(self, cache, roi):
+        self.op.cleanUp()
+
+    def time_hit(self, cache, roi):
+        self.op.Output(*self.roi).writeInto(self.result).wait()
+
+    def time_miss(self, cache, roi):
+        self.source.Output.setDirty(slice(None))
+        self.op.Output(*self.roi).writeInto(self.result).wait()
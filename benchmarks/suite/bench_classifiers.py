@@ -0,0 +1,119 @@
+"""
+Training and prediction of the lazyflow classifiers
+"""
+from functools import partial
+
+import numpy
+
+from lazyflow.classifiers import ParallelVigraRfLazyflowClassifierFactory, SklearnLazyflowClassifierFactory
+from lazyflow.graph import Graph
+from lazyflow.operators import OpPixelFeaturesPresmoothed, OpReorderAxes
+from lazyflow.operators.classifierOperators import OpVectorwiseClassifierPredict
+
+from .bench_features import FEATURE_IDS
+from .data import random_volume
+
+try:
+    from sklearn.ensemble import RandomForestClassifier
+
+    _supports_sklearn = True
+except ImportError:
+    _supports_sklearn = False
+
+N_FEATURES = 20
+
+
+def _factory(classifier):
+    if classifier == "vigra_rf":
+        return ParallelVigraRfLazyflowClassifierFactory(num_trees_total=100)
+    if not _supports_sklearn:
+        raise NotImplementedError("sklearn is not installed")
+    return SklearnLazyflowClassifierFactory(RandomForestClassifier, n_estimators=100, n_jobs=-1)
+
+
+def _samples(n_samples, seed=0):
+    rng = numpy.random.default_rng(seed)
+    y = rng.integers(1, 4, size=n_samples).astype(numpy.uint32)
+    X = rng.normal(size=(n_samples, N_FEATURES)).astype(numpy.float32)
+    # make the classes separable to a degree, so that trees have realistic depth
+    X[:, : N_FEATURES // 2] += y[:, numpy.newaxis]
+    return X, y
+
+
+class Predict(object):
+    params = [["vigra_rf", "sklearn_rf"], [10000, 1000000]]
+    param_names = ["classifier", "pixels"]
+
+    def setup(self, classifier, pixels):
+        X, y = _samples(2000)
+        self.classifier = _factory(classifier).create_and_train(X, y)
+        self.X, _ = _samples(pixels, seed=1)
+
+    def time_predict_probabilities(self, classifier, pixels):
+        self.classifier.predict_probabilities(self.X)
+
+
+class Train(object):
+    params = [["vigra_rf", "sklearn_rf"], [1000, 20000]]
+    param_names = ["classifier", "samples"]
+
+    def setup(self, classifier, samples):
+        self.factory = _factory(classifier)
+        self.X, self.y = _samples(samples)
+
+    def time_create_and_train(self, classifier, samples):
+        self.factory.create_and_train(self.X, self.y)
+
+
+def _slab_tile_shape(op, block_shape):
+    """
+    Tiling before the halo was taken into account: whole slabs along the outermost axes
+    """
+    max_pixels = max(1, op.TILE_FEATURE_BYTES // (max(op.Image.meta.dtype().nbytes, 4) * op.Image.meta.shape[-1]))
+    tile_shape = numpy.array(block_shape)
+    for axis in range(len(tile_shape)):
+        if numpy.prod(tile_shape) <= max_pixels:
+            break
+        tile_shape[axis] = max(1, max_pixels // numpy.prod(tile_shape[axis + 1 :]))
+    return tile_shape
+
+
+class TiledPrediction(object):
+    """
+    Pixel features and prediction of a block, in tiles of at most TILE_FEATURE_BYTES
+    """
+
+    params = [[1.6, 5.0], ["slabs", "halo"]]
+    param_names = ["sigma", "tiling"]
+
+    def setup(self, sigma, tiling):
+        graph = Graph()
+        self.opFeatures = OpPixelFeaturesPresmoothed(graph=graph)
+        self.opFeatures.Input.setValue(random_volume((1, 1, 256, 256, 256), "tczyx"))
+        self.opFeatures.Scales.setValue([0.7, sigma])
+        self.opFeatures.FeatureIds.setValue(FEATURE_IDS)
+        self.opFeatures.SelectionMatrix.setValue(numpy.ones((len(FEATURE_IDS), 2), dtype=bool))
+        self.opFeatures.ComputeIn2d.setValue([False, False])
+
+        opReorder = OpReorderAxes(graph=graph)
+        opReorder.Input.connect(self.opFeatures.Output)
+        opReorder.AxisOrder.setValue("tzyxc")
+
+        self.opPredict = OpVectorwiseClassifierPredict(graph=graph)
+        self.opPredict.Image.connect(opReorder.Output)
+        self.opPredict.LabelsCount.setValue(3)
+        n_features = opReorder.Output.meta.shape[-1]
+        X = numpy.random.default_rng(0).random((2000, n_features), dtype=numpy.float32)
+        y = (X[:, 0] * 3).astype(numpy.uint32) + 1
+        self.opPredict.Classifier.setValue(ParallelVigraRfLazyflowClassifierFactory(10).create_and_train(X, y))
+        # 20 feature channels, i.e. 160 MiB of features per 128^3 block
+        self.opPredict.TILE_FEATURE_BYTES = 16 * 2**20
+        if tiling == "slabs":
+            self.opPredict._tileShape = partial(_slab_tile_shape, self.opPredict)
+
+    def teardown(self, sigma, tiling):
+        self.opPredict.cleanUp()
+        self.opFeatures.cleanUp()
+
+    def time_predict_block(self, sigma, tiling):
+        self.opPredict.PMaps[:, 64:192, 64:192, 64:192].wait()
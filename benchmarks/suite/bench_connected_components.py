@@ -0,0 +1,23 @@
+"""
+Connected component labeling with OpLabelVolume
+"""
+from lazyflow.graph import Graph
+from lazyflow.operators import OpLabelVolume
+
+from .data import blob_volume
+
+
+class ConnectedComponents(object):
+    params = [[(1, 1024, 1024), (128, 256, 256)]]
+    param_names = ["shape"]
+
+    def setup(self, shape):
+        self.op = OpLabelVolume(graph=Graph())
+        self.op.Input.setValue(blob_volume(shape, "zyx"))
+        self.op.Method.setValue("vigra")
+
+    def teardown(self, shape):
+        self.op.cleanUp()
+
+    def time_label(self, shape):
+        self.op.Output[...].wait()
@@ -0,0 +1,83 @@
+"""
+Blockwise export with OpH5N5WriterBigDataset (which uses BigRequestStreamer)
+"""
+import os
+import shutil
+import tempfile
+
+import h5py
+import z5py
+
+from lazyflow.graph import Graph
+from lazyflow.operators import OpArrayPiper
+from lazyflow.operators.ioOperators import OpH5N5WriterBigDataset
+
+from .data import random_volume
+
+
+class Export(object):
+    params = [["hdf5", "n5"], [False, True]]
+    param_names = ["format", "compression"]
+
+    def setup(self, file_format, compression):
+        self.tmpdir = tempfile.mkdtemp()
+        self.data = random_volume((1, 128, 256, 256, 1), "tzyxc")
+        self.file_format = file_format
+        self.compression = compression
+        self.counter = 0
+
+    def teardown(self, file_format, compression):
+        shutil.rmtree(self.tmpdir)
+
+    def time_export(self, file_format, compression):
+        self.counter += 1
+        path = os.path.join(self.tmpdir, "export{}.{}".format(self.counter, "h5" if file_format == "hdf5" else "n5"))
+        f = h5py.File(path, "w") if file_format == "hdf5" else z5py.N5File(path, "w")
+        try:
+            graph = Graph()
+            opPiper = OpArrayPiper(graph=graph)
+            opPiper.Input.setValue(self.data)
+            opWriter = OpH5N5WriterBigDataset(graph=graph)
+            opWriter.h5N5File.setValue(f)
+            opWriter.h5N5Path.setValue("volume/data")
+            opWriter.CompressionEnabled.setValue(compression)
+            opWriter.Image.connect(opPiper.Output)
+            opWriter.WriteImage.value
+            opWriter.cleanUp()
+        finally:
+            f.close()
+
+
+class ExportHdf5ChunkWrites(object):
+    """
+    Blocks written one at a time through the hdf5 filter pipeline (direct_chunk_writes=False)
+    vs. chunks compressed by all workers and written with write_direct_chunk (direct_chunk_writes=True)
+    """
+
+    params = [[False, True], [False, True]]
+    param_names = ["direct_chunk_writes", "compression"]
+
+    def setup(self, direct_chunk_writes, compression):
+        self.tmpdir = tempfile.mkdtemp()
+        self.data = random_volume((1, 128, 256, 256, 1), "tzyxc")
+        self.counter = 0
+        self.default_direct_chunk_writes = OpH5N5WriterBigDataset.DIRECT_CHUNK_WRITES
+        OpH5N5WriterBigDataset.DIRECT_CHUNK_WRITES = direct_chunk_writes
+
+    def teardown(self, direct_chunk_writes, compression):
+        OpH5N5WriterBigDataset.DIRECT_CHUNK_WRITES = self.default_direct_chunk_writes
+        shutil.rmtree(self.tmpdir)
+
+    def time_export(self, direct_chunk_writes, compression):
+        self.counter += 1
+        with h5py.File(os.path.join(self.tmpdir, "export{}.h5".format(self.counter)), "w") as f:
+            graph = Graph()
+            opPiper = OpArrayPiper(graph=graph)
+            opPiper.Input.setValue(self.data)
+            opWriter = OpH5N5WriterBigDataset(graph=graph)
+            opWriter.h5N5File.setValue(f)
+            opWriter.h5N5Path.setValue("volume/data")
+            opWriter.CompressionEnabled.setValue(compression)
+            opWriter.Image.connect(opPiper.Output)
+            opWriter.WriteImage.value
+            opWriter.cleanUp()
@@ -0,0 +1,82 @@
+"""
+Pixel feature computation with OpPixelFeaturesPresmoothed
+"""
+import numpy
+
+from lazyflow.graph import Graph
+from lazyflow.operators import OpPixelFeaturesPresmoothed
+
+from .data import random_volume
+
+FEATURE_IDS = [
+    "GaussianSmoothing",
+    "LaplacianOfGaussian",
+    "GaussianGradientMagnitude",
+    "DifferenceOfGaussians",
+    "StructureTensorEigenvalues",
+    "HessianOfGaussianEigenvalues",
+]
+
+
+class PixelFeatures(object):
+    params = [[0.7, 1.6, 5.0], [(1, 256, 256), (64, 64, 64)], ["single", "all"]]
+    param_names = ["sigma", "blockshape", "features"]
+
+    def setup(self, sigma, blockshape, features):
+        op = OpPixelFeaturesPresmoothed(graph=Graph())
+        op.Input.setValue(random_volume((1, 1, 64, 256, 256), "tczyx"))
+        op.Scales.setValue([sigma])
+        op.FeatureIds.setValue(FEATURE_IDS)
+        matrix = numpy.zeros((len(FEATURE_IDS), 1), dtype=bool)
+        if features == "single":
+            matrix[FEATURE_IDS.index("GaussianGradientMagnitude")] = True
+        else:
+            matrix[:] = True
+        op.SelectionMatrix.setValue(matrix)
+        op.ComputeIn2d.setValue([blockshape[0] == 1])
+        invalid_scales, invalid_z_scales = op.getInvalidScales()
+        if invalid_scales or invalid_z_scales:
+            raise NotImplementedError("sigma too large for blockshape")
+        self.op = op
+        self.roi = ((0, 0, 0, 0, 0), (1, op.Output.meta.shape[1]) + tuple(blockshape))
+
+    def teardown(self, sigma, blockshape, features):
+        self.op.cleanUp()
+
+    def time_compute_block(self, sigma, blockshape, features):
+        self.op.Output(*self.roi).wait()
+
+
+class DerivativeFeatures(object):
+    """
+    ilastik's full default feature matrix, with the derivative features of a scale
+    computed separately or from shared derivatives (OpDerivativeFeatures)
+    """
+
+    params = [[(1, 256, 256), (64, 64, 64)], [False, True]]
+    param_names = ["blockshape", "fused"]
+
+    SCALES = [0.3, 0.7, 1.0, 1.6, 3.5, 5.0, 10.0]
+
+    def setup(self, blockshape, fused):
+        self._fuse = OpPixelFeaturesPresmoothed.FUSE_DERIVATIVE_FEATURES
+        OpPixelFeaturesPresmoothed.FUSE_DERIVATIVE_FEATURES = fused
+
+        op = OpPixelFeaturesPresmoothed(graph=Graph())
+        op.Input.setValue(random_volume((1, 1, 64, 256, 256), "tczyx"))
+        op.Scales.setValue(self.SCALES)
+        op.FeatureIds.setValue(FEATURE_IDS)
+        matrix = numpy.ones((len(FEATURE_IDS), len(self.SCALES)), dtype=bool)
+        # only smoothing is offered at the smallest scale
+        matrix[1:, 0] = False
+        op.SelectionMatrix.setValue(matrix)
+        op.ComputeIn2d.setValue([blockshape[0] == 1] * len(self.SCALES))
+        self.op = op
+        self.roi = ((0, 0, 0, 0, 0), (1, op.Output.meta.shape[1]) + tuple(blockshape))
+
+    def teardown(self, blockshape, fused):
+        self.op.cleanUp()
+        OpPixelFeaturesPresmoothed.FUSE_DERIVATIVE_FEATURES = self._fuse
+
+    def time_compute_block(self, blockshape, fused):
+        self.op.Output(*self.roi).wait()
@@ -0,0 +1,43 @@
+"""
+Object features in the object neighborhood with OpRegionFeatures, with and without the process pool
+"""
+from lazyflow.graph import Graph
+from lazyflow.operators import OpLabelVolume
+from lazyflow.request import processPool
+
+from .data import blob_volume, random_volume
+
+FEATURES = {
+    "Standard Object Features": {
+        "Count": {},
+        "Mean in neighborhood": {"margin": (5, 5, 2)},
+        "Variance in neighborhood": {"margin": (5, 5, 2)},
+    }
+}
+
+
+class LocalObjectFeatures(object):
+    params = [[0, 4]]
+    param_names = ["processes"]
+
+    def setup(self, processes):
+        from ilastik.applets.objectExtraction.opObjectExtraction import OpRegionFeatures
+
+        processPool.reset_process_pool(processes)
+        graph = Graph()
+        self.opLabel = OpLabelVolume(graph=graph)
+        self.opLabel.Input.setValue(blob_volume((1, 64, 256, 256, 1), "tzyxc"))
+        self.op = OpRegionFeatures(graph=graph)
+        self.op.RawVolume.setValue(random_volume((1, 64, 256, 256, 1), "tzyxc"))
+        self.op.LabelVolume.connect(self.opLabel.CachedOutput)
+        self.op.Features.setValue(FEATURES)
+        # Label once, so that only the features are timed
+        self.opLabel.CachedOutput[...].wait()
+
+    def teardown(self, processes):
+        self.op.cleanUp()
+        self.opLabel.cleanUp()
+        processPool.reset_process_pool(0)
+
+    def time_local_features(self, processes):
+        self.op.Output[0:1].wait()
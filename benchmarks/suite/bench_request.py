@@ -0,0 +1,81 @@
+"""
+Overhead of the request framework
+"""
+import functools
+
+import numpy
+
+from lazyflow.request import Request, RequestLock, RequestPool
+
+
+def _noop():
+    pass
+
+
+def _chain(depth):
+    if depth == 0:
+        return None
+    return Request(lambda: _chain(depth - 1)).wait()
+
+
+def _piper(data, depth):
+    # Like OpArrayPiper.execute(): wait for the upstream request, copy into our result
+    if depth == 0:
+        return data.copy()
+    upstream = Request(functools.partial(_piper, data, depth - 1)).wait()
+    result = numpy.empty_like(upstream)
+    result[...] = upstream
+    return result
+
+
+def _in_worker(fn):
+    req = Request(fn)
+    req.submit()
+    return req.wait()
+
+
+class RequestOverhead(object):
+    def time_request_wait(self):
+        Request(_noop).wait()
+
+    def time_nested_requests(self):
+        Request(lambda: Request(lambda: Request(_noop).wait()).wait()).wait()
+
+    def time_child_requests(self):
+        _in_worker(lambda: [Request(_noop).wait() for _ in range(100)])
+
+    def time_child_request_chain(self):
+        _in_worker(lambda: _chain(10))
+
+    def time_request_lock(self):
+        lock = RequestLock()
+        for _ in range(100):
+            with lock:
+                pass
+
+
+class PiperChainOverhead(object):
+    """
+    100 requests through a chain of pipers, within one worker request.
+    The per-request overhead is (time(n) - time(0)) / (100 * n).
+    """
+
+    params = [0, 1, 10, 50]
+    param_names = ["chain_length"]
+
+    def setup(self, chain_length):
+        self.data = numpy.zeros((1, 1, 1), dtype=numpy.float32)
+
+    def time_piper_chain(self, chain_length):
+        _in_worker(lambda: [_piper(self.data, chain_length) for _ in range(100)])
+
+
+class RequestPoolOverhead(object):
+    params = [1, 10, 100]
+    param_names = ["requests"]
+
+    def time_pool(self, n_requests):
+        pool = RequestPool()
+        for _ in range(n_requests):
+            pool.add(Request(_noop))
+        pool.wait()
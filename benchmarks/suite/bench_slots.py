@@ -0,0 +1,31 @@
+"""
+Overhead of requesting data through chains of operators
+"""
+import numpy
+
+from lazyflow.graph import Graph
+from lazyflow.operators import OpArrayPiper
+
+from .data import random_volume
+
+
+class SlotGet(object):
+    params = [[1, 10, 50], [(1, 1, 1), (64, 64, 64)]]
+    param_names = ["chain_length", "roi_shape"]
+
+    def setup(self, chain_length, roi_shape):
+        graph = Graph()
+        data = random_volume((64, 64, 64), "zyx")
+        ops = [OpArrayPiper(graph=graph) for _ in range(chain_length)]
+        ops[0].Input.setValue(data)
+        for upstream, downstream in zip(ops[:-1], ops[1:]):
+            downstream.Input.connect(upstream.Output)
+        self.output = ops[-1].Output
+        self.roi = ((0, 0, 0), roi_shape)
+        self.result = numpy.empty(roi_shape, dtype=data.dtype)
+
+    def time_get(self, chain_length, roi_shape):
+        self.output(*self.roi).wait()
+
+    def time_get_into(self, chain_length, roi_shape):
+        self.output(*self.roi).writeInto(self.result).wait()
@@ -0,0 +1,27 @@
+"""
+Synthetic data for the benchmark suite
+"""
+import numpy
+import vigra
+
+
+def random_volume(shape, axes, dtype=numpy.float32, seed=0):
+    """
+    smooth random volume, so that features and thresholds behave like on real data
+    """
+    rng = numpy.random.default_rng(seed)
+    data = rng.random(shape, dtype=numpy.float32)
+    spatial = [i for i, a in enumerate(axes) if a in "zyx"]
+    for axis in spatial:
+        data = (data + numpy.roll(data, 1, axis=axis) + numpy.roll(data, -1, axis=axis)) / 3
+    if numpy.issubdtype(dtype, numpy.integer):
+        data = (data - data.min()) / (data.max() - data.min()) * numpy.iinfo(dtype).max
+    return vigra.taggedView(data.astype(dtype), axes)
+
+
+def blob_volume(shape, axes, threshold=0.55, seed=0):
+    """
+    binary uint8 volume with many connected components
+    """
+    volume = random_volume(shape, axes, seed=seed)
+    return vigra.taggedView((volume > threshold).astype(numpy.uint8), axes)
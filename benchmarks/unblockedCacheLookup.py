@@ -0,0 +1,103 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Cache hit latency of OpUnblockedArrayCache against the number of cached blocks
+
+For each cache size, the cache is filled with 8x8x8 blocks of a volume and
+the time of a cache hit (a request for a sub-roi of a random stored block)
+is measured. For comparison, the time of the linear scan with
+lazyflow.roi.containing_rois that was used before the block index was
+introduced is reported as well.
+
+Usage:
+    python benchmarks/unblockedCacheLookup.py [--repeats N] [--sizes N [N ...]]
+"""
+import argparse
+import random
+import timeit
+
+import numpy
+import vigra
+
+from lazyflow.graph import Graph
+from lazyflow.operators.opUnblockedArrayCache import OpUnblockedArrayCache
+from lazyflow.roi import containing_rois
+
+BLOCK_SIDE = 8
+
+
+def fill_cache(n_blocks):
+    side = int(numpy.ceil(n_blocks ** (1.0 / 3)))
+    shape = (side * BLOCK_SIDE,) * 3
+    data = vigra.taggedView(numpy.zeros(shape, dtype=numpy.uint8), "zyx")
+
+    op = OpUnblockedArrayCache(graph=Graph())
+    op.Input.setValue(data)
+    block = numpy.zeros((BLOCK_SIDE,) * 3, dtype=numpy.uint8)
+    block_rois = []
+    for i in range(n_blocks):
+        index = numpy.unravel_index(i, (side,) * 3)
+        start = tuple(int(x) * BLOCK_SIDE for x in index)
+        stop = tuple(x + BLOCK_SIDE for x in start)
+        op.Input[tuple(slice(a, b) for a, b in zip(start, stop))] = block
+        block_rois.append((start, stop))
+    return op, block_rois
+
+
+def benchmark(n_blocks, repeats):
+    op, block_rois = fill_cache(n_blocks)
+    rng = random.Random(n_blocks)
+    queries = []
+    for _ in range(repeats):
+        start, _ = rng.choice(block_rois)
+        queries.append((tuple(a + 1 for a in start), tuple(a + BLOCK_SIDE - 1 for a in start)))
+
+    result = numpy.empty((BLOCK_SIDE - 2,) * 3, dtype=numpy.uint8)
+    queries_iter = iter(queries * 2)
+    indexed_lookup = timeit.timeit(lambda: op._get_containing_block_roi(next(queries_iter)), number=repeats)
+    cache_hit = timeit.timeit(lambda: op._execute_Output_impl(next(queries_iter), result), number=repeats)
+
+    queries_iter = iter(queries)
+    linear_scan = timeit.timeit(
+        lambda: containing_rois(list(op._block_data.keys()), next(queries_iter)), number=repeats
+    )
+    return indexed_lookup / repeats, cache_hit / repeats, linear_scan / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=1000, help="number of lookups per cache size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 50000])
+    args = parser.parse_args()
+
+    print("{:>10} {:>18} {:>18} {:>18}".format("blocks", "index lookup [us]", "cache hit [us]", "linear scan [us]"))
+    for n_blocks in args.sizes:
+        indexed_lookup, cache_hit, linear_scan = benchmark(n_blocks, args.repeats)
+        print(
+            "{:>10} {:>18.2f} {:>18.2f} {:>18.2f}".format(
+                n_blocks, indexed_lookup * 1e6, cache_hit * 1e6, linear_scan * 1e6
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
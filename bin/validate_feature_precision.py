@@ -0,0 +1,125 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+# 		   http://ilastik.org/license.html
+###############################################################################
+"""
+Report how reduced-precision feature caches change the predictions of a pixel classification project.
+
+The features of every image in the project are computed block by block and stored with the given
+precision, like the feature cache does with --feature-cache-precision. The project's classifier
+predicts each block from the full precision and from the reduced precision features, and the agreement
+of the two predictions is reported.
+
+Example usage:
+    python validate_feature_precision.py MyProject.ilp --precision uint8
+    python validate_feature_precision.py MyProject.ilp --precision float16 --block-shape 1 128 128
+"""
+import argparse
+import sys
+
+import numpy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("project", help="pixel classification project with a trained classifier")
+    parser.add_argument("--precision", choices=("float16", "uint16", "uint8"), default="uint8")
+    parser.add_argument(
+        "--block-shape",
+        type=int,
+        nargs="+",
+        help="spatial block shape (z y x, or y x for 2D images), default: the feature cache's blocks",
+    )
+    parsed_args = parser.parse_args()
+
+    import ilastik.app
+
+    ilastik_args = ilastik.app.parse_args(["--headless", "--readonly", "--project", parsed_args.project])
+    shell = ilastik.app.main(ilastik_args)
+
+    workflow = shell.projectManager.workflow
+    opFeatures = workflow.featureSelectionApplet.topLevelOperator
+    classifier = workflow.pcApplet.topLevelOperator.Classifier.value
+    if classifier is None:
+        sys.exit("The project has no trained classifier.")
+    if not hasattr(classifier, "predict_probabilities"):
+        sys.exit("Only vectorwise classifiers (like the default random forest) are supported.")
+
+    total = {"pixels": 0, "agreeing": 0, "max_difference": 0.0}
+    for lane_index, feature_slot in enumerate(opFeatures.OutputImage):
+        result = compare_predictions(feature_slot, classifier, parsed_args.precision, parsed_args.block_shape)
+        print_result(f"Image #{lane_index + 1}", result)
+        total["pixels"] += result["pixels"]
+        total["agreeing"] += result["agreeing"]
+        total["max_difference"] = max(total["max_difference"], result["max_difference"])
+    print_result("ALL IMAGES", total)
+
+
+def compare_predictions(feature_slot, classifier, precision, spatial_block_shape=None):
+    """
+    @return dict with the number of pixels, the number of pixels with the same predicted class
+            ("agreeing") and the largest difference of a class probability ("max_difference")
+    """
+    from lazyflow.roi import getIntersectingBlocks, getBlockBounds
+    from lazyflow.utility.quantizedArray import QuantizedArray
+
+    axis_keys = feature_slot.meta.getAxisKeys()
+    shape = feature_slot.meta.shape
+    channel_axis = axis_keys.index("c")
+    # like OpFeatureSelection's cache blocks in z (or in y for 2D images)
+    default_blocks = {"t": 1, "c": shape[channel_axis], "z": 32, "y": 256, "x": 256}
+    block_shape = [default_blocks[k] for k in axis_keys]
+    if spatial_block_shape is not None:
+        space_axes = [i for i, k in enumerate(axis_keys) if k in "zyx" and shape[i] > 1]
+        if len(spatial_block_shape) != len(space_axes):
+            sys.exit(f"--block-shape needs {len(space_axes)} values for this image.")
+        for axis, size in zip(space_axes, spatial_block_shape):
+            block_shape[axis] = size
+
+    result = {"pixels": 0, "agreeing": 0, "max_difference": 0.0}
+    for block_start in getIntersectingBlocks(block_shape, ([0] * len(shape), shape)):
+        block_roi = getBlockBounds(shape, block_shape, block_start)
+        features = feature_slot(*block_roi).wait()
+        reduced = QuantizedArray(features, precision, channel_axis=channel_axis)[:]
+
+        full_prediction = classifier.predict_probabilities(_featureMatrix(features, channel_axis))
+        reduced_prediction = classifier.predict_probabilities(_featureMatrix(reduced, channel_axis))
+
+        result["pixels"] += full_prediction.shape[0]
+        result["agreeing"] += int((full_prediction.argmax(axis=1) == reduced_prediction.argmax(axis=1)).sum())
+        difference = float(numpy.abs(full_prediction - reduced_prediction).max(initial=0.0))
+        result["max_difference"] = max(result["max_difference"], difference)
+    return result
+
+
+def _featureMatrix(features, channel_axis):
+    features = numpy.moveaxis(numpy.asarray(features), channel_axis, -1)
+    return features.reshape(-1, features.shape[-1])
+
+
+def print_result(name, result):
+    agreement = result["agreeing"] / result["pixels"] if result["pixels"] else 1.0
+    print(
+        f"{name}: {result['pixels']} pixels, same predicted class for {100 * agreement:.3f}%, "
+        f"largest probability difference {result['max_difference']:.4f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
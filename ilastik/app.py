@@ -58,6 +58,15 @@ def _argparser() -> argparse.ArgumentParser:
     ap.add_argument("--redirect_output", help="A filepath to redirect stdout to")
     ap.add_argument("--debug", help="Start ilastik in debug mode.", action="store_true")
     ap.add_argument("--logfile", help="A filepath to dump all log messages to.")
+    ap.add_argument(
+        "--trace_requests",
+        metavar="TRACE_JSON",
+        help=(
+            "Record the execution time of every lazyflow operator request. "
+            "On exit, write them as a Chrome trace-event file (chrome://tracing, ui.perfetto.dev) to the given path, "
+            "and log a per-operator summary."
+        ),
+    )
     ap.add_argument("--process_name", help="A process name (used for logging purposes).")
     ap.add_argument("--configfile", help="A custom path to a user config file for expert ilastik settings.")
     ap.add_argument("--fullscreen", help="Show Window in fullscreen mode.", action="store_true")
@@ -69,9 +78,36 @@ def _argparser() -> argparse.ArgumentParser:
     ap.add_argument(
         "--nn_device", help="Local device to run Neural Networks on. Examples: 'cpu', 'cuda:0'.", default=None
     )
+    ap.add_argument(
+        "--batch_server",
+        metavar="[HOST:]PORT",
+        type=_parse_server_address,
+        help=(
+            "Headless only: keep the project loaded and accept batch jobs as JSON lines on this local TCP address "
+            "(localhost, if no host is given; only loopback addresses are accepted) "
+            "until a shutdown request, SIGINT or SIGTERM."
+        ),
+    )
+    ap.add_argument(
+        "--batch_watch_dir",
+        help="Headless only: keep the project loaded and run the batch jobs in the *.json files of this directory.",
+    )
+    ap.add_argument(
+        "--batch_queue_size", help="Maximum number of queued jobs of the batch server.", type=int, default=16
+    )
     return ap
 
 
+def _parse_server_address(value: str) -> Tuple[str, int]:
+    from ilastik.shell.headless.batchServer import is_loopback_address
+
+    host, _, port = value.rpartition(":")
+    host = host.strip("[]") or "localhost"
+    if not is_loopback_address(host):
+        raise argparse.ArgumentTypeError(f"{host} is not a loopback address")
+    return (host, int(port))
+
+
 def _ensure_compatible_args(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
     """If args are invalid, print an error message to stderr and exit."""
 
@@ -96,6 +132,9 @@ def _ensure_compatible_args(parser: argparse.ArgumentParser, args: argparse.Name
             "and workflow when invoking ilastik in headless mode."
         )
 
+    if (args.batch_server or args.batch_watch_dir) and not (args.headless and args.project):
+        parser.error("The batch server (--batch_server, --batch_watch_dir) needs --headless and --project.")
+
 
 def parse_args(
     args: Optional[Sequence[str]] = None, namespace: Optional[argparse.Namespace] = None
@@ -164,6 +203,10 @@ def main(parsed_args, workflow_cmdline_args=[], init_logging=True):
     if lazyflow_config_fn:
         preinit_funcs.append(lazyflow_config_fn)
 
+    tracing_fn = _prepare_request_tracing(parsed_args)
+    if tracing_fn:
+        preinit_funcs.append(tracing_fn)
+
     # More initialization functions.
     # These will be called AFTER the shell is created.
     # The shell is provided as a parameter to the function.
@@ -202,6 +245,12 @@ def main(parsed_args, workflow_cmdline_args=[], init_logging=True):
         # Run post-init
         for f in postinit_funcs:
             f(shell)
+
+        if parsed_args.batch_server or parsed_args.batch_watch_dir:
+            from ilastik.shell.headless.batchServer import HeadlessBatchServer
+
+            server = HeadlessBatchServer(shell, queue_size=parsed_args.batch_queue_size)
+            server.serve(address=parsed_args.batch_server, watch_dir=parsed_args.batch_watch_dir)
         return shell
     # Normal launch
     else:
@@ -330,6 +379,12 @@ def _prepare_lazyflow_config(parsed_args):
     n_threads = os.getenv("LAZYFLOW_THREADS", None)
     total_ram_mb = os.getenv("LAZYFLOW_TOTAL_RAM_MB", None)
     status_interval_secs = int(os.getenv("LAZYFLOW_STATUS_MONITOR_SECONDS", "0"))
+    work_stealing = os.getenv("LAZYFLOW_WORK_STEALING", None)
+    n_processes = os.getenv("LAZYFLOW_PROCESSES", None)
+    cache_eviction = os.getenv("LAZYFLOW_CACHE_EVICTION", None)
+    spill_mb = os.getenv("LAZYFLOW_SPILL_MB", None)
+    spill_directory = os.getenv("LAZYFLOW_SPILL_DIRECTORY", None)
+    compressed_cache_store = os.getenv("LAZYFLOW_COMPRESSED_CACHE_STORE", None)
 
     # Convert str -> int
     if n_threads is not None:
@@ -342,9 +397,33 @@ def _prepare_lazyflow_config(parsed_args):
         if n_threads == -1:
             n_threads = None
     total_ram_mb = total_ram_mb or ilastik_config.getint("lazyflow", "total_ram_mb")
+    if work_stealing is not None:
+        work_stealing = work_stealing.lower() in ("1", "true", "yes", "on")
+    else:
+        work_stealing = ilastik_config.getboolean("lazyflow", "work_stealing")
+    if n_processes is not None:
+        n_processes = int(n_processes)
+    else:
+        n_processes = ilastik_config.getint("lazyflow", "processes")
+    cache_eviction = cache_eviction or ilastik_config.get("lazyflow", "cache_eviction")
+    if spill_mb is not None:
+        spill_mb = int(spill_mb)
+    else:
+        spill_mb = ilastik_config.getint("lazyflow", "spill_mb")
+    spill_directory = spill_directory or ilastik_config.get("lazyflow", "spill_directory") or None
+    compressed_cache_store = compressed_cache_store or ilastik_config.get("lazyflow", "compressed_cache_store")
 
     # Note that n_threads == 0 is valid and useful for debugging.
-    if (n_threads is not None) or total_ram_mb or status_interval_secs:
+    if (
+        (n_threads is not None)
+        or total_ram_mb
+        or status_interval_secs
+        or work_stealing
+        or n_processes
+        or cache_eviction != "lru"
+        or spill_mb
+        or compressed_cache_store != "hdf5"
+    ):
 
         def _configure_lazyflow_settings():
             import lazyflow
@@ -357,9 +436,29 @@ def _prepare_lazyflow_config(parsed_args):
                 memory_logger.setLevel(logging.DEBUG)
                 cacheMemoryManager.setRefreshInterval(status_interval_secs)
 
-            if n_threads is not None:
-                logger.info(f"Resetting lazyflow thread pool with {n_threads} threads.")
-                lazyflow.request.Request.reset_thread_pool(n_threads)
+            if n_threads is not None or work_stealing:
+                pool_args = {"work_stealing": work_stealing}
+                if n_threads is not None:
+                    pool_args["num_workers"] = n_threads
+                scheduler = "work-stealing" if work_stealing else "global queue"
+                threads = n_threads if n_threads is not None else "default number of"
+                logger.info(f"Resetting lazyflow thread pool with {threads} threads ({scheduler} scheduler).")
+                lazyflow.request.Request.reset_thread_pool(**pool_args)
+            if n_processes > 0:
+                from lazyflow.request import processPool
+
+                logger.info(f"Starting lazyflow process pool with {n_processes} processes.")
+                processPool.reset_process_pool(n_processes)
+            if cache_eviction != "lru":
+                logger.info(f"Using cache eviction policy {cache_eviction!r}.")
+                cacheMemoryManager.setEvictionPolicy(cache_eviction)
+            if spill_mb > 0:
+                _enable_cache_spilling(spill_mb, spill_directory)
+            if compressed_cache_store != "hdf5":
+                from lazyflow.operators.opCompressedCache import OpUnmanagedCompressedCache
+
+                logger.info(f"Using the {compressed_cache_store!r} block store for compressed caches.")
+                OpUnmanagedCompressedCache.block_store = compressed_cache_store
             if total_ram_mb > 0:
                 if total_ram_mb < 500:
                     raise Exception(
@@ -376,6 +475,50 @@ def _prepare_lazyflow_config(parsed_args):
     return None
 
 
+def _enable_cache_spilling(spill_mb, spill_directory):
+    import atexit
+    import contextlib
+    from ilastik.utility import autocleaned_tempdir
+    from lazyflow.operators import cacheMemoryManager
+    from lazyflow.operators.cacheSpillStore import SpillStore
+
+    exit_stack = contextlib.ExitStack()
+    scratch_dir = exit_stack.enter_context(autocleaned_tempdir(dir=spill_directory))
+    logger.info(f"Spilling evicted cache blocks to {scratch_dir} (up to {spill_mb} MB).")
+    cacheMemoryManager.setSpillStore(SpillStore(scratch_dir, spill_mb * 1024 ** 2))
+
+    def _cleanup():
+        # waits for a running cache cleanup, so nothing writes to the directory anymore
+        cacheMemoryManager.setSpillStore(None)
+        exit_stack.close()
+
+    atexit.register(_cleanup)
+
+
+def _prepare_request_tracing(parsed_args):
+    if not parsed_args.trace_requests:
+        return None
+    trace_path = os.path.expanduser(parsed_args.trace_requests)
+
+    def _start_request_tracing():
+        import atexit
+        from lazyflow.request.requestTracer import RequestTracer
+
+        tracer = RequestTracer()
+
+        def _write_trace():
+            tracer.stop()
+            tracer.write_chrome_trace(trace_path)
+            logger.info(f"Wrote {len(tracer.records)} request trace events to {trace_path}")
+            logger.info("Request time per operator:\n" + tracer.summary_table())
+
+        logger.info(f"Tracing lazyflow requests, trace will be written to {trace_path}")
+        tracer.start()
+        atexit.register(_write_trace)
+
+    return _start_request_tracing
+
+
 def _prepare_auto_open_project(parsed_args):
     if parsed_args.project is None:
         return None
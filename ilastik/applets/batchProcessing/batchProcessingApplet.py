@@ -1,13 +1,21 @@
+import itertools
 import logging
+import os
+import threading
 import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import Callable, Dict, List, Optional, Union
 import numpy
+import psutil
 from ndstructs import Slice5D
 from functools import partial
 import argparse
 import ast
 import textwrap
 
+from lazyflow.distributed.TaskOrchestrator import TaskOrchestrator
+from lazyflow.utility import Memory
+
 from ilastik.applets.base.applet import Applet
 from ilastik.applets.dataExport.opDataExport import OpDataExport
 from ilastik.applets.dataSelection import DataSelectionApplet
@@ -16,6 +24,19 @@ from ilastik.applets.dataSelection.opDataSelection import DatasetInfo, OpMultiLa
 logger = logging.getLogger(__name__)  # noqa
 
 
+def _run_headless(cmdline_args: List[str]):
+    """
+    Main function of the worker processes of --distributed-backend=local.
+    Workers run the export of the orchestrating process (see BatchProcessingApplet._worker_cmdline_args):
+    they load the project (once), and then process the blocks of every dataset that the orchestrator hands out.
+    """
+    from ilastik import app
+
+    parsed_args, workflow_cmdline_args = app.parse_known_args(cmdline_args)
+    shell = app.main(parsed_args, workflow_cmdline_args)
+    shell.closeCurrentProject()
+
+
 class BatchProcessingApplet(Applet):
     """
     This applet can be appended to a workflow to provide batch-processing support.
@@ -56,6 +77,25 @@ class BatchProcessingApplet(Applet):
             help="Distributed mode. Used for running ilastik on HPCs via SLURM/srun/mpirun",
             action="store_true",
         )
+        parser.add_argument(
+            "--distributed_backend",
+            "--distributed-backend",
+            help=textwrap.dedent(
+                """
+                How the processes of --distributed mode communicate (implies --distributed):
+                    mpi: ilastik is launched with mpirun/srun, rank 0 hands out the blocks to the others (default)
+                    local: ilastik starts --workers worker processes on this machine by itself, no MPI needed
+                """
+            ),
+            choices=["mpi", "local"],
+            default=None,
+        )
+        parser.add_argument(
+            "--workers",
+            help="Number of worker processes of --distributed-backend=local. Default: number of physical cores",
+            type=int,
+            default=None,
+        )
 
         default_block_roi = Slice5D.all(x=slice(0, 256), y=slice(0, 256), z=slice(0, 256), t=slice(0, 1))
 
@@ -94,26 +134,87 @@ class BatchProcessingApplet(Applet):
             default=default_block_roi,
         )
 
+        parser.add_argument(
+            "--batch_parallel_lanes",
+            "--batch-parallel-lanes",
+            help="Number of datasets to export in parallel. Useful for many small datasets. "
+            "The memory for computations is divided among the parallel exports.",
+            type=int,
+            default=1,
+        )
+
         parsed_args, unused_args = parser.parse_known_args(cmdline_args)
+        if parsed_args.batch_parallel_lanes < 1:
+            raise ValueError(f"--batch_parallel_lanes must be at least 1, got {parsed_args.batch_parallel_lanes}")
+        if parsed_args.distributed_backend is not None:
+            parsed_args.distributed = True
+        if parsed_args.distributed and parsed_args.batch_parallel_lanes > 1:
+            raise ValueError("--batch_parallel_lanes can not be combined with --distributed")
+        if parsed_args.workers is not None:
+            if parsed_args.distributed_backend != "local":
+                raise ValueError("--workers requires --distributed-backend=local")
+            if parsed_args.workers < 1:
+                raise ValueError(f"--workers must be at least 1, got {parsed_args.workers}")
         return parsed_args, unused_args
 
-    def run_export_from_parsed_args(self, parsed_args: argparse.Namespace):
-        "Run the export for each dataset listed in parsed_args as interpreted by DataSelectionApplet."
+    def run_export_from_parsed_args(
+        self, parsed_args: argparse.Namespace, workflow_cmdline_args: Optional[List[str]] = None
+    ):
+        """
+        Run the export for each dataset listed in parsed_args as interpreted by DataSelectionApplet.
+
+        workflow_cmdline_args are the workflow arguments (export settings and inputs) of this export,
+        which the worker processes of --distributed-backend=local run.  By default, those of the workflow.
+        """
+        orchestrator = None
         if parsed_args.distributed:
-            export_function = partial(self.do_distributed_export, block_roi=parsed_args.distributed_block_roi)
+            # The same processes export all datasets
+            orchestrator = self._create_orchestrator(parsed_args, workflow_cmdline_args)
+            export_function = partial(
+                self.do_distributed_export, block_roi=parsed_args.distributed_block_roi, orchestrator=orchestrator
+            )
         else:
             export_function = self.do_normal_export
 
-        return self.run_export(
-            lane_configs=self.dataSelectionApplet.lane_configs_from_parsed_args(parsed_args),
-            export_function=export_function,
-        )
+        try:
+            return self.run_export(
+                lane_configs=self.dataSelectionApplet.lane_configs_from_parsed_args(parsed_args),
+                export_function=export_function,
+                parallel_lanes=parsed_args.batch_parallel_lanes,
+            )
+        finally:
+            if orchestrator is not None:
+                orchestrator.close()
+
+    def _create_orchestrator(
+        self, parsed_args: argparse.Namespace, workflow_cmdline_args: Optional[List[str]] = None
+    ) -> TaskOrchestrator:
+        if parsed_args.distributed_backend == "local":
+            from lazyflow.distributed.localTransport import LocalTransport
+
+            num_workers = parsed_args.workers or psutil.cpu_count(logical=False) or psutil.cpu_count()
+            worker_cmdline_args = self._worker_cmdline_args(workflow_cmdline_args)
+            return TaskOrchestrator(LocalTransport(num_workers, partial(_run_headless, worker_cmdline_args)))
+        return TaskOrchestrator()
+
+    def _worker_cmdline_args(self, workflow_cmdline_args: Optional[List[str]] = None) -> List[str]:
+        """
+        Command line of the worker processes of --distributed-backend=local: the project and this export.
+        Not the command line of this process, which may e.g. be a batch server or a Python script.
+        """
+        project_file = self.dataSelectionApplet.project_file
+        if project_file is None:
+            raise ValueError("--distributed-backend=local needs a project file")
+        if workflow_cmdline_args is None:
+            workflow_cmdline_args = self.workflow().workflow_cmdline_args
+        return ["--headless", f"--project={project_file.filename}", *workflow_cmdline_args]
 
     def run_export(
         self,
         lane_configs: List[Dict[str, Optional[DatasetInfo]]],
         export_to_array: bool = False,
         export_function: Optional[Callable] = None,
+        parallel_lanes: int = 1,
     ) -> Union[List[str], List[numpy.array]]:
         """Run the export for each dataset listed in role_data_dict
 
@@ -133,14 +234,21 @@ class BatchProcessingApplet(Applet):
             export_to_array: If True do NOT export to disk as usual.
               Instead, export the results to a list of arrays, which is returned.
               If False, return a list of the filenames we produced to.
+            parallel_lanes: Number of batch lanes that are exported at the same time (see _run_parallel_export).
 
         Returns:
             list containing either strings of paths to exported files,
               or numpy.arrays (depending on export_to_array)
         """
         assert not (export_to_array and export_function)
+        opDataExport = self.dataExportApplet.topLevelOperator
+        project_identity = self._project_identity()
+        if project_identity is not None and hasattr(opDataExport, "ProjectIdentity"):
+            opDataExport.ProjectIdentity.setValue(project_identity)
         if not export_function:
             export_function = self.do_export_to_array if export_to_array else self.do_normal_export
+        if parallel_lanes > 1 and len(lane_configs) > 1:
+            return self._run_parallel_export(lane_configs, export_function, min(parallel_lanes, len(lane_configs)))
         self.progressSignal(0)
         try:
             results = []
@@ -163,6 +271,96 @@ class BatchProcessingApplet(Applet):
         finally:
             self.progressSignal(100)
 
+    def _run_parallel_export(
+        self,
+        lane_configs: List[Dict[str, Optional[DatasetInfo]]],
+        export_function: Callable[[OpDataExport], Union[str, numpy.array]],
+        parallel_lanes: int,
+    ) -> Union[List[str], List[numpy.array]]:
+        """
+        Like run_export, but exports up to parallel_lanes datasets at the same time, in a sliding window.
+
+        parallel_lanes batch lanes are added and configured in the calling thread before any export starts.
+        They are reused: as soon as the export of a lane is done, the lane is finished (post_process_lane_export)
+        and configured with the next dataset, again in the calling thread, while the other lanes keep exporting.
+        So a slow dataset doesn't hold up the others, and lanes are neither added nor removed while an export runs.
+        Only the lane whose export is done is reconfigured.  The lanes are removed once all exports have stopped.
+        Results are ordered like lane_configs.  post_process_lane_export is called in the order the exports finish.
+
+        Each export gets its share of the memory for computations (see Memory.setComputationShares).
+        """
+        first_batch_lane = self.dataSelectionApplet.num_lanes
+        results = [None] * len(lane_configs)
+        lane_progress = [0] * len(lane_configs)
+        progress_lock = threading.Lock()
+        next_batch_indices = iter(range(len(lane_configs)))
+        running = {}  # future -> (batch_index, lane_index, progress callback) of the running exports
+
+        def handle_lane_progress(batch_index, progress):
+            with progress_lock:
+                lane_progress[batch_index] = progress
+                self.progressSignal(sum(lane_progress) / len(lane_progress))
+
+        def prepare_lane(batch_index, lane_index):
+            # Call customization hook
+            self.dataExportApplet.prepare_lane_for_export(lane_index)
+            opDataExport = self.dataExportApplet.topLevelOperator.getLane(lane_index)
+            progress_callback = partial(handle_lane_progress, batch_index)
+            opDataExport.progressSignal.subscribe(progress_callback)
+            return opDataExport, (batch_index, lane_index, progress_callback)
+
+        logger.info(f"Exporting {len(lane_configs)} datasets, {parallel_lanes} in parallel")
+        computation_shares = Memory.getComputationShares()
+        Memory.setComputationShares(computation_shares * parallel_lanes)
+        self.progressSignal(0)
+        # Call customization hook
+        self.dataExportApplet.prepare_for_entire_export()
+        try:
+            with ThreadPoolExecutor(max_workers=parallel_lanes) as executor:
+                try:
+                    prepared = []
+                    for batch_index in itertools.islice(next_batch_indices, parallel_lanes):
+                        self.dataSelectionApplet.pushLane(lane_configs[batch_index])
+                        prepared.append(prepare_lane(batch_index, self.dataSelectionApplet.num_lanes - 1))
+                    for opDataExport, lane_export in prepared:
+                        running[executor.submit(export_function, opDataExport)] = lane_export
+
+                    while running:
+                        done, _ = wait(running, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            batch_index, lane_index, progress_callback = running.pop(future)
+                            opDataExport = self.dataExportApplet.topLevelOperator.getLane(lane_index)
+                            opDataExport.progressSignal.unsubscribe(progress_callback)
+                            results[batch_index] = future.result()
+                            handle_lane_progress(batch_index, 100)
+                            # Call customization hook
+                            self.dataExportApplet.post_process_lane_export(lane_index)
+                            logger.info(f"Finished batch dataset {batch_index + 1} of {len(lane_configs)}")
+
+                            for next_batch_index in itertools.islice(next_batch_indices, 1):
+                                self.dataSelectionApplet.get_lane(lane_index).configure(lane_configs[next_batch_index])
+                                opDataExport, lane_export = prepare_lane(next_batch_index, lane_index)
+                                running[executor.submit(export_function, opDataExport)] = lane_export
+                finally:
+                    # Lanes may only be dropped after all exports have stopped, also on failure
+                    wait(running)
+                    while self.dataSelectionApplet.num_lanes > first_batch_lane:
+                        self.dataSelectionApplet.dropLastLane()
+            self.dataExportApplet.post_process_entire_export()
+            return results
+        finally:
+            Memory.setComputationShares(computation_shares)
+            self.progressSignal(100)
+
+    def _project_identity(self):
+        """
+        Project file and its modification time: resumable exports don't reuse blocks exported with another project
+        """
+        project_file = self.dataSelectionApplet.project_file
+        if project_file is None:
+            return None
+        return [project_file.filename, os.path.getmtime(project_file.filename)]
+
     def do_normal_export(self, opDataExport):
         logger.info(f"Exporting to {opDataExport.ExportPath.value}")
         opDataExport.run_export()
@@ -172,9 +370,9 @@ class BatchProcessingApplet(Applet):
         logger.info("Exporting to in-memory array.")
         return opDataExport.run_export_to_array()
 
-    def do_distributed_export(self, opDataExport, *, block_roi: Slice5D):
+    def do_distributed_export(self, opDataExport, *, block_roi: Slice5D, orchestrator: TaskOrchestrator = None):
         logger.info("Running ilastik distributed...")
-        return opDataExport.run_distributed_export(block_roi=block_roi)
+        return opDataExport.run_distributed_export(block_roi=block_roi, orchestrator=orchestrator)
 
     def export_dataset(
         self,
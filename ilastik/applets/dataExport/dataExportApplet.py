@@ -26,6 +26,7 @@ import os
 
 import numpy
 
+from lazyflow.utility.multiscales import PYRAMID_METHODS
 from ilastik.applets.base.applet import Applet
 from ilastik.utility import OpMultiLaneWrapper
 from ilastik.utility.commandLineProcessing import ParseListFromString
@@ -161,6 +162,34 @@ class DataExportApplet(Applet):
             required=False,
         )
 
+        arg_parser.add_argument(
+            "--export_pyramid_levels",
+            help=(
+                "Number of downsampled levels to export along with the full resolution (hdf5, n5 and zarr only). "
+                "The internal path then names a multiscale group with the datasets s0, s1, ..."
+            ),
+            type=int,
+            required=False,
+        )
+        arg_parser.add_argument(
+            "--export_pyramid_method",
+            help=(
+                "Downsampling method of the pyramid levels. "
+                "auto: mode for label images (e.g. segmentations), mean for everything else"
+            ),
+            choices=PYRAMID_METHODS,
+            required=False,
+        )
+        arg_parser.add_argument(
+            "--resumable_export",
+            help=(
+                "Record the completed blocks of the export in a .manifest file next to it (hdf5, n5 and zarr only). "
+                "If the export is interrupted, run it again with the same settings to export the remaining blocks only."
+            ),
+            action="store_true",
+            default=False,
+        )
+
         arg_parser.add_argument(
             "--export_source",
             help="The data to export.  See the dropdown list on the Data Export page for choices.",
@@ -246,6 +275,9 @@ class DataExportApplet(Applet):
                 raise Exception("Invalid axes specified output_axis_order: {}".format(parsed_args.output_axis_order))
             parsed_args.output_axis_order = output_axis_order
 
+        if parsed_args.export_pyramid_levels is not None and parsed_args.export_pyramid_levels < 0:
+            raise Exception("export_pyramid_levels must not be negative: {}".format(parsed_args.export_pyramid_levels))
+
         return parsed_args, unused_args
 
     def configure_operator_with_parsed_args(self, parsed_args):
@@ -321,6 +353,15 @@ class DataExportApplet(Applet):
         if parsed_args.output_format:
             opDataExport.OutputFormat.setValue(parsed_args.output_format)
 
+        if parsed_args.export_pyramid_levels is not None:
+            opDataExport.PyramidLevels.setValue(parsed_args.export_pyramid_levels)
+
+        if parsed_args.export_pyramid_method:
+            opDataExport.PyramidMethod.setValue(parsed_args.export_pyramid_method)
+
+        if parsed_args.resumable_export:
+            opDataExport.ResumableExport.setValue(True)
+
         if parsed_args.table_only:
             opDataExport.TableOnly.setValue(True)
 
@@ -266,6 +266,8 @@ class DataExportGui(QWidget):
                 opExportModelOp.OutputFilenameFormat,
                 opExportModelOp.OutputInternalPath,
                 opExportModelOp.OutputFormat,
+                opExportModelOp.PyramidLevels,
+                opExportModelOp.PyramidMethod,
             ]
 
             # Disconnect the special 'transaction' slot to prevent these
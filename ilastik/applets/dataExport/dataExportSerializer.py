@@ -80,6 +80,8 @@ class DataExportSerializer(AppletSerializer):
             SerialSlot(operator.OutputFilenameFormat),
             SerialSlot(operator.OutputInternalPath),
             SerialSlot(operator.OutputFormat),
+            SerialSlot(operator.PyramidLevels),
+            SerialSlot(operator.PyramidMethod),
         ]
 
         slots += extraSerialSlots
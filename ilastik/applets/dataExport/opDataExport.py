@@ -94,6 +94,12 @@ class OpDataExport(Operator):
     )  # A format string allowing {dataset_dir} {nickname}, {roi}, {x_start}, {x_stop}, etc.
     OutputInternalPath = InputSlot(value="exported_data")
     OutputFormat = InputSlot(value="hdf5")
+    PyramidLevels = InputSlot(value=0)  # Downsampled levels to export (hdf5, n5 and zarr only)
+    PyramidMethod = InputSlot(value="auto")
+    ResumableExport = InputSlot(value=False)  # Skip the blocks that an interrupted export has completed
+    # Identity of the project (json-serializable, e.g. project file and modification time).
+    # An interrupted resumable export is only resumed for the same project, input files and export source.
+    ProjectIdentity = InputSlot(optional=True)
 
     # Only export csv/HDF5 table (don't export volume)
     TableOnlyName = InputSlot(value="Table-Only")
@@ -109,6 +115,10 @@ class OpDataExport(Operator):
 
     ALL_FORMATS = OpFormattedDataExport.ALL_FORMATS
 
+    # Export sources (see SelectionNames) with one of these words in their name are label images.
+    # With PyramidMethod "auto", their pyramid levels keep the most common label (see lazyflow.utility.multiscales).
+    LABEL_SOURCE_KEYWORDS = ("segmentation", "labels", "identities", "object predictions", "thresholded")
+
     ####
     # Simplified block diagram for actual export data and 'live preview' display:
     #
@@ -148,6 +158,8 @@ class OpDataExport(Operator):
         opFormattedExport.ExportDtype.connect(self.ExportDtype)
         opFormattedExport.OutputAxisOrder.connect(self.OutputAxisOrder)
         opFormattedExport.OutputFormat.connect(self.OutputFormat)
+        opFormattedExport.PyramidLevels.connect(self.PyramidLevels)
+        opFormattedExport.ResumableExport.connect(self.ResumableExport)
 
         self.ConvertedImage.connect(opFormattedExport.ConvertedImage)
         self.ImageToExport.connect(opFormattedExport.ImageToExport)
@@ -215,6 +227,12 @@ class OpDataExport(Operator):
 
         self._opFormattedExport.TransactionSlot.disconnect()
 
+        pyramid_method = self.PyramidMethod.value
+        if pyramid_method == "auto" and self.isLabelSource(result_types[selection_index]):
+            pyramid_method = "mode"
+        self._opFormattedExport.PyramidMethod.setValue(pyramid_method)
+        self._opFormattedExport.ExportIdentity.setValue(self._exportIdentity(rawInfo, result_types[selection_index]))
+
         # Blank the internal path while we manipulate the external path
         #  to avoid invalid intermediate states of ExportPath
         self._opFormattedExport.OutputInternalPath.setValue("")
@@ -235,6 +253,24 @@ class OpDataExport(Operator):
         # Re-connect to finish the 'transaction'
         self._opFormattedExport.TransactionSlot.connect(self.TransactionSlot)
 
+    def _exportIdentity(self, rawInfo, source_name):
+        """
+        What is exported, for resumable exports: the export source, the input files and the project
+        """
+        inputs = []
+        for path in getattr(rawInfo, "external_paths", []):
+            mtime = os.path.getmtime(path) if os.path.exists(path) else None
+            inputs.append([path, mtime])
+        identity = {"export_source": source_name, "inputs": inputs}
+        if self.ProjectIdentity.ready():
+            identity["project"] = self.ProjectIdentity.value
+        return identity
+
+    @classmethod
+    def isLabelSource(cls, source_name):
+        source_name = source_name.lower()
+        return any(keyword in source_name for keyword in cls.LABEL_SOURCE_KEYWORDS)
+
     def execute(self, slot, subindex, roi, result):
         assert False, "Shouldn't get here"
 
@@ -253,8 +289,8 @@ class OpDataExport(Operator):
         # (Typically used from pure-python clients in batch mode.)
         return self._opFormattedExport.run_export_to_array()
 
-    def run_distributed_export(self, block_roi: Slice5D):
-        return self._opFormattedExport.run_distributed_export(block_roi)
+    def run_distributed_export(self, block_roi: Slice5D, orchestrator=None):
+        return self._opFormattedExport.run_distributed_export(block_roi, orchestrator)
 
 
 class OpRawSubRegionHelper(Operator):
@@ -321,6 +357,8 @@ def get_model_op(wrappedOp):
         wrappedOp.OutputFilenameFormat,
         wrappedOp.OutputInternalPath,
         wrappedOp.OutputFormat,
+        wrappedOp.PyramidLevels,
+        wrappedOp.PyramidMethod,
     ]
 
     # Use an instance of OpFormattedDataExport, since has the important slots and no others.
@@ -43,7 +43,7 @@ class FeatureSelectionApplet(StandardApplet):
 
     @property
     def broadcastingSlots(self):
-        return ["Scales", "ComputeIn2d", "FeatureIds", "SelectionMatrix"]
+        return ["Scales", "ComputeIn2d", "FeatureIds", "SelectionMatrix", "CachePrecision"]
 
     @property
     def singleLaneGuiClass(self):
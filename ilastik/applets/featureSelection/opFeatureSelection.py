@@ -227,6 +227,8 @@ class OpFeatureSelection(OpFeatureSelectionNoCache):
     """
 
     BypassCache = InputSlot(value=False)
+    # Precision of the cached features, see lazyflow.utility.quantizedArray
+    CachePrecision = InputSlot(value="full")
     CachedOutputImage = OutputSlot()
 
     def __init__(self, *args, **kwargs):
@@ -236,6 +238,7 @@ class OpFeatureSelection(OpFeatureSelectionNoCache):
         self.opPixelFeatureCache = OpSlicedBlockedArrayCache(parent=self)
         self.opPixelFeatureCache.name = "opPixelFeatureCache"
         self.opPixelFeatureCache.BypassModeEnabled.connect(self.BypassCache)
+        self.opPixelFeatureCache.StoragePrecision.connect(self.CachePrecision)
 
         # Connect the cache to the feature output
         self.opPixelFeatureCache.Input.connect(self.OutputImage)
@@ -33,6 +33,7 @@ import vigra.analysis
 # lazyflow
 from lazyflow.graph import Operator, InputSlot, OutputSlot, OperatorWrapper
 from lazyflow.request import Request, RequestPool
+from lazyflow.request.processPool import runInProcessPool
 from lazyflow.stype import Opaque
 from lazyflow.rtype import List, SubRegion
 from lazyflow.roi import roiToSlice, sliceToRoi
@@ -117,6 +118,61 @@ def make_bboxes(binary_bbox, margin):
     return passed, context
 
 
+# Indices of the spatial and channel axes of a 4D image (picklable, unlike vigra.AxisTags)
+Axes = collections.namedtuple("Axes", "x y z c")
+
+
+@runInProcessPool
+def compute_local_features(image, axiskeys, labels, first_label, mincoords, maxcoords, feature_names, plugin_states):
+    """Compute the features of the objects first_label, first_label + 1, ... in their neighborhood.
+
+    The per-object loop is pure python, so it runs in the process pool, if one is configured.
+
+    :param image: 4D raw data, with axes axiskeys
+    :param labels: 3D label image (image without the channel axis)
+    :param mincoords, maxcoords: inclusive bounding boxes of the objects, relative to image
+    :param plugin_states: attributes of the plugins that compute local features, by plugin name.
+        Plugins may keep state from compute_global (e.g. the dimensionality of the data),
+        which worker processes would otherwise lack.
+    :returns: (features by plugin name, names of the features that failed),
+        with one row per object in every feature array
+    """
+    image = vigra.taggedView(image, axistags=axiskeys)
+    axes = Axes(*(axiskeys.index(k) for k in "xyzc"))
+    margin = max_margin(feature_names)
+
+    plugins = {}
+    for plugin_name, state in plugin_states.items():
+        plugins[plugin_name] = pluginManager.getPluginByName(plugin_name, "ObjectFeatures").plugin_object
+        plugins[plugin_name].__dict__.update(state)
+
+    def dictextend(a, b):
+        for key in b:
+            a[key].append(b[key])
+        return a
+
+    local_features = collections.defaultdict(lambda: collections.defaultdict(list))
+    for i in range(len(mincoords)):
+        logger.debug("processing object {}".format(first_label + i))
+        extent = OpRegionFeatures.compute_extent(i, image, mincoords, maxcoords, axes, margin)
+        rawbbox = OpRegionFeatures.compute_rawbbox(image, extent, axes)
+        binary_bbox = numpy.where(labels[tuple(extent)] == first_label + i, 1, 0).astype(bool)
+        for plugin_name, plugin in plugins.items():
+            feats = plugin.compute_local(rawbbox, binary_bbox, feature_names[plugin_name], axes)
+            local_features[plugin_name] = dictextend(local_features[plugin_name], feats)
+
+    failed = []
+    for pfeats in local_features.values():
+        for key in list(pfeats.keys()):
+            value = pfeats[key]
+            try:
+                pfeats[key] = numpy.vstack(list(v.reshape(1, -1) for v in value))
+            except:
+                failed.append(key)
+                del pfeats[key]
+    return {name: dict(pfeats) for name, pfeats in local_features.items()}, failed
+
+
 class OpCachedRegionFeatures(Operator):
     """Caches the region features computed by OpRegionFeatures."""
 
@@ -478,6 +534,9 @@ class OpRegionFeatures(Operator):
 
     Output = OutputSlot()
 
+    # Number of objects whose local features are computed in one request (or process pool task)
+    LOCAL_FEATURES_BATCH_SIZE = 256
+
     def setupOutputs(self):
         if self.LabelVolume.meta.axistags != self.RawVolume.meta.axistags:
             raise Exception("raw and label axis tags do not match")
@@ -548,7 +607,8 @@ class OpRegionFeatures(Operator):
         pool.wait()
         return result
 
-    def compute_extent(self, i, image, mincoords, maxcoords, axes, margin):
+    @staticmethod
+    def compute_extent(i, image, mincoords, maxcoords, axes, margin):
         """Make a slicing to extract object i from the image."""
         # find the bounding box (margin is always 'xyz' order)
         result = [None] * 3
@@ -574,7 +634,8 @@ class OpRegionFeatures(Operator):
 
         return result
 
-    def compute_rawbbox(self, image, extent, axes):
+    @staticmethod
+    def compute_rawbbox(image, extent, axes):
         """essentially returns image[extent], preserving all channels."""
         key = copy(extent)
         key.insert(axes.c, slice(None))
@@ -633,13 +694,8 @@ class OpRegionFeatures(Operator):
             )
 
         # FIXME: maybe simplify? taggedShape should be easier here
-        class Axes(object):
-            x = image.axistags.index("x")
-            y = image.axistags.index("y")
-            z = image.axistags.index("z")
-            c = image.axistags.index("c")
-
-        axes = Axes()
+        axiskeys = "".join(tag.key for tag in image.axistags)
+        axes = Axes(*(axiskeys.index(k) for k in "xyzc"))
 
         slc3d = [slice(None)] * 4  # FIXME: do not hardcode
         slc3d[axes.c] = 0
@@ -691,47 +747,65 @@ class OpRegionFeatures(Operator):
         maxcoords = extrafeats["Coord<Maximum>"].astype(int)
         nobj = mincoords.shape[0]
 
-        # local features: loop over all objects
-        def dictextend(a, b):
-            for key in b:
-                a[key].append(b[key])
-            return a
-
-        local_features = collections.defaultdict(lambda: collections.defaultdict(list))
+        # local features: loop over all objects, in batches of neighboring objects
         margin = max_margin(feature_names)
-        has_local_features = {}
+        local_feature_names = {}
         for plugin_name, feature_dict in feature_names.items():
-            has_local_features[plugin_name] = False
-            for features in feature_dict.values():
-                if "margin" in features:
-                    has_local_features[plugin_name] = True
-                    break
-
-        if numpy.any(margin) > 0:
-            # starting from 0, we stripped 0th background object in global computation
-            for i in range(0, nobj):
-                logger.debug("processing object {}".format(i))
-                extent = self.compute_extent(i, image, mincoords, maxcoords, axes, margin)
-                rawbbox = self.compute_rawbbox(image, extent, axes)
-                # it's i+1 here, because the background has label 0
-                binary_bbox = numpy.where(labels[tuple(extent)] == i + 1, 1, 0).astype(bool)
-                for plugin_name, feature_dict in feature_names.items():
-                    if not has_local_features[plugin_name]:
-                        continue
-                    plugin = pluginManager.getPluginByName(plugin_name, "ObjectFeatures")
-                    feats = plugin.plugin_object.compute_local(rawbbox, binary_bbox, feature_dict, axes)
-                    local_features[plugin_name] = dictextend(local_features[plugin_name], feats)
-
-        logger.debug("computing done, removing failures")
-        # remove local features that failed
-        for pname, pfeats in local_features.items():
-            for key in list(pfeats.keys()):
-                value = pfeats[key]
-                try:
-                    pfeats[key] = numpy.vstack(list(v.reshape(1, -1) for v in value))
-                except:
-                    logger.warning("feature {} failed".format(key))
-                    del pfeats[key]
+            if any("margin" in features for features in feature_dict.values()):
+                local_feature_names[plugin_name] = feature_dict
+
+        def compute_batch(batch, start, stop):
+            # Only pass the part of the image that the objects of this batch need
+            extent = self.compute_extent(
+                0,
+                image,
+                mincoords[start:stop].min(0, keepdims=True),
+                maxcoords[start:stop].max(0, keepdims=True),
+                axes,
+                margin,
+            )
+            offset = numpy.zeros(mincoords.shape[1], dtype=int)
+            for axis in (axes.x, axes.y, axes.z):
+                if axis < len(offset):
+                    offset[axis] = extent[axis].start
+            # starting from 0, we stripped 0th background object in global computation, so object i has label i+1
+            batch["features"], batch["failed"] = compute_local_features(
+                numpy.asarray(self.compute_rawbbox(image, extent, axes)),
+                axiskeys,
+                numpy.asarray(labels[tuple(extent)]),
+                start + 1,
+                mincoords[start:stop] - offset,
+                maxcoords[start:stop] - offset,
+                local_feature_names,
+                plugin_states,
+            )
+
+        local_features = {}
+        if numpy.any(margin) > 0 and nobj > 0:
+            plugin_states = {
+                plugin_name: vars(pluginManager.getPluginByName(plugin_name, "ObjectFeatures").plugin_object)
+                for plugin_name in local_feature_names
+            }
+            batches = []
+            pool = RequestPool()
+            for start in range(0, nobj, self.LOCAL_FEATURES_BATCH_SIZE):
+                batches.append({})
+                pool.add(Request(partial(compute_batch, batches[-1], start, start + self.LOCAL_FEATURES_BATCH_SIZE)))
+            pool.wait()
+
+            logger.debug("computing done, removing failures")
+            # remove local features that failed
+            failed = set().union(*(batch["failed"] for batch in batches))
+            for plugin_name in local_feature_names:
+                keys = set().union(*(batch["features"].get(plugin_name, {}).keys() for batch in batches))
+                for key in keys:
+                    try:
+                        if key in failed:
+                            raise ValueError(key)
+                        value = numpy.vstack([batch["features"][plugin_name][key] for batch in batches])
+                        local_features.setdefault(plugin_name, {})[key] = value
+                    except:
+                        logger.warning("feature {} failed".format(key))
 
         # merge the global and local features
         logger.debug("removed failed, merging")
@@ -78,6 +78,9 @@ class OpPixelClassification(Operator):
     CachedFeatureImages = InputSlot(level=1)  # Cached feature data.
 
     FreezePredictions = InputSlot(stype="bool")
+    # Skip the prediction of certain, homogeneous tiles in headless prediction.
+    # See OpVectorwiseClassifierPredict.CoarsePredictionTolerance.
+    CoarsePredictionTolerance = InputSlot(optional=True)
     ClassifierFactory = InputSlot(value=ParallelVigraRfLazyflowClassifierFactory(100))
 
     PredictionsFromDisk = InputSlot(optional=True, level=1)
@@ -177,6 +180,7 @@ class OpPixelClassification(Operator):
         self.opPredictionPipeline.FreezePredictions.connect(self.FreezePredictions)
         self.opPredictionPipeline.PredictionsFromDisk.connect(self.PredictionsFromDisk)
         self.opPredictionPipeline.PredictionMask.connect(self.PredictionMasks)
+        self.opPredictionPipeline.CoarsePredictionTolerance.connect(self.CoarsePredictionTolerance)
 
         # Feature Selection Stuff
         self.opFeatureMatrixCaches = OpMultiLaneWrapper(OpFeatureMatrixCache, parent=self)
@@ -461,6 +465,7 @@ class OpPredictionPipelineNoCache(Operator):
     Classifier = InputSlot()
     PredictionsFromDisk = InputSlot(optional=True)
     NumClasses = InputSlot()
+    CoarsePredictionTolerance = InputSlot(optional=True)  # Only used for the cacheless path
 
     HeadlessPredictionProbabilities = OutputSlot()  # drange is 0.0 to 1.0
     HeadlessUint8PredictionProbabilities = OutputSlot()  # drange 0 to 255
@@ -479,6 +484,7 @@ class OpPredictionPipelineNoCache(Operator):
         self.cacheless_predict.Image.connect(self.FeatureImages)  # <--- Not from cache
         self.cacheless_predict.LabelsCount.connect(self.NumClasses)
         self.cacheless_predict.PredictionMask.connect(self.PredictionMask)
+        self.cacheless_predict.CoarsePredictionTolerance.connect(self.CoarsePredictionTolerance)
         self.HeadlessPredictionProbabilities.connect(self.cacheless_predict.PMaps)
 
         # Alternate headless output: uint8 instead of float.
@@ -133,6 +133,7 @@ class ClassifierSelectionDlg(QDialog):
             VigraRfLazyflowClassifierFactory,
             SklearnLazyflowClassifierFactory,
             ParallelVigraRfLazyflowClassifierFactory,
+            IncrementalVigraRfLazyflowClassifierFactory,
             VigraRfPixelwiseClassifierFactory,
             LazyflowVectorwiseClassifierFactoryABC,
             LazyflowPixelwiseClassifierFactoryABC,
@@ -140,6 +141,7 @@ class ClassifierSelectionDlg(QDialog):
 
         classifiers = OrderedDict()
         classifiers["Parallel Random Forest (VIGRA)"] = ParallelVigraRfLazyflowClassifierFactory(100)
+        classifiers["Incremental Random Forest (VIGRA)"] = IncrementalVigraRfLazyflowClassifierFactory(100)
 
         try:
             from sklearn.ensemble import RandomForestClassifier, AdaBoostClassifier
@@ -48,6 +48,12 @@ output_filename_format: {dataset_dir}/{nickname}_{result_type}
 [lazyflow]
 threads: -1
 total_ram_mb: 0
+work_stealing: false
+processes: 0
+cache_eviction: lru
+spill_mb: 0
+spill_directory:
+compressed_cache_store: hdf5
 
 [hbp]
 token_url: https://web.ilastik.org/token/
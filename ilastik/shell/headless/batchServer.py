@@ -0,0 +1,426 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+# 		   http://ilastik.org/license.html
+###############################################################################
+import ipaddress
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class BatchJob(object):
+    """
+    A single batch job of the HeadlessBatchServer.
+
+    The job spec is a dict with the keys:
+        input:  A path (or list of paths) of the datasets to process (as for the positional headless arguments)
+        output: The output filename format (as for --output_filename_format), optional
+        export: A dict of export options, e.g. {"output_format": "hdf5", "export_source": "Probabilities"}
+                Keys are the names of the headless command line options without the leading "--".
+        args:   A list of additional headless command line arguments, optional
+        id:     The job id, optional
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, spec, job_id=None, status_path=None):
+        if not isinstance(spec, dict):
+            raise ValueError("A job must be a dict, got {!r}".format(spec))
+        self.spec = spec
+        self.job_id = str(job_id or spec.get("id") or uuid.uuid4().hex[:12])
+        self.args = self._cmdline_args(spec)
+        self.status_path = status_path
+        self.state = self.QUEUED
+        self.progress = 0
+        self.error = None
+        self.results = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    @staticmethod
+    def _cmdline_args(spec):
+        unknown_keys = set(spec.keys()) - {"input", "output", "export", "args", "id"}
+        if unknown_keys:
+            raise ValueError("Unknown job keys: {}".format(sorted(unknown_keys)))
+        inputs = spec.get("input")
+        if not inputs:
+            raise ValueError("A job needs at least one input")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+
+        args = ["--{}={}".format(key, value) for key, value in spec.get("export", {}).items()]
+        if spec.get("output"):
+            args.append("--output_filename_format={}".format(spec["output"]))
+        args += [str(arg) for arg in spec.get("args", [])]
+        return args + [str(path) for path in inputs]
+
+    def status(self):
+        return {
+            "id": self.job_id,
+            "state": self.state,
+            "progress": self.progress,
+            "error": self.error,
+            "results": self.results,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+    def set_state(self, state, **kwargs):
+        self.state = state
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+        if self.status_path is not None:
+            # Write atomically, so that clients never see partial status files
+            tmp_path = self.status_path.with_name(self.status_path.name + ".tmp")
+            tmp_path.write_text(json.dumps(self.status(), default=str))
+            os.replace(tmp_path, self.status_path)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class DuplicateJobError(ValueError):
+    pass
+
+
+def is_loopback_address(host):
+    """
+    Whether host (a name or IP address) is a local address that is not reachable from other machines.
+    """
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)]
+    except OSError:
+        return False
+    return all(ipaddress.ip_address(address.split("%")[0]).is_loopback for address in addresses)
+
+
+class HeadlessBatchServer(object):
+    """
+    Keeps the project of a HeadlessShell loaded and runs batch jobs (see BatchJob) on it,
+    so that the import, project loading and graph setup is paid only once.
+
+    Jobs can be submitted
+      - over a local TCP socket: one JSON request per line, answered with one JSON line.
+        Requests: {"command": "submit", "job": {...}}
+                  {"command": "status"} or {"command": "status", "id": job_id}
+                  {"command": "shutdown"} or {"command": "shutdown", "drain": true}
+      - via a watched directory: every <name>.json file is a job spec.
+        It is renamed to <name>.json.accepted when the job is queued,
+        and the job status is written to <name>.status.json.
+        A <name>.json file of a job that is still queued or running is picked up after that job has finished.
+
+    Jobs are run one after another in the thread that calls serve().
+    The queue is bounded: submissions to a full queue are rejected (socket) or picked up later (directory).
+    On shutdown, the running job is finished. Queued jobs are cancelled, unless drain is requested.
+    """
+
+    MAX_FINISHED_JOBS = 1000  # Status of older finished jobs is forgotten
+
+    def __init__(self, shell, queue_size=16, poll_interval=1.0):
+        if not hasattr(shell.workflow, "batchProcessingApplet"):
+            raise ValueError("The workflow {} does not support batch processing".format(type(shell.workflow).__name__))
+        self._shell = shell
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._poll_interval = poll_interval
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._drain = False
+        self._current_job = None
+        self._tcp_server = None
+
+        self._shell.workflow.batchProcessingApplet.progressSignal.subscribe(self._handle_progress)
+
+    @property
+    def address(self):
+        """(host, port) of the TCP server, if it is running"""
+        if self._tcp_server is not None:
+            return self._tcp_server.server_address
+        return None
+
+    def submit(self, spec, job_id=None, status_path=None):
+        """
+        Queue a job. Raises ValueError for invalid jobs and QueueFullError if the queue is full or the server stops.
+        """
+        job = BatchJob(spec, job_id, status_path)
+        with self._jobs_lock:
+            if self._stopping.is_set():
+                raise QueueFullError("The server is shutting down")
+            if job.job_id in self._jobs and self._jobs[job.job_id].state in (BatchJob.QUEUED, BatchJob.RUNNING):
+                raise DuplicateJobError("Job {} is already queued".format(job.job_id))
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFullError("The job queue is full ({} jobs)".format(self._queue.maxsize))
+            self._jobs.pop(job.job_id, None)
+            self._jobs[job.job_id] = job
+            self._forget_old_jobs()
+            job.set_state(BatchJob.QUEUED)  # Under the lock, so that it can't overwrite RUNNING
+        logger.info("Queued job {}".format(job.job_id))
+        return job
+
+    def status(self, job_id=None):
+        with self._jobs_lock:
+            if job_id is None:
+                return [job.status() for job in self._jobs.values()]
+            if job_id not in self._jobs:
+                raise KeyError("Unknown job: {}".format(job_id))
+            return self._jobs[job_id].status()
+
+    def shutdown(self, drain=False):
+        """
+        Stop accepting jobs. serve() returns after the running job (and all queued jobs, if drain) are finished.
+        """
+        logger.info("Shutting down batch server{}".format(" after the queued jobs" if drain else ""))
+        with self._jobs_lock:
+            self._drain = drain
+            self._stopping.set()
+
+    def serve(self, address=None, watch_dir=None):
+        """
+        Run jobs until shutdown() is called (also on SIGINT and SIGTERM, if called from the main thread).
+
+        address: (host, port) for the TCP server, if any. Port 0 picks a free port.
+                 Jobs run with the rights of the server, so the host must be a loopback address.
+        watch_dir: Directory to watch for job files, if any.
+        """
+        if address is not None and not is_loopback_address(address[0]):
+            raise ValueError("The batch server only accepts jobs on a loopback address, got {}".format(address[0]))
+        threads = []
+        if address is not None:
+            self._tcp_server = _JobTCPServer(address, _JobRequestHandler, self)
+            threads.append(threading.Thread(target=self._tcp_server.serve_forever, name="BatchServer TCP"))
+            logger.info("Accepting batch jobs on {}:{}".format(*self.address))
+        if watch_dir is not None:
+            threads.append(threading.Thread(target=self._watch, args=(Path(watch_dir),), name="BatchServer Watcher"))
+            logger.info("Watching {} for batch jobs".format(watch_dir))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            with self._shutdown_on_signals():
+                self._run_jobs()
+        finally:
+            if self._tcp_server is not None:
+                self._tcp_server.shutdown()
+                self._tcp_server.server_close()
+            for thread in threads:
+                thread.join()
+            logger.info("Batch server stopped")
+
+    def _run_jobs(self):
+        while True:
+            try:
+                job = self._queue.get(timeout=self._poll_interval)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+
+            if self._stopping.is_set() and not self._drain:
+                job.set_state(BatchJob.CANCELLED, finished=time.time())
+                logger.info("Cancelled job {}".format(job.job_id))
+            else:
+                self._run_job(job)
+
+    def _run_job(self, job):
+        logger.info("Starting job {}: {}".format(job.job_id, job.args))
+        self._current_job = job
+        with self._jobs_lock:
+            job.set_state(BatchJob.RUNNING, started=time.time())
+        try:
+            workflow = self._shell.workflow
+            export_args, unused_args = workflow.dataExportApplet.parse_known_cmdline_args(job.args)
+            input_args, unused_args = workflow.batchProcessingApplet.parse_known_cmdline_args(unused_args)
+            if unused_args:
+                raise ValueError("Unused job arguments: {}".format(unused_args))
+            with self._restored_export_settings(workflow.dataExportApplet.topLevelOperator):
+                workflow.dataExportApplet.configure_operator_with_parsed_args(export_args)
+                # Worker processes of --distributed-backend=local run this job, not the server
+                results = workflow.batchProcessingApplet.run_export_from_parsed_args(
+                    input_args, workflow_cmdline_args=[*workflow.workflow_cmdline_args, *job.args]
+                )
+        except Exception as e:
+            logger.exception("Job {} failed".format(job.job_id))
+            job.set_state(BatchJob.FAILED, error="{}: {}".format(type(e).__name__, e), finished=time.time())
+        else:
+            results = [r if isinstance(r, str) else None for r in results]
+            job.set_state(BatchJob.DONE, progress=100, results=results, finished=time.time())
+            logger.info("Finished job {}".format(job.job_id))
+        finally:
+            self._current_job = None
+
+    # The export settings that can be changed by job options
+    EXPORT_SETTING_SLOTS = [
+        "InputSelection",
+        "RegionStart",
+        "RegionStop",
+        "InputMin",
+        "InputMax",
+        "ExportMin",
+        "ExportMax",
+        "ExportDtype",
+        "OutputAxisOrder",
+        "WorkingDirectory",
+        "OutputFilenameFormat",
+        "OutputInternalPath",
+        "OutputFormat",
+        "PyramidLevels",
+        "PyramidMethod",
+        "ResumableExport",
+        "TableOnly",
+    ]
+
+    @contextmanager
+    def _restored_export_settings(self, opDataExport):
+        """
+        Jobs only override the export settings of the project for themselves.
+        Afterwards, each slot is reconnected to its upstream slot, set to its old value,
+        or disconnected if it was unready.
+        """
+        slots = [getattr(opDataExport, name) for name in self.EXPORT_SETTING_SLOTS if hasattr(opDataExport, name)]
+        settings = [(slot, slot.upstream_slot, slot.value if slot.ready() else None) for slot in slots]
+        try:
+            yield
+        finally:
+            opDataExport.TransactionSlot.disconnect()
+            for slot, upstream_slot, value in settings:
+                if upstream_slot is not None:
+                    slot.connect(upstream_slot)
+                elif value is not None:
+                    slot.setValue(value)
+                elif slot.upstream_slot is not None or slot.ready():
+                    slot.disconnect()
+            opDataExport.TransactionSlot.setValue(True)
+
+    def _handle_progress(self, progress):
+        job = self._current_job
+        if job is not None:
+            job.progress = progress
+
+    def _forget_old_jobs(self):
+        finished = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.state in (BatchJob.DONE, BatchJob.FAILED, BatchJob.CANCELLED)
+        ]
+        for job_id in finished[: max(0, len(finished) - self.MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _watch(self, watch_dir):
+        while not self._stopping.is_set():
+            for job_path in sorted(watch_dir.glob("*.json")):
+                if job_path.name.endswith(".status.json"):
+                    continue
+                job_id = job_path.name[: -len(".json")]
+                status_path = job_path.with_name(job_id + ".status.json")
+                try:
+                    spec = json.loads(job_path.read_text())
+                    self.submit(spec, job_id=job_id, status_path=status_path)
+                except QueueFullError:
+                    break  # Try again later
+                except DuplicateJobError:
+                    continue  # Queued again once the previous job with this name has finished
+                except ValueError as e:
+                    logger.error("Invalid job file {}: {}".format(job_path, e))
+                    status_path.write_text(json.dumps({"id": job_id, "state": BatchJob.FAILED, "error": str(e)}))
+                job_path.rename(job_path.with_name(job_path.name + ".accepted"))
+            self._stopping.wait(self._poll_interval)
+
+    @contextmanager
+    def _shutdown_on_signals(self):
+        if threading.current_thread() is not threading.main_thread():
+            yield
+            return
+
+        def handle_signal(signum, frame):
+            self.shutdown()
+
+        previous_handlers = {signum: signal.signal(signum, handle_signal) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            yield
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+    def handle_request(self, request):
+        """
+        Handle a request of the socket protocol (see class docstring) and return the response.
+        """
+        try:
+            command = request.get("command")
+            if command == "submit":
+                job = self.submit(request.get("job"))
+                return {"status": "ok", "id": job.job_id}
+            elif command == "status":
+                if "id" in request:
+                    return {"status": "ok", "job": self.status(request["id"])}
+                return {"status": "ok", "jobs": self.status()}
+            elif command == "shutdown":
+                self.shutdown(drain=bool(request.get("drain", False)))
+                return {"status": "ok"}
+            raise ValueError("Unknown command: {!r}".format(command))
+        except (ValueError, KeyError, QueueFullError) as e:
+            return {"status": "error", "error": str(e)}
+
+
+class _JobTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, handler_class, batch_server):
+        self.batch_server = batch_server
+        super().__init__(address, handler_class)
+
+
+class _JobRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("Requests must be JSON objects")
+            except ValueError as e:
+                response = {"status": "error", "error": "Invalid request: {}".format(e)}
+            else:
+                response = self.server.batch_server.handle_request(request)
+            self.wfile.write((json.dumps(response, default=str) + "\n").encode("utf-8"))
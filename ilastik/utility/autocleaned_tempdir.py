@@ -4,7 +4,7 @@ import shutil
 
 
 @contextlib.contextmanager
-def autocleaned_tempdir(autoclean=True):
+def autocleaned_tempdir(autoclean=True, dir=None):
     """
     Context manager.
     Creates a temporary directory upon entry, and removes it upon exit.
@@ -12,13 +12,15 @@ def autocleaned_tempdir(autoclean=True):
     Args:
         autoclean: For debugging purposes, it may sometimes be convenient
                     to inspect the temporary files after a test.
+        dir: Parent directory of the temporary directory
+             (defaults to the system's temporary directory).
 
     Example:
         with autocleaned_tempdir() as tmpdir_path:
             with open(tmpdir_path, 'w') as f:
                 f.write('Just testing here...')
     """
-    tmpdir = tempfile.mkdtemp()
+    tmpdir = tempfile.mkdtemp(dir=dir)
     try:
         yield tmpdir
     finally:
@@ -168,11 +168,17 @@ class Workflow(Operator):
         super(Workflow, self).__init__(parent=parent, graph=graph)
         self._shell = shell
         self._headless = headless
+        self._workflow_cmdline_args = list(workflow_cmdline_args or ())
 
     @property
     def shell(self):
         return self._shell
 
+    @property
+    def workflow_cmdline_args(self):
+        """The workflow arguments this workflow was started with (e.g. batch export settings and inputs)"""
+        return self._workflow_cmdline_args
+
     def cleanUp(self):
         """
         The user closed the project, so this workflow is being destroyed.
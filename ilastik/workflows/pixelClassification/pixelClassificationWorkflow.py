@@ -41,6 +41,7 @@ from ilastik.utility import SlotNameEnum
 
 from lazyflow.graph import Graph
 from lazyflow.roi import TinyVector, fullSlicing
+from lazyflow.utility.quantizedArray import PRECISIONS
 
 
 class PixelClassificationWorkflow(Workflow):
@@ -113,6 +114,20 @@ class PixelClassificationWorkflow(Workflow):
         parser.add_argument(
             "--label-proportion", help="Proportion of feature-pixels used to train the classifier.", type=float
         )
+        parser.add_argument(
+            "--feature-cache-precision",
+            help="Precision of the cached features used for prediction. Reduced precision lets more features fit "
+            "into the cache, check its effect on your project with bin/validate_feature_precision.py.",
+            choices=PRECISIONS,
+            default="full",
+        )
+        parser.add_argument(
+            "--coarse-prediction-tolerance",
+            help="Speed up headless prediction by predicting every 4th pixel first, and skipping the other pixels of "
+            "tiles whose coarse predictions agree with probabilities of at least 1 - tolerance (e.g. 0.05). "
+            "The skipped tiles are filled with the coarse prediction.",
+            type=float,
+        )
 
         # Parse the creation args: These were saved to the project file when this project was first created.
         parsed_creation_args, unused_args = parser.parse_known_args(project_creation_args)
@@ -128,6 +143,8 @@ class PixelClassificationWorkflow(Workflow):
         self.tree_count = parsed_args.tree_count
         self.variable_importance_path = parsed_args.variable_importance_path
         self.label_proportion = parsed_args.label_proportion
+        self.feature_cache_precision = parsed_args.feature_cache_precision
+        self.coarse_prediction_tolerance = parsed_args.coarse_prediction_tolerance
 
         data_instructions = (
             "Select your input data using the 'Raw Data' tab shown on the right.\n\n"
@@ -139,9 +156,12 @@ class PixelClassificationWorkflow(Workflow):
         opDataSelection = self.dataSelectionApplet.topLevelOperator
 
         self.featureSelectionApplet = self.createFeatureSelectionApplet()
+        self.featureSelectionApplet.topLevelOperator.CachePrecision.setValue(self.feature_cache_precision)
 
         self.pcApplet = self.createPixelClassificationApplet()
         opClassify = self.pcApplet.topLevelOperator
+        if self.coarse_prediction_tolerance is not None:
+            opClassify.CoarsePredictionTolerance.setValue(self.coarse_prediction_tolerance)
 
         self.dataExportApplet = PixelClassificationDataExportApplet(self, "Prediction Export")
         opDataExport = self.dataExportApplet.topLevelOperator
@@ -157,6 +177,7 @@ class PixelClassificationWorkflow(Workflow):
         self._applets.append(self.dataExportApplet)
 
         self.dataExportApplet.prepare_for_entire_export = self.prepare_for_entire_export
+        self.dataExportApplet.post_process_lane_export = self.post_process_lane_export
         self.dataExportApplet.post_process_entire_export = self.post_process_entire_export
 
         self.batchProcessingApplet = BatchProcessingApplet(
@@ -390,6 +411,22 @@ class PixelClassificationWorkflow(Workflow):
         self.freeze_status = self.pcApplet.topLevelOperator.FreezePredictions.value
         self.pcApplet.topLevelOperator.FreezePredictions.setValue(False)
 
+    def post_process_lane_export(self, lane_index):
+        """
+        Assigned to DataExportApplet.post_process_lane_export
+        (See above.)
+        """
+        if self.coarse_prediction_tolerance is None:
+            return
+        opPredict = self.pcApplet.topLevelOperator.opPredictionPipeline.getLane(lane_index).cacheless_predict
+        statistics = opPredict.coarsePredictionStatistics()
+        if statistics and statistics["tiles"]:
+            logger.info(
+                "Lane {}: skipped the full prediction of {} of {} tiles ({:.1%})".format(
+                    lane_index, statistics["skipped"], statistics["tiles"], statistics["skipped"] / statistics["tiles"]
+                )
+            )
+
     def post_process_entire_export(self):
         """
         Assigned to DataExportApplet.post_process_entire_export
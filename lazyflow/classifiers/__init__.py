@@ -10,7 +10,9 @@ from .parallelVigraRfLazyflowClassifier import (
     ParallelVigraRfLazyflowClassifier,
     ParallelVigraRfLazyflowClassifierFactory,
 )
+from .incrementalVigraRfLazyflowClassifier import IncrementalVigraRfLazyflowClassifierFactory
 from .sklearnLazyflowClassifier import SklearnLazyflowClassifier, SklearnLazyflowClassifierFactory
+from .compiledTreeEnsemble import CompiledTreeEnsemble, compileTreeEnsemble
 
 # Testing
 from .vigraRfPixelwiseClassifier import VigraRfPixelwiseClassifier, VigraRfPixelwiseClassifierFactory
@@ -0,0 +1,457 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Batched inference for trained random forests.
+
+The trees of a vigra or sklearn random forest are converted to flat node arrays
+(feature, threshold, children, leaf distributions), and all trees are evaluated
+for a whole feature matrix at once. With numba, the traversal is a compiled,
+parallel loop that releases the GIL; without numba, a (slower) numpy traversal
+is used.
+
+The probabilities are accumulated in the same order and with the same floating
+point types as vigra and sklearn do, so they are identical to those of the
+original classifier.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import weakref
+
+import h5py
+import numpy
+
+from lazyflow.request import RequestLock
+
+try:
+    import numba
+
+    WITH_NUMBA = True
+except ImportError:
+    WITH_NUMBA = False
+
+logger = logging.getLogger(__name__)
+
+# See vigra/random_forest/rf_nodeproxy.hxx
+_VIGRA_THRESHOLD_NODE = 0
+_VIGRA_CONST_PROB_NODE = 0x40000000
+
+
+class CompiledTreeEnsemble(object):
+    """
+    Flat representation of the trees of a random forest.
+
+    Node arrays (all trees concatenated):
+        feature, threshold: split of inner nodes
+        left, right: children of inner nodes (-1 for leaves)
+        value_index: row of leaf nodes in leaf_values (-1 for inner nodes)
+
+    A sample goes to the left child if its feature value is smaller than the threshold
+    (or equal to it, if inclusive_threshold is True, like in sklearn).
+
+    Trees are grouped into vigra forests (forest_bounds), whose probabilities are combined
+    like ParallelVigraRfLazyflowClassifier does (weight_forests) or taken as they are
+    (a single forest, like VigraRfLazyflowClassifier). If forest_bounds is None, all trees
+    are averaged like sklearn does.
+    """
+
+    # Rows per batch, bounds the (rows x trees) leaf index array
+    batch_size = 16384
+
+    def __init__(
+        self,
+        feature,
+        threshold,
+        left,
+        right,
+        value_index,
+        leaf_values,
+        roots,
+        feature_count,
+        inclusive_threshold=False,
+        forest_bounds=None,
+        weight_forests=True,
+        leaf_weights=None,
+    ):
+        self.feature = numpy.ascontiguousarray(feature, dtype=numpy.int32)
+        self.threshold = numpy.ascontiguousarray(threshold, dtype=numpy.float64)
+        self.left = numpy.ascontiguousarray(left, dtype=numpy.int32)
+        self.right = numpy.ascontiguousarray(right, dtype=numpy.int32)
+        self.value_index = numpy.ascontiguousarray(value_index, dtype=numpy.int32)
+        self.leaf_values = numpy.ascontiguousarray(leaf_values, dtype=numpy.float64)
+        self.roots = numpy.ascontiguousarray(roots, dtype=numpy.int32)
+        self.feature_count = feature_count
+        self.inclusive_threshold = inclusive_threshold
+        self.forest_bounds = forest_bounds
+        self.weight_forests = weight_forests
+        self.leaf_weights = leaf_weights
+
+    @property
+    def class_count(self):
+        return self.leaf_values.shape[1]
+
+    @property
+    def tree_count(self):
+        return len(self.roots)
+
+    def canPredict(self, X):
+        """
+        Checks whether X can be predicted by the ensemble. Otherwise, the original classifier
+        should be used (e.g. so that it reports the error for invalid data).
+        """
+        return X.ndim == 2 and X.shape[1] == self.feature_count and bool(numpy.isfinite(X).all())
+
+    def findLeaves(self, X):
+        """
+        Returns the (rows x trees) array of the leaf nodes the rows of X end up in.
+        """
+        X = numpy.ascontiguousarray(X, dtype=numpy.float32)
+        leaves = numpy.empty((len(X), self.tree_count), dtype=numpy.int32)
+        find_leaves = _findLeavesNumba if WITH_NUMBA else _findLeavesNumpy
+        find_leaves(
+            X, self.feature, self.threshold, self.left, self.right, self.roots, self.inclusive_threshold, leaves
+        )
+        return leaves
+
+    def predict_probabilities(self, X):
+        X = numpy.asarray(X, dtype=numpy.float32)
+        dtype = numpy.float64 if self.forest_bounds is None else numpy.float32
+        probabilities = numpy.empty((len(X), self.class_count), dtype=dtype)
+        for start in range(0, len(X), self.batch_size):
+            stop = min(start + self.batch_size, len(X))
+            leaves = self.findLeaves(X[start:stop])
+            if self.forest_bounds is None:
+                probabilities[start:stop] = self._averageTrees(leaves)
+            else:
+                probabilities[start:stop] = self._combineForests(leaves)
+        return probabilities
+
+    def _leafValues(self, leaves, tree):
+        return self.leaf_values[self.value_index[leaves[:, tree]]]
+
+    def _averageTrees(self, leaves):
+        # Like sklearn's ForestClassifier.predict_proba
+        probabilities = numpy.zeros((len(leaves), self.class_count), dtype=numpy.float64)
+        for tree in range(self.tree_count):
+            probabilities += self._leafValues(leaves, tree)
+        probabilities /= self.tree_count
+        return probabilities
+
+    def _combineForests(self, leaves):
+        if not self.weight_forests:
+            assert len(self.forest_bounds) == 1
+            return self._forestProbabilities(leaves, *self.forest_bounds[0])
+
+        # Like ParallelVigraRfLazyflowClassifier.predict_probabilities (in forest order)
+        total = None
+        for start, stop in self.forest_bounds:
+            probabilities = self._forestProbabilities(leaves, start, stop)
+            probabilities *= stop - start
+            if total is None:
+                total = probabilities
+            else:
+                total += probabilities
+        total /= self.tree_count
+        return total
+
+    def _forestProbabilities(self, leaves, start, stop):
+        # Like vigra's RandomForest::predictProbabilities:
+        # float32 accumulation of the leaf distributions, normalized by the total weight (accumulated as double)
+        probabilities = numpy.zeros((len(leaves), self.class_count), dtype=numpy.float32)
+        total_weight = numpy.zeros(len(leaves), dtype=numpy.float64)
+        for tree in range(start, stop):
+            values = self._leafValues(leaves, tree)
+            if self.leaf_weights is not None:
+                values = values * self.leaf_weights[self.value_index[leaves[:, tree]], None]
+            probabilities += values.astype(numpy.float32)
+            for c in range(self.class_count):
+                total_weight += values[:, c]
+        probabilities /= total_weight.astype(numpy.float32)[:, None]
+        return probabilities
+
+    @classmethod
+    def fromVigraForests(cls, forests, weight_forests=True):
+        """
+        Converts a list of vigra.learning.RandomForest objects, see weight_forests above.
+        Raises ValueError if the forests can't be converted.
+        """
+        tmpDir = tempfile.mkdtemp()
+        try:
+            # vigra doesn't expose the trees, but its hdf5 export does.
+            cachePath = os.path.join(tmpDir, "tmp_classifier_cache.h5").replace("\\", "/")
+            for i, forest in enumerate(forests):
+                forest.writeHDF5(cachePath, "Forest{:04d}".format(i))
+
+            builder = _EnsembleBuilder()
+            forest_bounds = []
+            feature_counts = set()
+            weighted = False
+            with h5py.File(cachePath, "r") as cacheFile:
+                for i in range(len(forests)):
+                    forest_group = cacheFile["Forest{:04d}".format(i)]
+                    options = forest_group.get("_options")
+                    if options is not None and "predict_weighted_" in options:
+                        weighted |= bool(numpy.asarray(options["predict_weighted_"]).ravel()[0])
+                    tree_names = sorted(
+                        (name for name in forest_group.keys() if name.startswith("Tree_")),
+                        key=lambda name: int(name[len("Tree_") :]),
+                    )
+                    start = builder.tree_count
+                    for name in tree_names:
+                        tree_group = forest_group[name]
+                        topology = tree_group["topology"][()]
+                        _addVigraTree(builder, topology, tree_group["parameters"][()])
+                        feature_counts.add(int(numpy.asarray(topology).ravel()[0]))
+                    forest_bounds.append((start, builder.tree_count))
+        finally:
+            shutil.rmtree(tmpDir, ignore_errors=True)
+
+        if len(feature_counts) != 1:
+            raise ValueError("Forests were trained with different features")
+        return builder.build(
+            inclusive_threshold=False,
+            feature_count=feature_counts.pop(),
+            forest_bounds=forest_bounds,
+            weight_forests=weight_forests,
+            weighted=weighted,
+        )
+
+    @classmethod
+    def fromSklearnForest(cls, sklearn_forest):
+        """
+        Converts a fitted sklearn RandomForestClassifier or ExtraTreesClassifier.
+        Raises ValueError if the forest can't be converted.
+        """
+        import sklearn
+
+        if sklearn_forest.n_outputs_ != 1:
+            raise ValueError("Only single-output forests are supported")
+        # Since sklearn 1.4, the tree values are class fractions, before they were counts
+        # that DecisionTreeClassifier.predict_proba normalized.
+        sklearn_version = tuple(int(v) for v in sklearn.__version__.split(".")[:2])
+        normalize = sklearn_version < (1, 4)
+        n_classes = sklearn_forest.n_classes_
+
+        builder = _EnsembleBuilder()
+        for estimator in sklearn_forest.estimators_:
+            tree = estimator.tree_
+            values = numpy.array(tree.value[:, 0, :n_classes], dtype=numpy.float64)
+            if normalize:
+                normalizer = values.sum(axis=1)[:, numpy.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                values /= normalizer
+            is_leaf = tree.children_left < 0
+            builder.addTree(
+                numpy.where(is_leaf, 0, tree.feature),
+                tree.threshold,
+                tree.children_left,
+                tree.children_right,
+                values,
+            )
+        return builder.build(inclusive_threshold=True, feature_count=sklearn_forest.n_features_in_)
+
+
+class _EnsembleBuilder(object):
+    def __init__(self):
+        self.features = []
+        self.thresholds = []
+        self.lefts = []
+        self.rights = []
+        self.values = []
+        self.weights = []
+        self.roots = []
+        self.num_nodes = 0
+
+    @property
+    def tree_count(self):
+        return len(self.roots)
+
+    def addTree(self, feature, threshold, left, right, values, weights=None):
+        """
+        Adds a tree given as node arrays with tree-local child indices (-1 for leaves),
+        values holds the distribution of each node (only the rows of leaves are used).
+        """
+        left = numpy.asarray(left)
+        right = numpy.asarray(right)
+        num_nodes = len(left)
+        if ((left >= num_nodes) | (right >= num_nodes) | ((left < 0) != (right < 0))).any():
+            raise ValueError("Invalid tree structure")
+        is_leaf = left < 0
+        self.features.append(numpy.asarray(feature))
+        self.thresholds.append(numpy.asarray(threshold))
+        self.lefts.append(numpy.where(is_leaf, -1, left + self.num_nodes))
+        self.rights.append(numpy.where(is_leaf, -1, right + self.num_nodes))
+        self.values.append(numpy.asarray(values)[is_leaf])
+        if weights is not None:
+            self.weights.append(numpy.asarray(weights)[is_leaf])
+        self.roots.append(self.num_nodes)
+        self.num_nodes += num_nodes
+
+    def build(self, inclusive_threshold, feature_count, forest_bounds=None, weight_forests=True, weighted=False):
+        if not self.roots:
+            raise ValueError("No trees")
+        left = numpy.concatenate(self.lefts)
+        is_leaf = left < 0
+        value_index = numpy.full(len(left), -1, dtype=numpy.int64)
+        value_index[is_leaf] = numpy.arange(is_leaf.sum())
+        feature = numpy.concatenate(self.features)
+        if (feature[~is_leaf] < 0).any() or (feature[~is_leaf] >= feature_count).any():
+            raise ValueError("Invalid split feature")
+        return CompiledTreeEnsemble(
+            feature,
+            numpy.concatenate(self.thresholds),
+            left,
+            numpy.concatenate(self.rights),
+            value_index,
+            numpy.concatenate(self.values),
+            self.roots,
+            feature_count,
+            inclusive_threshold=inclusive_threshold,
+            forest_bounds=forest_bounds,
+            weight_forests=weight_forests,
+            leaf_weights=numpy.concatenate(self.weights) if weighted else None,
+        )
+
+
+def _addVigraTree(builder, topology, parameters):
+    """
+    Adds a tree from vigra's hdf5 export (see vigra/random_forest/rf_nodeproxy.hxx):
+    topology starts with the feature and class count, followed by the nodes
+    [type, parameter address, left child, right child, column] (inner nodes) or
+    [type, parameter address] (leaves); the parameters of a node are its weight,
+    followed by the threshold (inner nodes) or the class distribution (leaves).
+    """
+    topology = numpy.asarray(topology).ravel().astype(numpy.int64)
+    parameters = numpy.asarray(parameters).ravel().astype(numpy.float64)
+    class_count = int(topology[1])
+
+    node_ids = {}  # topology index -> local node id
+    nodes = []
+    stack = [2]
+    while stack:
+        index = stack.pop()
+        node_ids[index] = len(nodes)
+        node_type = topology[index]
+        address = topology[index + 1]
+        if node_type == _VIGRA_THRESHOLD_NODE:
+            left, right = int(topology[index + 2]), int(topology[index + 3])
+            nodes.append((int(topology[index + 4]), parameters[address + 1], left, right, None, None))
+            stack += [right, left]
+        elif node_type == _VIGRA_CONST_PROB_NODE:
+            distribution = parameters[address + 1 : address + 1 + class_count]
+            if len(distribution) != class_count:
+                raise ValueError("Invalid leaf")
+            nodes.append((0, 0.0, None, None, distribution, parameters[address]))
+        else:
+            raise ValueError("Unsupported vigra node type {}".format(node_type))
+
+    values = numpy.zeros((len(nodes), class_count))
+    weights = numpy.zeros(len(nodes))
+    left = numpy.full(len(nodes), -1)
+    right = numpy.full(len(nodes), -1)
+    for i, (_, _, left_index, right_index, distribution, weight) in enumerate(nodes):
+        if distribution is None:
+            left[i] = node_ids[left_index]
+            right[i] = node_ids[right_index]
+        else:
+            values[i] = distribution
+            weights[i] = weight
+    builder.addTree([n[0] for n in nodes], [n[1] for n in nodes], left, right, values, weights)
+
+
+def _findLeavesNumpy(X, feature, threshold, left, right, roots, inclusive_threshold, leaves):
+    nodes = numpy.repeat(roots[numpy.newaxis, :], len(X), axis=0)
+    rows, trees = numpy.nonzero(left[nodes] >= 0)
+    while len(rows):
+        active_nodes = nodes[rows, trees]
+        values = X[rows, feature[active_nodes]].astype(numpy.float64)
+        if inclusive_threshold:
+            go_left = values <= threshold[active_nodes]
+        else:
+            go_left = values < threshold[active_nodes]
+        active_nodes = numpy.where(go_left, left[active_nodes], right[active_nodes])
+        nodes[rows, trees] = active_nodes
+        still_active = left[active_nodes] >= 0
+        rows = rows[still_active]
+        trees = trees[still_active]
+    leaves[...] = nodes
+
+
+if WITH_NUMBA:
+
+    @numba.njit(parallel=True, nogil=True, cache=True)
+    def _findLeavesNumba(X, feature, threshold, left, right, roots, inclusive_threshold, leaves):
+        for row in numba.prange(X.shape[0]):
+            for tree in range(roots.shape[0]):
+                node = roots[tree]
+                while left[node] >= 0:
+                    value = numpy.float64(X[row, feature[node]])
+                    if value < threshold[node] or (inclusive_threshold and value == threshold[node]):
+                        node = left[node]
+                    else:
+                        node = right[node]
+                leaves[row, tree] = node
+
+
+_compiled_ensembles = weakref.WeakKeyDictionary()
+_compiled_ensembles_lock = RequestLock()
+
+
+def compileTreeEnsemble(classifier):
+    """
+    Returns the CompiledTreeEnsemble of a lazyflow classifier, or None if the classifier
+    isn't a supported random forest. Results are cached per classifier object.
+    """
+    with _compiled_ensembles_lock:
+        try:
+            return _compiled_ensembles[classifier]
+        except KeyError:
+            pass
+        except TypeError:
+            return None  # Not weak-referenceable
+
+        ensemble = None
+        try:
+            ensemble = _compile(classifier)
+        except Exception:
+            logger.warning("Could not compile {}, using its own prediction".format(type(classifier).__name__))
+            logger.debug("", exc_info=True)
+        _compiled_ensembles[classifier] = ensemble
+        return ensemble
+
+
+def _compile(classifier):
+    # Late imports to avoid a circular dependency
+    from .parallelVigraRfLazyflowClassifier import ParallelVigraRfLazyflowClassifier
+    from .vigraRfLazyflowClassifier import VigraRfLazyflowClassifier
+    from .sklearnLazyflowClassifier import SklearnLazyflowClassifier
+
+    if type(classifier) is ParallelVigraRfLazyflowClassifier:
+        return CompiledTreeEnsemble.fromVigraForests(classifier._forests)
+    if type(classifier) is VigraRfLazyflowClassifier:
+        return CompiledTreeEnsemble.fromVigraForests([classifier._vigra_rf], weight_forests=False)
+    if type(classifier) is SklearnLazyflowClassifier:
+        sklearn_classifier = classifier._sklearn_classifier
+        if type(sklearn_classifier).__name__ in ("RandomForestClassifier", "ExtraTreesClassifier"):
+            return CompiledTreeEnsemble.fromSklearnForest(sklearn_classifier)
+    return None
@@ -0,0 +1,233 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+import hashlib
+import logging
+import threading
+from functools import partial
+
+import numpy
+import vigra
+
+from lazyflow.request import Request
+from lazyflow.utility import OrderedSignal
+from .lazyflowClassifier import LazyflowVectorwiseClassifierFactoryABC
+from .parallelVigraRfLazyflowClassifier import (
+    ParallelVigraRfLazyflowClassifierFactory,
+    ParallelVigraRfLazyflowClassifier,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalVigraRfLazyflowClassifierFactory(LazyflowVectorwiseClassifierFactoryABC):
+    """
+    Trains an RF as a forest-of-forests (like ParallelVigraRfLazyflowClassifierFactory), but keeps
+    the forests between trainings: when the training data changes, only the oldest forests are
+    retrained with the new data, the others are reused.
+
+    Since the kept forests were trained on older data, all forests are retrained in the background
+    after every full_rebuild_interval incremental updates. When the rebuild is done, the factory
+    fires classifierChanged, so that operators can mark their classifier dirty and request the
+    rebuilt classifier (which is returned without training for unchanged training data).
+
+    A full (synchronous) training is done for the first training and whenever the label classes
+    or the features change.
+
+    The factory is stateful. Only its parameters are pickled and compared, not the trained forests.
+    """
+
+    VERSION = 1  # This is used to determine compatibility of pickled classifier factories.
+    # You must bump this if any instance members are added/removed/renamed.
+
+    def __init__(
+        self, num_trees_total=100, num_forests=None, retrain_fraction=0.25, full_rebuild_interval=10, **kwargs
+    ):
+        """
+        num_trees_total: The number of trees to train
+
+        num_forests: How many forests in which to distribute the trees. Forests are the unit of retraining,
+                     so there should be more forests than for the parallel factory.
+                     If not provided, four forests per lazyflow worker thread are used.
+
+        retrain_fraction: The fraction of forests retrained for each update of the training data
+
+        full_rebuild_interval: Start retraining all forests in the background after this many incremental updates
+
+        kwargs: Additional keyword args, passed directly to the vigra.RandomForest constructor.
+        """
+        assert 0.0 < retrain_fraction <= 1.0
+        self._num_trees = num_trees_total
+        self._num_forests = max(1, min(num_trees_total, num_forests or 4 * Request.global_thread_pool.num_workers))
+        self._retrain_fraction = retrain_fraction
+        self._full_rebuild_interval = full_rebuild_interval
+        self._kwargs = kwargs
+        self._init_training_state()
+
+    def _init_training_state(self):
+        self.classifierChanged = OrderedSignal()
+        self._lock = threading.Lock()
+        self._forests = []  # oldest first
+        self._oobs = []
+        self._training_key = None  # known labels and feature names of the current forests
+        self._training_set_digest = None
+        self._classifier = None
+        self._updates_since_rebuild = 0
+        self._generation = 0  # Incremented whenever the forests are replaced
+        self._rebuild_running = False
+
+    def __getstate__(self):
+        return {
+            "VERSION": self.VERSION,
+            "_num_trees": self._num_trees,
+            "_num_forests": self._num_forests,
+            "_retrain_fraction": self._retrain_fraction,
+            "_full_rebuild_interval": self._full_rebuild_interval,
+            "_kwargs": self._kwargs,
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_training_state()
+
+    def set_num_trees(self, num_trees_total):
+        self._num_trees = num_trees_total
+        with self._lock:
+            self._training_key = None  # Next training is a full training
+
+    def create_and_train(self, X, y, feature_names=None):
+        X = numpy.asarray(X, numpy.float32)
+        y = numpy.asarray(y, numpy.uint32)
+        if y.ndim == 1:
+            y = y[:, numpy.newaxis]
+        assert X.ndim == 2
+        assert len(X) == len(y)
+
+        known_labels = numpy.unique(y)
+        training_key = (tuple(known_labels), X.shape[1], tuple(feature_names or ()))
+        sha = hashlib.sha1(numpy.ascontiguousarray(X))
+        sha.update(numpy.ascontiguousarray(y))
+        digest = sha.hexdigest()
+
+        with self._lock:
+            if training_key == self._training_key and digest == self._training_set_digest:
+                logger.debug("Training data unchanged, reusing the current forests")
+                return self._classifier
+            full_training = training_key != self._training_key
+            forests = list(self._forests)
+            oobs = list(self._oobs)
+            generation = self._generation
+
+        if full_training:
+            logger.debug("Training incremental vigra RF from scratch")
+            forests = self._new_forests(self._num_trees)
+            oobs = ParallelVigraRfLazyflowClassifierFactory._train_forests(forests, X, y)
+        else:
+            num_retrain = max(1, int(round(self._retrain_fraction * len(forests))))
+            logger.debug("Retraining {} of {} forests".format(num_retrain, len(forests)))
+            retrained = [vigra.learning.RandomForest(f.treeCount(), **self._kwargs) for f in forests[:num_retrain]]
+            retrained_oobs = ParallelVigraRfLazyflowClassifierFactory._train_forests(retrained, X, y)
+            forests = forests[num_retrain:] + retrained
+            oobs = oobs[num_retrain:] + retrained_oobs
+
+        classifier = ParallelVigraRfLazyflowClassifier(forests, oobs, known_labels, feature_names)
+        start_rebuild = False
+        with self._lock:
+            if full_training or generation == self._generation:
+                self._forests = forests
+                self._oobs = oobs
+                self._training_key = training_key
+                self._training_set_digest = digest
+                self._classifier = classifier
+                self._generation += 1
+                self._updates_since_rebuild = 0 if full_training else self._updates_since_rebuild + 1
+                start_rebuild = self._updates_since_rebuild >= self._full_rebuild_interval and not self._rebuild_running
+                self._rebuild_running |= start_rebuild
+            rebuild_generation = self._generation
+
+        if start_rebuild:
+            req = Request(partial(self._rebuild, X, y, known_labels, feature_names, rebuild_generation))
+            req.submit()
+
+        logger.info("Training complete. Average OOB: {}".format(numpy.average(oobs)))
+        return classifier
+
+    def _new_forests(self, num_trees):
+        # Distribute trees as evenly as possible
+        tree_counts = [num_trees // self._num_forests] * self._num_forests
+        for i in range(num_trees % self._num_forests):
+            tree_counts[i] += 1
+        return [vigra.learning.RandomForest(count, **self._kwargs) for count in tree_counts if count > 0]
+
+    def _rebuild(self, X, y, known_labels, feature_names, generation):
+        """
+        Retrain all forests with the given training data and install them if the forests were not
+        changed in the meantime. Runs in the background.
+        """
+        logger.debug("Rebuilding incremental vigra RF in the background")
+        try:
+            forests = self._new_forests(self._num_trees)
+            oobs = ParallelVigraRfLazyflowClassifierFactory._train_forests(forests, X, y)
+        except Exception:
+            with self._lock:
+                self._rebuild_running = False
+            raise
+
+        with self._lock:
+            self._rebuild_running = False
+            installed = generation == self._generation
+            if installed:
+                self._forests = forests
+                self._oobs = oobs
+                self._classifier = ParallelVigraRfLazyflowClassifier(forests, oobs, known_labels, feature_names)
+                self._generation += 1
+                self._updates_since_rebuild = 0
+
+        if installed:
+            logger.info("Background rebuild complete. Average OOB: {}".format(numpy.average(oobs)))
+            self.classifierChanged()
+        else:
+            # The training data changed during the rebuild.
+            # The next incremental update starts another rebuild.
+            logger.debug("Discarding outdated background rebuild")
+
+    def estimated_ram_usage_per_requested_predictionchannel(self):
+        return (Request.global_thread_pool.num_workers) * 4
+
+    @property
+    def description(self):
+        return "Incremental Vigra Random Forest Factory ({} trees total)".format(self._num_trees)
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, type(self))
+            and self._num_trees == other._num_trees
+            and self._num_forests == other._num_forests
+            and self._retrain_fraction == other._retrain_fraction
+            and self._full_rebuild_interval == other._full_rebuild_interval
+            and self._kwargs == other._kwargs
+        )
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+assert issubclass(IncrementalVigraRfLazyflowClassifierFactory, LazyflowVectorwiseClassifierFactoryABC)
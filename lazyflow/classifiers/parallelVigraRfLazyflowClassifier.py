@@ -45,7 +45,7 @@ import h5py
 import random
 
 from lazyflow.utility import Timer
-from lazyflow.request import Request, RequestPool, RequestLock
+from lazyflow.request import Request, RequestPool
 from .lazyflowClassifier import LazyflowVectorwiseClassifierABC, LazyflowVectorwiseClassifierFactoryABC
 
 import logging
@@ -341,30 +341,26 @@ class ParallelVigraRfLazyflowClassifier(LazyflowVectorwiseClassifierABC):
                 X.shape[1], len(self._feature_names), self._feature_names
             )
 
-        # As each forest completes, aggregate results in a shared array.
-        # (Must put in a list so we can update it in this closure.)
-        total_predictions = [None]
-        prediction_lock = RequestLock()
+        # Create a request for each forest
+        forest_predictions = [None] * len(self._forests)
 
-        def update_predictions(forest, forest_predictions):
-            forest_predictions *= forest.treeCount()
-            with prediction_lock:
-                if total_predictions[0] is None:
-                    total_predictions[0] = forest_predictions
-                else:
-                    total_predictions[0] += forest_predictions
+        def predict_forest(i, forest):
+            predictions = forest.predictProbabilities(X)
+            predictions *= forest.treeCount()
+            forest_predictions[i] = predictions
 
-        # Create a request for each forest
         pool = RequestPool()
-        for forest in self._forests:
-            req = Request(partial(forest.predictProbabilities, X))
-            req.notify_finished(partial(update_predictions, forest))
-            pool.add(req)
-        del req
+        for i, forest in enumerate(self._forests):
+            pool.add(Request(partial(predict_forest, i, forest)))
         pool.wait()
 
-        total_predictions[0] /= self._num_trees
-        return total_predictions[0]
+        # Aggregate the results in forest order, so that the (float32) sum doesn't depend on
+        # the order in which the forests completed.
+        total_predictions = forest_predictions[0]
+        for predictions in forest_predictions[1:]:
+            total_predictions += predictions
+        total_predictions /= self._num_trees
+        return total_predictions
 
     @property
     def oobs(self):
@@ -1,7 +1,6 @@
-from mpi4py import MPI
-import enum
-from typing import Iterable, TypeVar, Generic, Callable, Tuple
-import uuid
+import abc
+import itertools
+from typing import Iterable, TypeVar, Generic, Callable, Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,91 +10,99 @@ COMMAND_STOP_WORKER = "COMMAND_STOP_WORKER-eb23ae13-709e-4ac3-931d-99ab059ef0c2"
 UNIT_OF_WORK = TypeVar("UNIT_OF_WORK")
 
 
-@enum.unique
-class Tags(enum.IntEnum):
-    """Tags are arbitrary ints used to identify the type/purpose of a message in MPI"""
+class Transport(abc.ABC, Generic[UNIT_OF_WORK]):
+    """How the orchestrating process (rank 0) and the worker processes (ranks 1..num_workers) exchange units of work.
 
-    TASK_DONE = 1  # workers send messages tagged with TASK_DONE when they finished processing a unit of work
-    WORK = enum.auto()  # units of work are tagged with "WORK" and sent to workers for processing
+    See MPITransport (lazyflow.distributed.mpiTransport) and LocalTransport (lazyflow.distributed.localTransport)
+    """
+
+    rank: int
+    num_workers: int
+
+    @abc.abstractmethod
+    def send_work(self, unit_of_work: UNIT_OF_WORK):
+        """Orchestrator: hand a unit of work to a worker. Only called while fewer than num_workers units are pending"""
 
+    @abc.abstractmethod
+    def send_stop(self):
+        """Orchestrator: send COMMAND_STOP_WORKER to every worker, exactly once. Only called while no unit is pending"""
 
-class _Worker(Generic[UNIT_OF_WORK]):
-    """A representation of a remote worker"""
+    @abc.abstractmethod
+    def recv_done(self) -> UNIT_OF_WORK:
+        """Orchestrator: wait until a worker has finished processing a unit of work, and return that unit"""
 
-    def __init__(self, comm, rank: int):
-        self.comm = comm  # MPI communication channel
-        self.rank = rank  # mpi worker rank, analogous to a worker ID
-        self.stopped = False
+    @abc.abstractmethod
+    def recv_work(self) -> UNIT_OF_WORK:
+        """Worker: wait for the next unit of work (or COMMAND_STOP_WORKER)"""
 
-    def send(self, unit_of_work: UNIT_OF_WORK):
-        logger.debug(f"Sending unit_of_work {unit_of_work} to worker {self.rank}...")
-        self.comm.send(unit_of_work, dest=self.rank, tag=Tags.WORK)
+    @abc.abstractmethod
+    def send_done(self, unit_of_work: UNIT_OF_WORK):
+        """Worker: report that unit_of_work has been processed"""
 
-    def stop(self):
-        self.send(COMMAND_STOP_WORKER)
-        self.stopped = True
+    def close(self):
+        """Release the resources of the transport, e.g. wait for worker processes to exit"""
 
 
 class TaskOrchestrator(Generic[UNIT_OF_WORK]):
-    """Coordinates work amongst MPI processes.
+    """Coordinates work amongst processes.
 
-    In order to use this class, applications must be launched with mpirun: e.g.: mpirun -N <num_workers> ilastik.py
+    By default, processes communicate via MPI, so applications must be launched with mpirun:
+    e.g.: mpirun -N <num_workers> ilastik.py
     """
 
-    def __init__(self, comm=None):
-        self.comm = comm or MPI.COMM_WORLD
-        self.rank = self.comm.Get_rank()
-        num_workers = self.comm.size - 1
-        if num_workers <= 0:
-            raise ValueError("Trying to orchestrate tasks with {num_workers} workers")
-        self.workers = {rank: _Worker(self.comm, rank) for rank in range(1, num_workers + 1)}
+    def __init__(self, transport: Optional[Transport[UNIT_OF_WORK]] = None):
+        if transport is None:
+            from lazyflow.distributed.mpiTransport import MPITransport
 
-    def _get_finished_worker(self) -> _Worker[UNIT_OF_WORK]:
-        status = MPI.Status()
-        self.comm.recv(source=MPI.ANY_SOURCE, tag=Tags.TASK_DONE, status=status)
-        return self.workers[status.Get_source()]
+            transport = MPITransport()
+        self.transport = transport
+        self.rank = transport.rank
+        if transport.num_workers <= 0:
+            raise ValueError(f"Trying to orchestrate tasks with {transport.num_workers} workers")
 
-    def orchestrate(self, work_units: Iterable[UNIT_OF_WORK]):
-        """Sends work units from work_units to workers as they become free. Usually ran in the process with mpi rank 0
+    def orchestrate(
+        self, work_units: Iterable[UNIT_OF_WORK], on_done: Optional[Callable[[UNIT_OF_WORK], None]] = None
+    ):
+        """Sends work units from work_units to workers as they become free. Usually ran in the process with rank 0
 
         Blocks until all work units have been consumed and processed by the workers.
-        Automatically terminates all workers when all work units have been consumed."""
+        Automatically terminates all workers when all work units have been consumed.
+        If given, on_done is called with every work unit that a worker has finished processing."""
 
-        logger.info(f"ORCHESTRATOR: Starting orchestration of {len(self.workers)}...")
+        logger.info(f"ORCHESTRATOR: Starting orchestration of {self.transport.num_workers}...")
+        work_units = iter(work_units)
         num_busy_workers = 0
-        for worker in self.workers.values():
-            try:
-                worker.send(next(work_units))
+        for unit_of_work in itertools.islice(work_units, self.transport.num_workers):
+            self.transport.send_work(unit_of_work)
+            num_busy_workers += 1
+
+        while num_busy_workers > 0:
+            finished = self.transport.recv_done()
+            num_busy_workers -= 1
+            if on_done is not None:
+                on_done(finished)
+            for unit_of_work in itertools.islice(work_units, 1):
+                self.transport.send_work(unit_of_work)
                 num_busy_workers += 1
-            except StopIteration:
-                break
 
-        while True:
-            worker = self._get_finished_worker()
-            try:
-                worker.send(next(work_units))
-            except StopIteration:
-                worker.stop()
-                num_busy_workers -= 1
-                if num_busy_workers == 0:
-                    break
-
-        for worker in self.workers.values():
-            if not worker.stopped:
-                worker.stop()
+        # Every worker ends this round, before it can receive work of the next one
+        self.transport.send_stop()
 
     def start_as_worker(self, target: Callable[[UNIT_OF_WORK, int], None]):
         """Synchronously runs 'target' on every work unit passed in by the orchestrating intance of this class
-        (usually the process with mpi rank == 0, which should be executing the 'orchestrate' method)
+        (usually the process with rank == 0, which should be executing the 'orchestrate' method)
 
         Blocks until the orchestrator version of this object sends the termination command COMMAND_STOP_WORKER
         """
 
         logger.info(f"WORKER {self.rank}: Started")
         while True:
-            status = MPI.Status()
-            unit_of_work = self.comm.recv(source=MPI.ANY_SOURCE, tag=Tags.WORK, status=status)
+            unit_of_work = self.transport.recv_work()
             if unit_of_work == COMMAND_STOP_WORKER:
                 break
-            self.comm.send(target(unit_of_work, self.rank), dest=status.Get_source(), tag=Tags.TASK_DONE)
+            target(unit_of_work, self.rank)
+            self.transport.send_done(unit_of_work)
         logger.info(f"WORKER {self.rank}: Terminated")
+
+    def close(self):
+        self.transport.close()
@@ -0,0 +1,109 @@
+import logging
+import multiprocessing
+import os
+import queue
+from typing import Callable, Optional
+
+import psutil
+
+from lazyflow.distributed.TaskOrchestrator import COMMAND_STOP_WORKER, Transport
+
+logger = logging.getLogger(__name__)
+
+# In worker processes: (rank, work queue of the worker, done queue)
+_worker_context = None
+
+
+def _worker_main(rank, num_workers, work_queue, done_queue, worker_main):
+    global _worker_context
+    _worker_context = (rank, work_queue, done_queue)
+
+    # The workers share the machine, unless configured otherwise
+    os.environ.setdefault("LAZYFLOW_THREADS", str(max(1, (os.cpu_count() or 1) // num_workers)))
+    os.environ.setdefault("LAZYFLOW_TOTAL_RAM_MB", str(psutil.virtual_memory().total // 1024**2 // num_workers))
+
+    worker_main()
+
+
+class LocalTransport(Transport):
+    """Exchanges units of work with worker processes on this machine, without MPI.
+
+    Constructed in the orchestrating process (rank 0), it starts num_workers processes (with multiprocessing's
+    "spawn" method), which call worker_main.  worker_main is expected to set up the same work as the orchestrator
+    (e.g. load the same project), construct a LocalTransport in turn, and call TaskOrchestrator.start_as_worker.
+    In the worker processes, LocalTransport is the worker end of the transport (ranks 1..num_workers),
+    and worker_main is ignored.
+
+    Like MPITransport, the orchestrator sends every unit of work to an idle worker, through a queue of its own.
+    So each worker receives the COMMAND_STOP_WORKER that ends a round of orchestrate exactly once,
+    and no worker takes units of work of the next round before it has finished the current one.
+    Unless LAZYFLOW_THREADS or LAZYFLOW_TOTAL_RAM_MB are set, each worker uses its share of the cores and the RAM.
+    """
+
+    # Seconds between checks that the other end of the transport is still alive
+    POLL_INTERVAL = 1.0
+    # Seconds to wait for workers to exit on close, before they are terminated
+    CLOSE_TIMEOUT = 60.0
+
+    def __init__(self, num_workers: int, worker_main: Optional[Callable[[], None]] = None):
+        self.num_workers = num_workers
+        self._processes = []
+        if _worker_context is not None:
+            self.rank, self._work_queue, self._done_queue = _worker_context
+            return
+
+        assert worker_main is not None, "The orchestrating process needs a worker_main to start workers with"
+        context = multiprocessing.get_context("spawn")
+        self.rank = 0
+        self._work_queues = {rank: context.Queue() for rank in range(1, num_workers + 1)}
+        self._done_queue = context.Queue()
+        # Ranks of the workers that wait for a unit of work
+        self._idle_workers = list(range(num_workers, 0, -1))
+        for rank, work_queue in self._work_queues.items():
+            process = context.Process(
+                target=_worker_main,
+                args=(rank, num_workers, work_queue, self._done_queue, worker_main),
+                name=f"lazyflow distributed worker #{rank}",
+            )
+            process.start()
+            self._processes.append(process)
+
+    def send_work(self, unit_of_work):
+        rank = self._idle_workers.pop()
+        logger.debug(f"Sending unit_of_work {unit_of_work} to worker {rank}...")
+        self._work_queues[rank].put(unit_of_work)
+
+    def send_stop(self):
+        for work_queue in self._work_queues.values():
+            work_queue.put(COMMAND_STOP_WORKER)
+
+    def recv_done(self):
+        while True:
+            try:
+                rank, unit_of_work = self._done_queue.get(timeout=self.POLL_INTERVAL)
+                self._idle_workers.append(rank)
+                return unit_of_work
+            except queue.Empty:
+                failed = [p.name for p in self._processes if p.exitcode not in (None, 0)]
+                if failed or not any(p.is_alive() for p in self._processes):
+                    raise RuntimeError(f"Worker processes exited before finishing their work: {failed}")
+
+    def recv_work(self):
+        while True:
+            try:
+                return self._work_queue.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                if not multiprocessing.parent_process().is_alive():
+                    raise RuntimeError("The orchestrating process has exited")
+
+    def send_done(self, unit_of_work):
+        self._done_queue.put((self.rank, unit_of_work))
+
+    def close(self):
+        for process in self._processes:
+            process.join(self.CLOSE_TIMEOUT)
+            if process.is_alive():
+                logger.warning(f"Terminating {process.name}")
+                process.terminate()
+                process.join()
+        self._processes = []
@@ -0,0 +1,50 @@
+from mpi4py import MPI
+import enum
+import logging
+
+from lazyflow.distributed.TaskOrchestrator import COMMAND_STOP_WORKER, Transport
+
+logger = logging.getLogger(__name__)
+
+
+@enum.unique
+class Tags(enum.IntEnum):
+    """Tags are arbitrary ints used to identify the type/purpose of a message in MPI"""
+
+    TASK_DONE = 1  # workers send messages tagged with TASK_DONE when they finished processing a unit of work
+    WORK = enum.auto()  # units of work are tagged with "WORK" and sent to workers for processing
+
+
+class MPITransport(Transport):
+    """Exchanges units of work among MPI processes. The process with mpi rank 0 is the orchestrator.
+
+    In order to use this class, applications must be launched with mpirun: e.g.: mpirun -N <num_workers> ilastik.py
+    """
+
+    def __init__(self, comm=None):
+        self.comm = comm or MPI.COMM_WORLD  # MPI communication channel
+        self.rank = self.comm.Get_rank()
+        self.num_workers = self.comm.size - 1
+        # Orchestrator: ranks of the workers that wait for a unit of work
+        self._idle_workers = list(range(self.num_workers, 0, -1))
+
+    def send_work(self, unit_of_work):
+        rank = self._idle_workers.pop()
+        logger.debug(f"Sending unit_of_work {unit_of_work} to worker {rank}...")
+        self.comm.send(unit_of_work, dest=rank, tag=Tags.WORK)
+
+    def send_stop(self):
+        for rank in range(1, self.num_workers + 1):
+            self.comm.send(COMMAND_STOP_WORKER, dest=rank, tag=Tags.WORK)
+
+    def recv_done(self):
+        status = MPI.Status()
+        unit_of_work = self.comm.recv(source=MPI.ANY_SOURCE, tag=Tags.TASK_DONE, status=status)
+        self._idle_workers.append(status.Get_source())
+        return unit_of_work
+
+    def recv_work(self):
+        return self.comm.recv(source=0, tag=Tags.WORK)
+
+    def send_done(self, unit_of_work):
+        self.comm.send(unit_of_work, dest=0, tag=Tags.TASK_DONE)
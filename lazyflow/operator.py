@@ -30,6 +30,7 @@ from contextlib import contextmanager
 from traceback import walk_tb, FrameSummary, format_list
 
 # lazyflow
+from lazyflow.request import Request, processPool
 from lazyflow.slot import InputSlot, OutputSlot, Slot
 
 
@@ -487,6 +488,22 @@ class Operator(metaclass=OperatorMetaClass):
         wrapper.__wrapped__ = func  # Emulate python 3 behavior of @wraps
         return wrapper
 
+    @staticmethod
+    def runInProcessPool(func):
+        """Use this decorator with static methods that do GIL-bound work
+        on numpy arrays, e.g. the compute kernel called by execute().
+
+        - If a lazyflow process pool is configured, the function runs in
+          a worker process; arrays are passed through shared memory.
+
+        - Otherwise, it is simply called in the current thread.
+
+        The function must not access the operator or its slots.
+        See :mod:`lazyflow.request.processPool`.
+
+        """
+        return processPool.runInProcessPool(func)
+
     def _setupOutputs(self):
         # Don't setup this operator if there are currently
         # requests on it.
@@ -593,6 +610,9 @@ class Operator(metaclass=OperatorMetaClass):
             )
 
     def call_execute(self, slot, subindex, roi, result, **kwargs):
+        tracer = Request._tracer
+        if tracer is not None:
+            record = tracer.begin_execute(self, slot, roi)
         try:
             # We are executing the operator. Incremement the execution
             # count to protect against simultaneous setupOutputs()
@@ -601,6 +621,8 @@ class Operator(metaclass=OperatorMetaClass):
             return self.execute(slot, subindex, roi, result, **kwargs)
         finally:
             self._decrementOperatorExecutionCount()
+            if tracer is not None:
+                tracer.end_execute(record, result)
 
     def execute(self, slot, subindex, roi, result):
         """This method of the operator is called when a connected
@@ -32,6 +32,7 @@ from .classifierOperators import (
 )
 from .filterOperators import (
     OpBaseFilter,
+    OpDerivativeFeatures,
     OpDifferenceOfGaussians,
     OpGaussianGradientMagnitude,
     OpGaussianSmoothing,
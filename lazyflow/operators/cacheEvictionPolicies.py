@@ -0,0 +1,194 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Eviction policies for the cache memory manager
+
+A policy keeps an incrementally updated index of all cache entries the
+memory manager knows about and decides which entry is released next
+when the caches exceed their memory budget. Entries are identified by
+arbitrary hashable keys and carry a size (bytes) and a recompute cost
+(seconds it took to compute the entry).
+
+Policies are not thread safe, the memory manager serializes all calls.
+"""
+
+import collections
+import heapq
+import itertools
+from abc import ABC, abstractmethod
+
+
+class EvictionPolicy(ABC):
+    """
+    Interface for cache eviction policies
+    """
+
+    @abstractmethod
+    def add(self, key, size, cost=0.0):
+        """
+        record that an entry was stored (or replaced)
+
+        size is given in bytes, cost in seconds needed to compute the entry
+        """
+
+    @abstractmethod
+    def touch(self, key):
+        """
+        record an access to an existing entry; unknown keys are ignored
+        """
+
+    @abstractmethod
+    def remove(self, key):
+        """
+        forget about an entry; unknown keys are ignored
+        """
+
+    @abstractmethod
+    def pop(self):
+        """
+        remove the next entry to evict from the index and return its key
+
+        @return None if the index is empty
+        """
+
+    @abstractmethod
+    def __len__(self):
+        pass
+
+
+class LRUPolicy(EvictionPolicy):
+    """
+    evict the least recently used entry first, ignoring size and cost
+    """
+
+    def __init__(self):
+        self._entries = collections.OrderedDict()
+
+    def add(self, key, size, cost=0.0):
+        self._entries[key] = None
+        self._entries.move_to_end(key)
+
+    def touch(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+
+    def remove(self, key):
+        self._entries.pop(key, None)
+
+    def pop(self):
+        if not self._entries:
+            return None
+        key, _ = self._entries.popitem(last=False)
+        return key
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class GreedyDualSizePolicy(EvictionPolicy):
+    """
+    GreedyDual-Size eviction (Cao and Irani, 1997)
+
+    Every entry gets the priority ``L + cost / size`` whenever it is stored
+    or accessed, the entry with the lowest priority is evicted first and
+    the inflation value ``L`` is raised to the priority of the evicted
+    entry. Entries that are expensive to recompute per byte thus survive
+    longer, while entries that are not accessed anymore age out as ``L``
+    grows. If all costs are equal to zero this degenerates to LRU.
+
+    The priorities are kept in a heap with lazy deletion, so stores,
+    accesses and evictions are O(log n).
+    """
+
+    def __init__(self):
+        self._inflation = 0.0
+        self._heap = []
+        # key -> (priority, sequence number, size, cost)
+        self._entries = {}
+        self._sequence = itertools.count()
+
+    def _credit(self, size, cost):
+        return cost / max(size, 1)
+
+    def _push(self, key, size, cost):
+        priority = self._inflation + self._credit(size, cost)
+        seq = next(self._sequence)
+        self._entries[key] = (priority, seq, size, cost)
+        # the sequence number is unique, keys never get compared
+        heapq.heappush(self._heap, (priority, seq, key))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._compact()
+
+    def _compact(self):
+        self._heap = [(priority, seq, key) for key, (priority, seq, _, _) in self._entries.items()]
+        heapq.heapify(self._heap)
+
+    def add(self, key, size, cost=0.0):
+        self._push(key, size, cost)
+
+    def touch(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._push(key, entry[2], entry[3])
+
+    def remove(self, key):
+        self._entries.pop(key, None)
+
+    def pop(self):
+        while self._heap:
+            priority, seq, key = heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != seq:
+                # stale heap item, the entry was removed or re-prioritized
+                continue
+            del self._entries[key]
+            self._inflation = priority
+            return key
+        return None
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SizePolicy(GreedyDualSizePolicy):
+    """
+    GreedyDual-Size with uniform cost: large entries are evicted before
+    small ones of similar age, recompute cost is ignored
+    """
+
+    def _credit(self, size, cost):
+        return 1.0 / max(size, 1)
+
+
+class CostPolicy(GreedyDualSizePolicy):
+    """
+    GreedyDual with the plain recompute cost as credit: entries that took
+    long to compute are kept regardless of their size
+    """
+
+    def _credit(self, size, cost):
+        return cost
+
+
+policies = {"lru": LRUPolicy, "size": SizePolicy, "cost": CostPolicy, "gds": GreedyDualSizePolicy}
+
+default_policy = "lru"
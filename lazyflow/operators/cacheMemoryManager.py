@@ -25,13 +25,14 @@ from __future__ import division
 # Python
 import gc
 import threading
+import collections
 import weakref
-import functools
 import atexit
 import warnings
 
 
 # lazyflow
+from lazyflow.operators.cacheEvictionPolicies import EvictionPolicy, policies, default_policy
 from lazyflow.utility import OrderedSignal
 from lazyflow.utility import log_exception
 from lazyflow.utility import Memory
@@ -43,6 +44,9 @@ logger = logging.getLogger(__name__)
 
 default_refresh_interval = 10
 
+# block id used in the eviction index for caches that can only be freed as a whole
+_WHOLE_CACHE = "<whole cache>"
+
 
 class _CacheMemoryManager(threading.Thread):
     """
@@ -72,10 +76,32 @@ class _CacheMemoryManager(threading.Thread):
 
     the interval is measured in seconds. Each change of refresh interval
     triggers cleanup.
+
+    Which cache entries are released first is decided by an eviction
+    policy (see cacheEvictionPolicies.py), which can be exchanged with::
+
+        cache_mem_manager.setEvictionPolicy("lru")
+
+    Caches that set `reportsBlockEvents` notify the manager about every
+    stored, accessed and freed block via blockStored(), blockAccessed()
+    and blockFreed(), so the policy index is kept up to date
+    incrementally. Accesses are only queued (they happen on every cache
+    hit), and are applied to the index the next time it is locked anyway.
+    All other managed caches are synchronized into the index via
+    lastAccessTime()/getBlockAccessTimes() when memory needs to be
+    released.
+
+    Optionally, evicted blocks can be demoted to a disk tier instead of
+    being discarded (see cacheSpillStore.py)::
+
+        cache_mem_manager.setSpillStore(SpillStore(directory, max_bytes))
     """
 
     totalCacheMemory = OrderedSignal()
 
+    # number of queued block accesses above which blockAccessed() applies them, if the index is not locked
+    MAX_PENDING_ACCESSES = 10000
+
     def __init__(self):
         threading.Thread.__init__(self)
         self.daemon = True
@@ -92,6 +118,24 @@ class _CacheMemoryManager(threading.Thread):
         self._refresh_interval = default_refresh_interval
         self._first_class_caches_lock = threading.Lock()
 
+        # all state below is guarded by _eviction_lock, which is never held
+        # while calling into a cache
+        self._eviction_lock = threading.Lock()
+        self._eviction_policy = policies[default_policy]()
+        # id(cache) -> weak reference to the cache
+        self._cache_refs = {}
+        # references to garbage collected caches, appended by weakref callbacks
+        self._dead_cache_refs = collections.deque()
+        # id(cache) -> {block_id: (size, cost)} for all entries in the policy
+        self._cache_blocks = {}
+        # id(cache) -> {block_id: access time} for caches that don't report block events
+        self._synced_access_times = {}
+        # (id(cache), block_id) of reported accesses that have not been applied to the policy yet.
+        # Appended to without holding _eviction_lock (deque.append is thread safe), drained with it.
+        self._pending_accesses = collections.deque()
+
+        self._spill_store = None
+
         # maximum fraction of *allowed memory* used
         self._max_usage = 1.0
         # target usage fraction
@@ -153,6 +197,177 @@ class _CacheMemoryManager(threading.Thread):
         elif isinstance(cache, ManagedCache):
             self._managed_caches.add(cache)
 
+    def setEvictionPolicy(self, policy):
+        """
+        set the eviction policy, either by name (one of the keys of
+        cacheEvictionPolicies.policies) or as an EvictionPolicy instance
+
+        Entries known to the previous policy are carried over.
+        """
+        if not isinstance(policy, EvictionPolicy):
+            try:
+                policy = policies[policy]()
+            except KeyError:
+                raise ValueError(
+                    "Unknown cache eviction policy {!r}, choose one of {}".format(policy, ", ".join(policies))
+                )
+
+        with self._eviction_lock:
+            self._applyPendingAccesses()
+            for cache_id, blocks in self._cache_blocks.items():
+                for block_id, (size, cost) in blocks.items():
+                    policy.add((cache_id, block_id), size, cost)
+            self._eviction_policy = policy
+
+    def getEvictionPolicy(self):
+        return self._eviction_policy
+
+    def setSpillStore(self, spill_store):
+        """
+        set a SpillStore that evicted blocks are demoted to, or None to
+        discard evicted blocks
+
+        This method blocks until current memory management tasks are
+        finished, so the previous store is not in use anymore when it
+        returns.
+        """
+        with self._disable_lock:
+            self._spill_store = spill_store
+
+    def getSpillStore(self):
+        return self._spill_store
+
+    def blockStored(self, cache, block_id, size, cost=0.0):
+        """
+        register a block that was just stored in cache
+
+        size is the memory held by the block in bytes, cost the time in
+        seconds it took to compute the block.
+        """
+        with self._eviction_lock:
+            # earlier accesses first, so that the policy sees events in order
+            self._applyPendingAccesses()
+            self._addBlock(cache, block_id, size, cost)
+
+    def blockAccessed(self, cache, block_id):
+        """
+        register a read access to a stored block of cache
+
+        Called on every cache hit, so this only queues the access instead
+        of contending for the lock of the policy index.
+        """
+        self._pending_accesses.append((id(cache), block_id))
+        if len(self._pending_accesses) > self.MAX_PENDING_ACCESSES and self._eviction_lock.acquire(blocking=False):
+            try:
+                self._applyPendingAccesses()
+            finally:
+                self._eviction_lock.release()
+
+    def _applyPendingAccesses(self):
+        touch = self._eviction_policy.touch
+        pending = self._pending_accesses
+        for _ in range(len(pending)):
+            touch(pending.popleft())
+
+    def blockFreed(self, cache, block_id):
+        """
+        forget about a block that was removed from cache
+        """
+        cache_id = id(cache)
+        with self._eviction_lock:
+            blocks = self._cache_blocks.get(cache_id)
+            if blocks is not None and blocks.pop(block_id, None) is not None:
+                self._eviction_policy.remove((cache_id, block_id))
+
+    def cacheCleared(self, cache):
+        """
+        forget about all blocks of cache
+        """
+        with self._eviction_lock:
+            self._forgetCache(id(cache))
+
+    def _addBlock(self, cache, block_id, size, cost):
+        cache_id = id(cache)
+        ref = self._cache_refs.get(cache_id)
+        if ref is None or ref() is not cache:
+            # first block of this cache, or a dead cache's id got reused
+            self._forgetCache(cache_id)
+            self._cache_refs[cache_id] = weakref.ref(cache, self._dead_cache_refs.append)
+            self._cache_blocks[cache_id] = {}
+        self._cache_blocks[cache_id][block_id] = (size, cost)
+        self._eviction_policy.add((cache_id, block_id), size, cost)
+
+    def _forgetCache(self, cache_id):
+        self._cache_refs.pop(cache_id, None)
+        self._synced_access_times.pop(cache_id, None)
+        for block_id in self._cache_blocks.pop(cache_id, {}):
+            self._eviction_policy.remove((cache_id, block_id))
+
+    def _forgetDeadCaches(self):
+        # weakref callbacks only queue the reference, taking the lock inside
+        # a callback could deadlock when garbage collection kicks in while
+        # the lock is held
+        while self._dead_cache_refs:
+            ref = self._dead_cache_refs.popleft()
+            for cache_id, known_ref in list(self._cache_refs.items()):
+                if known_ref is ref:
+                    self._forgetCache(cache_id)
+
+    def _syncUnreportedCaches(self):
+        """
+        update the policy index for caches that don't report block events
+        """
+        entries = []
+        current = {}
+        for cache in list(self._managed_caches):
+            entries.append((cache.lastAccessTime(), cache, _WHOLE_CACHE, cache.usedMemory()))
+        for cache in list(self._managed_blocked_caches):
+            if not cache.reportsBlockEvents:
+                access_times = dict(cache.getBlockAccessTimes())
+                current[id(cache)] = access_times
+                entries += [(t, cache, block_id, 0) for block_id, t in access_times.items()]
+        # older entries first, so that they get evicted first among equals
+        entries.sort(key=lambda entry: entry[0])
+
+        with self._eviction_lock:
+            for cache_id, access_times in current.items():
+                known = self._synced_access_times.get(cache_id, {})
+                blocks = self._cache_blocks.get(cache_id, {})
+                for block_id in [block_id for block_id in known if block_id not in access_times]:
+                    del known[block_id]
+                    if blocks.pop(block_id, None) is not None:
+                        self._eviction_policy.remove((cache_id, block_id))
+
+            for access_time, cache, block_id, size in entries:
+                known = self._synced_access_times.get(id(cache), {})
+                if known.get(block_id) == access_time:
+                    continue
+                if block_id in self._cache_blocks.get(id(cache), {}):
+                    self._eviction_policy.touch((id(cache), block_id))
+                else:
+                    self._addBlock(cache, block_id, size, 0.0)
+                self._synced_access_times.setdefault(id(cache), {})[block_id] = access_time
+
+    def _popVictim(self):
+        """
+        remove the next entry to evict from the index
+
+        @return tuple (cache, block_id) or None if there is nothing left to evict
+        """
+        with self._eviction_lock:
+            self._applyPendingAccesses()
+            while True:
+                key = self._eviction_policy.pop()
+                if key is None:
+                    return None
+                cache_id, block_id = key
+                self._cache_blocks.get(cache_id, {}).pop(block_id, None)
+                self._synced_access_times.get(cache_id, {}).pop(block_id, None)
+                ref = self._cache_refs.get(cache_id)
+                cache = ref() if ref is not None else None
+                if cache is not None:
+                    return cache, block_id
+
     def run(self):
         """
         main loop
@@ -173,6 +388,10 @@ class _CacheMemoryManager(threading.Thread):
         from lazyflow.operators.opCache import ObservableCache
 
         try:
+            with self._eviction_lock:
+                self._applyPendingAccesses()
+                self._forgetDeadCaches()
+
             # notify subscribed functions about current cache memory
             total = 0
 
@@ -204,27 +423,27 @@ class _CacheMemoryManager(threading.Thread):
             if total <= self._max_usage * cache_memory:
                 return
 
-            cache_entries = []
-            cache_entries += [
-                (cache.lastAccessTime(), cache.name, cache.freeMemory) for cache in list(self._managed_caches)
-            ]
-            cache_entries += [
-                (lastAccessTime, f"{cache.name}: {blockKey}", functools.partial(cache.freeBlock, blockKey))
-                for cache in list(self._managed_blocked_caches)
-                for blockKey, lastAccessTime in cache.getBlockAccessTimes()
-            ]
-            cache_entries.sort(key=lambda entry: entry[0])
-
-            for lastAccessTime, info, cleanupFun in cache_entries:
-                if total <= self._target_usage * cache_memory:
+            self._syncUnreportedCaches()
+
+            while total > self._target_usage * cache_memory:
+                victim = self._popVictim()
+                if victim is None:
                     break
-                mem = cleanupFun()
+                cache, block_id = victim
+                if block_id is _WHOLE_CACHE:
+                    info = cache.name
+                    mem = cache.freeMemory()
+                elif self._spill_store is not None:
+                    info = f"{cache.name}: {block_id}"
+                    mem = cache.demoteBlock(block_id)
+                else:
+                    info = f"{cache.name}: {block_id}"
+                    mem = cache.freeBlock(block_id)
                 logger.debug(f"Cleaned up {info} ({Memory.format(mem)})")
                 total -= mem
 
             # Remove references to cache entries before triggering garbage collection.
-            cleanupFun = None
-            cache_entries = None
+            cache = victim = None
             gc.collect()
 
             msg = "Done cleaning up, cache memory usage is now at {}".format(Memory.format(total))
@@ -300,3 +519,31 @@ def addFirstClassCache(cache):
 
 def setRefreshInterval(seconds):
     _cache_memory_manager.setRefreshInterval(seconds)
+
+
+def setEvictionPolicy(policy):
+    _cache_memory_manager.setEvictionPolicy(policy)
+
+
+def setSpillStore(spill_store):
+    _cache_memory_manager.setSpillStore(spill_store)
+
+
+def getSpillStore():
+    return _cache_memory_manager.getSpillStore()
+
+
+def blockStored(cache, block_id, size, cost=0.0):
+    _cache_memory_manager.blockStored(cache, block_id, size, cost)
+
+
+def blockAccessed(cache, block_id):
+    _cache_memory_manager.blockAccessed(cache, block_id)
+
+
+def blockFreed(cache, block_id):
+    _cache_memory_manager.blockFreed(cache, block_id)
+
+
+def cacheCleared(cache):
+    _cache_memory_manager.cacheCleared(cache)
@@ -0,0 +1,192 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Disk tier for managed caches
+
+When the cache memory manager has a SpillStore (see
+cacheMemoryManager.setSpillStore), blocks it evicts from caches that
+support it are written to a scratch directory instead of being dropped,
+and are read back from there the next time they are requested.
+"""
+
+import collections
+import itertools
+import logging
+import mmap
+import os
+import threading
+import zlib
+
+import numpy
+
+from lazyflow.operators.cacheEvictionPolicies import LRUPolicy
+
+logger = logging.getLogger(__name__)
+
+_SpillEntry = collections.namedtuple("_SpillEntry", "path nbytes dtype shape compressed cost")
+
+
+class SpillStore(object):
+    """
+    bounded, thread safe store of numpy arrays in a scratch directory
+
+    Each array is written to its own file, compressed with zlib (which
+    releases the GIL) unless that saves less than 10% of the space. Files
+    are memory mapped for reading. If the files exceed max_bytes, the
+    least recently used arrays are deleted.
+
+    The store only removes its own files, the directory itself has to be
+    cleaned up by the owner, e.g. with ilastik.utility.autocleaned_tempdir.
+    """
+
+    def __init__(self, directory, max_bytes, compression_level=1):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._compression_level = compression_level
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._policy = LRUPolicy()
+        self._used_bytes = 0
+        self._file_counter = itertools.count()
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def maxBytes(self):
+        return self._max_bytes
+
+    def usedBytes(self):
+        return self._used_bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def put(self, key, array, cost=0.0):
+        """
+        write array to disk under key, replacing a previous entry
+
+        cost is the time in seconds it took to compute the array and is
+        handed back by get() to be reused for cache eviction decisions.
+
+        @return True if the array was stored; masked and object arrays,
+                empty arrays and arrays that exceed the byte budget are not
+        """
+        if isinstance(array, numpy.ma.MaskedArray) or array.dtype.hasobject or array.size == 0:
+            return False
+        array = numpy.ascontiguousarray(array)
+        payload = memoryview(array).cast("B")
+        compressed = False
+        if self._compression_level:
+            compressed_payload = zlib.compress(payload, self._compression_level)
+            if len(compressed_payload) < 0.9 * array.nbytes:
+                payload = compressed_payload
+                compressed = True
+        if len(payload) > self._max_bytes:
+            return False
+
+        path = os.path.join(self._directory, "{}.block".format(next(self._file_counter)))
+        with open(path, "wb") as f:
+            f.write(payload)
+        entry = _SpillEntry(path, len(payload), array.dtype, array.shape, compressed, cost)
+
+        with self._lock:
+            obsolete = []
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._used_bytes -= previous.nbytes
+                obsolete.append(previous)
+            self._entries[key] = entry
+            self._used_bytes += entry.nbytes
+            self._policy.add(key, entry.nbytes)
+            while self._used_bytes > self._max_bytes:
+                evicted = self._entries.pop(self._policy.pop())
+                self._used_bytes -= evicted.nbytes
+                obsolete.append(evicted)
+        self._removeFiles(obsolete)
+        return key in self._entries
+
+    def get(self, key):
+        """
+        read the array stored under key
+
+        @return tuple (read-only array, cost) or None if key is not stored
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._policy.touch(key)
+
+        try:
+            with open(entry.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if entry.compressed:
+                    array = numpy.frombuffer(zlib.decompress(mapped), dtype=entry.dtype)
+                else:
+                    # copy, so that the mapping can be closed
+                    array = numpy.frombuffer(mapped, dtype=entry.dtype).copy()
+                    array.flags.writeable = False
+        except (OSError, ValueError):
+            # removed concurrently
+            return None
+        return array.reshape(entry.shape), entry.cost
+
+    def discard(self, key):
+        """
+        remove key from the store, if present
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return
+            self._policy.remove(key)
+            self._used_bytes -= entry.nbytes
+        self._removeFiles([entry])
+
+    def discardAll(self, predicate):
+        """
+        remove all keys for which predicate(key) is true
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            entries = [self._entries.pop(key) for key in keys]
+            for key, entry in zip(keys, entries):
+                self._policy.remove(key)
+                self._used_bytes -= entry.nbytes
+        self._removeFiles(entries)
+
+    def clear(self):
+        """
+        remove all files written by this store
+        """
+        self.discardAll(lambda key: True)
+
+    def _removeFiles(self, entries):
+        for entry in entries:
+            try:
+                os.remove(entry.path)
+            except OSError as e:
+                logger.debug("Could not remove spilled block {}: {}".format(entry.path, e))
@@ -24,7 +24,9 @@ from __future__ import absolute_import
 # Python
 from abc import abstractmethod
 import copy
+import itertools
 import logging
+import threading
 
 traceLogger = logging.getLogger("TRACE." + __name__)
 
@@ -36,11 +38,13 @@ from lazyflow.graph import Operator, InputSlot, OutputSlot, OrderedSignal, Opera
 from lazyflow.roi import sliceToRoi, roiToSlice, getIntersection, roiFromShape, nonzero_bounding_box, enlargeRoiForHalo
 from lazyflow.utility import Timer
 from lazyflow.classifiers import (
+    compileTreeEnsemble,
     LazyflowVectorwiseClassifierABC,
     LazyflowVectorwiseClassifierFactoryABC,
     LazyflowPixelwiseClassifierABC,
     LazyflowPixelwiseClassifierFactoryABC,
 )
+from lazyflow.classifiers.compiledTreeEnsemble import WITH_NUMBA
 
 from lazyflow.utility.helpers import bigintprod
 
@@ -314,6 +318,7 @@ class OpTrainClassifierFromFeatureVectors(Operator):
     def __init__(self, *args, **kwargs):
         super(OpTrainClassifierFromFeatureVectors, self).__init__(*args, **kwargs)
         self.trainingCompleteSignal = OrderedSignal()
+        self._observed_factory = None
 
         # TODO: Progress...
         # self.progressSignal = OrderedSignal()
@@ -325,6 +330,27 @@ class OpTrainClassifierFromFeatureVectors(Operator):
         # Special metadata for downstream operators using the classifier
         self.Classifier.meta.classifier_factory = self.ClassifierFactory.value
 
+        # Stateful factories (e.g. IncrementalVigraRfLazyflowClassifierFactory)
+        # can replace the classifier without a change of the training data.
+        self._observeFactory(self.ClassifierFactory.value)
+
+    def _observeFactory(self, classifier_factory):
+        if classifier_factory is self._observed_factory:
+            return
+        if self._observed_factory is not None:
+            self._observed_factory.classifierChanged.unsubscribe(self._handleClassifierChanged)
+            self._observed_factory = None
+        if hasattr(classifier_factory, "classifierChanged"):
+            classifier_factory.classifierChanged.subscribe(self._handleClassifierChanged)
+            self._observed_factory = classifier_factory
+
+    def _handleClassifierChanged(self):
+        self.Classifier.setDirty()
+
+    def cleanUp(self):
+        self._observeFactory(None)
+        super(OpTrainClassifierFromFeatureVectors, self).cleanUp()
+
     def execute(self, slot, subindex, roi, result):
         channel_names = self.LabelAndFeatureMatrix.meta.channel_names
         labels_and_features = self.LabelAndFeatureMatrix.value
@@ -370,6 +396,9 @@ class OpClassifierPredict(Operator):
     # Otherwise, the request is serviced as usual and the mask is ignored.
     PredictionMask = InputSlot(optional=True)
 
+    # See OpVectorwiseClassifierPredict (ignored for pixelwise classifiers)
+    CoarsePredictionTolerance = InputSlot(optional=True)
+
     PMaps = OutputSlot()
 
     def __init__(self, *args, **kwargs):
@@ -404,6 +433,7 @@ class OpClassifierPredict(Operator):
 
         if self._mode == "vectorwise":
             self._prediction_op = OpVectorwiseClassifierPredict(parent=self)
+            self._prediction_op.CoarsePredictionTolerance.connect(self.CoarsePredictionTolerance)
         elif self._mode == "pixelwise":
             self._prediction_op = OpPixelwiseClassifierPredict(parent=self)
 
@@ -416,6 +446,14 @@ class OpClassifierPredict(Operator):
     def execute(self, slot, subindex, roi, result):
         assert False, "Shouldn't get here..."
 
+    def coarsePredictionStatistics(self):
+        """
+        see OpVectorwiseClassifierPredict.coarsePredictionStatistics (None for pixelwise classifiers)
+        """
+        if self._mode != "vectorwise":
+            return None
+        return self._prediction_op.coarsePredictionStatistics()
+
     def propagateDirty(self, slot, subindex, roi):
         if slot == self.Classifier:
             self.PMaps.setDirty()
@@ -557,8 +595,33 @@ class OpPixelwiseClassifierPredict(OpBaseClassifierPredict):
 
 
 class OpVectorwiseClassifierPredict(OpBaseClassifierPredict):
+    # Optional coarse-to-fine prediction: each tile is first predicted at every COARSE_PREDICTION_STRIDE-th pixel.
+    # If all of these predict the same class with a probability of at least 1 - tolerance, and no class probability
+    # varies by more than the tolerance, the tile is filled with the coarse prediction (nearest neighbor upsampled).
+    # Otherwise, all pixels are predicted.
+    CoarsePredictionTolerance = InputSlot(optional=True)
+    COARSE_PREDICTION_STRIDE = 4
+
+    # Predict random forests with a CompiledTreeEnsemble (same probabilities, but batched over all trees).
+    # Without numba, the ensemble's numpy traversal is slower than the classifiers' own prediction.
+    USE_COMPILED_TREE_ENSEMBLE = WITH_NUMBA
+
+    # Upper bound for the features of a tile, including the input the feature operators read around it
+    # (see _tileShape)
+    TILE_FEATURE_BYTES = 256 * 2**20
+    # Axes with a halo are split into at most this many tiles each
+    MAX_TILE_SPLITS = 32
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._coarse_lock = threading.Lock()
+        self._coarse_tiles = 0
+        self._coarse_tiles_skipped = 0
+        self._tile_shapes = {}
+
     def setupOutputs(self):
         super().setupOutputs()
+        self._tile_shapes = {}
         nlabels = max(self.LabelsCount.value, 1)
 
         ideal_blockshape = self.Image.meta.ideal_blockshape
@@ -569,16 +632,21 @@ class OpVectorwiseClassifierPredict(OpBaseClassifierPredict):
         self.PMaps.meta.ideal_blockshape = tuple(ideal_blockshape)
 
         output_channels = nlabels
-        input_channels = self.Image.meta.shape[-1]
         # Temporarily consumed RAM includes the following:
         # >> result array: 4 * N output_channels
         # >> (times 2 due to temporary variable)
-        # >> input data allocation
+        # >> classifier allocations
+        # >> the features of a tile, including the halo the feature operators read around it
+        #    (per pixel of the tiles a large block is split into, see _tileShape)
         classifier_factory = self.Classifier.meta.classifier_factory
         classifier_ram_per_pixelchannel = classifier_factory.estimated_ram_usage_per_requested_predictionchannel()
         classifier_ram_per_pixel = classifier_ram_per_pixelchannel * output_channels
-        feature_ram_per_pixel = max(self.Image.meta.dtype().nbytes, 4) * input_channels
-        self.PMaps.meta.ram_usage_per_requested_pixel = classifier_ram_per_pixel + feature_ram_per_pixel
+        result_ram_per_pixel = 2 * 4 * output_channels
+        tile_shape = self._tileShape(self.Image.meta.shape[:-1])
+        feature_ram_per_pixel = self._tileFeatureBytes(tile_shape) / bigintprod(tile_shape)
+        self.PMaps.meta.ram_usage_per_requested_pixel = (
+            classifier_ram_per_pixel + result_ram_per_pixel + feature_ram_per_pixel
+        )
 
     def _calculate_probabilities(self, roi):
         classifier = self.Classifier.value
@@ -587,25 +655,174 @@ class OpVectorwiseClassifierPredict(OpBaseClassifierPredict):
             classifier, LazyflowVectorwiseClassifierABC
         ), f"Classifier {classifier} must be sublcass of {LazyflowVectorwiseClassifierABC}"
 
-        key = roi.toSlice()
-        newKey = key[:-1]
-        newKey += (slice(0, self.Image.meta.shape[-1], None),)
+        # Features and predictions are computed tile by tile, so the full feature block never has to be in memory.
+        start = numpy.array(roi.start[:-1])
+        stop = numpy.array(roi.stop[:-1])
+        tile_shape = self._tileShape(stop - start)
+        tile_starts = itertools.product(*(range(a, b, t) for a, b, t in zip(start, stop, tile_shape)))
 
-        with Timer() as features_timer:
-            input_data = self.Image[newKey].wait()
+        tolerance = self.CoarsePredictionTolerance.value if self.CoarsePredictionTolerance.ready() else None
 
-        input_data = numpy.asarray(input_data, numpy.float32)
-        shape = input_data.shape
-        prod = bigintprod(shape[:-1])
-        features = input_data.reshape((prod, shape[-1]))
+        probabilities = None
+        features_time = prediction_time = 0.0
+        for tile_start in tile_starts:
+            tile_start = numpy.array(tile_start)
+            tile_stop = numpy.minimum(tile_start + tile_shape, stop)
 
-        with Timer() as prediction_timer:
-            probabilities = classifier.predict_probabilities(features)
+            with Timer() as features_timer:
+                input_data = self.Image(list(tile_start) + [0], list(tile_stop) + [self.Image.meta.shape[-1]]).wait()
 
-        logger.debug(
-            f"Features took {features_timer.seconds()} seconds."
-            f" Prediction took {prediction_timer.seconds()} seconds. {roi}"
-        )
+            input_data = numpy.asarray(input_data, numpy.float32)
+
+            with Timer() as prediction_timer:
+                tile_probabilities = None
+                if tolerance is not None:
+                    tile_probabilities = self._predictCoarse(classifier, input_data, tolerance)
+                if tile_probabilities is None:
+                    tile_probabilities = self._predict(classifier, input_data)
+            del input_data
+
+            if probabilities is None:
+                probabilities = numpy.empty(
+                    tuple(stop - start) + (tile_probabilities.shape[-1],), dtype=tile_probabilities.dtype
+                )
+            probabilities[roiToSlice(tile_start - start, tile_stop - start)] = tile_probabilities
 
+            features_time += features_timer.seconds()
+            prediction_time += prediction_timer.seconds()
+
+        logger.debug(f"Features took {features_time} seconds. Prediction took {prediction_time} seconds. {roi}")
+        return probabilities
+
+    def _halo(self):
+        """
+        Halo (in pixels, per side) that the feature operators read around a requested roi,
+        for each axis of Image except channel (see OpPixelFeaturesPresmoothed).
+        """
+        halo = self.Image.meta.halo or {}
+        return numpy.array([halo.get(key, 0) for key in self.Image.meta.getAxisKeys()[:-1]])
+
+    def _tileFeatureBytes(self, tile_shape):
+        """
+        RAM needed to compute the features of a tile: the features themselves (as float32)
+        and whatever the feature operators keep of the input around it.
+        Also works for an array of tile shapes (one per row).
+        """
+        meta = self.Image.meta
+        tile_shape = numpy.asarray(tile_shape)
+        feature_bytes_per_pixel = max(meta.dtype().nbytes, 4) * meta.shape[-1]
+        tile_bytes = numpy.prod(tile_shape, axis=-1, dtype=numpy.float64) * feature_bytes_per_pixel
+
+        halo = self._halo()
+        if not halo.any():
+            return tile_bytes
+        halo_bytes_per_pixel = meta.halo_ram_usage_per_pixel
+        if halo_bytes_per_pixel is None:
+            halo_bytes_per_pixel = feature_bytes_per_pixel
+        halo_shape = numpy.minimum(tile_shape + 2 * halo, meta.shape[:-1])
+        return tile_bytes + numpy.prod(halo_shape, axis=-1, dtype=numpy.float64) * halo_bytes_per_pixel
+
+    def _tileShape(self, block_shape):
+        """
+        Shape of the tiles (without channel) for predicting a block of the given shape.
+
+        The features of a tile, including the input the feature operators read around it, take at most
+        TILE_FEATURE_BYTES. Every tile is computed with its own halo, so the block is split along the
+        (outermost) axes without a halo first. Along the axes with a halo, the tiling that reads the fewest
+        input pixels in total is used.
+        """
+        key = (tuple(int(n) for n in block_shape), self.TILE_FEATURE_BYTES)
+        tile_shape = self._tile_shapes.get(key)
+        if tile_shape is None:
+            tile_shape = self._tile_shapes[key] = self._computeTileShape(numpy.array(key[0]))
+        return tile_shape.copy()
+
+    def _computeTileShape(self, block_shape):
+        halo = self._halo()
+        tile_shape = block_shape.copy()
+        for axis in numpy.flatnonzero(halo == 0):
+            if self._tileFeatureBytes(tile_shape) <= self.TILE_FEATURE_BYTES:
+                return tile_shape
+            # The features of the tile scale linearly along this axis
+            tile_shape[axis] = 1
+            length = max(1, int(self.TILE_FEATURE_BYTES // self._tileFeatureBytes(tile_shape)))
+            splits = -(-block_shape[axis] // min(length, block_shape[axis]))
+            tile_shape[axis] = -(-block_shape[axis] // splits)
+        if not halo.any() or self._tileFeatureBytes(tile_shape) <= self.TILE_FEATURE_BYTES:
+            return tile_shape
+
+        # Candidate tiles: every way to split each halo axis evenly into at most MAX_TILE_SPLITS parts
+        axes = numpy.flatnonzero(halo)
+        lengths = [
+            numpy.unique(-(-block_shape[axis] // numpy.arange(1, min(block_shape[axis], self.MAX_TILE_SPLITS) + 1)))
+            for axis in axes
+        ]
+        halo_tiles = numpy.stack(numpy.meshgrid(*lengths, indexing="ij"), axis=-1).reshape(-1, len(axes))
+        candidates = numpy.repeat(tile_shape[numpy.newaxis], len(halo_tiles), axis=0)
+        candidates[:, axes] = halo_tiles
+
+        footprint = self._tileFeatureBytes(candidates)
+        fits = footprint <= self.TILE_FEATURE_BYTES
+        if not fits.any():
+            return candidates[numpy.argmin(footprint)]
+        tiles = numpy.prod(-(-block_shape // candidates), axis=-1, dtype=numpy.float64)
+        halo_shape = numpy.minimum(candidates + 2 * halo, self.Image.meta.shape[:-1])
+        reads = numpy.where(fits, tiles * numpy.prod(halo_shape, axis=-1, dtype=numpy.float64), numpy.inf)
+        # Fewest tiles among the tilings that read the least
+        return candidates[numpy.lexsort((tiles, reads))[0]]
+
+    def _predict(self, classifier, input_data):
+        """
+        Predicts a feature image (channel last), returns the probability image (channel last).
+        """
+        shape = input_data.shape
+        features = input_data.reshape((bigintprod(shape[:-1]), shape[-1]))
+        ensemble = compileTreeEnsemble(classifier) if self.USE_COMPILED_TREE_ENSEMBLE else None
+        if ensemble is not None and ensemble.canPredict(features):
+            probabilities = ensemble.predict_probabilities(features)
+        else:
+            probabilities = classifier.predict_probabilities(features)
         probabilities.shape = shape[:-1] + (probabilities.shape[-1],)
         return probabilities
+
+    def _predictCoarse(self, classifier, input_data, tolerance):
+        """
+        Returns the upsampled coarse prediction of a feature image if it's certain and homogeneous, otherwise None.
+        """
+        stride = self.COARSE_PREDICTION_STRIDE
+        spatial_shape = input_data.shape[:-1]
+        if bigintprod(spatial_shape) < 2 * bigintprod([-(-n // stride) for n in spatial_shape]):
+            return None  # Not worth it for tiny tiles
+
+        # Sample the center of each stride x stride x ... cell
+        sampling = tuple(slice(min(stride // 2, n - 1), None, stride) for n in spatial_shape)
+        coarse = self._predict(classifier, input_data[sampling])
+
+        samples = coarse.reshape((-1, coarse.shape[-1]))
+        winners = numpy.argmax(samples, axis=-1)
+        certain = (winners == winners[0]).all() and samples[:, winners[0]].min() >= 1.0 - tolerance
+        homogeneous = (samples.max(axis=0) - samples.min(axis=0)).max() <= tolerance
+
+        with self._coarse_lock:
+            self._coarse_tiles += 1
+            self._coarse_tiles_skipped += int(certain and homogeneous)
+        if not (certain and homogeneous):
+            return None
+
+        upsampling = [numpy.minimum(numpy.arange(n) // stride, m - 1) for n, m in zip(spatial_shape, coarse.shape)]
+        upsampling.append(numpy.arange(coarse.shape[-1]))
+        return coarse[numpy.ix_(*upsampling)]
+
+    def coarsePredictionStatistics(self):
+        """
+        @return dict with the number of tiles predicted with coarse-to-fine prediction ("tiles")
+                and the number of tiles that were filled with the coarse prediction ("skipped")
+        """
+        with self._coarse_lock:
+            return {"tiles": self._coarse_tiles, "skipped": self._coarse_tiles_skipped}
+
+    def propagateDirty(self, slot, subindex, roi):
+        if slot == self.CoarsePredictionTolerance:
+            self.PMaps.setDirty()
+        else:
+            super().propagateDirty(slot, subindex, roi)
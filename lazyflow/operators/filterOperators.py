@@ -24,6 +24,8 @@ import logging
 import numpy
 import vigra
 
+from functools import partial
+
 from lazyflow import roi
 from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.roi import roiToSlice
@@ -552,3 +554,157 @@ class OpLaplacianOfGaussian(OpBaseFilter):
 
     def resultingChannels(self):
         return 1
+
+
+def derivativeFeatures(image, scale, features, window_size, roi=None):
+    """
+    compute several derivative features of a single channel image from one shared derivative stack
+
+    The gradient and the Hessian of Gaussian at the given scale are computed once and the features are
+    derived from them:
+        GaussianGradientMagnitude:    norm of the gradient
+        StructureTensorEigenvalues:   eigenvalues of the outer product of the gradient, smoothed with scale / 2
+        LaplacianOfGaussian:          trace of the Hessian
+        HessianOfGaussianEigenvalues: eigenvalues of the Hessian
+    This gives the same results as the individual vigra filters, with fewer convolutions whenever features
+    share a derivative.
+
+    input:  VigraArray with a single channel in front ('cyx' or 'czyx')
+            roi: (start, stop) without the channel axis, like the roi parameter of vigra's filters
+    output: feature channels stacked along the channel axis, in the order of features
+    """
+    assert image.channelIndex == 0, "channel axis must come first"
+    n_space = image.ndim - 1
+    space_shape = image.shape[1:]
+    if roi is None:
+        start, stop = (0,) * n_space, space_shape
+    else:
+        start, stop = (tuple(int(x) for x in r) for r in roi)
+
+    # the structure tensor is smoothed after taking the outer product, so it needs the gradient in a halo
+    if "StructureTensorEigenvalues" in features:
+        margin = int(numpy.ceil(window_size * scale * 0.5)) + 1
+        gradient_start = tuple(max(0, a - margin) for a in start)
+        gradient_stop = tuple(min(s, b + margin) for b, s in zip(stop, space_shape))
+    else:
+        gradient_start, gradient_stop = start, stop
+    inner_start = tuple(a - g for a, g in zip(start, gradient_start))
+    inner_stop = tuple(b - g for b, g in zip(stop, gradient_start))
+    inner_slice = (slice(None),) + roiToSlice(inner_start, inner_stop)
+
+    # the Laplacian alone is cheaper to compute directly than via the full Hessian
+    share_hessian = "HessianOfGaussianEigenvalues" in features
+
+    gradient = None
+    hessian = None
+    results = []
+    for feature in features:
+        if feature in ("GaussianGradientMagnitude", "StructureTensorEigenvalues") and gradient is None:
+            gradient = vigra.filters.gaussianGradient(
+                image, scale, window_size=window_size, roi=(gradient_start, gradient_stop)
+            )
+        if feature in ("LaplacianOfGaussian", "HessianOfGaussianEigenvalues") and share_hessian and hessian is None:
+            hessian = vigra.filters.hessianOfGaussian(image, scale, window_size=window_size, roi=(start, stop))
+
+        if feature == "GaussianGradientMagnitude":
+            squared = numpy.square(gradient.view(numpy.ndarray)[inner_slice])
+            result = numpy.sqrt(numpy.sum(squared, axis=0, keepdims=True))
+        elif feature == "StructureTensorEigenvalues":
+            tensor = vigra.filters.vectorToTensor(gradient)
+            tensor = vigra.filters.gaussianSmoothing(
+                tensor, scale * 0.5, window_size=window_size, roi=(inner_start, inner_stop)
+            )
+            result = vigra.filters.tensorEigenvalues(tensor)
+        elif feature == "LaplacianOfGaussian":
+            if hessian is None:
+                result = vigra.filters.laplacianOfGaussian(image, scale, window_size=window_size, roi=(start, stop))
+            else:
+                # the tensor is stored as its upper triangle, row by row
+                diagonal = [i * n_space - i * (i - 1) // 2 for i in range(n_space)]
+                second_derivatives = numpy.take(hessian.view(numpy.ndarray), diagonal, axis=0)
+                result = numpy.sum(second_derivatives, axis=0, keepdims=True)
+        elif feature == "HessianOfGaussianEigenvalues":
+            result = vigra.filters.tensorEigenvalues(hessian)
+        else:
+            raise ValueError(f"{feature} is not a derivative feature")
+        results.append(numpy.asarray(result, dtype=numpy.float32))
+
+    return numpy.concatenate(results, axis=0)
+
+
+def fastDerivativeFeatures(image, scale, features, window_size):
+    """
+    compute the Laplacian and the Hessian eigenvalues of a single channel image from one Hessian, with fastfilters
+
+    fastfilters only exposes the final features, not the derivatives.  But the Laplacian is the trace of the Hessian,
+    i.e. the sum of its eigenvalues, so it comes for free with the Hessian eigenvalues.
+
+    input/output: like derivativeFeatures(), without roi support
+    """
+    eigenvalues = numpy.asarray(
+        fastfilters.hessianOfGaussianEigenvalues(image, scale=scale, window_size=window_size), dtype=numpy.float32
+    )
+    results = []
+    for feature in features:
+        if feature == "LaplacianOfGaussian":
+            results.append(numpy.sum(eigenvalues, axis=0, keepdims=True))
+        elif feature == "HessianOfGaussianEigenvalues":
+            results.append(eigenvalues)
+        else:
+            raise ValueError(f"{feature} can not be computed from the Hessian eigenvalues")
+
+    return numpy.concatenate(results, axis=0)
+
+
+class OpDerivativeFeatures(OpBaseFilter):
+    """
+    Gaussian derivative features of a single scale, computed together with derivativeFeatures()
+
+    The output contains, for each input channel, the channels of all features (see DERIVATIVE_FEATURES)
+    in the order they were given to the constructor.
+    With fastfilters, only the Laplacian and the Hessian eigenvalues share their computation (see
+    fastDerivativeFeatures()).
+    """
+
+    scale = InputSlot()
+
+    supports_window = True
+
+    if WITH_FAST_FILTERS:
+        name = "DerivativeFeaturesFF"
+        shared_fn = staticmethod(fastDerivativeFeatures)
+        DERIVATIVE_FEATURES = ("LaplacianOfGaussian", "HessianOfGaussianEigenvalues")
+    else:
+        name = "DerivativeFeatures"
+        shared_fn = staticmethod(derivativeFeatures)
+        supports_roi = True
+        DERIVATIVE_FEATURES = (
+            "LaplacianOfGaussian",
+            "GaussianGradientMagnitude",
+            "StructureTensorEigenvalues",
+            "HessianOfGaussianEigenvalues",
+        )
+
+    def __init__(self, *args, features, **kwargs):
+        assert features, "at least one feature is needed"
+        assert all(f in self.DERIVATIVE_FEATURES for f in features), features
+        self.features = tuple(features)
+        self.filter_fn = partial(self.shared_fn, features=self.features)
+        super().__init__(*args, **kwargs)
+
+    def featureChannels(self, feature):
+        """
+        number of channels of a feature (per input channel)
+        """
+        if feature in ("StructureTensorEigenvalues", "HessianOfGaussianEigenvalues"):
+            return self._n_per_space_axis()
+        return 1
+
+    def featureChannelOffset(self, feature):
+        """
+        first channel of a feature within the channels of one input channel
+        """
+        return sum(self.featureChannels(f) for f in self.features[: self.features.index(feature)])
+
+    def resultingChannels(self):
+        return sum(self.featureChannels(f) for f in self.features)
@@ -29,6 +29,7 @@ from .opStreamingUfmfReader import OpStreamingUfmfReader
 from .opRawBinaryFileReader import OpRawBinaryFileReader
 from .opNpyFileReader import OpNpyFileReader
 from .opStreamingH5N5Reader import OpStreamingH5N5Reader
+from .opStreamingZarrReader import OpStreamingZarrReader
 from .opStreamingH5N5SequenceReaderS import OpStreamingH5N5SequenceReaderS
 from .opStreamingH5N5SequenceReaderM import OpStreamingH5N5SequenceReaderM
 from .opBlockwiseFilesetReader import OpBlockwiseFilesetReader
@@ -26,6 +26,11 @@ import os
 import math
 import logging
 import glob
+import json
+import queue
+import threading
+import zlib
+from functools import partial
 import h5py
 import z5py
 from collections import OrderedDict
@@ -39,9 +44,12 @@ import numpy
 import vigra
 
 from lazyflow.graph import OrderedSignal, Operator, OutputSlot, InputSlot
-from lazyflow.roi import roiToSlice, roiFromShape, determineBlockShape
+from lazyflow.roi import roiToSlice, roiFromShape, determineBlockShape, getIntersectingBlocks, getBlockBounds
+from lazyflow.request import Request
 from lazyflow.utility.bigRequestStreamer import BigRequestStreamer
+from lazyflow.utility.exportManifest import ExportManifest
 from lazyflow.utility.helpers import bigintprod
+from lazyflow.utility.multiscales import downsample, ngff_multiscales_attrs, pyramid_factors, pyramid_method
 
 
 class OpImageReader(Operator):
@@ -528,6 +536,99 @@ class OpStackToH5Writer(Operator):
         return result
 
 
+class _H5ChunkWriter(object):
+    """
+    Writes chunk-aligned blocks to a chunked hdf5 dataset, bypassing the hdf5 filter pipeline.
+
+    Blocks are split into chunks and compressed by the threads that call write_block (zlib releases the GIL),
+    a single writer thread stores the compressed chunks with write_direct_chunk.
+    The queue between them is bounded, so compute threads wait if the disk can't keep up.
+    """
+
+    def __init__(self, dataset, queue_size):
+        assert self.supports(dataset)
+        self._dataset = dataset
+        self._chunks = numpy.array(dataset.chunks)
+        self._level = dataset.compression_opts if dataset.compression == "gzip" else None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="H5ChunkWriter", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def supports(dataset):
+        """
+        Chunks can only be compressed outside of hdf5 if no filter other than gzip is involved.
+        """
+        return (
+            isinstance(dataset, h5py.Dataset)
+            and dataset.chunks is not None
+            and dataset.compression in (None, "gzip")
+            and not dataset.shuffle
+            and not dataset.fletcher32
+            and dataset.scaleoffset is None
+            and not dataset.dtype.hasobject
+        )
+
+    def write_block(self, roi, data):
+        """
+        Compress and enqueue all chunks of a block. Blocks must consist of whole chunks
+        (clipped to the dataset shape only at its upper borders).
+        """
+        start, stop = numpy.array(roi)
+        assert (start % self._chunks == 0).all(), f"Block {roi} is not aligned to chunks {tuple(self._chunks)}"
+        for chunk_start in getIntersectingBlocks(self._chunks, (start, stop)):
+            chunk_roi = getBlockBounds(self._dataset.shape, self._chunks, chunk_start)
+            assert (chunk_roi[1] <= stop).all(), f"Block {roi} is not aligned to chunks {tuple(self._chunks)}"
+            chunk_data = data[roiToSlice(chunk_roi[0] - start, chunk_roi[1] - start)]
+            if chunk_data.shape != tuple(self._chunks):
+                # hdf5 always stores whole chunks, also at the borders of the dataset
+                padded = numpy.zeros(self._chunks, dtype=self._dataset.dtype)
+                padded[tuple(slice(0, s) for s in chunk_data.shape)] = chunk_data
+                chunk_data = padded
+            buf = numpy.ascontiguousarray(chunk_data, dtype=self._dataset.dtype).tobytes()
+            if self._level is not None:
+                buf = zlib.compress(buf, self._level)
+            self._raise_error()
+            self._queue.put((tuple(int(s) for s in chunk_start), buf))
+
+    def call_when_written(self, callback):
+        """
+        Call callback (in the writer thread) once all chunks that have been enqueued so far are written.
+        """
+        self._raise_error()
+        self._queue.put(callback)
+
+    def close(self):
+        """
+        Wait until all enqueued chunks are written.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                # Keep draining the queue, so that no producer blocks forever
+                continue
+            try:
+                if callable(item):
+                    item()
+                else:
+                    offset, buf = item
+                    self._dataset.id.write_direct_chunk(offset, buf)
+            except Exception as ex:
+                self._error = ex
+
+
 class OpH5N5WriterBigDataset(Operator):
     name = "H5 and N5 File Writer BigDataset"
     category = "Output"
@@ -539,8 +640,27 @@ class OpH5N5WriterBigDataset(Operator):
     CompressionEnabled = InputSlot(value=False)
     BatchSize = InputSlot(optional=True)
 
+    # If given, h5N5Path names a multiscale image group, and the image is written to its dataset "s0".
+    # The given number of downsampled levels ("s1", "s2", ...) is computed from the same blocks.
+    PyramidLevels = InputSlot(optional=True)
+    PyramidMethod = InputSlot(value="auto")  # See lazyflow.utility.multiscales.PYRAMID_METHODS
+
+    # If given, the export can be resumed: Completed blocks are recorded in this file (see ExportManifest).
+    # If the file lists blocks of an earlier, interrupted export with the same settings,
+    # the existing datasets are kept and those blocks are not computed again.
+    # The file is removed once the export is complete.
+    ManifestPath = InputSlot(optional=True)
+    # Identity of what is exported (json-serializable, e.g. input files and project), stored in the manifest.
+    # A manifest with another identity is discarded.
+    ManifestIdentity = InputSlot(optional=True)
+
     WriteImage = OutputSlot()
 
+    # Compress chunks of hdf5 datasets in parallel and write them with write_direct_chunk (see _H5ChunkWriter)
+    DIRECT_CHUNK_WRITES = True
+    # Compressed chunks that may wait to be written, per worker thread
+    WRITE_QUEUE_CHUNKS_PER_WORKER = 16
+
     loggingName = __name__ + ".OpH5N5WriterBigDataset"
     logger = logging.getLogger(loggingName)
     traceLogger = logging.getLogger("TRACE." + loggingName)
@@ -552,6 +672,7 @@ class OpH5N5WriterBigDataset(Operator):
         Image=None,
         BatchSize: int = None,
         CompressionEnabled: bool = None,
+        PyramidLevels: int = None,
         *args,
         **kwargs,
     ):
@@ -560,18 +681,25 @@ class OpH5N5WriterBigDataset(Operator):
         self.progressSignal = OrderedSignal()
         self.d = None
         self.f = None
+        self.g = None
+        self._levels = []
+        self._manifest = None
 
         self.h5N5File.setOrConnectIfAvailable(h5N5File)
         self.h5N5Path.setOrConnectIfAvailable(h5N5Path)
         self.Image.setOrConnectIfAvailable(Image)
         self.BatchSize.setOrConnectIfAvailable(BatchSize)
         self.CompressionEnabled.setOrConnectIfAvailable(CompressionEnabled)
+        self.PyramidLevels.setOrConnectIfAvailable(PyramidLevels)
 
     def cleanUp(self):
         super().cleanUp()
         # Discard the reference to the dataset, to ensure that the file can be closed.
         self.d = None
         self.f = None
+        self.g = None
+        self._levels = []
+        self._closeManifest()
         self.progressSignal.clean()
 
     def setupOutputs(self):
@@ -585,6 +713,8 @@ class OpH5N5WriterBigDataset(Operator):
         h5N5Path = h5N5Path.replace("\\", "/")
 
         h5N5GroupName, datasetName = os.path.split(h5N5Path)
+        if self.PyramidLevels.ready():
+            h5N5GroupName, datasetName = h5N5Path.strip("/"), "s0"
         if h5N5GroupName == "":
             g = self.f
         else:
@@ -615,8 +745,6 @@ class OpH5N5WriterBigDataset(Operator):
 
         self.chunkShape = determineBlockShape(list(tagged_maxshape.values()), 512_000.0 / dtypeBytes)
 
-        if datasetName in list(g.keys()):
-            del g[datasetName]
         kwargs = {"shape": dataShape, "dtype": dtype, "chunks": self.chunkShape}
         if self.CompressionEnabled.value:
             kwargs["compression"] = "gzip"  # <-- Would be nice to use lzf compression here, but that is h5py-specific.
@@ -625,49 +753,197 @@ class OpH5N5WriterBigDataset(Operator):
             else:  # z5py has uses different names here
                 kwargs["level"] = 1  # <-- Optimize for speed, not disk space.
         else:
-            if isinstance(self.f, z5py.N5File):  # n5 uses gzip level 5 as default compression.
+            if isinstance(self.f, z5py.File):  # n5 uses gzip level 5, zarr blosc as default compression.
                 kwargs["compression"] = "raw"
 
-        self.d = g.create_dataset(datasetName, **kwargs)
+        # The datasets to write: (name, creation kwargs, factors from the previous level)
+        datasetSpecs = [(datasetName, kwargs, None)]
+        if self.PyramidLevels.ready():
+            axiskeys = self.Image.meta.getAxisKeys()
+            for level, (factors, shape) in enumerate(pyramid_factors(axiskeys, dataShape, self.PyramidLevels.value), 1):
+                chunks = tuple(min(c, s) for c, s in zip(self.chunkShape, shape))
+                datasetSpecs.append((f"s{level}", dict(kwargs, shape=shape, chunks=chunks), factors))
+
+        resume = False
+        self._closeManifest()
+        if self.ManifestPath.ready():
+            self._manifest = ExportManifest(
+                self.ManifestPath.value,
+                dataShape,
+                self.chunkShape,
+                path=h5N5Path,
+                dtype=numpy.dtype(dtype).str,
+                compression=bool(self.CompressionEnabled.value),
+                pyramid_levels=self.PyramidLevels.value if self.PyramidLevels.ready() else None,
+                pyramid_method=self.PyramidMethod.value,
+                identity=self.ManifestIdentity.value if self.ManifestIdentity.ready() else None,
+            )
+            if not self._manifest.empty:
+                resume = all(self._isResumable(g, name, spec) for name, spec, _ in datasetSpecs)
+                if not resume:
+                    self.logger.warning(f"Existing data doesn't match {self._manifest.path}, exporting all blocks")
+                    self._manifest.reset()
+
+        datasets = []
+        for name, spec, _ in datasetSpecs:
+            if resume:
+                datasets.append(g[name])
+            else:
+                if name in g:
+                    del g[name]
+                datasets.append(g.create_dataset(name, **spec))
+        self.d = datasets[0]
+        self.g = g
+
+        # The downsampled levels: (factors from the previous level, dataset)
+        self._levels = [(factors, dataset) for (_, _, factors), dataset in zip(datasetSpecs[1:], datasets[1:])]
+
+        for dataset in [self.d] + [dataset for _, dataset in self._levels]:
+            if self.Image.meta.drange is not None:
+                dataset.attrs["drange"] = self.Image.meta.drange
+            if self.Image.meta.display_mode is not None:
+                dataset.attrs["display_mode"] = self.Image.meta.display_mode
+
+    @staticmethod
+    def _isResumable(g, name, spec):
+        """
+        Whether g holds a dataset name that was created with the same spec by an earlier, interrupted export
+        """
+        if name not in g:
+            return False
+        dataset = g[name]
+        return (
+            tuple(getattr(dataset, "shape", ())) == tuple(spec["shape"])
+            and tuple(getattr(dataset, "chunks", None) or ()) == tuple(spec["chunks"])
+            and getattr(dataset, "dtype", None) == numpy.dtype(spec["dtype"])
+        )
+
+    def _closeManifest(self):
+        if self._manifest is not None:
+            self._manifest.close()
+            self._manifest = None
+
+    def _writeMetadata(self):
+        axistags = self.Image.meta.axistags
+        axiskeys = "".join(tag.key for tag in axistags)
+        scale = numpy.ones(len(axiskeys), dtype=int)
+        scales = [tuple(scale)]
+        for factors, _ in self._levels:
+            scale = scale * factors
+            scales.append(tuple(scale))
+
+        datasets = [self.d] + [dataset for _, dataset in self._levels]
+        for dataset, dataset_scale in zip(datasets, scales):
+            # Save the axistags as a dataset attribute
+            dataset.attrs["axistags"] = axistags.toJSON()
+            if isinstance(dataset, h5py.Dataset):
+                for index, tag in enumerate(axistags):
+                    dataset.dims[index].label = tag.key
+            else:  # if n5 dataset, apply neuroglancer's axes tags convention
+                dataset.attrs["axes"] = axiskeys[::-1]
+                if self.PyramidLevels.ready():
+                    # n5-viewer's multiscale convention
+                    dataset.attrs["downsamplingFactors"] = [int(s) for s in dataset_scale[::-1]]
+            drange = self.Image.meta.get("drange")
+            if drange:
+                dataset.attrs["drange"] = drange
+
+        if self.PyramidLevels.ready():
+            paths = [f"s{level}" for level in range(len(datasets))]
+            multiscales = ngff_multiscales_attrs(axiskeys, paths, scales, name=self.h5N5Path.value.strip("/"))
+            if isinstance(self.d, h5py.Dataset):
+                self.g.attrs["multiscales"] = json.dumps(multiscales["multiscales"])
+            else:
+                self.g.attrs.update(multiscales)
 
-        if self.Image.meta.drange is not None:
-            self.d.attrs["drange"] = self.Image.meta.drange
-        if self.Image.meta.display_mode is not None:
-            self.d.attrs["display_mode"] = self.Image.meta.display_mode
+    @staticmethod
+    def _writeBlock(dataset, roi, data):
+        slicing = roiToSlice(*roi)
+        if data.flags.c_contiguous:
+            dataset.write_direct(data.view(numpy.ndarray), dest_sel=slicing)
+        else:
+            dataset[slicing] = data
 
     def execute(self, slot, subindex, rroi, result):
         self.progressSignal(0)
 
-        # Save the axistags as a dataset attribute
-        self.d.attrs["axistags"] = self.Image.meta.axistags.toJSON()
-        if isinstance(self.d, h5py.Dataset):
-            for index, tag in enumerate(self.Image.meta.axistags):
-                self.d.dims[index].label = tag.key
-        else:  # if n5 dataset, apply neuroglancer's axes tags convention
-            self.d.attrs["axes"] = "".join(tag.key for tag in self.Image.meta.axistags)[::-1]
-        drange = self.Image.meta.get("drange")
-        if drange:
-            self.d.attrs["drange"] = drange
+        self._writeMetadata()
+
+        method = pyramid_method(self.PyramidMethod.value, self.Image.meta)
+        pyramid_lock = threading.Lock()
+
+        chunk_writer = None
+        if self.DIRECT_CHUNK_WRITES and _H5ChunkWriter.supports(self.d):
+            queue_size = self.WRITE_QUEUE_CHUNKS_PER_WORKER * max(1, Request.global_thread_pool.num_workers)
+            chunk_writer = _H5ChunkWriter(self.d, queue_size)
 
         def handle_block_result(roi, data):
-            slicing = roiToSlice(*roi)
-            if data.flags.c_contiguous:
-                self.d.write_direct(data.view(numpy.ndarray), dest_sel=slicing)
+            data = data.view(numpy.ndarray)
+            if chunk_writer is not None:
+                chunk_writer.write_block(roi, data)
             else:
-                self.d[slicing] = data
+                self._writeBlock(self.d, roi, data)
+
+            # Reduce the block to each coarser level.
+            start, stop = numpy.array(roi)
+            levels = []
+            for factors, dataset in self._levels:
+                data = downsample(data, factors, method)
+                start = start // factors
+                stop = -(-stop // factors)
+                levels.append((dataset, (start, stop), data))
+            # The reduced blocks are not aligned to the chunks of the coarser levels
+            with pyramid_lock:
+                for dataset, level_roi, level_data in levels:
+                    self._writeBlock(dataset, level_roi, level_data)
+
+            if self._manifest is not None:
+                if chunk_writer is not None:
+                    chunk_writer.call_when_written(partial(record_block, roi))
+                else:
+                    record_block(roi)
+
+        def record_block(roi):
+            if isinstance(self.d, h5py.Dataset):
+                # Don't record blocks that could still be lost in hdf5's caches
+                self.d.file.flush()
+            self._manifest.add(roi)
 
         batch_size = None
         if self.BatchSize.ready():
             batch_size = self.BatchSize.value
-        requester = BigRequestStreamer(self.Image, roiFromShape(self.Image.meta.shape), batchSize=batch_size)
+        # Blocks consist of whole chunks, so no chunk is written (and compressed) twice.
+        # Each chunk of a N5/Zarr dataset is a separate file, so such blocks can be written in parallel.
+        # hdf5 chunks are compressed in parallel by the chunk writer.
+        parallel_results = chunk_writer is not None or not isinstance(self.d, h5py.Dataset)
+        alignment = numpy.array(self.d.chunks)
+        if self._levels:
+            # Blocks must consist of whole windows of all downsampled levels
+            alignment = numpy.lcm(alignment, numpy.prod([factors for factors, _ in self._levels], axis=0))
+        requester = BigRequestStreamer(
+            self.Image,
+            roiFromShape(self.Image.meta.shape),
+            batchSize=batch_size,
+            allowParallelResults=parallel_results,
+            chunkShape=tuple(int(a) for a in alignment),
+            skipRoi=self._manifest.is_complete if self._manifest is not None else None,
+        )
         requester.resultSignal.subscribe(handle_block_result)
         requester.progressSignal.subscribe(self.progressSignal)
-        requester.execute()
+        try:
+            requester.execute()
+        finally:
+            if chunk_writer is not None:
+                chunk_writer.close()
 
         # Be paranoid: Flush right now.
         if isinstance(self.f, h5py.File):
             self.f.file.flush()  # not available in z5py
 
+        if self._manifest is not None:
+            self._manifest.finish()
+            self._manifest = None
+
         # We're finished.
         result[0] = True
 
@@ -34,6 +34,7 @@ import numpy
 import vigra
 
 from lazyflow.graph import Operator, InputSlot, OutputSlot
+from lazyflow.operators import OpReorderAxes
 from lazyflow.roi import roiFromShape
 from lazyflow.utility import OrderedSignal, format_known_keys, PathComponents, mkdir_p
 from lazyflow.operators.ioOperators import (
@@ -46,6 +47,8 @@ from lazyflow.operators.ioOperators import (
     OpExportMultipageTiffSequence,
     OpExportToArray,
 )
+from lazyflow.utility.exportManifest import ExportManifest
+from lazyflow.utility.multiscales import ngff_axis_order
 
 try:
     from lazyflow.operators.ioOperators import OpExportDvidVolume
@@ -74,6 +77,18 @@ class OpExportSlot(Operator):
     )  # A format string allowing {roi}, {t_start}, {t_stop}, etc (but not {nickname} or {dataset_dir})
     OutputInternalPath = InputSlot(value="exported_data")
 
+    # Number of downsampled levels to export along with the full resolution (hdf5, n5 and zarr only).
+    # With pyramid levels, the internal path names a multiscale image group, holding the datasets "s0", "s1", ...
+    PyramidLevels = InputSlot(value=0)
+    PyramidMethod = InputSlot(value="auto")  # See lazyflow.utility.multiscales.PYRAMID_METHODS
+
+    # Record completed blocks next to the export (hdf5, n5 and zarr only), and skip the blocks that an earlier,
+    # interrupted export with the same settings has completed, instead of starting over.
+    ResumableExport = InputSlot(value=False)
+    # Identity of what is exported (json-serializable, e.g. input files and project) for resumable exports:
+    # Blocks of an interrupted export with another identity are not reused.
+    ExportIdentity = InputSlot(optional=True)
+
     CoordinateOffset = InputSlot(
         optional=True
     )  # Add an offset to the roi coordinates in the export path (useful if Input is a subregion of a larger dataset)
@@ -93,6 +108,8 @@ class OpExportSlot(Operator):
         FormatInfo("compressed hdf5", "h5", 0, 5),
         FormatInfo("n5", "n5", 0, 5),
         FormatInfo("compressed n5", "n5", 0, 5),
+        FormatInfo("zarr", "zarr", 0, 5),
+        FormatInfo("compressed zarr", "zarr", 0, 5),
         FormatInfo("numpy", "npy", 0, 5),
         FormatInfo("dvid", "", 2, 5),
         FormatInfo("blockwise hdf5", "json", 0, 5),
@@ -110,6 +127,8 @@ class OpExportSlot(Operator):
         export_impls["compressed hdf5"] = ("h5", partial(self._export_h5n5, True))
         export_impls["n5"] = ("n5", self._export_h5n5)
         export_impls["compressed n5"] = ("n5", partial(self._export_h5n5, True))
+        export_impls["zarr"] = ("zarr", self._export_zarr)
+        export_impls["compressed zarr"] = ("zarr", partial(self._export_zarr, True))
         export_impls["numpy"] = ("npy", self._export_npy)
         export_impls["dvid"] = ("", self._export_dvid)
         export_impls["blockwise hdf5"] = ("json", self._export_blockwise_hdf5)
@@ -151,7 +170,7 @@ class OpExportSlot(Operator):
             path_format += "." + file_extension
 
         # Provide the TOTAL path (including dataset name)
-        if self.OutputFormat.value in ("hdf5", "compressed hdf5", "n5", "compressed n5"):
+        if self.OutputFormat.value in ("hdf5", "compressed hdf5", "n5", "compressed n5", "zarr", "compressed zarr"):
             path_format += "/" + self.OutputInternalPath.value
 
         roi = numpy.array(roiFromShape(self.Input.meta.shape))
@@ -186,7 +205,16 @@ class OpExportSlot(Operator):
         output_format = self.OutputFormat.value
 
         # These cases support all combinations
-        if output_format in ("hdf5", "compressed hdf5", "n5", "compressed n5", "npy", "blockwise hdf5"):
+        if output_format in (
+            "hdf5",
+            "compressed hdf5",
+            "n5",
+            "compressed n5",
+            "zarr",
+            "compressed zarr",
+            "npy",
+            "blockwise hdf5",
+        ):
             return ""
 
         tagged_shape = self.Input.meta.getTaggedShape()
@@ -266,10 +294,17 @@ class OpExportSlot(Operator):
             with OpStreamingH5N5Reader.get_h5_n5_file(export_components.externalPath, mode="a") as h5N5File:
                 # Create a temporary operator to do the work for us
                 opH5N5Writer = OpH5N5WriterBigDataset(parent=self)
-                with contextlib.suppress(KeyError):
-                    del h5N5File[export_components.internalPath]
+                if not self.ResumableExport.value:
+                    with contextlib.suppress(KeyError):
+                        del h5N5File[export_components.internalPath]
                 try:
+                    if self.ResumableExport.value:
+                        opH5N5Writer.ManifestPath.setValue(self._manifest_path(export_components))
+                        opH5N5Writer.ManifestIdentity.connect(self.ExportIdentity)
                     opH5N5Writer.CompressionEnabled.setValue(compress)
+                    if self.PyramidLevels.value > 0:
+                        opH5N5Writer.PyramidLevels.setValue(self.PyramidLevels.value)
+                        opH5N5Writer.PyramidMethod.setValue(self.PyramidMethod.value)
                     opH5N5Writer.h5N5File.setValue(h5N5File)
                     opH5N5Writer.h5N5Path.setValue(export_components.internalPath)
                     opH5N5Writer.Image.connect(self.Input)
@@ -291,6 +326,51 @@ class OpExportSlot(Operator):
             sys.stderr.write(msg)
             raise
 
+    @staticmethod
+    def _manifest_path(export_components):
+        return ExportManifest.sidecar_path(export_components.externalPath, export_components.internalPath)
+
+    def _export_zarr(self, compress=False):
+        """
+        Export as an OME-Zarr (NGFF) image: The internal path names the image group,
+        which holds the data in the dataset "s0" (and pyramid levels in "s1", ...),
+        with axes in the order required by OME-Zarr (t, c, z, y, x).
+        """
+        self.progressSignal(0)
+
+        export_components = PathComponents(self.ExportPath.value)
+        image_path = (export_components.internalPath or "").strip("/")
+        axiskeys = ngff_axis_order(self.Input.meta.getAxisKeys())
+
+        with OpStreamingH5N5Reader.get_h5_n5_file(export_components.externalPath, mode="a") as zarrFile:
+            if image_path and not self.ResumableExport.value:
+                with contextlib.suppress(KeyError):
+                    del zarrFile[image_path]
+
+            opReorderAxes = OpReorderAxes(parent=self)
+            opZarrWriter = OpH5N5WriterBigDataset(parent=self)
+            try:
+                opReorderAxes.AxisOrder.setValue(axiskeys)
+                opReorderAxes.Input.connect(self.Input)
+
+                if self.ResumableExport.value:
+                    opZarrWriter.ManifestPath.setValue(self._manifest_path(export_components))
+                    opZarrWriter.ManifestIdentity.connect(self.ExportIdentity)
+                opZarrWriter.CompressionEnabled.setValue(compress)
+                opZarrWriter.PyramidLevels.setValue(self.PyramidLevels.value)
+                opZarrWriter.PyramidMethod.setValue(self.PyramidMethod.value)
+                opZarrWriter.h5N5File.setValue(zarrFile)
+                opZarrWriter.h5N5Path.setValue(image_path)
+                opZarrWriter.Image.connect(opReorderAxes.Output)
+                opZarrWriter.progressSignal.subscribe(self.progressSignal)
+
+                # Perform the export and block for it in THIS THREAD.
+                opZarrWriter.WriteImage[:].wait()
+            finally:
+                opZarrWriter.cleanUp()
+                opReorderAxes.cleanUp()
+        self.progressSignal(100)
+
     def _export_npy(self):
         self.progressSignal(0)
         export_path = self.ExportPath.value
@@ -485,6 +565,18 @@ class FormatValidity(object):
             np.float32,
             np.float64,
         ),
+        "zarr": (
+            np.uint8,
+            np.uint16,
+            np.uint32,
+            np.uint64,
+            np.int8,
+            np.int16,
+            np.int32,
+            np.int64,
+            np.float32,
+            np.float64,
+        ),
     }
 
     # { extension : (min_ndim, max_ndim) }
@@ -505,6 +597,7 @@ class FormatValidity(object):
         "compressed hdf5": (0, 5),
         "n5": (0, 5),
         "compressed n5": (0, 5),
+        "zarr": (0, 5),
     }
 
     # { extension : [allowed_num_channels] }
@@ -525,6 +618,7 @@ class FormatValidity(object):
         "compressed hdf5": (),  # ditto
         "n5": (),  # ditto
         "compressed n5": (),  # ditto
+        "zarr": (),  # ditto
     }
 
     @classmethod
@@ -39,6 +39,7 @@ from lazyflow.roi import roiFromShape
 from lazyflow.operators.generic import OpSubRegion, OpPixelOperator
 from lazyflow.operators.valueProviders import OpMetadataInjector
 from lazyflow.operators.opReorderAxes import OpReorderAxes
+from lazyflow.utility.exportManifest import ExportManifest
 from lazyflow.utility.pathHelpers import PathComponents
 
 from .opExportSlot import OpExportSlot
@@ -78,6 +79,10 @@ class OpFormattedDataExport(Operator):
     )  # A format string allowing {roi}, {x_start}, {x_stop}, etc.
     OutputInternalPath = InputSlot(value="exported_data")
     OutputFormat = InputSlot(value="hdf5")
+    PyramidLevels = InputSlot(value=0)  # Downsampled levels to export (hdf5, n5 and zarr only)
+    PyramidMethod = InputSlot(value="auto")
+    ResumableExport = InputSlot(value=False)  # Skip the blocks that an interrupted export has completed
+    ExportIdentity = InputSlot(optional=True)  # Of the input and project, for resumable exports (see OpExportSlot)
 
     ConvertedImage = OutputSlot()  # Not yet re-ordered
     ImageToExport = OutputSlot()  # Preview of the pre-processed image that will be exported
@@ -126,6 +131,10 @@ class OpFormattedDataExport(Operator):
         self._opExportSlot = OpExportSlot(parent=self)
         self._opExportSlot.Input.connect(opReorderAxes.Output)
         self._opExportSlot.OutputFormat.connect(self.OutputFormat)
+        self._opExportSlot.PyramidLevels.connect(self.PyramidLevels)
+        self._opExportSlot.PyramidMethod.connect(self.PyramidMethod)
+        self._opExportSlot.ResumableExport.connect(self.ResumableExport)
+        self._opExportSlot.ExportIdentity.connect(self.ExportIdentity)
 
         self.ExportPath.connect(self._opExportSlot.ExportPath)
         self.FormatSelectionErrorMsg.connect(self._opExportSlot.FormatSelectionErrorMsg)
@@ -278,28 +287,71 @@ class OpFormattedDataExport(Operator):
     def run_export_to_array(self):
         return self._opExportSlot.run_export_to_array()
 
-    def run_distributed_export(self, block_roi: Slice5D):
-        from lazyflow.distributed.TaskOrchestrator import TaskOrchestrator
+    def run_distributed_export(self, block_roi: Slice5D, orchestrator=None):
+        """
+        Export to n5 with several processes, which each compute blocks of block_roi's shape.
+        Without orchestrator (a lazyflow.distributed.TaskOrchestrator), the processes communicate via MPI.
+        """
+        if orchestrator is None:
+            from lazyflow.distributed.TaskOrchestrator import TaskOrchestrator
 
-        orchestrator = TaskOrchestrator()
+            orchestrator = TaskOrchestrator()
         n5_file_path = Path(self.OutputFilenameFormat.value).with_suffix(".n5")
         output_meta = self.ImageToExport.meta
         if orchestrator.rank == 0:
             output_shape = output_meta.getShape5D()
             block_shape = block_roi.clamped(output_shape.to_slice_5d()).shape
+            internal_path = self.OutputInternalPath.value
+            chunks = block_shape.to_tuple(output_meta.getAxisKeys())
 
-            with z5py.File(n5_file_path, "w") as f:
-                ds = f.create_dataset(
-                    self.OutputInternalPath.value,
-                    shape=output_meta.shape,
-                    chunks=block_shape.to_tuple(output_meta.getAxisKeys()),
-                    dtype=output_meta.dtype.__name__,
+            def tile_roi(tile: Slice5D):
+                slices = tile.to_slices(output_meta.getAxisKeys())
+                return [s.start for s in slices], [s.stop for s in slices]
+
+            manifest = None
+            if self.ResumableExport.value:
+                # Tiles are recorded by this process once their worker reports them done
+                manifest = ExportManifest(
+                    ExportManifest.sidecar_path(str(n5_file_path), internal_path),
+                    output_meta.shape,
+                    chunks,
+                    dtype=numpy.dtype(output_meta.dtype).str,
+                    identity=self.ExportIdentity.value if self.ExportIdentity.ready() else None,
+                )
+
+            with z5py.File(n5_file_path, "w" if manifest is None else "a") as f:
+                resume = (
+                    manifest is not None
+                    and not manifest.empty
+                    and internal_path in f
+                    and tuple(f[internal_path].shape) == tuple(output_meta.shape)
+                    and tuple(f[internal_path].chunks) == tuple(chunks)
                 )
-                ds.attrs["axes"] = list(reversed(output_meta.getAxisKeys()))
-                ds[...] = 1  # FIXME: for some reason setting to 0 does nothing
+                if manifest is not None and not resume:
+                    manifest.reset()
+                    if internal_path in f:
+                        del f[internal_path]
+                if not resume:
+                    ds = f.create_dataset(
+                        internal_path,
+                        shape=output_meta.shape,
+                        chunks=chunks,
+                        dtype=output_meta.dtype.__name__,
+                    )
+                    ds.attrs["axes"] = list(reversed(output_meta.getAxisKeys()))
+                    ds[...] = 1  # FIXME: for some reason setting to 0 does nothing
 
             cutout = self.get_roi()
-            orchestrator.orchestrate(cutout.split(block_shape=block_shape))
+            tiles = cutout.split(block_shape=block_shape)
+            if manifest is None:
+                orchestrator.orchestrate(tiles)
+            else:
+                try:
+                    tiles = (tile for tile in tiles if not manifest.is_complete(tile_roi(tile)))
+                    orchestrator.orchestrate(tiles, on_done=lambda tile: manifest.add(tile_roi(tile)))
+                finally:
+                    manifest.close()
+                manifest.finish()
         else:
 
             def process_tile(tile: Slice5D, rank: int):
@@ -27,6 +27,7 @@ from lazyflow.operators.ioOperators import (
     OpKlbReader,
     OpRESTfulBlockwiseFilesetReader,
     OpStreamingH5N5Reader,
+    OpStreamingZarrReader,
     OpStreamingH5N5SequenceReaderS,
     OpStreamingH5N5SequenceReaderM,
     OpTiffReader,
@@ -88,6 +89,7 @@ class OpInputDataReader(Operator):
     videoExts = ["ufmf", "mmf"]
     h5_n5_Exts = ["h5", "hdf5", "ilp", "n5"]
     n5Selection = ["json"]  # n5 stores data in a directory, containing a json-file which we use to select the n5-file
+    zarrExts = ["zarr"]
     klbExts = ["klb"]
     npyExts = ["npy"]
     npzExts = ["npz"]
@@ -98,7 +100,16 @@ class OpInputDataReader(Operator):
     vigraImpexExts = vigra.impex.listExtensions().split()
 
     SupportedExtensions = (
-        h5_n5_Exts + n5Selection + npyExts + npzExts + rawExts + vigraImpexExts + blockwiseExts + videoExts + klbExts
+        h5_n5_Exts
+        + n5Selection
+        + zarrExts
+        + npyExts
+        + npzExts
+        + rawExts
+        + vigraImpexExts
+        + blockwiseExts
+        + videoExts
+        + klbExts
     )
 
     if _supports_dvid:
@@ -193,6 +204,7 @@ class OpInputDataReader(Operator):
             self._attemptOpenAsTiffStack,
             self._attemptOpenAsStack,
             self._attemptOpenAsH5N5,
+            self._attemptOpenAsZarr,
             self._attemptOpenAsNpy,
             self._attemptOpenAsRawBinary,
             self._attemptOpenAsTiledVolume,
@@ -428,6 +440,53 @@ class OpInputDataReader(Operator):
 
         return ([h5N5Reader], h5N5Reader.OutputImage)
 
+    def _attemptOpenAsZarr(self, filePath):
+        pathComponents = PathComponents(filePath)
+        if pathComponents.extension[1:] not in OpInputDataReader.zarrExts:
+            return [], None
+
+        externalPath = pathComponents.externalPath
+        internalPath = pathComponents.internalPath or ""
+
+        if not os.path.isdir(externalPath):
+            raise OpInputDataReader.DatasetReadError("Input file does not exist: " + externalPath)
+
+        try:
+            zarrFile = OpStreamingH5N5Reader.get_h5_n5_file(externalPath, "r")
+        except Exception as e:
+            msg = "Unable to open Zarr File: {}\n{}".format(externalPath, str(e))
+            raise OpInputDataReader.DatasetReadError(msg) from e
+
+        if not internalPath and "multiscales" not in zarrFile.attrs:
+            # Not an OME-Zarr image: the store must contain a single dataset
+            possible_internal_paths = lsH5N5(zarrFile)
+            if len(possible_internal_paths) == 1:
+                internalPath = possible_internal_paths[0]["name"]
+            elif len(possible_internal_paths) == 0:
+                zarrFile.close()
+                raise OpInputDataReader.DatasetReadError("Zarr file contains no datasets: {}".format(externalPath))
+            else:
+                zarrFile.close()
+                msg = (
+                    "When using zarr, you must append the internal path to the dataset "
+                    "to your filename, e.g. myfile.zarr/volume/data  "
+                    "No internal path provided for dataset in file: {}".format(externalPath)
+                )
+                raise OpInputDataReader.DatasetReadError(msg)
+
+        self._file = zarrFile
+
+        zarrReader = OpStreamingZarrReader(parent=self)
+        zarrReader.ZarrFile.setValue(zarrFile)
+
+        try:
+            zarrReader.InternalPath.setValue(internalPath)
+        except OpStreamingZarrReader.DatasetReadError as e:
+            msg = "Error reading Zarr File: {}\n{}".format(externalPath, e.msg)
+            raise OpInputDataReader.DatasetReadError(msg) from e
+
+        return ([zarrReader], zarrReader.OutputImage)
+
     def _attemptOpenAsNpy(self, filePath):
         pathComponents = PathComponents(filePath)
         ext = pathComponents.extension
@@ -33,6 +33,7 @@ import numpy as np
 from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.utility import Timer
 from lazyflow.utility.helpers import get_default_axisordering, bigintprod
+from lazyflow.utility.multiscales import read_ngff_multiscales
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +57,7 @@ class OpStreamingH5N5Reader(Operator):
 
     H5EXTS = [".h5", ".hdf5", ".ilp"]
     N5EXTS = [".n5"]
+    ZARREXTS = [".zarr"]
 
     class DatasetReadError(Exception):
         def __init__(self, internalPath):
@@ -66,6 +68,7 @@ class OpStreamingH5N5Reader(Operator):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._h5N5File = None
+        self._internalPath = None
 
     def setupOutputs(self):
         # Read the dataset meta-info from the HDF5 dataset
@@ -75,6 +78,14 @@ class OpStreamingH5N5Reader(Operator):
         if internalPath not in self._h5N5File:
             raise OpStreamingH5N5Reader.DatasetReadError(internalPath)
 
+        multiscales = read_ngff_multiscales(self._h5N5File[internalPath].attrs)
+        if multiscales is not None:
+            # A multiscale image group (e.g. exported with a pyramid): read its full resolution level
+            internalPath = internalPath.rstrip("/") + "/" + multiscales[1][0]["path"]
+            if internalPath not in self._h5N5File:
+                raise OpStreamingH5N5Reader.DatasetReadError(internalPath)
+        self._internalPath = internalPath
+
         dataset = self._h5N5File[internalPath]
 
         try:
@@ -125,7 +136,7 @@ class OpStreamingH5N5Reader(Operator):
         # Read the desired data directly from the hdf5File
         key = roi.toSlice()
         h5N5File = self._h5N5File
-        internalPath = self.InternalPath.value
+        internalPath = self._internalPath
 
         timer = None
         if logger.isEnabledFor(logging.DEBUG):
@@ -152,12 +163,14 @@ class OpStreamingH5N5Reader(Operator):
     @staticmethod
     def get_h5_n5_file(filepath, mode="a"):
         """
-        returns, depending on the file-extension of filepath, either a hdf5 or a N5 file defined by filepath
+        returns, depending on the file-extension of filepath, either a hdf5, a N5 or a Zarr file defined by filepath
         If the file is created when it does not exist depends on mode and on the function z5py.N5File/h5py.File.
         default mode = 'a':  Read/write if exists, create otherwise
         """
         name, ext = os.path.splitext(filepath)
         if ext in OpStreamingH5N5Reader.N5EXTS:
             return z5py.N5File(filepath, mode)
+        elif ext in OpStreamingH5N5Reader.ZARREXTS:
+            return z5py.ZarrFile(filepath, mode)
         elif ext in OpStreamingH5N5Reader.H5EXTS:
             return h5py.File(filepath, mode)
@@ -0,0 +1,171 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+import logging
+from functools import partial
+
+import numpy
+import vigra
+import z5py
+
+from lazyflow.graph import Operator, InputSlot, OutputSlot
+from lazyflow.request import Request, RequestPool
+from lazyflow.roi import getIntersectingBlocks, getBlockBounds, getIntersection, roiToSlice
+from lazyflow.utility.helpers import get_default_axisordering
+from lazyflow.utility.multiscales import NGFF_AXIS_TYPES, read_ngff_multiscales
+
+logger = logging.getLogger(__name__)
+
+
+class OpStreamingZarrReader(Operator):
+    """
+    Reads a dataset or an OME-Zarr (NGFF) image from an already opened Zarr store.
+
+    If InternalPath refers to an OME-Zarr image group, the axes are taken from its multiscales metadata,
+    AvailableScales lists its scale levels and Scale selects the level to read (0 = full resolution).
+
+    Requests that cover several chunks are split along the chunk grid, and the pieces are read in parallel.
+    """
+
+    name = "OpStreamingZarrReader"
+    category = "Reader"
+
+    # The zarr store (z5py.ZarrFile, already opened)
+    ZarrFile = InputSlot()
+
+    # Path of a dataset or of an OME-Zarr image group within the store ("" for the root)
+    InternalPath = InputSlot(value="")
+
+    # Index of the scale level of an OME-Zarr image
+    Scale = InputSlot(optional=True)
+
+    # Scale levels of the image: tuple of {"path": ..., "shape": ..., "scale": ...}, full resolution first
+    AvailableScales = OutputSlot()
+
+    OutputImage = OutputSlot()
+
+    ZARREXTS = [".zarr"]
+
+    # Don't split requests into more pieces than this many per worker thread
+    MAX_READS_PER_WORKER = 4
+
+    class DatasetReadError(Exception):
+        def __init__(self, internalPath, reason="Unable to open Zarr dataset"):
+            self.internalPath = internalPath
+            self.msg = f"{reason}: {internalPath}"
+            super().__init__(self.msg)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._dataset = None
+
+    def setupOutputs(self):
+        self._dataset = None
+        zarrFile = self.ZarrFile.value
+        internalPath = self.InternalPath.value.strip("/")
+
+        if internalPath and internalPath not in zarrFile:
+            raise OpStreamingZarrReader.DatasetReadError(internalPath)
+        node = zarrFile[internalPath] if internalPath else zarrFile
+
+        multiscales = None
+        if isinstance(node, z5py.dataset.Dataset):
+            dataset = node
+            available_scales = ({"path": internalPath, "shape": dataset.shape, "scale": None},)
+        else:
+            multiscales = read_ngff_multiscales(node.attrs)
+            if multiscales is None:
+                raise OpStreamingZarrReader.DatasetReadError(internalPath, "Not a dataset or OME-Zarr image")
+            levels = multiscales[1]
+            available_scales = tuple(
+                {"path": level["path"], "shape": node[level["path"]].shape, "scale": level["scale"]}
+                for level in levels
+            )
+            scale = self.Scale.value if self.Scale.ready() else 0
+            if not 0 <= scale < len(levels):
+                raise OpStreamingZarrReader.DatasetReadError(internalPath, f"No scale level {scale} in image")
+            dataset = node[levels[scale]["path"]]
+
+        axisorder = None
+        if "axistags" in dataset.attrs:
+            axistags = vigra.AxisTags.fromJSON(dataset.attrs["axistags"])
+            axisorder = "".join(tag.key for tag in axistags)
+            if "?" in axisorder:
+                axisorder = None
+        if axisorder is None and multiscales is not None:
+            axisorder = multiscales[0]
+        if axisorder is None and "_ARRAY_DIMENSIONS" in dataset.attrs:
+            # xarray's convention for zarr
+            names = "".join(name.lower() for name in dataset.attrs["_ARRAY_DIMENSIONS"])
+            if all(key in NGFF_AXIS_TYPES for key in names) and len(set(names)) == len(names):
+                axisorder = names
+        if axisorder is None or len(axisorder) != len(dataset.shape):
+            axisorder = get_default_axisordering(dataset.shape)
+
+        self._dataset = dataset
+        self.AvailableScales.setValue(available_scales)
+
+        self.OutputImage.meta.dtype = dataset.dtype.type
+        self.OutputImage.meta.shape = dataset.shape
+        self.OutputImage.meta.axistags = vigra.defaultAxistags(str(axisorder))
+        self.OutputImage.meta.ideal_blockshape = dataset.chunks
+
+        if "drange" in dataset.attrs:
+            self.OutputImage.meta.drange = tuple(dataset.attrs["drange"])
+        if "display_mode" in dataset.attrs:
+            self.OutputImage.meta.display_mode = str(dataset.attrs["display_mode"])
+
+    def _readBlockshape(self, roi_shape):
+        """
+        Multiple of the chunk shape that splits roi_shape into not many more pieces than there are workers.
+        """
+        blockshape = numpy.array(self._dataset.chunks)
+        roi_shape = numpy.array(roi_shape)
+        max_blocks = self.MAX_READS_PER_WORKER * max(1, Request.global_thread_pool.num_workers)
+        while numpy.prod(numpy.ceil(roi_shape / blockshape)) > max_blocks:
+            # Grow the block along the axis on which it covers the smallest fraction of the roi
+            coverage = numpy.where(blockshape < roi_shape, blockshape / roi_shape, numpy.inf)
+            blockshape[numpy.argmin(coverage)] *= 2
+        return blockshape
+
+    def execute(self, slot, subindex, roi, result):
+        assert self._dataset is not None
+        dataset = self._dataset
+        blockshape = self._readBlockshape(roi.stop - roi.start)
+        block_starts = getIntersectingBlocks(blockshape, (roi.start, roi.stop))
+
+        if len(block_starts) == 1:
+            result[...] = dataset[roi.toSlice()]
+            return result
+
+        def read_block(block_roi):
+            result[roiToSlice(block_roi[0] - roi.start, block_roi[1] - roi.start)] = dataset[roiToSlice(*block_roi)]
+
+        pool = RequestPool()
+        for block_start in block_starts:
+            block_bounds = getBlockBounds(dataset.shape, blockshape, block_start)
+            block_roi = numpy.array(getIntersection(block_bounds, (roi.start, roi.stop)))
+            pool.add(Request(partial(read_block, block_roi)))
+        pool.wait()
+        return result
+
+    def propagateDirty(self, slot, subindex, roi):
+        self.OutputImage.setDirty(slice(None))
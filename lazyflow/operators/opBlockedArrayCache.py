@@ -49,10 +49,14 @@ class OpBlockedArrayCache(Operator, ManagedBlockedCache):
     # If not provided, will be set to Input.meta.shape
     BypassModeEnabled = InputSlot(value=False)
     CompressionEnabled = InputSlot(value=False)
+    StoragePrecision = InputSlot(value="full")
 
     Output = OutputSlot(allow_mask=True)
     CleanBlocks = OutputSlot()  # A list of slicings indicating which blocks are stored in the cache and clean.
 
+    # blocks are reported to the memory manager by the internal OpSimpleBlockedArrayCache
+    reportsBlockEvents = True
+
     def __init__(self, *args, **kwargs):
         super(OpBlockedArrayCache, self).__init__(*args, **kwargs)
 
@@ -74,6 +78,7 @@ class OpBlockedArrayCache(Operator, ManagedBlockedCache):
 
         self._opSimpleBlockedArrayCache = OpSimpleBlockedArrayCache(parent=self)
         self._opSimpleBlockedArrayCache.CompressionEnabled.connect(self.CompressionEnabled)
+        self._opSimpleBlockedArrayCache.StoragePrecision.connect(self.StoragePrecision)
         self._opSimpleBlockedArrayCache.Input.connect(self._opCacheFixer.Output)
         self._opSimpleBlockedArrayCache.BlockShape.connect(self.BlockShape)
         self._opSimpleBlockedArrayCache.BypassModeEnabled.connect(self.BypassModeEnabled)
@@ -117,9 +122,15 @@ class OpBlockedArrayCache(Operator, ManagedBlockedCache):
     def freeBlock(self, key):
         return self._opSimpleBlockedArrayCache.freeBlock(key)
 
+    def demoteBlock(self, key):
+        return self._opSimpleBlockedArrayCache.demoteBlock(key)
+
     def freeDirtyMemory(self):
         return self._opSimpleBlockedArrayCache.freeDirtyMemory()
 
+    def coalescingStatistics(self):
+        return self._opSimpleBlockedArrayCache.coalescingStatistics()
+
     def generateReport(self, report):
         self._opSimpleBlockedArrayCache.generateReport(report)
         child = copy.copy(report)
@@ -169,6 +169,13 @@ class ManagedBlockedCache(ManagedCache):
     Interface for caches that can be managed in more detail
     """
 
+    # Caches that call cacheMemoryManager.blockStored(), blockAccessed() and
+    # blockFreed() for all of their blocks set this to True. Otherwise, the
+    # memory manager has to enumerate all blocks via getBlockAccessTimes()
+    # whenever it needs to free memory, and knows nothing about block sizes
+    # or recompute costs.
+    reportsBlockEvents = False
+
     def lastAccessTime(self):
         """
         get the timestamp of the last access (python timestamp)
@@ -201,6 +208,17 @@ class ManagedBlockedCache(ManagedCache):
         """
         raise NotImplementedError("No default implementation for freeBlock()")
 
+    def demoteBlock(self, block_id):
+        """
+        free memory in a specific block, keeping its contents in the
+        memory manager's spill store if the cache supports reading it back
+
+        The default implementation just calls freeBlock().
+
+        @return amount of bytes freed from memory (if applicable)
+        """
+        return self.freeBlock(block_id)
+
 
 class MemInfoNode(object):
     """
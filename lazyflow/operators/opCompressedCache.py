@@ -31,6 +31,7 @@ from functools import partial
 import collections
 import itertools
 import time
+import uuid
 
 # Third-party
 import numpy
@@ -39,9 +40,11 @@ import h5py
 # Lazyflow
 from lazyflow.request import Request, RequestPool, RequestLock
 from lazyflow.graph import Operator, InputSlot, OutputSlot
+from lazyflow.operators import cacheMemoryManager
 from lazyflow.roi import TinyVector, getIntersectingBlocks, getBlockBounds, roiToSlice, getIntersection
 from lazyflow.operators.opCache import ManagedBlockedCache
 from lazyflow.utility.chunkHelpers import chooseChunkShape
+from lazyflow.utility.compressedArray import CompressedArray, CompressedBlock, copyToHdf5
 from lazyflow.utility.helpers import bigintprod
 
 logger = logging.getLogger(__name__)
@@ -53,6 +56,8 @@ def get_storage_size(h5dataset):
 
     (shorthand for the hidden h5py functionality)
     """
+    if isinstance(h5dataset, CompressedArray):
+        return h5dataset.storageSize()
     return h5py.h5d.DatasetID.get_storage_size(h5dataset.id)
 
 
@@ -69,6 +74,11 @@ class OpUnmanagedCompressedCache(Operator):
         3. Automatically determined shape with t=1, c=1 and xyz such that the
            blocks are smaller than 1MiB (raw)
 
+    With block_store = "numpy", blocks are kept in CompressedArray buffers instead of hdf5 files
+    (see lazyflow.utility.compressedArray). Those can be read and decompressed by many threads in
+    parallel, whereas h5py serializes all access. The hdf5 slots (OutputHdf5, InputHdf5) work with
+    both stores. The store is chosen when the operator is created.
+
     Note: This class is not managed by the memory manager, so there can be non-managed subclasses.
           The "managed" version is OpCompressedCache, defined below.
 
@@ -93,9 +103,16 @@ class OpUnmanagedCompressedCache(Operator):
     # Provides data as hdf5 datasets.  Only allowed for rois that exactly match a block.
     OutputHdf5 = OutputSlot(allow_mask=True)
 
+    # Storage for the blocks: "hdf5" (in-memory hdf5 files) or "numpy" (CompressedArray buffers)
+    block_store = "hdf5"
+
     def __init__(self, *args, **kwargs):
         super(OpUnmanagedCompressedCache, self).__init__(*args, **kwargs)
+        assert self.block_store in ("hdf5", "numpy"), "Unknown block store: {}".format(self.block_store)
+        self._use_numpy_store = self.block_store == "numpy"
         self._lock = RequestLock()
+        # prefix for the keys of our blocks in the memory manager's spill store
+        self._spill_namespace = uuid.uuid4().hex
         self._init_cache(None)
         self._block_id_counter = itertools.count()  # Used to ensure unique in-memory file names
         self._ignore_ideal_blockshape = False
@@ -108,6 +125,9 @@ class OpUnmanagedCompressedCache(Operator):
             self._blockLocks = {}
             self._chunkshape = self._chooseChunkshape(self._blockshape)
             self._last_access_times = collections.defaultdict(float)
+        spill_store = cacheMemoryManager.getSpillStore()
+        if spill_store is not None:
+            spill_store.discardAll(lambda key: key[0] == self._spill_namespace)
 
     def cleanUp(self):
         logger.debug("Cleaning up")
@@ -167,6 +187,20 @@ class OpUnmanagedCompressedCache(Operator):
         self._copyData(roi, destination, block_starts)
         return destination
 
+    def _forEachBlock(self, block_starts, func):
+        """
+        Call func(block_start) for all blocks; in parallel if the blocks can be read concurrently.
+        """
+        if not self._use_numpy_store:
+            # h5py would serialize parallel requests anyway
+            for block_start in block_starts:
+                func(block_start)
+            return
+        reqPool = RequestPool()
+        for block_start in block_starts:
+            reqPool.add(Request(partial(func, block_start)))
+        reqPool.wait()
+
     def _waitForBlocks(self, block_starts):
         """
         Make sure that all blocks in the given list of blocks are present in the cache before returning.
@@ -182,9 +216,9 @@ class OpUnmanagedCompressedCache(Operator):
 
     def _copyData(self, roi, destination, block_starts):
         # Copy data from each block
-        # (Parallelism not needed here: h5py will serialize these requests anyway)
         logger.debug("Copying data from {} blocks...".format(len(block_starts)))
-        for block_start in block_starts:
+
+        def copy_block(block_start):
             entire_block_roi = getBlockBounds(self.Output.meta.shape, self._blockshape, block_start)
 
             # This block's portion of the roi
@@ -210,6 +244,8 @@ class OpUnmanagedCompressedCache(Operator):
                 destination[destination_relative_intersection_slicing] = dataset[block_relative_intersection_slicing]
             self._last_access_times[block_start] = time.time()
 
+        self._forEachBlock(block_starts, copy_block)
+
     def _executeCleanBlocks(self, destination):
         """
         Execute function for the CleanBlocks output slot, which produces
@@ -242,7 +278,10 @@ class OpUnmanagedCompressedCache(Operator):
         self._ensureCached(block_roi)
         dataset = self._getBlockDataset(block_roi)
         assert str(block_roi) not in destination, "destination hdf5 group already has a dataset with this block's name"
-        destination.copy(dataset, str(block_roi))
+        if self._use_numpy_store:
+            copyToHdf5(dataset, destination, str(block_roi))
+        else:
+            destination.copy(dataset, str(block_roi))
         return destination
 
     def propagateDirty(self, slot, subindex, roi):
@@ -255,6 +294,9 @@ class OpUnmanagedCompressedCache(Operator):
 
                     for block_start in block_starts:
                         self._dirtyBlocks.add(block_start)
+                # (after marking the blocks dirty, see OpCompressedCache.demoteBlock)
+                for block_start in block_starts:
+                    self._discardSpilledBlock(block_start)
             # Forward to downstream connections
             self.Output.setDirty(roi)
         elif slot == self.BlockShape:
@@ -393,19 +435,26 @@ class OpUnmanagedCompressedCache(Operator):
             return self._cacheFiles[block_start]
         with self._lock:
             if block_start not in self._cacheFiles:
-                # Create an in-memory hdf5 file with a unique name
-                # (the counter ensures that even blocks that have been deleted previously get a unique name when they are re-created).
                 logger.debug("Creating a cache file for block: {}".format(list(block_start)))
-                filename = (
-                    str(id(self)) + str(id(self._cacheFiles)) + str(block_start) + str(next(self._block_id_counter))
-                )
-                mem_file = h5py.File(filename, driver="core", backing_store=False, mode="w")
 
                 # h5py will crash if the chunkshape is larger than the dataset shape.
                 datashape = tuple(entire_block_roi[1] - entire_block_roi[0])
                 chunkshape = numpy.minimum(numpy.array(datashape), self._chunkshape)
                 chunkshape = tuple(chunkshape)
 
+                if self._use_numpy_store:
+                    mem_file = CompressedBlock()
+                else:
+                    # Create an in-memory hdf5 file with a unique name
+                    # (the counter ensures that even blocks that have been deleted previously get a unique name when they are re-created).
+                    filename = (
+                        str(id(self))
+                        + str(id(self._cacheFiles))
+                        + str(block_start)
+                        + str(next(self._block_id_counter))
+                    )
+                    mem_file = h5py.File(filename, driver="core", backing_store=False, mode="w")
+
                 # Make a compressed dataset
                 mem_file.create_dataset(
                     "data", shape=datashape, dtype=self.Output.meta.dtype, chunks=chunkshape, compression="lzf"
@@ -440,7 +489,9 @@ class OpUnmanagedCompressedCache(Operator):
                     # Can't write directly into the hdf5 dataset because
                     #  h5py.dataset.__getitem__ creates a copy, not a view.
                     # We must use a temporary numpy array to hold the data.
-                    data = self.Input(*entire_block_roi).wait()
+                    data = self._readSpilledBlock(block_start)
+                    if data is None:
+                        data = self.Input(*entire_block_roi).wait()
                     block_file["data"][...] = data
                     if self.Output.meta.has_mask:
                         block_file["mask"][...] = data.mask
@@ -448,11 +499,12 @@ class OpUnmanagedCompressedCache(Operator):
 
                     if logger.isEnabledFor(logging.DEBUG):
                         uncompressed_size = bigintprod(data.shape) * self._getDtypeBytes(data.dtype)
-                        storage_size = block_file["data"].id.get_storage_size()
+                        storage_size = get_storage_size(block_file["data"])
                         if "mask" in block_file:
-                            storage_size += block_file["mask"].id.get_storage_size()
+                            storage_size += get_storage_size(block_file["mask"])
                         if "fill_value" in block_file:
-                            storage_size += block_file["fill_value"].id.get_storage_size()
+                            fill_value = block_file["fill_value"]
+                            storage_size += fill_value.size * self._getDtypeBytes(fill_value.dtype)
                         logger.debug(
                             "Storage for block: {} is {}. ({}% of original)".format(
                                 block_start, storage_size, 100 * storage_size / uncompressed_size
@@ -547,6 +599,7 @@ class OpUnmanagedCompressedCache(Operator):
             #  block, he is responsible for updating the ENTIRE block.
             # Therefore, this block is no longer 'dirty'
             self._dirtyBlocks.discard(block_start)
+            self._discardSpilledBlock(block_start)
 
     #            self.Output._sig_value_changed()
     #            self.OutputHdf5._sig_value_changed()
@@ -591,6 +644,7 @@ class OpUnmanagedCompressedCache(Operator):
 
             block_start = tuple(roi.start)
             self._dirtyBlocks.discard(block_start)
+            self._discardSpilledBlock(block_start)
         else:
             # This hdf5 data does not correspond to exactly one block.
             # We must uncompress it and write it the "normal" way (the slow way)
@@ -621,6 +675,26 @@ class OpUnmanagedCompressedCache(Operator):
         else:
             return block_file["data"]
 
+    def _readSpilledBlock(self, block_start):
+        """
+        Read a block that the memory manager demoted to its spill store
+        (see OpCompressedCache.demoteBlock). The spilled copy is removed.
+        """
+        spill_store = cacheMemoryManager.getSpillStore()
+        if spill_store is None or self.Output.meta.has_mask:
+            return None
+        spilled = spill_store.get((self._spill_namespace, block_start))
+        if spilled is None:
+            return None
+        spill_store.discard((self._spill_namespace, block_start))
+        data, _cost = spilled
+        return data
+
+    def _discardSpilledBlock(self, block_start):
+        spill_store = cacheMemoryManager.getSpillStore()
+        if spill_store is not None:
+            spill_store.discard((self._spill_namespace, block_start))
+
     def _closeAllCacheFiles(self):
         logger.debug("Closing all caches")
         cacheFiles = self._cacheFiles
@@ -695,6 +769,21 @@ class OpCompressedCache(OpUnmanagedCompressedCache, ManagedBlockedCache):
                 del self._last_access_times[block_id]
             return mem
 
+    def demoteBlock(self, block_id):
+        spill_store = cacheMemoryManager.getSpillStore()
+        if spill_store is None or self.Output.meta.has_mask or block_id not in self._blockLocks:
+            return self.freeBlock(block_id)
+
+        with self._blockLocks[block_id]:
+            f = self._cacheFiles.get(block_id)
+            if f is not None and "data" in f and block_id not in self._dirtyBlocks:
+                spill_store.put((self._spill_namespace, block_id), f["data"][()])
+        # If the block became dirty while we were writing it, the spilled copy is stale.
+        # (propagateDirty() discards spilled blocks only after marking them dirty.)
+        if block_id in self._dirtyBlocks:
+            spill_store.discard((self._spill_namespace, block_id))
+        return self.freeBlock(block_id)
+
     def getBlockAccessTimes(self):
         with self._lock:
             # needs to be locked because dicts must not change size
@@ -351,9 +351,9 @@ class OpCompressedUserLabelArray(OpUnmanagedCompressedCache):
         Copy data from each block into the destination array.
         For blocks that aren't currently stored, just write zeros.
         """
-        # (Parallelism not needed here: h5py will serialize these requests anyway)
         block_starts = list(map(tuple, block_starts))
-        for block_start in block_starts:
+
+        def copy_block(block_start):
             entire_block_roi = getBlockBounds(self.Output.meta.shape, self._blockshape, block_start)
 
             # This block's portion of the roi
@@ -385,6 +385,8 @@ class OpCompressedUserLabelArray(OpUnmanagedCompressedCache):
                 # Not stored yet.  Overwrite with zeros.
                 destination[destination_relative_intersection_slicing] = 0
 
+        self._forEachBlock(block_starts, copy_block)
+
     def propagateDirty(self, slot, subindex, roi):
         # There should be no way to make the output dirty except via setInSlot()
         pass
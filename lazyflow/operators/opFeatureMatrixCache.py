@@ -62,6 +62,12 @@ class OpFeatureMatrixCache(Operator):
     # to a downstream operator (such as OpConcatenateFeatureMatrices),
     # we provide the progressSignal member as an output slot.
 
+    # Features are requested for groups of nearby label points (see groupLabelPoints)
+    # rather than for the bounding box of all labels in a block.
+    sparse_cell_size = 16  # Initial grouping of the label points in cells of this size (per spatial axis)
+    sparse_halo_estimate = 8  # Rough halo of the feature computation, used to decide whether to merge groups
+    sparse_max_boxes = 256  # Label points in more cells than this are treated as dense
+
     def __init__(self, *args, **kwargs):
         super(OpFeatureMatrixCache, self).__init__(*args, **kwargs)
         self._lock = RequestLock()
@@ -269,26 +275,100 @@ class OpFeatureMatrixCache(Operator):
             # Return an empty label&feature matrix (of the correct shape)
             return numpy.ndarray(shape=(0, 1 + num_feature_channels), dtype=numpy.float32)
 
-        # Shrink the roi to the bounding box of nonzero labels
-        block_bounding_box_start = numpy.min(label_block_positions, axis=1)
-        block_bounding_box_stop = 1 + numpy.max(label_block_positions, axis=1)
-
-        global_bounding_box_start = block_bounding_box_start + label_block_roi[0][:-1]
-        global_bounding_box_stop = block_bounding_box_stop + label_block_roi[0][:-1]
-
-        # Since we're just requesting the bounding box, offset the feature positions by the box start
-        bounding_box_positions = numpy.transpose(
-            numpy.transpose(label_block_positions) - numpy.array(block_bounding_box_start)
-        )
-        bounding_box_positions = tuple(bounding_box_positions)
-
-        # Append channel roi (all feature channels)
-        feature_roi_start = list(global_bounding_box_start) + [0]
-        feature_roi_stop = list(global_bounding_box_stop) + [num_feature_channels]
+        # Group the label points into boxes and request the features of each box.
+        # For scattered labels (e.g. brush strokes) this avoids computing features
+        # for the (mostly unlabeled) bounding box of all labels in the block.
+        tagged_space_axes = [k in "zyx" for k in self.LabelImage.meta.getAxisKeys()[:-1]]
+        cell_shape = [self.sparse_cell_size if is_space else 1 for is_space in tagged_space_axes]
+        halo = [self.sparse_halo_estimate if is_space else 0 for is_space in tagged_space_axes]
+        boxes = groupLabelPoints(numpy.transpose(label_block_positions), cell_shape, halo, self.sparse_max_boxes)
+
+        block_start = numpy.array(label_block_roi[0][:-1])
+        feature_reqs = []
+        for box_start, box_stop, _ in boxes:
+            # Append channel roi (all feature channels)
+            feature_roi_start = list(box_start + block_start) + [0]
+            feature_roi_stop = list(box_stop + block_start) + [num_feature_channels]
+            req = self.FeatureImage(feature_roi_start, feature_roi_stop)
+            req.submit()
+            feature_reqs.append(req)
+
+        features_matrix = numpy.empty((len(labels_matrix), num_feature_channels), dtype=self.FeatureImage.meta.dtype)
+        for (box_start, box_stop, point_indices), req in zip(boxes, feature_reqs):
+            features = req.wait()
+            # Offset the label positions by the box start
+            box_positions = tuple(
+                positions[point_indices] - start for positions, start in zip(label_block_positions, box_start)
+            )
+            # Cast as plain ndarray (not VigraArray), since we don't need/want axistags
+            features_matrix[point_indices] = features[box_positions].view(numpy.ndarray)
+        return numpy.concatenate((labels_matrix, features_matrix), axis=1)
 
-        # Request features (bounding box only)
-        features = self.FeatureImage(feature_roi_start, feature_roi_stop).wait()
 
-        # Cast as plain ndarray (not VigraArray), since we don't need/want axistags
-        features_matrix = features[bounding_box_positions].view(numpy.ndarray)
-        return numpy.concatenate((labels_matrix, features_matrix), axis=1)
+def groupLabelPoints(points, cell_shape, halo, max_groups=256):
+    """
+    Group label points into boxes, such that computing the features in all boxes is cheap.
+
+    The points are first grouped by the cells of a grid with the given cell shape, each group gets
+    the bounding box of its points. Since the features of a box need a halo around it, two boxes
+    are merged if the merged box (with halo) is not larger than the two boxes (with halo) together.
+    If there are more than max_groups cells with points, or if the boxes end up being more
+    expensive than the bounding box of all points, the bounding box is returned.
+
+    :param points: integer array of shape (n, ndim)
+    :param cell_shape: shape of the grid cells used for the initial grouping
+    :param halo: estimated halo (per axis) the feature computation adds around each box
+    :param max_groups: maximum number of initial groups (bounds the effort spent on grouping)
+    :returns: list of (start, stop, indices) with the bounding box of each group and
+              the indices of its points
+    """
+    points = numpy.asarray(points)
+    halo = numpy.asarray(halo)
+
+    def cost(start, stop):
+        return numpy.prod(stop - start + 2 * halo, axis=-1)
+
+    bounding_box = [(points.min(axis=0), points.max(axis=0) + 1, numpy.arange(len(points)))]
+
+    cells = points // numpy.asarray(cell_shape)
+    _, cell_index = numpy.unique(cells, axis=0, return_inverse=True)
+    cell_index = cell_index.reshape(-1)
+    num_cells = cell_index.max() + 1
+    if num_cells == 1 or num_cells > max_groups:
+        # Single group, or dense labels: not worth grouping
+        return bounding_box
+
+    point_order = numpy.argsort(cell_index, kind="stable")
+    groups = numpy.split(point_order, numpy.cumsum(numpy.bincount(cell_index))[:-1])
+    starts = numpy.array([points[g].min(axis=0) for g in groups])
+    stops = numpy.array([points[g].max(axis=0) + 1 for g in groups])
+
+    # Greedily merge each box with all boxes that are cheaper to compute together with it,
+    # until no more boxes can be merged.
+    merged = True
+    while merged:
+        merged = False
+        i = 0
+        while i < len(groups):
+            merged_costs = cost(numpy.minimum(starts, starts[i]), numpy.maximum(stops, stops[i]))
+            separate_costs = cost(starts, stops) + cost(starts[i], stops[i])
+            candidates = numpy.flatnonzero(merged_costs <= separate_costs)
+            candidates = candidates[candidates != i]
+            if len(candidates) == 0:
+                i += 1
+                continue
+            j = candidates[0]
+            starts[i] = numpy.minimum(starts[i], starts[j])
+            stops[i] = numpy.maximum(stops[i], stops[j])
+            groups[i] = numpy.concatenate((groups[i], groups[j]))
+            starts = numpy.delete(starts, j, axis=0)
+            stops = numpy.delete(stops, j, axis=0)
+            del groups[j]
+            if j < i:
+                i -= 1
+            merged = True
+
+    boxes = list(zip(starts, stops, groups))
+    if sum(cost(start, stop) for start, stop, _ in boxes) >= cost(*bounding_box[0][:2]):
+        return bounding_box
+    return boxes
@@ -19,6 +19,7 @@
 # This information is also available on the ilastik web site at:
 #          http://ilastik.org/license/
 ###############################################################################
+import collections
 import copy
 import logging
 import math
@@ -41,6 +42,7 @@ from .filterOperators import (
     OpStructureTensorEigenvalues,
     OpGaussianGradientMagnitude,
     OpLaplacianOfGaussian,
+    OpDerivativeFeatures,
     WITH_FAST_FILTERS,
 )
 
@@ -76,10 +78,15 @@ class OpPixelFeaturesPresmoothed(Operator):
 
     WINDOW_SIZE = 3.5
 
+    # Compute the derivative features of a scale together from shared derivatives (see OpDerivativeFeatures).
+    FUSE_DERIVATIVE_FEATURES = True
+
     def __init__(self, *args, **kwargs):
         Operator.__init__(self, *args, **kwargs)
         self.source = OpArrayPiper(parent=self)
         self.source.Input.connect(self.Input)
+        self.derivativeOps = []
+        self.derivativeChannels = {}
 
     def getInvalidScales(self):
         """
@@ -219,6 +226,8 @@ class OpPixelFeaturesPresmoothed(Operator):
                     oparray[i].append(None)
                     featureNameArray[i].append(None)
 
+        self._setupDerivativeOps(oparray)
+
         # We use 0.7 as an approximation of not doing any smoothing.
         if self.matrix.any():
             self.max_sigma = max(0.7, max(numpy.asarray(self.scales)[self.matrix.any(axis=0)]))
@@ -240,6 +249,53 @@ class OpPixelFeaturesPresmoothed(Operator):
         #        but vigra functions may use internal RAM as well.
         self.Output.meta.ram_usage_per_requested_pixel = 4.0 * self.Output.meta.shape[1]
 
+        # Every request reads the input around the requested roi (see execute()) and converts it to float32.
+        # The halo is given per axis key, so it survives axis reordering downstream.
+        halo = int(numpy.ceil(0.7 * self.WINDOW_SIZE) + numpy.ceil(self.max_sigma * self.WINDOW_SIZE))
+        in2d = all(self.ComputeIn2d.value[j] for j in range(dimCol) if self.matrix[:, j].any())
+        self.Output.meta.halo = {"z": 0 if in2d else halo, "y": halo, "x": halo}
+        self.Output.meta.halo_ram_usage_per_pixel = (self.Input.meta.dtype().nbytes + 4.0) * self.Input.meta.shape[1]
+
+    def _setupDerivativeOps(self, featureOps):
+        """
+        Create an OpDerivativeFeatures for every scale with more than one derivative feature selected.
+
+        Sets self.derivativeOps (the operator or None for each scale) and self.derivativeChannels, which maps
+        (feature index, scale index) of the features these operators compute to the channels of the operator
+        output that correspond to the channels of featureOps[i][j].Output.
+        """
+        for op in self.derivativeOps:
+            if op is not None:
+                op.cleanUp()
+        self.derivativeOps = [None] * len(self.scales)
+        self.derivativeChannels = {}
+        if not self.FUSE_DERIVATIVE_FEATURES:
+            return
+
+        numChannels = self.Input.meta.shape[1]
+        for j in range(len(self.scales)):
+            selected = [
+                (i, featureId)
+                for i, featureId in enumerate(self.FeatureIds.value)
+                if self.matrix[i, j] and featureId in OpDerivativeFeatures.DERIVATIVE_FEATURES
+            ]
+            if len(selected) < 2:
+                continue
+
+            op = OpDerivativeFeatures(self, scale=self.newScales[j], features=[featureId for _, featureId in selected])
+            op.ComputeIn2d.setValue(self.ComputeIn2d.value[j])
+            op.Input.connect(self.source.Output)
+
+            # output channels are ordered by input channel, then feature
+            opChannels = op.resultingChannels()
+            for i, featureId in selected:
+                offset = op.featureChannelOffset(featureId)
+                featureChannels = op.featureChannels(featureId)
+                channels = [c * opChannels + offset + k for c in range(numChannels) for k in range(featureChannels)]
+                assert len(channels) == featureOps[i][j].Output.meta.shape[1]
+                self.derivativeChannels[i, j] = numpy.array(channels)
+            self.derivativeOps[j] = op
+
     def _get_ideal_blockshape(self):
         assert self.Output.meta.getAxisKeys() == list("tczyx")
 
@@ -331,7 +387,13 @@ class OpPixelFeaturesPresmoothed(Operator):
             full_output_shape = self.Output.meta.shape
             full_output_start, full_output_stop = sliceToRoi(full_output_slice, full_output_shape)
             assert len(full_output_shape) == 5
-            if all(self.ComputeIn2d.value):  # todo: check for this particular slice
+
+            # only the scales of the requested channels need to be pre-smoothed, and only their sigmas need a halo
+            plan = self._featureChannelPlan(full_output_start[1], full_output_stop[1])
+            planned_scales = {j for _, j, _, _, _ in plan}
+            max_sigma = max([0.7] + [self.scales[j] for j in planned_scales])
+
+            if all(self.ComputeIn2d.value[j] for j in planned_scales):
                 axes2enlarge = (0, 1, 1)
             else:
                 axes2enlarge = (1, 1, 1)
@@ -355,7 +417,7 @@ class OpPixelFeaturesPresmoothed(Operator):
                 input_filter_start,
                 input_filter_stop,
                 output_shape,
-                self.max_sigma,
+                max_sigma,
                 self.WINDOW_SIZE,
                 enlarge_axes=axes2enlarge,
             )
@@ -390,7 +452,6 @@ class OpPixelFeaturesPresmoothed(Operator):
             sourceV.axistags = copy.copy(self.Input.meta.axistags)
 
             dimCol = len(self.scales)
-            dimRow = self.matrix.shape[0]
 
             presmoothed_source = [None] * dimCol
 
@@ -401,12 +462,8 @@ class OpPixelFeaturesPresmoothed(Operator):
             ) + source_smooth_shape
             try:
                 for j in range(dimCol):
-                    for i in range(dimRow):
-                        if self.matrix[i, j]:
-                            # There is at least one filter op with this scale
-                            break
-                    else:
-                        # There is no filter op at this scale
+                    if j not in planned_scales:
+                        # None of the requested channels is computed at this scale
                         continue
 
                     if self.scales[j] > 1.0:
@@ -442,54 +499,64 @@ class OpPixelFeaturesPresmoothed(Operator):
                 logger.debug("Failed to free array memory.")
             del source
 
-            cnt = 0
-            written = 0
+            # the shared derivative features only pay off if more than one of them is requested
+            shared_derivatives = collections.Counter(j for i, j, _, _, _ in plan if (i, j) in self.derivativeChannels)
+
             closures = []
-            # connect individual operators
-            for i in range(dimRow):
-                for j in range(dimCol):
-                    if self.matrix[i, j]:
-                        oslot = self.featureOps[i][j].Output
-                        req = None
-                        slices = oslot.meta.shape[1]
-                        if (
-                            cnt + slices >= slot_roi.start[1]
-                            and slot_roi.start[1] - cnt < slices
-                            and slot_roi.start[1] + written < slot_roi.stop[1]
-                        ):
-                            begin = 0
-                            if cnt < slot_roi.start[1]:
-                                begin = slot_roi.start[1] - cnt
-                            end = slices
-                            if cnt + end > slot_roi.stop[1]:
-                                end = slot_roi.stop[1] - cnt
-
-                            # feature slice in output frame
-                            feature_slice = (slice(None), slice(written, written + end - begin)) + (slice(None),) * 3
-
-                            subtarget = target[feature_slice]
-                            # readjust the roi for the new source array
-                            full_filter_target_slice = [full_output_slice[0], slice(begin, end), *filter_target_slice]
-                            filter_target_roi = SubRegion(oslot, pslice=full_filter_target_slice)
-
-                            closure = partial(
-                                oslot.operator.call_execute,
-                                oslot,
-                                (),
-                                filter_target_roi,
-                                subtarget,
-                                sourceArray=presmoothed_source[j],
-                            )
-                            closures.append(closure)
-
-                            written += end - begin
-                        cnt += slices
+            derivative_targets = []
+            for i, j, begin, end, written in plan:
+                oslot = self.featureOps[i][j].Output
+                # feature slice in output frame
+                feature_slice = (slice(None), slice(written, written + end - begin)) + (slice(None),) * 3
+
+                subtarget = target[feature_slice]
+                if (i, j) in self.derivativeChannels and shared_derivatives[j] > 1:
+                    # copied from the shared derivative features of this scale below
+                    derivative_targets.append((j, self.derivativeChannels[i, j][begin:end], subtarget))
+                else:
+                    # readjust the roi for the new source array
+                    full_filter_target_slice = [full_output_slice[0], slice(begin, end), *filter_target_slice]
+                    filter_target_roi = SubRegion(oslot, pslice=full_filter_target_slice)
+
+                    closure = partial(
+                        oslot.operator.call_execute,
+                        oslot,
+                        (),
+                        filter_target_roi,
+                        subtarget,
+                        sourceArray=presmoothed_source[j],
+                    )
+                    closures.append(closure)
+
+            derivative_results = {}
+            for j in sorted({j for j, _, _ in derivative_targets}):
+                dslot = self.derivativeOps[j].Output
+                derivative_results[j] = numpy.ndarray(
+                    (full_output_stop[0] - full_output_start[0], dslot.meta.shape[1])
+                    + tuple(filter_target_stop - filter_target_start),
+                    numpy.float32,
+                )
+                full_filter_target_slice = [full_output_slice[0], slice(None), *filter_target_slice]
+                closure = partial(
+                    dslot.operator.call_execute,
+                    dslot,
+                    (),
+                    SubRegion(dslot, pslice=full_filter_target_slice),
+                    derivative_results[j],
+                    sourceArray=presmoothed_source[j],
+                )
+                closures.append(closure)
+
             pool = RequestPool()
             for c in closures:
                 pool.request(c)
             pool.wait()
             pool.clean()
 
+            for j, channels, subtarget in derivative_targets:
+                subtarget[...] = derivative_results[j][:, channels]
+            del derivative_results
+
             for i in range(len(presmoothed_source)):
                 if presmoothed_source[i] is not None:
                     try:
@@ -497,6 +564,38 @@ class OpPixelFeaturesPresmoothed(Operator):
                     except Exception:
                         presmoothed_source[i] = None
 
+    def _featureChannelPlan(self, channel_start, channel_stop):
+        """
+        Find the feature operators that compute the output channels [channel_start, channel_stop).
+
+        Returns:
+            list of (i, j, begin, end, written): channels begin:end of self.featureOps[i][j].Output are the
+            requested channels written:written + end - begin
+        """
+        plan = []
+        cnt = 0
+        written = 0
+        for i in range(self.matrix.shape[0]):
+            for j in range(len(self.scales)):
+                if self.matrix[i, j]:
+                    slices = self.featureOps[i][j].Output.meta.shape[1]
+                    if (
+                        cnt + slices >= channel_start
+                        and channel_start - cnt < slices
+                        and channel_start + written < channel_stop
+                    ):
+                        begin = 0
+                        if cnt < channel_start:
+                            begin = channel_start - cnt
+                        end = slices
+                        if cnt + end > channel_stop:
+                            end = channel_stop - cnt
+
+                        plan.append((i, j, begin, end, written))
+                        written += end - begin
+                    cnt += slices
+        return plan
+
     def _computeGaussianSmoothing(self, vol, sigma, roi, in2d):
         if WITH_FAST_FILTERS:
             # Use fast filters (if available)
@@ -48,6 +48,7 @@ class OpSlicedBlockedArrayCache(Operator, ObservableCache):
     BlockShape = InputSlot()
     BypassModeEnabled = InputSlot(value=False)
     CompressionEnabled = InputSlot(value=False)
+    StoragePrecision = InputSlot(value="full")
 
     # Outputs
     Output = OutputSlot(allow_mask=True)
@@ -122,6 +123,7 @@ class OpSlicedBlockedArrayCache(Operator, ObservableCache):
                 op.inputs["fixAtCurrent"].connect(self.inputs["fixAtCurrent"])
                 op.BypassModeEnabled.connect(self.BypassModeEnabled)
                 op.CompressionEnabled.connect(self.CompressionEnabled)
+                op.StoragePrecision.connect(self.StoragePrecision)
                 self._innerOps.append(op)
 
                 op.inputs["Input"].connect(self.inputs["Input"])
@@ -192,7 +194,7 @@ class OpSlicedBlockedArrayCache(Operator, ObservableCache):
                 # self.Output.setDirty( slice(None) )
                 pass  # Blockshape changes don't trigger dirty notifications
                 # It is considered an error to change the blockshape after the initial configuration.
-            elif slot is self.fixAtCurrent:
+            elif slot is self.fixAtCurrent or slot is self.StoragePrecision:
                 self.Output.setDirty(slice(None))
             elif slot not in (self.BypassModeEnabled, self.CompressionEnabled):
                 assert False, "Unknown dirty input slot"
@@ -23,15 +23,19 @@ from builtins import map
 ###############################################################################
 
 import time
+import uuid
 import collections
 from itertools import starmap
 import numpy
 import vigra
 
 from lazyflow.graph import Operator, InputSlot, OutputSlot
+from lazyflow.operators import cacheMemoryManager
 from lazyflow.operators.opCache import ManagedBlockedCache
 from lazyflow.request import RequestLock
-from lazyflow.roi import getIntersection, roiFromShape, roiToSlice, containing_rois, sliceToRoi
+from lazyflow.roi import getIntersection, roiFromShape, roiToSlice, sliceToRoi
+from lazyflow.utility.quantizedArray import QuantizedArray
+from lazyflow.utility.roiIndex import RoiIndex
 
 import logging
 
@@ -52,17 +56,31 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
     Instead, it is assumed that the downstream operators have chosen some reasonable blocking.
     Hopefully the downstream operators are reasonably consistent in the blocks they request data with,
     since every unique result is cached separately.
+
+    Requests that arrive while an upstream request for an enclosing block is
+    still in flight wait for that request instead of issuing their own (see
+    coalescingStatistics()).
     """
 
     Input = InputSlot(allow_mask=True)
     CompressionEnabled = InputSlot(value=False)  # If True, compression will be enabled for certain dtypes
+    # "float16", "uint16" or "uint8" to store float data with reduced precision (see lazyflow.utility.quantizedArray)
+    StoragePrecision = InputSlot(value="full")
     Output = OutputSlot(allow_mask=True)
 
     CleanBlocks = OutputSlot()  # A list of slicings indicating which blocks are stored in the cache and clean.
 
+    reportsBlockEvents = True
+
     def __init__(self, *args, **kwargs):
         super(OpUnblockedArrayCache, self).__init__(*args, **kwargs)
         self._lock = RequestLock()
+        # prefix for the keys of our blocks in the memory manager's spill store
+        self._spill_namespace = uuid.uuid4().hex
+        # number of blocks requested from upstream, and of requests that were
+        # served by waiting for such an upstream request to finish
+        self._upstream_fetches = 0
+        self._coalesced_requests = 0
         self._resetBlocks()
 
         self.Input.notifyUnready(self._resetBlocks)
@@ -95,12 +113,17 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
 
     def _execute_Output_impl(self, request_roi, result):
         request_roi = self._standardize_roi(*request_roi)
-        with self._lock:
-            block_roi = self._get_containing_block_roi(request_roi)
-            if block_roi is not None:
+        # No need to take self._lock for cache hits: the block index can be
+        # queried concurrently and stored blocks are never modified in place.
+        block_roi = self._get_containing_block_roi(request_roi)
+        if block_roi is not None:
+            block = self._block_data.get(block_roi)
+            # (The block may have been freed since we looked it up.)
+            if block is not None:
                 # Data is already in the cache. Just extract it.
                 block_relative_roi = numpy.array(request_roi) - block_roi[0]
-                self.Output.stype.copy_data(result, self._block_data[block_roi][roiToSlice(*block_relative_roi)])
+                self.Output.stype.copy_data(result, block[roiToSlice(*block_relative_roi)])
+                cacheMemoryManager.blockAccessed(self, block_roi)
                 return
 
         if self.Input.meta.dontcache:
@@ -108,17 +131,56 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
             self.Input(*request_roi).writeInto(result).block()
             return
 
+        if self._join_pending_fetch(request_roi, result):
+            return
+
         # Data isn't in the cache, so request it and cache it
         self._fetch_and_store_block(request_roi, out=result)
 
+    def _join_pending_fetch(self, request_roi, result):
+        """
+        If an upstream request for a block containing request_roi is in
+        flight, wait until that block is stored and copy the requested
+        region from it.
+
+        @return True if result was filled
+        """
+        for block_roi in self._pending_fetches.containing(request_roi):
+            block_lock = self._block_locks.get(block_roi)
+            if block_lock is None:
+                continue
+            # The fetching request holds the block lock until the block is stored.
+            with block_lock:
+                block = self._block_data.get(block_roi)
+            if block is None:
+                # The upstream request failed or the block was discarded in the meantime.
+                continue
+            block_relative_roi = numpy.array(request_roi) - block_roi[0]
+            self.Output.stype.copy_data(result, block[roiToSlice(*block_relative_roi)])
+            cacheMemoryManager.blockAccessed(self, block_roi)
+            with self._lock:
+                self._coalesced_requests += 1
+            return True
+        return False
+
+    def coalescingStatistics(self):
+        """
+        @return dict with the number of blocks requested from upstream
+                ("upstream") and the number of requests that were served
+                by waiting for an identical or enclosing upstream request
+                that was already in flight ("coalesced")
+        """
+        with self._lock:
+            return {"upstream": self._upstream_fetches, "coalesced": self._coalesced_requests}
+
     def _get_containing_block_roi(self, request_roi):
         # Does this roi happen to fit ENTIRELY within an existing stored block?
         request_roi = self._standardize_roi(*request_roi)
-        outer_rois = containing_rois(list(self._block_data.keys()), request_roi)
-        if len(outer_rois) > 0:
-            # Standardize roi for usage as dict key
-            block_roi = self._standardize_roi(*outer_rois[0])
-            return block_roi
+        if request_roi in self._block_data:
+            return request_roi
+        outer_rois = self._block_index.containing(request_roi)
+        if outer_rois:
+            return outer_rois[0]
         return None
 
     def _fetch_and_store_block(self, block_roi, out):
@@ -136,6 +198,10 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
         # without preventing parallel requests for different blocks.
         with block_lock:
             if block_roi in self._block_data:
+                # Another request fetched this block while we were waiting for the lock.
+                cacheMemoryManager.blockAccessed(self, block_roi)
+                with self._lock:
+                    self._coalesced_requests += 1
                 if out is None:
                     # Extra [:] here is in case we are decompressing from a chunkedarray
                     return self._block_data[block_roi][:]
@@ -144,20 +210,42 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
                     self.Output.stype.copy_data(out, self._block_data[block_roi][:])
                     return out
 
+            spilled = self._readSpilledBlock(block_roi)
+            if spilled is not None:
+                block_data, cost = spilled
+                if out is not None:
+                    self.Output.stype.copy_data(out, block_data)
+                self._store_block_data(block_roi, block_data, cost)
+                return out if out is not None else block_data
+
             req = self.Input(*block_roi)
             if out is not None:
                 req.writeInto(out)
-            block_data = req.wait()
-            self._store_block_data(block_roi, block_data)
+            pending_fetches = self._pending_fetches
+            pending_fetches.add(block_roi)
+            with self._lock:
+                self._upstream_fetches += 1
+            try:
+                start = time.perf_counter()
+                block_data = req.wait()
+                self._store_block_data(block_roi, block_data, cost=time.perf_counter() - start)
+            finally:
+                pending_fetches.remove(block_roi)
         return block_data
 
-    def _store_block_data(self, block_roi, block_data):
+    def _store_block_data(self, block_roi, block_data, cost=0.0):
         """
         Copy block_data and store it into the cache.
         The block_lock is not obtained here, so lock it before you call this.
+        cost is the time in seconds it took to compute block_data, it is
+        passed on to the memory manager's eviction policy.
         """
+        stored = False
+        precision = self.StoragePrecision.value
         with self._lock:
-            if self.CompressionEnabled.value and numpy.dtype(block_data.dtype) in [
+            if QuantizedArray.canStore(block_data, precision):
+                block_storage_data = QuantizedArray(block_data, precision, channel_axis=self._channelAxis())
+            elif self.CompressionEnabled.value and numpy.dtype(block_data.dtype) in [
                 numpy.dtype(numpy.uint8),
                 numpy.dtype(numpy.uint32),
                 numpy.dtype(numpy.float32),
@@ -176,8 +264,25 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
             # (Could have happened via propagateDirty() or eventually the arrayCacheMemoryMgr)
             if block_roi in self._block_locks:
                 self._block_data[block_roi] = block_storage_data
+                self._block_index.add(block_roi)
+                self._block_costs[block_roi] = cost
+                stored = True
 
         self._last_access_times[block_roi] = time.time()
+        # the block is in memory again, or was replaced by new data
+        self._discardSpilledBlock(block_roi)
+        if stored:
+            if isinstance(block_storage_data, QuantizedArray):
+                size = block_storage_data.nbytes
+            else:
+                size = block_data.size * numpy.dtype(block_data.dtype).itemsize
+            cacheMemoryManager.blockStored(self, block_roi, size, cost)
+
+    def _channelAxis(self):
+        if self.Input.meta.axistags is None:
+            return None
+        axis_keys = self.Input.meta.getAxisKeys()
+        return axis_keys.index("c") if "c" in axis_keys else None
 
     def _execute_CleanBlocks(self, slot, subindex, roi, result):
         with self._lock:
@@ -200,6 +305,11 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
     def propagateDirty(self, slot, subindex, roi):
         if slot is self.CompressionEnabled:
             return
+        if slot is self.StoragePrecision:
+            # stored blocks have the old precision
+            self._resetBlocks()
+            self.Output.setDirty(slice(None))
+            return
 
         dirty_roi = self._standardize_roi(roi.start, roi.stop)
         maximum_roi = roiFromShape(self.Input.meta.shape)
@@ -210,11 +320,14 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
             # Everything is dirty, so no need to loop
             self._resetBlocks()
         else:
-            # FIXME: This is O(N) for now.
-            #        We should speed this up by maintaining a bookkeeping data structure in execute().
-            for block_roi in list(self._block_data.keys()):
-                if getIntersection(block_roi, dirty_roi, assertIntersect=False):
-                    self.freeBlock(block_roi)
+            for block_roi in self._block_index.intersecting(dirty_roi):
+                self.freeBlock(block_roi)
+            spill_store = cacheMemoryManager.getSpillStore()
+            if spill_store is not None:
+                spill_store.discardAll(
+                    lambda key: key[0] == self._spill_namespace
+                    and getIntersection(key[1], dirty_roi, assertIntersect=False) is not None
+                )
 
         self.Output.setDirty(roi.start, roi.stop)
 
@@ -258,15 +371,58 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
 
     def freeBlock(self, key):
         with self._lock:
-            if key not in self._block_locks:
+            mem = self._removeBlock(key)
+        self._discardSpilledBlock(key)
+        cacheMemoryManager.blockFreed(self, key)
+        return mem
+
+    def demoteBlock(self, key):
+        spill_store = cacheMemoryManager.getSpillStore()
+        with self._lock:
+            block = self._block_data.get(key)
+            cost = self._block_costs.get(key, 0.0)
+        if spill_store is None or block is None:
+            return self.freeBlock(key)
+
+        # Extra [:] here is in case we are decompressing from a chunkedarray
+        spill_store.put((self._spill_namespace, key), block[:], cost)
+        with self._lock:
+            # If the block was freed or replaced while we were writing it,
+            # the spilled copy is stale.
+            if self._block_data.get(key) is not block:
+                spill_store.discard((self._spill_namespace, key))
                 return 0
-            block = self._block_data[key]
-            bytes_per_pixel = numpy.dtype(block.dtype).itemsize
-            mem = block.size * bytes_per_pixel
-            del self._block_data[key]
-            del self._block_locks[key]
-            del self._last_access_times[key]
-            return mem
+            mem = self._removeBlock(key)
+        cacheMemoryManager.blockFreed(self, key)
+        return mem
+
+    def _removeBlock(self, key):
+        """
+        Remove a block from memory and return the number of bytes freed.
+        Call this with self._lock held.
+        """
+        if key not in self._block_locks:
+            return 0
+        block = self._block_data[key]
+        bytes_per_pixel = numpy.dtype(block.dtype).itemsize
+        mem = block.size * bytes_per_pixel
+        del self._block_data[key]
+        self._block_index.remove(key)
+        del self._block_locks[key]
+        del self._last_access_times[key]
+        self._block_costs.pop(key, None)
+        return mem
+
+    def _readSpilledBlock(self, key):
+        spill_store = cacheMemoryManager.getSpillStore()
+        if spill_store is None:
+            return None
+        return spill_store.get((self._spill_namespace, key))
+
+    def _discardSpilledBlock(self, key):
+        spill_store = cacheMemoryManager.getSpillStore()
+        if spill_store is not None:
+            spill_store.discard((self._spill_namespace, key))
 
     def freeDirtyMemory(self):
         return 0.0
@@ -274,5 +430,14 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
     def _resetBlocks(self, *_):
         with self._lock:
             self._block_data = {}
+            # spatial index over the keys of self._block_data
+            self._block_index = RoiIndex()
+            # rois of the blocks that are currently requested from upstream
+            self._pending_fetches = RoiIndex()
             self._block_locks = {}
             self._last_access_times = collections.defaultdict(float)
+            self._block_costs = {}
+        cacheMemoryManager.cacheCleared(self)
+        spill_store = cacheMemoryManager.getSpillStore()
+        if spill_store is not None:
+            spill_store.discardAll(lambda key: key[0] == self._spill_namespace)
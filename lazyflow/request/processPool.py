@@ -0,0 +1,479 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2022, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""Optional process pool for GIL-bound computations.
+
+The greenlet-based :class:`~lazyflow.request.threadPool.ThreadPool` runs everything inside one
+process, so pure-Python kernels stop scaling once they saturate the GIL. Functions decorated with
+:func:`runInProcessPool` (also available as ``Operator.runInProcessPool``) are shipped to a pool
+of worker processes instead, if one has been configured via :func:`reset_process_pool`
+(``[lazyflow] processes`` in the ilastik config, or ``LAZYFLOW_PROCESSES``).
+Without a configured pool, they run inline, exactly as before.
+
+Numpy arrays are passed to and returned from the worker processes through
+``multiprocessing.shared_memory`` buffers, everything else is pickled.
+
+Decorated functions must be pure: module-level functions or static methods that only
+depend on their arguments. They cannot access slots, since the operator graph only lives
+in the parent process. Fetch the inputs in ``execute``, and call the decorated kernel with them.
+
+Example::
+
+    class OpHeavy(Operator):
+        def execute(self, slot, subindex, roi, result):
+            data = self.Input(roi.start, roi.stop).wait()
+            self._compute(data, out=result)
+
+        @Operator.runInProcessPool
+        @staticmethod
+        def _compute(data, out):
+            ...
+
+If the request that calls a decorated function is cancelled, the worker process that runs
+it is terminated (and replaced), and the request raises ``Request.CancellationException``.
+"""
+
+import atexit
+import collections
+import functools
+import importlib
+import logging
+import multiprocessing
+import threading
+import traceback
+from concurrent.futures import Future
+from multiprocessing import connection, shared_memory
+from typing import Callable, Optional
+
+import numpy
+
+from .request import Request
+
+logger = logging.getLogger(__name__)
+
+#: Seconds between checks for cancelled requests while tasks are running.
+CANCELLATION_POLL_INTERVAL = 0.05
+
+
+class SharedArray:
+    """Pickle-able handle to a numpy array that lives in a shared memory segment."""
+
+    __slots__ = ("name", "shape", "dtype")
+
+    def __init__(self, name: str, shape, dtype):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+
+    @classmethod
+    def create(cls, array: numpy.ndarray):
+        """Copy array into a new shared memory segment.
+
+        Returns:
+            The handle and the segment. The caller owns the segment, and must ``close()`` and ``unlink()`` it.
+        """
+        segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        handle = cls(segment.name, array.shape, array.dtype)
+        numpy.ndarray(handle.shape, handle.dtype, buffer=segment.buf)[...] = array
+        return handle, segment
+
+    def attach(self):
+        """Open the shared memory segment.
+
+        Returns:
+            An array view onto the segment, and the segment itself (which must be ``close()``d after use).
+        """
+        segment = shared_memory.SharedMemory(name=self.name)
+        return numpy.ndarray(self.shape, self.dtype, buffer=segment.buf), segment
+
+    def __repr__(self):
+        return f"SharedArray(name={self.name!r}, shape={self.shape}, dtype={self.dtype})"
+
+
+def _close_segment(segment, unlink=False):
+    try:
+        segment.close()
+    except BufferError:
+        # Some array still refers to the segment (e.g. via an exception traceback); it is closed once collected.
+        pass
+    if unlink:
+        segment.unlink()
+
+
+def _share(obj, segments):
+    """Replace numpy arrays in obj (recursing into tuples, lists and dicts) by SharedArray handles."""
+    if isinstance(obj, numpy.ndarray):
+        handle, segment = SharedArray.create(obj)
+        segments.append(segment)
+        return handle
+    if isinstance(obj, (tuple, list)):
+        return type(obj)(_share(o, segments) for o in obj)
+    if isinstance(obj, dict):
+        return {k: _share(v, segments) for k, v in obj.items()}
+    return obj
+
+
+def _attach(obj, segments, copy=False):
+    """Inverse of :func:`_share`. If copy is False, the returned arrays are views onto the segments."""
+    if isinstance(obj, SharedArray):
+        array, segment = obj.attach()
+        segments.append(segment)
+        return array.copy() if copy else array
+    if isinstance(obj, (tuple, list)):
+        return type(obj)(_attach(o, segments, copy) for o in obj)
+    if isinstance(obj, dict):
+        return {k: _attach(v, segments, copy) for k, v in obj.items()}
+    return obj
+
+
+class _FunctionReference:
+    """Refers to a decorated function by name, since pickle refuses to pickle the wrapper by reference."""
+
+    __slots__ = ("module", "qualname")
+
+    def __init__(self, func):
+        self.module = func.__module__
+        self.qualname = func.__qualname__
+
+    def resolve(self):
+        obj = importlib.import_module(self.module)
+        for name in self.qualname.split("."):
+            obj = getattr(obj, name)
+        # Run the undecorated function, not the wrapper that would submit it again.
+        return getattr(obj, "__process_pool_target__", obj)
+
+
+class ProcessTaskError(Exception):
+    """Raised in the parent if a task failed in a worker process and its exception could not be pickled."""
+
+
+def _worker_main(conn):
+    """Main loop of a worker process: receive a task, run it, send back the result."""
+    result_segments = []
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            message = None
+
+        # The parent has copied the previous result by now (it only sends when done with it).
+        for segment in result_segments:
+            _close_segment(segment)
+        result_segments.clear()
+
+        if message is None:
+            return
+
+        func_ref, args, kwargs = message
+        arg_segments = []
+        try:
+            func = func_ref.resolve()
+            result = func(*_attach(args, arg_segments), **_attach(kwargs, arg_segments))
+            reply = (True, _share(result, result_segments))
+            del result
+        except BaseException as e:
+            reply = (False, (e, traceback.format_exc()))
+        finally:
+            for segment in arg_segments:
+                _close_segment(segment)
+
+        try:
+            conn.send(reply)
+        except Exception:
+            # The exception (or result) could not be pickled.
+            conn.send((False, (None, traceback.format_exc())))
+
+
+class _ProcessTask:
+    __slots__ = ("func_ref", "args", "kwargs", "out", "out_view", "future", "request", "segments")
+
+    def __init__(self, func_ref, args, kwargs, out):
+        self.func_ref = func_ref
+        self.args = args
+        self.kwargs = kwargs
+        self.out = out
+        self.out_view = None
+        self.future = Future()
+        self.request = Request._current_request()
+        self.segments = []
+
+    @property
+    def cancelled(self):
+        return self.future.cancelled() or (self.request is not None and self.request.cancelled)
+
+    def share(self):
+        """Move the array arguments to shared memory; return the message for the worker process."""
+        args = _share(self.args, self.segments)
+        kwargs = _share(self.kwargs, self.segments)
+        if self.out is not None:
+            kwargs["out"], segment = SharedArray.create(self.out)
+            self.segments.append(segment)
+            self.out_view = numpy.ndarray(self.out.shape, self.out.dtype, buffer=segment.buf)
+        return self.func_ref, args, kwargs
+
+    def release(self):
+        self.out_view = None
+        for segment in self.segments:
+            _close_segment(segment, unlink=True)
+        self.segments.clear()
+
+
+class _ProcessWorker:
+    def __init__(self, context, index):
+        self.context = context
+        self.index = index
+        self.task = None
+        self.conn = None
+        self.process = None
+        self.start()
+
+    def start(self):
+        self.conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(
+            target=_worker_main, args=(child_conn,), name=f"lazyflow process worker #{self.index}", daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def restart(self):
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+        self.start()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+
+
+class ProcessPool:
+    """Run functions in a set of worker processes, on behalf of lazyflow requests.
+
+    Tasks are queued in FIFO order and dispatched by a background thread, which also
+    collects the results and watches the submitting requests for cancellation.
+
+    Attributes:
+        num_workers: The number of worker processes.
+    """
+
+    def __init__(self, num_workers: int):
+        assert num_workers > 0
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._pending = collections.deque()
+        self._stopped = False
+        self._wakeup_recv, self._wakeup_send = multiprocessing.Pipe(duplex=False)
+        self._workers = [_ProcessWorker(self._context, i) for i in range(num_workers)]
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="ProcessPool dispatcher", daemon=True)
+        self._dispatcher.start()
+        atexit.register(self.stop)
+
+    @property
+    def num_workers(self):
+        return len(self._workers)
+
+    def submit(self, func: Callable, *args, out: Optional[numpy.ndarray] = None, **kwargs) -> Future:
+        """Schedule func(*args, **kwargs) in a worker process.
+
+        func must be importable by name (a module-level function or static method).
+        If out is given, it is passed on as the ``out`` keyword argument, and whatever
+        the function writes into it is copied back into out before the future completes.
+        """
+        if self._stopped:
+            raise RuntimeError("ProcessPool has been stopped.")
+        task = _ProcessTask(_FunctionReference(func), args, kwargs, out)
+        with self._lock:
+            self._pending.append(task)
+        self._wakeup_send.send_bytes(b"")
+        return task.future
+
+    def run(self, func: Callable, *args, **kwargs):
+        """Like :meth:`submit`, but wait for the result.
+
+        Within a request, the request is suspended (not the worker thread) while the task runs.
+        """
+        future = self.submit(func, *args, **kwargs)
+        current_request = Request._current_request()
+        if current_request is not None and not future.done():
+            future.add_done_callback(lambda f: current_request._wake_up())
+            current_request._suspend()
+            Request.raise_if_cancelled()
+        return future.result()
+
+    def stop(self) -> None:
+        """Stop the dispatcher and all worker processes. Unfinished tasks are cancelled."""
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wakeup_send.send_bytes(b"")
+        self._dispatcher.join()
+
+        with self._lock:
+            pending, self._pending = list(self._pending), collections.deque()
+        for task in pending:
+            task.future.cancel()
+        for worker in self._workers:
+            if worker.task is not None:
+                self._release_task(worker, cancel=True)
+            worker.stop()
+
+    def _dispatch_loop(self):
+        while not self._stopped:
+            self._assign_pending_tasks()
+
+            busy = {w.conn: w for w in self._workers if w.task is not None}
+            ready = connection.wait([self._wakeup_recv, *busy], timeout=CANCELLATION_POLL_INTERVAL if busy else None)
+
+            for conn in ready:
+                if conn is self._wakeup_recv:
+                    conn.recv_bytes()
+                else:
+                    self._collect_result(busy[conn])
+
+            self._cancel_abandoned_tasks()
+
+    def _assign_pending_tasks(self):
+        for worker in self._workers:
+            if worker.task is not None:
+                continue
+
+            with self._lock:
+                task = self._pending.popleft() if self._pending else None
+            while task is not None and task.cancelled:
+                task.future.cancel()
+                with self._lock:
+                    task = self._pending.popleft() if self._pending else None
+            if task is None:
+                return
+
+            try:
+                worker.conn.send(task.share())
+            except Exception as e:
+                task.release()
+                task.future.set_exception(e)
+                continue
+            worker.task = task
+
+    def _collect_result(self, worker):
+        task = worker.task
+        try:
+            success, payload = worker.conn.recv()
+        except EOFError:
+            logger.error(f"Process worker #{worker.index} died while running {task.func_ref.qualname}.")
+            worker.restart()
+            self._release_task(worker, exception=ProcessTaskError("Worker process died unexpectedly."))
+            return
+
+        if not success:
+            exc, formatted_tb = payload
+            if exc is None:
+                exc = ProcessTaskError(formatted_tb)
+            logger.debug(f"Task {task.func_ref.qualname} failed in worker process:\n{formatted_tb}")
+            self._release_task(worker, exception=exc)
+            return
+
+        result_segments = []
+        try:
+            if task.out is not None:
+                task.out[...] = task.out_view
+            result = _attach(payload, result_segments, copy=True)
+        except Exception as e:
+            self._release_task(worker, exception=e)
+            return
+        finally:
+            for segment in result_segments:
+                _close_segment(segment, unlink=True)
+        self._release_task(worker, result=result)
+
+    def _cancel_abandoned_tasks(self):
+        with self._lock:
+            cancelled = [task for task in self._pending if task.cancelled]
+            for task in cancelled:
+                self._pending.remove(task)
+        for task in cancelled:
+            task.future.cancel()
+
+        for worker in self._workers:
+            if worker.task is not None and worker.task.cancelled:
+                logger.debug(f"Cancelling {worker.task.func_ref.qualname} in process worker #{worker.index}")
+                worker.restart()
+                self._release_task(worker, cancel=True)
+
+    def _release_task(self, worker, result=None, exception=None, cancel=False):
+        task, worker.task = worker.task, None
+        task.release()
+        if task.future.cancelled():
+            return
+        if cancel:
+            task.future.cancel()
+        elif exception is not None:
+            task.future.set_exception(exception)
+        else:
+            task.future.set_result(result)
+
+
+#: The process pool shared by all operators, or None if disabled.
+global_process_pool: Optional[ProcessPool] = None
+_global_pool_lock = threading.Lock()
+
+
+def reset_process_pool(num_workers: int) -> None:
+    """Replace the global process pool by one with the given number of worker processes.
+
+    With ``num_workers == 0`` (the default), the pool is disabled and decorated functions run inline.
+
+    .. note:: Only valid during startup. Running tasks are cancelled.
+    """
+    global global_process_pool
+    with _global_pool_lock:
+        if global_process_pool is not None:
+            global_process_pool.stop()
+        global_process_pool = ProcessPool(num_workers) if num_workers > 0 else None
+
+
+def runInProcessPool(func):
+    """Decorator: run func in the global process pool, if there is one.
+
+    Must be applied to module-level functions, or on top of ``@staticmethod``.
+    A keyword argument ``out`` (numpy array) is treated as an output buffer.
+    See the module documentation for details.
+    """
+    if isinstance(func, staticmethod):
+        func = func.__func__
+    if "<locals>" in func.__qualname__:
+        raise ValueError(f"{func.__qualname__} cannot be run in a process pool: it is not importable by name.")
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        pool = global_process_pool
+        if pool is None:
+            return func(*args, **kwargs)
+        return pool.run(func, *args, **kwargs)
+
+    wrapper.__process_pool_target__ = func
+    return staticmethod(wrapper) if "." in func.__qualname__ else wrapper
@@ -109,6 +109,38 @@ def log_exception(logger, msg=None, exc_info=None, level=logging.ERROR):
 
 class Request(object):
 
+    # Requests are created for every slot access, so their footprint matters.
+    # (__dict__ is kept so that client code can still attach its own attributes, e.g. RequestPool.owning_pool.)
+    __slots__ = (
+        "_lock",
+        "_sig_failed",
+        "_sig_cancelled",
+        "_sig_finished",
+        "_sig_execution_complete",
+        "fn",
+        "_result",
+        "started",
+        "cancelled",
+        "uncancellable",
+        "finished",
+        "execution_complete",
+        "_finished_event",
+        "exception",
+        "exception_info",
+        "_cleaned",
+        "greenlet",
+        "_assigned_worker",
+        "pending_requests",
+        "blocking_requests",
+        "child_requests",
+        "_current_foreign_thread",
+        "parent_request",
+        "_max_child_priority",
+        "_priority",
+        "__dict__",
+        "__weakref__",
+    )
+
     # One thread pool shared by all requests.
     # See initialization after this class definition (below)
     global_thread_pool = None
@@ -117,8 +149,11 @@ class Request(object):
     class_lock = threading.Lock()
     active_count = 0
 
+    # The active requestTracer.RequestTracer, if any.
+    _tracer = None
+
     @classmethod
-    def reset_thread_pool(cls, num_workers=min(multiprocessing.cpu_count(), 8)):
+    def reset_thread_pool(cls, num_workers=min(multiprocessing.cpu_count(), 8), work_stealing=False):
         """
         Change the number of threads allocated to the request system.
 
@@ -127,6 +162,9 @@ class Request(object):
                             workers, even on machines with many CPUs.
                             For more details, see:
                             https://github.com/ilastik/ilastik/issues/1458
+        :param work_stealing: If True, use a :class:`threadPool.WorkStealingThreadPool`
+                              (per-worker task heaps, one wakeup per task) instead of a single
+                              global task queue. Reduces lock contention on machines with many cores.
 
         As a special case, you may set ``num_workers`` to 0.
         In that case, the normal thread pool is not used at all.
@@ -142,7 +180,8 @@ class Request(object):
 
             if cls.global_thread_pool is not None:
                 cls.global_thread_pool.stop()
-            cls.global_thread_pool = threadPool.ThreadPool(num_workers)
+            pool_class = threadPool.WorkStealingThreadPool if work_stealing else threadPool.ThreadPool
+            cls.global_thread_pool = pool_class(num_workers)
 
     class CancellationException(Exception):
         """
@@ -204,10 +243,12 @@ class Request(object):
         """
 
         self._lock = threading.Lock()  # NOT an RLock, since requests may share threads
-        self._sig_failed = SimpleSignal()
-        self._sig_cancelled = SimpleSignal()
-        self._sig_finished = SimpleSignal()
-        self._sig_execution_complete = SimpleSignal()
+        # Signals are only created once somebody subscribes (see _subscribe()),
+        #  most requests are simply waited for.
+        self._sig_failed = None
+        self._sig_cancelled = None
+        self._sig_finished = None
+        self._sig_execution_complete = None
 
         # Workload
         self.fn = fn
@@ -221,7 +262,8 @@ class Request(object):
         self.uncancellable = False
         self.finished = False
         self.execution_complete = False
-        self.finished_event = threading.Event()
+        # Only needed if a foreign thread has to block for us, see _wait_within_foreign_thread()
+        self._finished_event = None
         self.exception = None
         self.exception_info = (None, None, None)
         self._cleaned = False
@@ -280,6 +322,17 @@ class Request(object):
             )
         )
 
+    def _subscribe(self, signal_name, fn):
+        """
+        Subscribe fn to one of the _sig_* signals, creating the signal if necessary.
+        Call this with self._lock held.
+        """
+        signal = getattr(self, signal_name)
+        if signal is None:
+            signal = SimpleSignal()
+            setattr(self, signal_name, signal)
+        signal.subscribe(fn)
+
     @classmethod
     def with_value(cls, value):
         """
@@ -299,23 +352,45 @@ class Request(object):
         :param _fullClean: Internal use only.  If False, only clean internal bookkeeping members.
                            Otherwise, delete everything, including the result.
         """
-        self._sig_cancelled.clean()
-        self._sig_finished.clean()
-        self._sig_failed.clean()
+        for signal in (self._sig_cancelled, self._sig_finished, self._sig_failed):
+            if signal is not None:
+                signal.clean()
 
         with self._lock:
+            self._release_children()
+        self._detach_from_parent()
+
+        if _fullClean:
+            self._cleaned = True
+            self._result = None
+
+    def _release_children(self):
+        """
+        Forget our child requests.  Call this with self._lock held.
+        """
+        if self.child_requests:
             for child in self.child_requests:
                 child.parent_request = None
             self.child_requests.clear()
 
+    def _detach_from_parent(self):
         parent_req = self.parent_request
         if parent_req is not None:
             with parent_req._lock:
                 parent_req.child_requests.discard(self)
 
-        if _fullClean:
-            self._cleaned = True
-            self._result = None
+    @property
+    def finished_event(self):
+        """
+        A threading.Event that is set once this request has finished executing.
+        Created on first access, most requests are simply waited for.
+        """
+        with self._lock:
+            if self._finished_event is None:
+                self._finished_event = threading.Event()
+                if self.execution_complete:
+                    self._finished_event.set()
+            return self._finished_event
 
     @property
     def assigned_worker(self):
@@ -374,14 +449,38 @@ class Request(object):
         # Guarantee that self.finished doesn't change while wait() owns self._lock
         with self._lock:
             self.finished = True
+            # Fast path for the common case: the request succeeded and nobody has
+            #  subscribed to any of our signals yet (later subscribers are called
+            #  immediately), so we can complete in one step.
+            quiet = (
+                self.exception is None
+                and not self.cancelled
+                and self._sig_finished is None
+                and self._sig_execution_complete is None
+                and self._finished_event is None
+            )
+            if quiet:
+                self.execution_complete = True
+                self._release_children()
+
+        if quiet:
+            # Same as clean(_fullClean=False), but our children are already released.
+            if self._sig_failed is not None:
+                self._sig_failed.clean()
+            if self._sig_cancelled is not None:
+                self._sig_cancelled.clean()
+            self._detach_from_parent()
+            self._release_execution_context()
+            return
 
         try:
             # Notify ONE callback (never more than one)
             if self.exception is not None:
-                self._sig_failed(self.exception, self.exception_info)
+                if self._sig_failed is not None:
+                    self._sig_failed(self.exception, self.exception_info)
 
                 if (
-                    len(self._sig_failed.callbacks) == 0  # No callbacks registered
+                    self._has_no_failure_handlers()  # No callbacks registered
                     and len(self.pending_requests) == 0  # No pending requests to propagate the exception to
                     and Request._current_request() is not None
                 ):  # Not executing synchronously in a non-worked ('foreign') thread
@@ -390,8 +489,9 @@ class Request(object):
                     # (Otherwise, it would be hidden.)
                     sys.excepthook(*self.exception_info)
             elif self.cancelled:
-                self._sig_cancelled()
-            else:
+                if self._sig_cancelled is not None:
+                    self._sig_cancelled()
+            elif self._sig_finished is not None:
                 self._sig_finished(self._result)
 
         except Exception as ex:
@@ -407,11 +507,11 @@ class Request(object):
 
             # If we already fired sig_failed(), then there's no point in firing it again.
             #  That's the function that caused this problem in the first place!
-            if not failed_during_failure_handler:
+            if not failed_during_failure_handler and self._sig_failed is not None:
                 self._sig_failed(self.exception, self.exception_info)
 
             if failed_during_failure_handler or (
-                len(self._sig_failed.callbacks) == 0  # No callbacks registered
+                self._has_no_failure_handlers()  # No callbacks registered
                 and len(self.pending_requests) == 0  # No pending requests to propagate the exception to
                 and Request._current_request() is not None
             ):  # Not executing synchronously in a non-worked ('foreign') thread
@@ -428,20 +528,33 @@ class Request(object):
             # Unconditionally signal (internal use only)
             with self._lock:
                 self.execution_complete = True
-                self._sig_execution_complete()
-                self._sig_execution_complete.clean()
+                if self._sig_execution_complete is not None:
+                    self._sig_execution_complete()
+                    self._sig_execution_complete.clean()
+                finished_event = self._finished_event
 
             # Notify non-request-based threads
-            self.finished_event.set()
+            if finished_event is not None:
+                finished_event.set()
+
+            self._release_execution_context()
 
-            # Clean-up
-            if self.greenlet is not None:
-                popped = self.greenlet.owning_requests.pop()
-                assert popped == self
+    def _release_execution_context(self):
+        if self.greenlet is not None:
+            owning_requests = self.greenlet.owning_requests
+            popped = owning_requests.pop()
+            assert popped == self
             self.greenlet = None
+            if owning_requests:
+                # We were executed within the greenlet of the request that waited for us,
+                #  see _wait_within_request().  Only that request is counted as active.
+                return
+
+        with Request.class_lock:
+            Request.active_count -= 1
 
-            with Request.class_lock:
-                Request.active_count -= 1
+    def _has_no_failure_handlers(self):
+        return self._sig_failed is None or len(self._sig_failed.callbacks) == 0
 
     def submit(self):
         """
@@ -559,6 +672,18 @@ class Request(object):
         # Identify the request that is waiting for us (the current context)
         current_request = Request._current_request()
 
+        tracer = Request._tracer
+        if (
+            tracer is None
+            and current_request is not None
+            and self.parent_request is current_request
+            and self._execute_inline(current_request)
+        ):
+            return self._result
+
+        if tracer is not None:
+            wait_token = tracer.begin_wait(current_request)
+
         if current_request is None:
             # 'None' means that this thread is not one of the request worker threads.
             self._wait_within_foreign_thread(timeout)
@@ -568,13 +693,16 @@ class Request(object):
             ), "The timeout parameter may only be used when wait() is called from a foreign thread."
             self._wait_within_request(current_request)
 
+        if tracer is not None:
+            tracer.end_wait(wait_token)
+
         assert self.finished
         return self._result
 
     def _wait_within_foreign_thread(self, timeout):
         """
         This is the implementation of wait() when executed from a foreign (non-worker) thread.
-        Here, we rely on an ordinary threading.Event primitive: ``self.finished_event``
+        Here, we rely on an ordinary threading.Event primitive: ``self._finished_event``
         """
         # Don't allow this request to be cancelled, since a real thread is waiting for it.
         self.uncancellable = True
@@ -611,8 +739,14 @@ class Request(object):
             self.submit()
 
         # This is a non-worker thread, so just block the old-fashioned way
-        completed = self.finished_event.wait(timeout)
-        if not completed:
+        with self._lock:
+            if self.execution_complete:
+                finished_event = None
+            else:
+                if self._finished_event is None:
+                    self._finished_event = threading.Event()
+                finished_event = self._finished_event
+        if finished_event is not None and not finished_event.wait(timeout):
             raise Request.TimeoutException()
 
         if self.cancelled:
@@ -663,13 +797,14 @@ class Request(object):
                 # This request hasn't been started yet
                 # We can execute it directly in the current greenlet instead of creating a new greenlet (big optimization)
                 # Mark it as 'started' so that no other greenlet can claim it
-                self._set_started()
+                # (not counted in active_count, see _release_execution_context())
+                self.started = True
             elif suspend_needed:
                 # This request is already started in some other greenlet.
                 # We must suspend the current greenlet while we wait for this request to complete.
                 # Here, we set up a callback so we'll wake up once this request is complete.
-                self._sig_execution_complete.subscribe(
-                    functools.partial(current_request._handle_finished_request, self)
+                self._subscribe(
+                    "_sig_execution_complete", functools.partial(current_request._handle_finished_request, self)
                 )
 
         if suspend_needed:
@@ -697,6 +832,41 @@ class Request(object):
             exc_type, exc_value, exc_tb = self.exception_info
             raise_with_traceback(exc_value, exc_tb)
 
+    def _execute_inline(self, current_request):
+        """
+        Fast path of wait() for the most common case: a request waits for a
+        child request that nobody has started yet. The child is executed right
+        here, in the greenlet of the current request, like in
+        _wait_within_request(), but without the bookkeeping that is only
+        needed for requests that may be shared with other requests.
+
+        :return: False if the request was started elsewhere in the meantime,
+                 use the regular wait() implementation then.
+        """
+        if current_request.cancelled:
+            raise Request.CancellationException()
+
+        with self._lock:
+            if self.started or self.cancelled:
+                return False
+            # Not counted in active_count, see _release_execution_context()
+            self.started = True
+            # Needed by _post_execute() to decide whether a failure has to be reported
+            self.pending_requests.add(current_request)
+
+        self.greenlet = current_request.greenlet
+        self.greenlet.owning_requests.append(self)
+        self._assigned_worker = current_request._assigned_worker
+        self._execute()
+        self.pending_requests.discard(current_request)
+
+        if current_request.cancelled:
+            raise Request.CancellationException()
+        if self.exception is not None:
+            exc_type, exc_value, exc_tb = self.exception_info
+            raise_with_traceback(exc_value, exc_tb)
+        return True
+
     def _handle_finished_request(self, request, *args):
         """
         Called when a request that we were waiting for has completed.
@@ -722,7 +892,7 @@ class Request(object):
             complete = self.execution_complete
             if not complete:
                 # Call when we eventually finish
-                self._sig_execution_complete.subscribe(lambda: callback(self))
+                self._subscribe("_sig_execution_complete", lambda: callback(self))
 
         if complete:
             callback(self)
@@ -739,7 +909,7 @@ class Request(object):
             finished = self.finished
             if not finished:
                 # Call when we eventually finish
-                self._sig_finished.subscribe(fn)
+                self._subscribe("_sig_finished", fn)
 
         if finished:
             # Call immediately
@@ -758,7 +928,7 @@ class Request(object):
             cancelled = self.cancelled
             if not finished:
                 # Call when we eventually finish
-                self._sig_cancelled.subscribe(fn)
+                self._subscribe("_sig_cancelled", fn)
 
         if finished and cancelled:
             # Call immediately
@@ -779,7 +949,7 @@ class Request(object):
             failed = self.exception is not None
             if not finished:
                 # Call when we eventually finish
-                self._sig_failed.subscribe(fn)
+                self._subscribe("_sig_failed", fn)
 
         if finished and failed:
             # Call immediately
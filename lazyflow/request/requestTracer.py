@@ -0,0 +1,235 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2022, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""Opt-in tracing of operator executions, to find out where the wall time of a workflow goes.
+
+Example::
+
+    tracer = RequestTracer()
+    with tracer:
+        op.Output[:].wait()
+
+    tracer.write_chrome_trace("trace.json")  # open in chrome://tracing or https://ui.perfetto.dev
+    print(tracer.summary_table())
+
+While no tracer is active, the hooks in ``Operator.call_execute``, ``Slot.RequestExecutionWrapper``
+and ``Request.wait`` cost one attribute lookup each.
+
+In ilastik, use the ``--trace_requests <file.json>`` command-line flag (also works with ``--headless``).
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+from typing import Dict, List
+
+from .request import Request
+
+
+class ExecutionRecord:
+    """Timing of one ``Operator.call_execute``. Times are seconds (``time.perf_counter``)."""
+
+    __slots__ = (
+        "operator",
+        "slot",
+        "roi_shape",
+        "nbytes",
+        "thread_id",
+        "start",
+        "duration",
+        "queue_wait",
+        "child_time",
+    )
+
+    def __init__(self, operator, slot, roi_shape, thread_id, start, queue_wait):
+        self.operator = operator
+        self.slot = slot
+        self.roi_shape = roi_shape
+        self.nbytes = 0
+        self.thread_id = thread_id
+        self.start = start
+        self.duration = 0.0
+        self.queue_wait = queue_wait
+        #: Time spent in wait() for other requests, or in nested call_execute()s of other operators.
+        self.child_time = 0.0
+
+    @property
+    def self_time(self):
+        return max(self.duration - self.child_time, 0.0)
+
+
+def _context_key(current_request):
+    """Requests are suspended and resumed independently, so each one gets its own record stack."""
+    return current_request if current_request is not None else threading.current_thread()
+
+
+def _roi_shape(roi):
+    try:
+        return tuple(int(stop - start) for start, stop in zip(roi.start, roi.stop))
+    except (AttributeError, TypeError):
+        return None
+
+
+class RequestTracer:
+    """Collect an :class:`ExecutionRecord` for every operator execution while active.
+
+    Only one tracer can be active at a time.
+    """
+
+    def __init__(self):
+        self.records: List[ExecutionRecord] = []
+        self._origin = None
+        self._stacks: Dict[object, List[ExecutionRecord]] = {}
+        self._queue_waits = {}
+
+    def start(self):
+        assert Request._tracer is None, "Another RequestTracer is already active."
+        self._origin = time.perf_counter()
+        Request._tracer = self
+
+    def stop(self):
+        if Request._tracer is self:
+            Request._tracer = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    # Hooks ##################################################################
+
+    def note_queue_wait(self, created):
+        """Called when a slot request starts executing; created is the perf_counter() at request creation."""
+        if created is not None:
+            key = _context_key(Request._current_request())
+            self._queue_waits[key] = time.perf_counter() - created
+
+    def begin_execute(self, operator, slot, roi):
+        key = _context_key(Request._current_request())
+        record = ExecutionRecord(
+            operator.name,
+            getattr(slot, "name", str(slot)),
+            _roi_shape(roi),
+            threading.get_ident(),
+            time.perf_counter(),
+            self._queue_waits.pop(key, 0.0),
+        )
+        self._stacks.setdefault(key, []).append(record)
+        return record
+
+    def end_execute(self, record, result):
+        record.duration = time.perf_counter() - record.start
+        record.nbytes = getattr(result, "nbytes", 0)
+        self.records.append(record)
+
+        key = _context_key(Request._current_request())
+        stack = self._stacks.get(key)
+        if stack:
+            stack.pop()
+            if stack:
+                stack[-1].child_time += record.duration
+            else:
+                del self._stacks[key]
+
+    def begin_wait(self, current_request):
+        """Called when Request.wait() is entered; returns a token for :meth:`end_wait`."""
+        stack = self._stacks.get(_context_key(current_request))
+        if not stack:
+            return None
+        record = stack[-1]
+        return record, record.child_time, time.perf_counter()
+
+    def end_wait(self, token):
+        """Attribute the time spent in Request.wait() to the waiting execution."""
+        if token is None:
+            return
+        record, child_time_before, wait_start = token
+        # Requests executed inline in the waiting thread have already been added by end_execute()
+        nested = record.child_time - child_time_before
+        record.child_time += max(time.perf_counter() - wait_start - nested, 0.0)
+
+    # Export #################################################################
+
+    def chrome_trace_events(self):
+        """Return the records as Chrome trace-event 'complete' events."""
+        pid = os.getpid()
+        events = []
+        for r in list(self.records):
+            events.append(
+                {
+                    "name": f"{r.operator}.{r.slot}",
+                    "cat": r.operator,
+                    "ph": "X",
+                    "ts": (r.start - self._origin) * 1e6,
+                    "dur": r.duration * 1e6,
+                    "pid": pid,
+                    "tid": r.thread_id,
+                    "args": {
+                        "roi_shape": r.roi_shape,
+                        "bytes": r.nbytes,
+                        "queue_wait_ms": r.queue_wait * 1e3,
+                        "child_wait_ms": r.child_time * 1e3,
+                    },
+                }
+            )
+        return events
+
+    def write_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.chrome_trace_events(), "displayTimeUnit": "ms"}, f)
+
+    def summary(self):
+        """Aggregate the records per operator and slot, sorted by total self time (descending)."""
+        totals = collections.OrderedDict()
+        for r in list(self.records):
+            row = totals.setdefault(
+                (r.operator, r.slot),
+                {
+                    "operator": r.operator,
+                    "slot": r.slot,
+                    "calls": 0,
+                    "total": 0.0,
+                    "self": 0.0,
+                    "queue": 0.0,
+                    "bytes": 0,
+                },
+            )
+            row["calls"] += 1
+            row["total"] += r.duration
+            row["self"] += r.self_time
+            row["queue"] += r.queue_wait
+            row["bytes"] += r.nbytes
+        return sorted(totals.values(), key=lambda row: row["self"], reverse=True)
+
+    def summary_table(self):
+        header = f"{'operator.slot':<60} {'calls':>8} {'total [s]':>10} {'self [s]':>10} {'queue [s]':>10} {'MB':>10}"
+        lines = [header, "-" * len(header)]
+        for row in self.summary():
+            name = f"{row['operator']}.{row['slot']}"
+            lines.append(
+                f"{name:<60.60} {row['calls']:>8} {row['total']:>10.3f} {row['self']:>10.3f}"
+                f" {row['queue']:>10.3f} {row['bytes'] / 1e6:>10.1f}"
+            )
+        return "\n".join(lines)
@@ -21,8 +21,11 @@
 ###############################################################################
 
 import atexit
+import heapq
+import itertools
 import logging
 import queue
+import random
 import threading
 from typing import Callable, List
 
@@ -36,11 +39,13 @@ class ThreadPool:
         num_workers: The number of worker threads.
     """
 
+    _worker_class = None  # Set to _Worker below, after the class definition
+
     def __init__(self, num_workers: int):
         """Start all workers."""
         self.unassigned_tasks = queue.PriorityQueue()
 
-        self.workers = {_Worker(self, i) for i in range(num_workers)}
+        self.workers = {self._worker_class(self, i) for i in range(num_workers)}
         for w in self.workers:
             w.start()
 
@@ -182,3 +187,178 @@ class _Worker(threading.Thread):
                 # You may have to wrap it in a custom class first.
                 task.assigned_worker = self
                 return task
+
+
+ThreadPool._worker_class = _Worker
+
+
+class WorkStealingThreadPool(ThreadPool):
+    """Thread pool with per-worker task heaps, targeted wakeups and work stealing.
+
+    Unassigned tasks are pushed onto the local heap of the submitting worker (or of a
+    round-robin chosen worker, if submitted from a foreign thread), and only a single idle
+    worker is woken up for each task. Idle workers steal the highest-priority unassigned
+    task from their peers.
+
+    Tasks that already have an ``assigned_worker`` (i.e. started greenlets) are never stolen,
+    and each heap is ordered by the tasks' own ``__lt__``, like the global queue of :class:`ThreadPool`.
+    """
+
+    def __init__(self, num_workers: int):
+        # Must exist before the workers start, since they register as idle immediately.
+        self._idle_lock = threading.Lock()
+        self._idle_workers = []  # LIFO, so that the most recently active (cache-warm) worker is woken first
+        self._submit_counter = itertools.count()
+        self._worker_list = []
+        super().__init__(num_workers)
+        self._worker_list = sorted(self.workers, key=lambda w: w.name)
+
+    def wake_up(self, task: Callable[[], None]) -> None:
+        """Schedule the given task on the worker that is assigned to it.
+
+        If it has no assigned worker yet, push it to a local task heap and wake up one idle worker.
+        """
+        if getattr(task, "assigned_worker", None) is not None:
+            task.assigned_worker.wake_up(task)
+            return
+
+        home = threading.current_thread()
+        if home not in self.workers:
+            home = self._worker_list[next(self._submit_counter) % len(self._worker_list)]
+        home.push_unassigned(task)
+        self._notify_idle_worker()
+
+    def _notify_idle_worker(self) -> None:
+        with self._idle_lock:
+            if not self._idle_workers:
+                return
+            worker = self._idle_workers.pop()
+        worker.notify()
+
+    def _mark_idle(self, worker: "_StealingWorker") -> None:
+        with self._idle_lock:
+            if worker not in self._idle_workers:
+                self._idle_workers.append(worker)
+
+    def _unmark_idle(self, worker: "_StealingWorker") -> bool:
+        """Remove worker from the idle list.
+
+        Return False if it had already been removed by a notifier, i.e. a wakeup was addressed to it.
+        """
+        with self._idle_lock:
+            try:
+                self._idle_workers.remove(worker)
+            except ValueError:
+                return False
+            return True
+
+    def _steal(self, thief: "_StealingWorker"):
+        """Take the highest-priority unassigned task from some other worker, or return None."""
+        workers = self._worker_list
+        if len(workers) < 2:
+            return None
+        start = random.randrange(len(workers))
+        for i in range(len(workers)):
+            victim = workers[(start + i) % len(workers)]
+            if victim is thief:
+                continue
+            task = victim.pop_unassigned()
+            if task is not None:
+                return task
+        return None
+
+
+class _StealingWorker(_Worker):
+    """Worker of a :class:`WorkStealingThreadPool`.
+
+    In addition to the queue of tasks that are bound to this worker (``job_queue``),
+    each worker owns a heap of unassigned tasks that any other worker may steal from.
+    """
+
+    def __init__(self, thread_pool, index):
+        super().__init__(thread_pool, index)
+        self.unassigned_tasks = []
+        self._unassigned_lock = threading.Lock()
+        self._notified = False
+
+    def push_unassigned(self, task):
+        with self._unassigned_lock:
+            heapq.heappush(self.unassigned_tasks, task)
+
+    def pop_unassigned(self):
+        with self._unassigned_lock:
+            if self.unassigned_tasks:
+                return heapq.heappop(self.unassigned_tasks)
+        return None
+
+    def notify(self):
+        """Wake up this worker if it is waiting for work."""
+        with self.job_queue_condition:
+            self._notified = True
+            self.job_queue_condition.notify()
+
+    def wake_up(self, task):
+        """Add this task to the queue of tasks that are ready to be processed.
+
+        The task may or not be started already.
+        """
+        assert task.assigned_worker is self
+        # This worker is going to be busy; don't let the pool hand it unassigned work too.
+        self.thread_pool._unmark_idle(self)
+        with self.job_queue_condition:
+            self.job_queue.put_nowait(task)
+            self._notified = True
+            self.job_queue_condition.notify()
+
+    def _get_next_job(self):
+        """Get the next available job to perform.
+
+        If necessary, block until a task is available (return it) or the worker has been stopped (might return None).
+        """
+        while not self.stopped:
+            next_task = self._pop_job()
+            if next_task is not None:
+                return next_task
+
+            with self.job_queue_condition:
+                self._notified = False
+
+            # Advertise idleness *before* the final check, so that a task pushed after this
+            # check is guaranteed to find this (or another) idle worker to notify.
+            self.thread_pool._mark_idle(self)
+            next_task = self._pop_job()
+            if next_task is not None:
+                if not self.thread_pool._unmark_idle(self):
+                    # A wakeup meant for this worker is consumed by the task we just found, pass it on.
+                    self.thread_pool._notify_idle_worker()
+                return next_task
+
+            with self.job_queue_condition:
+                while not (self._notified or self.stopped):
+                    self.job_queue_condition.wait()
+            self.thread_pool._unmark_idle(self)
+
+        return None
+
+    def _pop_job(self):
+        """Get a job from our own job queue, our own unassigned heap, or steal one from another worker.
+
+        Return None if no work is available.
+
+        Non-blocking.
+        """
+        try:
+            return self.job_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+        task = self.pop_unassigned()
+        if task is None:
+            task = self.thread_pool._steal(self)
+        if task is not None:
+            # See _Worker._pop_job
+            task.assigned_worker = self
+        return task
+
+
+WorkStealingThreadPool._worker_class = _StealingWorker
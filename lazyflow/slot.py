@@ -844,14 +844,19 @@ class Slot(object):
         return "Couldn't find an upstream problem slot."
 
     class RequestExecutionWrapper:
-        __slots__ = ("slot", "operator", "roi")
+        __slots__ = ("slot", "operator", "roi", "created")
 
         def __init__(self, slot, roi):
             self.slot = slot
             self.operator = slot.operator
             self.roi = roi
+            # Only needed for request tracing (queue wait time)
+            self.created = time.perf_counter() if Request._tracer is not None else None
 
         def __call__(self, destination=None):
+            if Request._tracer is not None:
+                Request._tracer.note_queue_wait(self.created)
+
             # store whether the user wants the results in a given
             # destination area
             destination_given = destination is not None
@@ -95,7 +95,15 @@ class BigRequestStreamer(object):
     """
 
     def __init__(
-        self, outputSlot, roi, blockshape=None, batchSize=None, blockAlignment="absolute", allowParallelResults=False
+        self,
+        outputSlot,
+        roi,
+        blockshape=None,
+        batchSize=None,
+        blockAlignment="absolute",
+        allowParallelResults=False,
+        chunkShape=None,
+        skipRoi=None,
     ):
         """
         Constructor.
@@ -107,6 +115,10 @@ class BigRequestStreamer(object):
         :param blockAlignment: Determines how block the requests. Choices are 'absolute' or 'relative'.
         :param allowParallelResults: If False, The resultSignal will not be called in parallel.
                                      In that case, your handler function has no need for locks.
+        :param chunkShape: If given, the blockshape is rounded up to a multiple of it.  With 'absolute' alignment,
+                           every block then covers whole chunks (e.g. of the dataset the results are written to).
+        :param skipRoi: If given, a function ``f(roi)`` that returns True for blocks that need not be requested,
+                        e.g. because their results have been written by an earlier, interrupted run.
         """
         self._outputSlot = outputSlot
         self._bigRoi = roi
@@ -120,6 +132,9 @@ class BigRequestStreamer(object):
         if blockshape is None:
             blockshape = self._determine_blockshape(outputSlot)
 
+        if chunkShape is not None:
+            blockshape = tuple(int(numpy.ceil(b / c)) * c for b, c in zip(blockshape, chunkShape))
+
         assert blockAlignment in ["relative", "absolute"]
         if blockAlignment == "relative":
             # Align the blocking with the start of the roi
@@ -174,7 +189,15 @@ class BigRequestStreamer(object):
                         logger.debug("Requesting Roi: {}".format(block_bounds))
                         yield block_intersecting_portion
 
-        self._requestBatch = RoiRequestBatch(self._outputSlot, roiGen(), totalVolume, batchSize, allowParallelResults)
+        roiIter = roiGen()
+        if skipRoi is not None:
+            # Filter the blocks up front, so that progress is reported for the remaining blocks only
+            rois = [roi for roi in roiIter if not skipRoi(roi)]
+            logger.info(f"Skipping {len(block_starts) - len(rois)} of {len(block_starts)} blocks")
+            totalVolume = sum(bigintprod(numpy.subtract(roi[1], roi[0])) for roi in rois)
+            roiIter = iter(rois)
+
+        self._requestBatch = RoiRequestBatch(self._outputSlot, roiIter, totalVolume, batchSize, allowParallelResults)
 
     def _determine_blockshape(self, outputSlot):
         """
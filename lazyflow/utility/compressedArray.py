@@ -0,0 +1,248 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Chunked, compressed in-memory arrays
+
+CompressedArray and CompressedBlock implement the small part of the
+h5py Dataset/File interface that OpUnmanagedCompressedCache uses for its
+blocks, without h5py's global lock: any number of threads can read (and
+decompress) concurrently, writes to an array are serialized.
+
+Chunks are compressed with blosc/LZ4 if python-blosc is installed and
+with zlib otherwise. Both release the GIL.
+"""
+
+import itertools
+import threading
+import zlib
+
+import numpy
+
+try:
+    import blosc
+
+    blosc.set_releasegil(True)
+    _supports_blosc = True
+except ImportError:
+    _supports_blosc = False
+
+
+def compress(buffer, typesize):
+    if _supports_blosc:
+        return blosc.compress(buffer, typesize=typesize, cname="lz4")
+    return zlib.compress(buffer, 1)
+
+
+def decompress(buffer):
+    if _supports_blosc:
+        return blosc.decompress(buffer)
+    return zlib.decompress(buffer)
+
+
+class CompressedArray(object):
+    """
+    array stored as separately compressed chunks
+
+    Supports reading and writing with basic slicing (slices with step 1,
+    integers, Ellipsis). Chunks that were never written read as zeros.
+    """
+
+    def __init__(self, shape, dtype, chunks=None):
+        self.shape = tuple(int(s) for s in shape)
+        self.dtype = numpy.dtype(dtype)
+        if chunks is None:
+            chunks = self.shape
+        self.chunks = tuple(max(1, min(int(c), s)) for c, s in zip(chunks, self.shape))
+        # chunk index -> compressed bytes; missing chunks are all zero
+        self._chunks = {}
+        self._write_lock = threading.Lock()
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(numpy.prod(self.shape, dtype=numpy.int64))
+
+    def storageSize(self):
+        """
+        number of bytes used by the compressed chunks
+        """
+        return sum(len(chunk) for chunk in list(self._chunks.values()))
+
+    def __getitem__(self, key):
+        starts, stops, int_axes = self._normalizeKey(key)
+        result = numpy.zeros(tuple(numpy.subtract(stops, starts)), dtype=self.dtype)
+        for chunk_index, chunk_slicing, result_slicing in self._intersectingChunks(starts, stops):
+            data = self._chunks.get(chunk_index)
+            if data is not None:
+                result[result_slicing] = self._decompressChunk(chunk_index, data)[chunk_slicing]
+        if int_axes:
+            result = result[tuple(0 if axis in int_axes else slice(None) for axis in range(self.ndim))]
+        return result
+
+    def __setitem__(self, key, value):
+        starts, stops, int_axes = self._normalizeKey(key)
+        shape = tuple(numpy.subtract(stops, starts))
+        value = numpy.asarray(value, dtype=self.dtype)
+        if int_axes and value.ndim == self.ndim - len(int_axes):
+            value = numpy.expand_dims(value, tuple(int_axes))
+        value = numpy.broadcast_to(value, shape)
+
+        with self._write_lock:
+            for chunk_index, chunk_slicing, value_slicing in self._intersectingChunks(starts, stops):
+                chunk_shape = self._chunkShape(chunk_index)
+                if all(s.stop - s.start == n for s, n in zip(chunk_slicing, chunk_shape)):
+                    chunk = value[value_slicing]
+                else:
+                    data = self._chunks.get(chunk_index)
+                    if data is None:
+                        chunk = numpy.zeros(chunk_shape, dtype=self.dtype)
+                    else:
+                        chunk = self._decompressChunk(chunk_index, data).copy()
+                    chunk[chunk_slicing] = value[value_slicing]
+                self._chunks[chunk_index] = compress(
+                    numpy.ascontiguousarray(chunk).tobytes(), typesize=self.dtype.itemsize
+                )
+
+    def _decompressChunk(self, chunk_index, data):
+        return numpy.frombuffer(decompress(data), dtype=self.dtype).reshape(self._chunkShape(chunk_index))
+
+    def _chunkShape(self, chunk_index):
+        return tuple(min(c, s - i * c) for i, c, s in zip(chunk_index, self.chunks, self.shape))
+
+    def _normalizeKey(self, key):
+        """
+        convert key to start and stop coordinates and the list of axes
+        that were indexed with integers
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = next(i for i, k in enumerate(key) if k is Ellipsis)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1 :]
+        key = key + (slice(None),) * (self.ndim - len(key))
+        assert len(key) == self.ndim, "Too many indices for array of shape {}".format(self.shape)
+
+        starts, stops, int_axes = [], [], []
+        for axis, (k, s) in enumerate(zip(key, self.shape)):
+            if isinstance(k, slice):
+                start, stop, step = k.indices(s)
+                assert step == 1, "CompressedArray only supports slices with step 1"
+                stop = max(start, stop)
+            else:
+                start = int(k)
+                if start < 0:
+                    start += s
+                assert 0 <= start < s, "Index {} out of bounds for axis {} with size {}".format(k, axis, s)
+                stop = start + 1
+                int_axes.append(axis)
+            starts.append(start)
+            stops.append(stop)
+        return starts, stops, int_axes
+
+    def _intersectingChunks(self, starts, stops):
+        """
+        iterate over (chunk index, slicing within chunk, slicing within the roi)
+        for all chunks that intersect the roi [starts, stops)
+        """
+        if any(stop <= start for start, stop in zip(starts, stops)):
+            return
+        ranges = [range(start // c, -(-stop // c)) for start, stop, c in zip(starts, stops, self.chunks)]
+        for chunk_index in itertools.product(*ranges):
+            chunk_start = [i * c for i, c in zip(chunk_index, self.chunks)]
+            lo = [max(a, b) for a, b in zip(starts, chunk_start)]
+            hi = [min(a, b + c) for a, b, c in zip(stops, chunk_start, self.chunks)]
+            chunk_slicing = tuple(slice(l - c, h - c) for l, h, c in zip(lo, hi, chunk_start))
+            roi_slicing = tuple(slice(l - s, h - s) for l, h, s in zip(lo, hi, starts))
+            yield chunk_index, chunk_slicing, roi_slicing
+
+
+class CompressedBlock(object):
+    """
+    group of named arrays standing in for the in-memory hdf5 file of a cache block
+
+    Provides the dict-like access, close() and copy() used by
+    OpUnmanagedCompressedCache. Scalar entries (like "fill_value") are
+    stored as plain 0-d numpy arrays.
+    """
+
+    def __init__(self):
+        self._arrays = {}
+
+    def create_dataset(self, name, shape, dtype, chunks=None, compression=None):
+        """
+        create an all-zero array; compression is accepted for compatibility
+        with h5py, the module's codec is always used
+        """
+        if len(shape) == 0:
+            array = numpy.zeros(shape, dtype=dtype)
+        else:
+            array = CompressedArray(shape, dtype, chunks)
+        self._arrays[name] = array
+        return array
+
+    def copy(self, source, name):
+        """
+        store a copy of the array-like source (e.g. an h5py dataset) as name
+        """
+        data = numpy.asarray(source[()])
+        chunks = getattr(source, "chunks", None)
+        array = self.create_dataset(name, data.shape, data.dtype, chunks)
+        array[...] = data
+
+    def close(self):
+        self._arrays = {}
+
+    def keys(self):
+        return self._arrays.keys()
+
+    def __len__(self):
+        return len(self._arrays)
+
+    def __contains__(self, name):
+        return name in self._arrays
+
+    def __getitem__(self, name):
+        if name == "/":
+            return self
+        return self._arrays[name]
+
+    def __delitem__(self, name):
+        del self._arrays[name]
+
+
+def copyToHdf5(source, group, name):
+    """
+    write a CompressedArray or CompressedBlock to the h5py group, in the
+    layout h5py.Group.copy() produces for the in-memory hdf5 files of
+    OpUnmanagedCompressedCache
+    """
+    if isinstance(source, CompressedBlock):
+        subgroup = group.create_group(name)
+        for key in source.keys():
+            copyToHdf5(source[key], subgroup, key)
+    elif isinstance(source, CompressedArray):
+        group.create_dataset(name, data=source[()], chunks=source.chunks, compression="lzf")
+    else:
+        group.create_dataset(name, data=source)
@@ -0,0 +1,175 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+import contextlib
+import json
+import logging
+import os
+import threading
+
+import numpy
+
+logger = logging.getLogger(__name__)
+
+
+class ExportManifest(object):
+    """
+    Sidecar file that records the blocks of a blockwise export that have been written completely,
+    so that an interrupted export can be resumed without computing them again.
+
+    The first line of the file is a json header that describes the export (shape, grid, and any settings
+    the caller passes, e.g. an identity of the exported input and project).  Each following line is the
+    json roi ``[start, stop]`` of one completed block.
+    Lines are flushed to disk as soon as they are added, so after a crash the manifest lists at most
+    the blocks that were really written.  Once the export is complete, the manifest is removed (see finish()).
+
+    Completed regions are tracked on a grid (usually the chunk grid of the exported dataset):
+    a grid cell counts as done once a completed block covers it entirely.
+
+    Example:
+        >>> import tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), "export.manifest")
+        >>> manifest = ExportManifest(path, shape=(100, 100), grid=(10, 10))
+        >>> manifest.add(((0, 0), (20, 100)))
+        >>> manifest.is_complete(((10, 30), (20, 40))), manifest.is_complete(((10, 30), (30, 40)))
+        (True, False)
+        >>> ExportManifest(path, shape=(100, 100), grid=(10, 10)).is_complete(((10, 30), (20, 40)))
+        True
+    """
+
+    def __init__(self, path, shape, grid, **settings):
+        """
+        Open the manifest at path.  If it exists and its header matches the given shape, grid and settings,
+        the blocks recorded in it count as completed.  Otherwise, a new manifest is started.
+        """
+        self.path = path
+        header = dict(settings, shape=[int(s) for s in shape], grid=[int(g) for g in grid])
+        self._header = json.loads(json.dumps(header))  # as read back from the file, e.g. tuples become lists
+        self._shape = numpy.array(shape)
+        self._grid = numpy.array(grid)
+        self._done = numpy.zeros(-(-self._shape // self._grid), dtype=bool)
+        self._lock = threading.Lock()
+        self._file = None
+
+        rois = self._read()
+        if rois is None:
+            self.reset()
+        else:
+            for roi in rois:
+                self._mark(roi)
+            self._file = open(self.path, "a")
+            logger.info(f"Resuming export: {len(rois)} completed blocks in {self.path}")
+
+    def _read(self):
+        """
+        The rois recorded in an existing manifest, or None if there is no manifest for this export.
+        """
+        try:
+            with open(self.path, "r") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return None
+        try:
+            if not lines or json.loads(lines[0]) != self._header:
+                logger.info(f"Ignoring manifest of a different export: {self.path}")
+                return None
+            # The last line might be incomplete if the export was killed while writing it
+            return [json.loads(line) for line in lines[1:] if line.endswith("\n")]
+        except ValueError:
+            logger.warning(f"Ignoring unreadable manifest: {self.path}")
+            return None
+
+    def reset(self):
+        """
+        Forget all completed blocks, e.g. because the exported data has been discarded.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self._done[...] = False
+            self._file = open(self.path, "w")
+            self._file.write(json.dumps(self._header) + "\n")
+            self._sync()
+
+    @property
+    def empty(self):
+        return not self._done.any()
+
+    def _cells(self, roi, inner):
+        """
+        Slicing of the grid cells that lie entirely within roi (inner=True) or intersect it (inner=False).
+        The cells at the upper border of the shape are clipped to it.
+        """
+        start, stop = numpy.array(roi[0]), numpy.minimum(roi[1], self._shape)
+        if inner:
+            first, last = -(-start // self._grid), stop // self._grid
+            last = numpy.where(stop == self._shape, self._done.shape, last)
+        else:
+            first, last = start // self._grid, -(-stop // self._grid)
+        return tuple(slice(int(a), max(int(a), int(b))) for a, b in zip(first, last))
+
+    def _mark(self, roi):
+        self._done[self._cells(roi, inner=True)] = True
+
+    def is_complete(self, roi):
+        """
+        True if all of roi has been written by completed blocks.
+        """
+        if (numpy.array(roi[1]) > self._shape).any():
+            return False
+        return bool(self._done[self._cells(roi, inner=False)].all())
+
+    def add(self, roi):
+        """
+        Record a block whose data has been written (and flushed) completely.
+        """
+        start, stop = roi
+        with self._lock:
+            self._mark(roi)
+            self._file.write(json.dumps([[int(s) for s in start], [int(s) for s in stop]]) + "\n")
+            self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def finish(self):
+        """
+        Remove the manifest of a complete export.  Exporting again starts from scratch.
+        """
+        self.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
+
+    @staticmethod
+    def sidecar_path(external_path, internal_path):
+        """
+        Manifest path of an export to the dataset internal_path of the file (or n5/zarr directory) external_path.
+        """
+        name = (internal_path or "").strip("/").replace("/", "_")
+        external_path = os.path.normpath(external_path)
+        return f"{external_path}.{name}.manifest" if name else f"{external_path}.manifest"
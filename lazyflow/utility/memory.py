@@ -50,6 +50,7 @@ class Memory(object):
     _default_cache_fraction = 0.25
     _allowed_ram = _default_allowed_ram
     _user_limits_specified = {"total": False, "caches": False}
+    _computation_shares = 1
 
     _magnitude_strings = {0: "B", 1: "KiB", 2: "MiB", 3: "GiB", 4: "TiB"}
     _magnitude_aliases = {
@@ -147,14 +148,33 @@ class Memory(object):
     @classmethod
     def getAvailableRamComputation(cls):
         """
-        shortcut for available_ram - ram_for_caches
+        shortcut for (available_ram - ram_for_caches) / computation_shares
         """
         available = cls.getAvailableRam()
         caches = cls.getAvailableRamCaches()
         comp = available - caches
         if comp < 0:
             comp = 0
-        return comp
+        return comp // cls._computation_shares
+
+    @classmethod
+    def getComputationShares(cls):
+        """
+        get the number of independent computations (e.g. parallel batch exports) sharing the memory for computations
+        """
+        return cls._computation_shares
+
+    @classmethod
+    def setComputationShares(cls, shares):
+        """
+        set the number of independent computations sharing the memory for computations
+
+        getAvailableRamComputation() then returns the share of a single computation.
+        The memory for caches is not divided, because the caches are shared.
+        """
+        assert shares >= 1
+        cls._computation_shares = int(shares)
+        logger.info("Memory for computations shared by {} computations".format(cls._computation_shares))
 
     @staticmethod
     def format(ram, trailing_digits=1):
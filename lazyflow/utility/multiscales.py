@@ -0,0 +1,187 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Helpers for multiscale images (image pyramids): OME-Zarr (NGFF) metadata and block downsampling.
+
+A multiscale image is a group that holds one dataset per scale level ("s0" is full resolution),
+and describes the levels in its "multiscales" attribute.
+"""
+import json
+
+import numpy
+
+# OME-Zarr (NGFF) requires the axes of an image in this order (time, channel, space)
+NGFF_AXIS_ORDER = "tczyx"
+NGFF_AXIS_TYPES = {"t": "time", "c": "channel", "z": "space", "y": "space", "x": "space"}
+NGFF_VERSION = "0.4"
+
+PYRAMID_METHODS = ("auto", "mean", "mode", "stride")
+
+# Images with these display modes (see DatasetInfo.display_mode) are label images, e.g. segmentations and masks
+LABEL_DISPLAY_MODES = ("random-colortable", "binary-mask")
+
+# Each level halves the spatial axes of the previous one
+DOWNSAMPLING_FACTOR = 2
+
+
+def ngff_axis_order(axiskeys):
+    """
+    The order of the given axes that is allowed in an OME-Zarr image, e.g. "yxc" -> "cyx"
+    """
+    return "".join(key for key in NGFF_AXIS_ORDER if key in axiskeys)
+
+
+def ngff_multiscales_attrs(axiskeys, dataset_paths, scales, name=""):
+    """
+    OME-Zarr (NGFF v0.4) metadata of an image group that contains one dataset per scale level.
+    Valid OME-Zarr requires axiskeys in NGFF order (see ngff_axis_order).
+
+    :param axiskeys: axis keys of the datasets
+    :param dataset_paths: path of each level within the image group, starting with full resolution
+    :param scales: pixel size of each level along each axis
+    """
+    assert len(dataset_paths) == len(scales)
+    multiscale = {
+        "version": NGFF_VERSION,
+        "name": name,
+        "axes": [{"name": key, "type": NGFF_AXIS_TYPES.get(key, "custom")} for key in axiskeys],
+        "datasets": [
+            {"path": path, "coordinateTransformations": [{"type": "scale", "scale": [float(s) for s in scale]}]}
+            for path, scale in zip(dataset_paths, scales)
+        ],
+    }
+    return {"multiscales": [multiscale]}
+
+
+def read_ngff_multiscales(attrs):
+    """
+    Parse the multiscales metadata of a multiscale image group.
+
+    :param attrs: group attributes. (In hdf5 files, "multiscales" is stored as a json string.)
+    :returns: ``(axiskeys, levels)`` where levels is a list of ``{"path": ..., "scale": ...}``
+              (full resolution first), or ``None`` if attrs don't describe a multiscale image.
+              ``axiskeys`` is ``None`` if the axes are not given or not understood.
+    """
+    if "multiscales" not in attrs:
+        return None
+    multiscales = attrs["multiscales"]
+    if isinstance(multiscales, (str, bytes)):
+        multiscales = json.loads(multiscales)
+    multiscale = multiscales[0]
+
+    axiskeys = None
+    axes = multiscale.get("axes")
+    if axes is None and multiscale.get("version") in ("0.1", "0.2"):
+        # Before v0.3, all images were 5D tczyx
+        axiskeys = NGFF_AXIS_ORDER
+    elif axes is not None:
+        # v0.3 lists the names only, v0.4 lists dicts
+        names = [axis["name"] if isinstance(axis, dict) else axis for axis in axes]
+        names = [name.lower() for name in names]
+        if all(name in NGFF_AXIS_TYPES for name in names) and len(set(names)) == len(names):
+            axiskeys = "".join(names)
+
+    levels = []
+    for dataset in multiscale["datasets"]:
+        scale = None
+        for transformation in dataset.get("coordinateTransformations", []):
+            if transformation["type"] == "scale":
+                scale = tuple(transformation["scale"])
+        levels.append({"path": dataset["path"], "scale": scale})
+    return axiskeys, levels
+
+
+def pyramid_method(method, meta):
+    """
+    Resolve the "auto" downsampling method from what the image shows, not from its dtype
+    (raw data is often integer, too): mode for label images (see LABEL_DISPLAY_MODES),
+    mean for everything else (intensities, probabilities).
+
+    :param meta: MetaDict of the image
+    """
+    assert method in PYRAMID_METHODS, f"Unknown downsampling method: {method}"
+    if method != "auto":
+        return method
+    return "mode" if meta.display_mode in LABEL_DISPLAY_MODES else "mean"
+
+
+def pyramid_factors(axiskeys, shape, levels):
+    """
+    Downsampling factors from each level to the next, for at most `levels` levels below full resolution.
+    Spatial axes are downsampled as long as they are longer than 1, the others never.
+    Stops early once no axis can be downsampled any further.
+
+    :returns: list of (factors, shape) of each downsampled level
+    """
+    result = []
+    for _ in range(levels):
+        factors = tuple(
+            DOWNSAMPLING_FACTOR if key in "zyx" and size > 1 else 1 for key, size in zip(axiskeys, shape)
+        )
+        if all(factor == 1 for factor in factors):
+            break
+        shape = tuple(-(-size // factor) for size, factor in zip(shape, factors))
+        result.append((factors, shape))
+    return result
+
+
+def downsample(data, factors, method):
+    """
+    Reduce each window of shape `factors` of data to one pixel.
+    Incomplete windows at the upper borders are reduced, too, as if their pixels were repeated.
+    This doesn't change the mean or the mode of a window.
+
+    :param method: "mean", "mode" or "stride" (the first pixel of each window)
+    """
+    factors = tuple(factors)
+    if method == "stride":
+        return data[tuple(slice(None, None, factor) for factor in factors)]
+
+    # Pad incomplete windows by repeating the border
+    padding = [(0, -size % factor) for size, factor in zip(data.shape, factors)]
+    if any(after for _, after in padding):
+        data = numpy.pad(data, padding, mode="edge")
+
+    # Move the pixels of each window to the last axis
+    windowed_shape = []
+    for size, factor in zip(data.shape, factors):
+        windowed_shape += [size // factor, factor]
+    windows = data.reshape(windowed_shape)
+    ndim = len(factors)
+    windows = windows.transpose(tuple(range(0, 2 * ndim, 2)) + tuple(range(1, 2 * ndim, 2)))
+    windows = windows.reshape(windows.shape[:ndim] + (-1,))
+
+    if method == "mean":
+        if numpy.issubdtype(data.dtype, numpy.floating):
+            return windows.mean(axis=-1, dtype=data.dtype)
+        return numpy.round(windows.mean(axis=-1)).astype(data.dtype)
+
+    assert method == "mode", f"Unknown downsampling method: {method}"
+    # Windows are tiny, so count the occurrences of each window pixel by comparing it with all others.
+    # Ties are resolved in favor of the pixel that comes first in the window.
+    window_size = windows.shape[-1]
+    counts = numpy.zeros(windows.shape, dtype=numpy.uint8)
+    for i in range(window_size):
+        for j in range(window_size):
+            counts[..., i] += windows[..., i] == windows[..., j]
+    most_common = numpy.argmax(counts, axis=-1)
+    return numpy.take_along_axis(windows, most_common[..., None], axis=-1)[..., 0]
@@ -42,6 +42,7 @@ class PathComponents(object):
     # Only files with these extensions are allowed to have an 'internal' path
     HDF5_EXTS = [".ilp", ".h5", ".hdf5"]
     N5_EXTS = [".n5"]
+    ZARR_EXTS = [".zarr"]
     NPZ_EXTS = [".npz"]
 
     def __init__(self, totalPath, cwd=None):
@@ -77,8 +78,8 @@ class PathComponents(object):
         # convention for Windows: use "/"
         totalPath = totalPath.replace("\\", "/")
 
-        # For hdf5/n5 paths, split into external, extension, and internal paths
-        for x in self.HDF5_EXTS + self.NPZ_EXTS + self.N5_EXTS:
+        # For hdf5/n5/zarr paths, split into external, extension, and internal paths
+        for x in self.HDF5_EXTS + self.NPZ_EXTS + self.N5_EXTS + self.ZARR_EXTS:
             if totalPath.find(x) > extIndex:
                 extIndex = totalPath.find(x)
                 ext = x
@@ -370,7 +371,7 @@ def lsH5N5(h5N5FileObject, minShape=2, maxShape=5):
             return
         if len(obj.shape) not in range(minShape, maxShape + 1):
             return
-        if isinstance(h5N5FileObject, z5py.N5File):
+        if isinstance(h5N5FileObject, z5py.File):
             # make sure we get a path with forward slashes on windows
             objectName = pathlib.Path(objectName).as_posix()
         listOfDatasets.append({"name": objectName, "object": obj})
@@ -391,7 +392,7 @@ def globH5N5(fileObject, globString):
 
 
     Args:
-        fileObject: h5py.File/z5py.N5File object
+        fileObject: h5py.File/z5py.N5File/z5py.ZarrFile object
         globString: String describing the internal path of the dataset(s) with
             glob-like placeholders
 
@@ -400,7 +401,7 @@ def globH5N5(fileObject, globString):
           matches occurred.
         - None if fileObject is not a h5 or n5 file object
     """
-    if isinstance(fileObject, (h5py.File, z5py.N5File)):
+    if isinstance(fileObject, (h5py.File, z5py.File)):
         pathlist = [x["name"] for x in lsH5N5(fileObject)]
     else:
         return None
@@ -0,0 +1,128 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Float arrays stored with reduced precision
+
+Used by the array caches (see the StoragePrecision slot of
+OpUnblockedArrayCache) to keep more feature blocks in the same amount of
+memory. Supported precisions:
+
+    "full":    values are stored unchanged
+    "float16": values are stored as half precision floats
+    "uint16", "uint8": values are quantized per channel, linearly between the
+               minimum and the maximum of the channel in the array, so the
+               error is at most half of (maximum - minimum) / 65535 or / 255
+"""
+
+import numpy
+
+PRECISIONS = ("full", "float16", "uint16", "uint8")
+
+
+class QuantizedArray(object):
+    """
+    read-only copy of a float array with reduced precision
+
+    Indexing (with integers and slices) returns values in the dtype of the
+    original array. dtype, size and nbytes describe the stored values.
+    """
+
+    def __init__(self, data, precision, channel_axis=None):
+        assert precision in PRECISIONS[1:], "Unknown precision: {}".format(precision)
+        data = numpy.asarray(data)
+        self.shape = data.shape
+        self.original_dtype = data.dtype
+        self.precision = precision
+        self._channel_axis = channel_axis
+
+        if precision == "float16":
+            self._data = data.astype(numpy.float16)
+            self._scale = None
+            self._offset = None
+            return
+
+        levels = numpy.iinfo(precision).max
+        reduce_axes = tuple(axis for axis in range(data.ndim) if axis != channel_axis)
+        if data.size == 0:
+            broadcast_shape = tuple(1 if axis in reduce_axes else s for axis, s in enumerate(data.shape))
+            low = numpy.zeros(broadcast_shape, dtype=numpy.float64)
+            high = low
+        else:
+            low = data.min(axis=reduce_axes, keepdims=True).astype(numpy.float64)
+            high = data.max(axis=reduce_axes, keepdims=True).astype(numpy.float64)
+        scale = (high - low) / levels
+        # constant channels: every value is exactly the offset
+        scale[scale == 0] = 1.0
+
+        quantized = numpy.rint((data - low) / scale)
+        self._data = numpy.clip(quantized, 0, levels).astype(precision)
+        self._scale = scale.astype(self.original_dtype)
+        self._offset = low.astype(self.original_dtype)
+
+    @staticmethod
+    def canStore(data, precision):
+        """
+        True if data can be stored with the given precision: it has to be a
+        plain float array with more than 16 bits per value and, for the
+        quantized precisions, all values have to be finite.
+        """
+        if precision == "full" or isinstance(data, numpy.ma.MaskedArray):
+            return False
+        dtype = numpy.dtype(data.dtype)
+        if dtype.kind != "f" or dtype.itemsize <= 2:
+            return False
+        return precision == "float16" or bool(numpy.isfinite(data).all())
+
+    @property
+    def dtype(self):
+        return self._data.dtype
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return self._data.size
+
+    @property
+    def nbytes(self):
+        nbytes = self._data.nbytes
+        if self._scale is not None:
+            nbytes += self._scale.nbytes + self._offset.nbytes
+        return nbytes
+
+    def __getitem__(self, key):
+        stored = self._data[key]
+        if self._scale is None:
+            return stored.astype(self.original_dtype)
+
+        # index scale and offset like the data, but keep their singleton axes
+        if not isinstance(key, tuple):
+            key = (key,)
+        assert all(k is not Ellipsis for k in key), "QuantizedArray does not support Ellipsis"
+        key = key + (slice(None),) * (self.ndim - len(key))
+        channel_key = tuple(
+            k if axis == self._channel_axis else (slice(None) if isinstance(k, slice) else 0)
+            for axis, k in enumerate(key)
+        )
+        return stored.astype(self.original_dtype) * self._scale[channel_key] + self._offset[channel_key]
@@ -0,0 +1,203 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+import collections
+import itertools
+import threading
+
+
+class RoiIndex(object):
+    """
+    Spatial index over a set of rois for containment and intersection queries.
+
+    Rois are given as (start, stop) tuples of int tuples. The index is a
+    hash grid: space is divided into cells, and every roi is listed in each
+    cell it overlaps (rois that would overlap more than max_cells_per_roi
+    cells are kept in a separate list that every query scans). Since a roi
+    containing another roi contains its start point, containing() only needs
+    to look at a single cell, so lookups stay fast no matter how many rois
+    are stored.
+
+    The cell shape is the (per axis) median shape of the stored rois. It is
+    reconsidered whenever the number of rois added since the last check
+    exceeds the number of rois at that time, and the grid is rebuilt if it
+    changed, which keeps the cost of additions amortized constant.
+
+    Writers are serialized by an internal lock. Cell entries are immutable
+    tuples that are replaced on modification, and a rebuilt grid replaces
+    the old one as a whole, so containing() can run concurrently with
+    writers without taking any lock.
+
+    Example:
+        >>> index = RoiIndex()
+        >>> index.add(((0, 0), (10, 10)))
+        >>> index.add(((10, 0), (20, 10)))
+        >>> index.containing(((12, 2), (15, 5)))
+        [((10, 0), (20, 10))]
+    """
+
+    max_cells_per_roi = 64
+    # minimum number of additions between checks of the cell shape
+    min_rebuild_interval = 8
+
+    # key of the rois that overlap too many cells, in the cell dict
+    _LARGE = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def __len__(self):
+        return len(self._rois)
+
+    def __contains__(self, roi):
+        return roi in self._rois
+
+    def add(self, roi):
+        with self._lock:
+            if roi in self._rois:
+                return
+            self._rois.add(roi)
+            self._shapes[_shape(roi)] += 1
+            self._additions += 1
+            if self._grid is None:
+                self._grid = (_shape(roi), {})
+            elif self._additions > max(self.min_rebuild_interval, self._checked_size):
+                self._additions = 0
+                self._checked_size = len(self._rois)
+                cell_shape = self._medianShape()
+                if cell_shape != self._grid[0]:
+                    self._rebuild(cell_shape)
+                    return
+            self._insert(self._grid, roi)
+
+    def remove(self, roi):
+        """
+        remove roi from the index; unknown rois are ignored
+        """
+        with self._lock:
+            if roi not in self._rois:
+                return
+            self._rois.remove(roi)
+            shape = _shape(roi)
+            self._shapes[shape] -= 1
+            if not self._shapes[shape]:
+                del self._shapes[shape]
+            cell_shape, cells = self._grid
+            for cell in self._cellsFor(cell_shape, roi):
+                remaining = tuple(r for r in cells[cell] if r != roi)
+                if remaining:
+                    cells[cell] = remaining
+                else:
+                    del cells[cell]
+
+    def clear(self):
+        with self._lock:
+            self._rois = set()
+            # roi shape -> number of stored rois of that shape
+            self._shapes = collections.Counter()
+            # (cell shape, {cell: tuple of rois}), None while empty
+            self._grid = None
+            self._additions = 0
+            self._checked_size = 0
+
+    def containing(self, inner_roi):
+        """
+        get the list of stored rois that entirely envelop inner_roi
+        """
+        grid = self._grid
+        if grid is None:
+            return []
+        cell_shape, cells = grid
+        start, stop = inner_roi
+        cell = tuple(a // c for a, c in zip(start, cell_shape))
+        candidates = cells.get(cell, ()) + cells.get(self._LARGE, ())
+        return [roi for roi in candidates if _contains(roi, start, stop)]
+
+    def intersecting(self, roi):
+        """
+        get the list of stored rois that intersect roi
+        """
+        start, stop = roi
+        with self._lock:
+            if self._grid is None:
+                return []
+            cell_shape, cells = self._grid
+            candidates = set()
+            for cell in self._cellsFor(cell_shape, roi):
+                if cell is self._LARGE:
+                    candidates = self._rois
+                    break
+                candidates.update(cells.get(cell, ()))
+            else:
+                candidates.update(cells.get(self._LARGE, ()))
+            return [r for r in candidates if _intersects(r, start, stop)]
+
+    def _insert(self, grid, roi):
+        cell_shape, cells = grid
+        for cell in self._cellsFor(cell_shape, roi):
+            cells[cell] = cells.get(cell, ()) + (roi,)
+
+    def _rebuild(self, cell_shape):
+        grid = (cell_shape, {})
+        for roi in self._rois:
+            self._insert(grid, roi)
+        self._grid = grid
+
+    def _medianShape(self):
+        """
+        per axis median of the shapes of the stored rois
+        """
+        shapes = sorted(self._shapes.items())
+        median = []
+        for axis in range(len(shapes[0][0])):
+            remaining = len(self._rois) // 2
+            for extent, count in sorted((shape[axis], count) for shape, count in shapes):
+                remaining -= count
+                if remaining < 0:
+                    median.append(extent)
+                    break
+        return tuple(median)
+
+    def _cellsFor(self, cell_shape, roi):
+        """
+        the cells roi overlaps, or (_LARGE,) if there are more than max_cells_per_roi
+        """
+        start, stop = roi
+        ranges = [range(a // c, (max(a, b - 1)) // c + 1) for a, b, c in zip(start, stop, cell_shape)]
+        count = 1
+        for r in ranges:
+            count *= len(r)
+        if count > self.max_cells_per_roi:
+            return (self._LARGE,)
+        return itertools.product(*ranges)
+
+
+def _shape(roi):
+    return tuple(max(1, b - a) for a, b in zip(*roi))
+
+
+def _contains(roi, start, stop):
+    return all(a <= s for a, s in zip(roi[0], start)) and all(b >= s for b, s in zip(roi[1], stop))
+
+
+def _intersects(roi, start, stop):
+    return all(a < t and s < b for a, b, s, t in zip(roi[0], roi[1], start, stop))
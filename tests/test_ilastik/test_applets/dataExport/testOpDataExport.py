@@ -102,6 +102,49 @@ class TestOpDataExport(object):
             opRead.cleanUp()
 
 
+    def testPyramidMethodOfLabelSources(self, tmp_h5_single_dataset: Path):
+        opExport = OpDataExport(graph=Graph())
+        try:
+            opExport.TransactionSlot.setValue(True)
+            opExport.WorkingDirectory.setValue(self._tmpdir)
+            opExport.RawDatasetInfo.setValue(
+                FilesystemDatasetInfo(filePath=str(tmp_h5_single_dataset / "test_group/test_data"), nickname="test")
+            )
+            opExport.SelectionNames.setValue(["Probabilities", "Simple Segmentation"])
+            opExport.Inputs.resize(2)
+            opExport.Inputs[0].setValue(vigra.taggedView(numpy.zeros((10, 10, 2), dtype=numpy.float32), "yxc"))
+            opExport.Inputs[1].setValue(vigra.taggedView(numpy.zeros((10, 10, 1), dtype=numpy.uint8), "yxc"))
+            opExport.OutputFilenameFormat.setValue("{dataset_dir}/{nickname}_{result_type}")
+            opExport.PyramidLevels.setValue(2)
+
+            # Resolved from the image for other sources
+            opExport.InputSelection.setValue(0)
+            assert opExport._opFormattedExport.PyramidMethod.value == "auto"
+            opExport.InputSelection.setValue(1)
+            assert opExport._opFormattedExport.PyramidMethod.value == "mode"
+
+            # An explicit method applies to all sources
+            opExport.PyramidMethod.setValue("stride")
+            assert opExport._opFormattedExport.PyramidMethod.value == "stride"
+        finally:
+            opExport.cleanUp()
+
+    @pytest.mark.parametrize(
+        "source_name,is_label",
+        [
+            ("Probabilities", False),
+            ("Simple Segmentation", True),
+            ("Labels Stage 2", True),
+            ("Object Identities", True),
+            ("Blockwise Object Predictions", True),
+            ("Object Probabilities", False),
+            ("Multicut Segmentation", True),
+        ],
+    )
+    def testIsLabelSource(self, source_name, is_label):
+        assert OpDataExport.isLabelSource(source_name) == is_label
+
+
 class TestDataExportPathFormatter:
     class DummyDSInfo:
         def __init__(self, filePath, nickname, default_output_dir):
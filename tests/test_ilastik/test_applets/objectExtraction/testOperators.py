@@ -28,6 +28,7 @@ import numpy as np
 import vigra
 from lazyflow.graph import Graph
 from lazyflow.operators import OpLabelVolume
+from lazyflow.request import processPool
 from ilastik.applets.objectExtraction.opObjectExtraction import OpAdaptTimeListRoi, OpRegionFeatures, OpObjectExtraction
 from ilastik.plugins import pluginManager
 
@@ -211,3 +212,17 @@ class TestOpRegionFeaturesAgainstNumpy(unittest.TestCase):
                 # that means bounding box centers can differ with a maximum of 0.5
                 bbox_center = mins[iobj] + ((maxs[iobj] - mins[iobj]) / 2.0)
                 np.testing.assert_allclose(centers[iobj], bbox_center, atol=0.5)
+
+
+class TestOpRegionFeaturesInProcessPool(TestOpRegionFeaturesAgainstNumpy):
+    """Same as TestOpRegionFeaturesAgainstNumpy, with the local features of every object computed in a worker process"""
+
+    def setUp(self):
+        super().setUp()
+        self.batch_size = OpRegionFeatures.LOCAL_FEATURES_BATCH_SIZE
+        OpRegionFeatures.LOCAL_FEATURES_BATCH_SIZE = 1
+        processPool.reset_process_pool(2)
+
+    def tearDown(self):
+        processPool.reset_process_pool(0)
+        OpRegionFeatures.LOCAL_FEATURES_BATCH_SIZE = self.batch_size
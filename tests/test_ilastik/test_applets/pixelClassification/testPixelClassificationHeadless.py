@@ -26,6 +26,7 @@ import numpy
 import vigra
 import h5py
 import tempfile
+import time
 
 from lazyflow.graph import Graph
 from lazyflow.operators.ioOperators import OpStackLoader
@@ -231,6 +232,78 @@ class TestPixelClassificationHeadless(object):
         for result in predictions:
             assert result.shape == (2, 20, 20, 5, 2)
 
+    def testParallelBatchLanes(self):
+        args = app.parse_args([])
+        args.headless = True
+        args.project = self.PROJECT_FILE
+        shell = app.main(args)
+        batchProcessingApplet = shell.workflow.batchProcessingApplet
+        num_lanes = batchProcessingApplet.dataSelectionApplet.num_lanes
+
+        role_data_dict = [
+            {
+                "Raw Data": PreloadedArrayDatasetInfo(
+                    preloaded_array=numpy.random.randint(0, 255, (2, 20, 20, 5, 1)).astype(numpy.uint8),
+                    axistags=vigra.AxisTags("tzyxc"),
+                )
+            }
+            for _ in range(5)
+        ]
+
+        expected = batchProcessingApplet.run_export(role_data_dict, export_to_array=True)
+        predictions = batchProcessingApplet.run_export(role_data_dict, export_to_array=True, parallel_lanes=3)
+        assert len(predictions) == len(expected)
+        for result, expected_result in zip(predictions, expected):
+            numpy.testing.assert_array_equal(result, expected_result)
+
+        # All batch lanes were removed
+        assert batchProcessingApplet.dataSelectionApplet.num_lanes == num_lanes
+
+    def testParallelBatchLanesAreNotReconfiguredDuringExport(self):
+        args = app.parse_args([])
+        args.headless = True
+        args.project = self.PROJECT_FILE
+        shell = app.main(args)
+        batchProcessingApplet = shell.workflow.batchProcessingApplet
+        dataSelectionApplet = batchProcessingApplet.dataSelectionApplet
+        num_lanes = dataSelectionApplet.num_lanes
+
+        role_data_dict = [
+            {
+                "Raw Data": PreloadedArrayDatasetInfo(
+                    preloaded_array=numpy.random.randint(0, 255, (2, 20, 20, 5, 1)).astype(numpy.uint8),
+                    axistags=vigra.AxisTags("tzyxc"),
+                    nickname=f"dataset{i}",
+                )
+            }
+            for i in range(5)
+        ]
+
+        exports = []
+        finished = []
+
+        def export_function(opDataExport):
+            lanes_before, nickname_before = dataSelectionApplet.num_lanes, opDataExport.RawDatasetInfo.value.nickname
+            result = opDataExport.run_export_to_array()
+            # The first dataset is slow, the others don't wait for it
+            time.sleep(2.0 if nickname_before == "dataset0" else 0.1)
+            nickname_after = opDataExport.RawDatasetInfo.value.nickname
+            exports.append((lanes_before, dataSelectionApplet.num_lanes, nickname_before == nickname_after))
+            finished.append(nickname_before)
+            return result
+
+        expected = batchProcessingApplet.run_export(role_data_dict, export_to_array=True)
+        predictions = batchProcessingApplet.run_export(
+            role_data_dict, export_function=export_function, parallel_lanes=3
+        )
+        for result, expected_result in zip(predictions, expected):
+            numpy.testing.assert_array_equal(result, expected_result)
+
+        # 3 lanes, neither added or removed nor reconfigured while one of their exports was running
+        assert exports == [(num_lanes + 3, num_lanes + 3, True)] * 5
+        assert finished[-1] == "dataset0"
+        assert dataSelectionApplet.num_lanes == num_lanes
+
     @timeLogged(logger)
     def testLotsOfOptions(self):
         # OLD_LAZYFLOW_STATUS_MONITOR_SECONDS = os.getenv("LAZYFLOW_STATUS_MONITOR_SECONDS", None)
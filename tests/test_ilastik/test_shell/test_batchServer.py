@@ -0,0 +1,323 @@
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from ilastik.applets.dataExport.dataExportApplet import DataExportApplet
+from ilastik.applets.dataExport.opDataExport import OpDataExport
+from ilastik.shell.headless.batchServer import BatchJob, HeadlessBatchServer, QueueFullError
+from lazyflow.graph import Graph
+from lazyflow.operators import OpValueCache
+
+
+class FakeSignal:
+    def __init__(self):
+        self.callbacks = []
+
+    def subscribe(self, callback):
+        self.callbacks.append(callback)
+
+    def __call__(self, *args):
+        for callback in self.callbacks:
+            callback(*args)
+
+
+class FakeSlot:
+    def __init__(self, value=None):
+        self.value = value
+        self.upstream_slot = None
+
+    def ready(self):
+        return self.value is not None
+
+    def setValue(self, value):
+        self.value = value
+
+    def disconnect(self):
+        pass
+
+
+class FakeOpDataExport:
+    def __init__(self):
+        self.TransactionSlot = FakeSlot()
+        self.OutputFilenameFormat = FakeSlot("{nickname}_default.h5")
+        self.OutputFormat = FakeSlot("hdf5")
+
+
+class FakeDataExportApplet:
+    def __init__(self):
+        self.topLevelOperator = FakeOpDataExport()
+
+    def parse_known_cmdline_args(self, args):
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--output_filename_format")
+        parser.add_argument("--output_format")
+        return parser.parse_known_args(args)
+
+    def configure_operator_with_parsed_args(self, parsed_args):
+        if parsed_args.output_filename_format:
+            self.topLevelOperator.OutputFilenameFormat.setValue(parsed_args.output_filename_format)
+        if parsed_args.output_format:
+            self.topLevelOperator.OutputFormat.setValue(parsed_args.output_format)
+
+
+class FakeBatchProcessingApplet:
+    def __init__(self, dataExportApplet):
+        self.dataExportApplet = dataExportApplet
+        self.progressSignal = FakeSignal()
+        self.exports = []
+        self.workflow_cmdline_args = []
+        self.unblocked = threading.Event()
+        self.unblocked.set()
+
+    def parse_known_cmdline_args(self, args):
+        parser = argparse.ArgumentParser()
+        parser.add_argument("inputs", nargs="*")
+        return parser.parse_known_args(args)
+
+    def run_export_from_parsed_args(self, parsed_args, workflow_cmdline_args=None):
+        self.workflow_cmdline_args.append(workflow_cmdline_args)
+        self.unblocked.wait()
+        if "missing.h5" in parsed_args.inputs:
+            raise OSError("missing.h5 does not exist")
+        opDataExport = self.dataExportApplet.topLevelOperator
+        output_format = opDataExport.OutputFormat.value
+        self.exports.append((parsed_args.inputs, opDataExport.OutputFilenameFormat.value, output_format))
+        self.progressSignal(50)
+        return [opDataExport.OutputFilenameFormat.value.format(nickname=path) for path in parsed_args.inputs]
+
+
+class FakeShell:
+    def __init__(self):
+        self.workflow = argparse.Namespace(dataExportApplet=FakeDataExportApplet(), workflow_cmdline_args=[])
+        self.workflow.batchProcessingApplet = FakeBatchProcessingApplet(self.workflow.dataExportApplet)
+
+
+class RealDataExportApplet:
+    """The command line handling of DataExportApplet, on a real OpDataExport"""
+
+    def __init__(self):
+        self.topLevelOperator = OpDataExport(graph=Graph())
+
+    def parse_known_cmdline_args(self, args):
+        return DataExportApplet.parse_known_cmdline_args(args)
+
+    def configure_operator_with_parsed_args(self, parsed_args):
+        DataExportApplet._configure_operator_with_parsed_args(parsed_args, self.topLevelOperator)
+
+
+@pytest.fixture
+def shell():
+    return FakeShell()
+
+
+@pytest.fixture
+def serve(shell):
+    """Runs the server in a thread, returns the server"""
+    servers = []
+
+    def _serve(**kwargs):
+        server = HeadlessBatchServer(shell, queue_size=kwargs.pop("queue_size", 16), poll_interval=0.01)
+        thread = threading.Thread(target=server.serve, kwargs=kwargs)
+        thread.start()
+        servers.append((server, thread))
+        return server
+
+    yield _serve
+
+    for server, thread in servers:
+        shell.workflow.batchProcessingApplet.unblocked.set()
+        server.shutdown()
+        thread.join(timeout=10)
+        assert not thread.is_alive()
+
+
+def wait_for(condition, timeout=10.0):
+    end = time.time() + timeout
+    while not condition():
+        assert time.time() < end, "Timeout"
+        time.sleep(0.01)
+
+
+def test_job_args():
+    job = BatchJob({"input": "a.h5", "output": "{nickname}.h5", "export": {"output_format": "n5"}, "args": ["--x"]})
+    assert job.args == ["--output_format=n5", "--output_filename_format={nickname}.h5", "--x", "a.h5"]
+    assert job.state == BatchJob.QUEUED
+
+    with pytest.raises(ValueError):
+        BatchJob({"output": "out.h5"})
+    with pytest.raises(ValueError):
+        BatchJob({"input": "a.h5", "outptu": "out.h5"})
+
+
+def test_jobs_use_their_own_export_settings(shell, serve):
+    server = serve()
+    first = server.submit({"input": ["a.h5", "b.h5"], "output": "{nickname}_out.h5", "export": {"output_format": "n5"}})
+    second = server.submit({"input": "c.h5"})
+    wait_for(lambda: second.state == BatchJob.DONE)
+
+    assert first.status()["state"] == BatchJob.DONE
+    assert first.results == ["a.h5_out.h5", "b.h5_out.h5"]
+    assert first.progress == 100
+    assert shell.workflow.batchProcessingApplet.exports == [
+        (["a.h5", "b.h5"], "{nickname}_out.h5", "n5"),
+        (["c.h5"], "{nickname}_default.h5", "hdf5"),
+    ]
+
+
+def test_workers_run_the_job(shell, serve):
+    """The worker processes of --distributed-backend=local export the job, they don't start another server"""
+    shell.workflow.workflow_cmdline_args = ["--export_dtype=uint8"]
+    server = serve(address=("localhost", 0))
+    job = server.submit({"input": "a.h5", "export": {"output_format": "n5"}})
+    wait_for(lambda: job.state == BatchJob.DONE)
+
+    assert shell.workflow.batchProcessingApplet.workflow_cmdline_args == [["--export_dtype=uint8", *job.args]]
+
+
+def test_failed_job(serve):
+    server = serve()
+    failed = server.submit({"input": "missing.h5"})
+    succeeded = server.submit({"input": "a.h5"})
+    wait_for(lambda: succeeded.state == BatchJob.DONE)
+    assert server.status(failed.job_id)["state"] == BatchJob.FAILED
+    assert "missing.h5 does not exist" in server.status(failed.job_id)["error"]
+
+
+def test_bounded_queue_and_shutdown(shell, serve):
+    shell.workflow.batchProcessingApplet.unblocked.clear()
+    server = serve(queue_size=2)
+
+    running = server.submit({"input": "a.h5"})
+    wait_for(lambda: running.state == BatchJob.RUNNING)
+    queued = [server.submit({"input": "b.h5"}), server.submit({"input": "c.h5"})]
+    with pytest.raises(QueueFullError):
+        server.submit({"input": "d.h5"})
+
+    # The running job is finished, the queued jobs are cancelled
+    server.shutdown()
+    with pytest.raises(QueueFullError):
+        server.submit({"input": "e.h5"})
+    shell.workflow.batchProcessingApplet.unblocked.set()
+    wait_for(lambda: all(job.state == BatchJob.CANCELLED for job in queued))
+    assert running.state == BatchJob.DONE
+
+
+def test_drain_on_shutdown(shell, serve):
+    shell.workflow.batchProcessingApplet.unblocked.clear()
+    server = serve()
+    jobs = [server.submit({"input": "a.h5"}), server.submit({"input": "b.h5"})]
+    server.shutdown(drain=True)
+    shell.workflow.batchProcessingApplet.unblocked.set()
+    wait_for(lambda: all(job.state == BatchJob.DONE for job in jobs))
+
+
+def test_socket_protocol(serve):
+    server = serve(address=("localhost", 0))
+    wait_for(lambda: server.address is not None)
+
+    with socket.create_connection(server.address) as sock:
+        stream = sock.makefile("rw")
+
+        def request(message):
+            stream.write(message + "\n")
+            stream.flush()
+            return json.loads(stream.readline())
+
+        response = request(json.dumps({"command": "submit", "job": {"input": "a.h5", "id": "job-a"}}))
+        assert response == {"status": "ok", "id": "job-a"}
+        wait_for(lambda: request('{"command": "status", "id": "job-a"}')["job"]["state"] == BatchJob.DONE)
+
+        assert request('{"command": "status"}')["jobs"][0]["results"] == ["a.h5_default.h5"]
+        assert request('{"command": "status", "id": "unknown"}')["status"] == "error"
+        assert request('{"command": "submit", "job": {}}')["status"] == "error"
+        assert request("not json")["status"] == "error"
+        assert request('{"command": "shutdown"}') == {"status": "ok"}
+
+
+def test_watched_directory(tmp_path, serve):
+    (tmp_path / "job1.json").write_text(json.dumps({"input": "a.h5"}))
+    (tmp_path / "broken.json").write_text(json.dumps({"output": "out.h5"}))
+    serve(watch_dir=tmp_path)
+
+    status_path = tmp_path / "job1.status.json"
+    wait_for(lambda: status_path.exists() and json.loads(status_path.read_text())["state"] == BatchJob.DONE)
+    assert (tmp_path / "job1.json.accepted").exists()
+    assert json.loads((tmp_path / "broken.status.json").read_text())["state"] == BatchJob.FAILED
+
+
+def test_restores_export_settings_of_opDataExport(shell, serve):
+    shell.workflow.dataExportApplet = RealDataExportApplet()
+    shell.workflow.batchProcessingApplet.dataExportApplet = shell.workflow.dataExportApplet
+    opDataExport = shell.workflow.dataExportApplet.topLevelOperator
+    opProjectDir = OpValueCache(graph=opDataExport.graph)
+    opProjectDir.Input.setValue("/project")
+    opDataExport.WorkingDirectory.connect(opProjectDir.Output)
+    opDataExport.OutputFilenameFormat.setValue("{nickname}_default.h5")
+    opDataExport.TransactionSlot.setValue(True)
+    optional_slots = ["RegionStart", "RegionStop", "InputMin", "InputMax", "ExportMin", "ExportMax"]
+    optional_slots += ["ExportDtype", "OutputAxisOrder"]
+
+    settings_during_export = {}
+    run_export = shell.workflow.batchProcessingApplet.run_export_from_parsed_args
+
+    def run_export_from_parsed_args(parsed_args, workflow_cmdline_args=None):
+        for name in optional_slots + ["WorkingDirectory", "OutputFilenameFormat", "OutputFormat"]:
+            settings_during_export[name] = getattr(opDataExport, name).value
+        return run_export(parsed_args, workflow_cmdline_args)
+
+    shell.workflow.batchProcessingApplet.run_export_from_parsed_args = run_export_from_parsed_args
+    server = serve()
+    job_export = {
+        "cutout_subregion": "[(0,0,0,0,0),(1,1,10,10,1)]",
+        "pipeline_result_drange": "(0.0,1.0)",
+        "export_drange": "(0,255)",
+        "export_dtype": "uint8",
+        "output_axis_order": "zyx",
+        "output_format": "n5",
+    }
+    job = server.submit({"input": "a.h5", "output": "{nickname}_out.h5", "export": job_export})
+    wait_for(lambda: job.state in (BatchJob.DONE, BatchJob.FAILED))
+    assert job.state == BatchJob.DONE, job.error
+
+    assert settings_during_export["OutputAxisOrder"] == "zyx"
+    assert settings_during_export["WorkingDirectory"] == os.getcwd()
+    assert settings_during_export["OutputFilenameFormat"] == "{nickname}_out.h5"
+    assert settings_during_export["OutputFormat"] == "n5"
+
+    # Slots that were unready are unready again, connected slots are connected again
+    assert not any(getattr(opDataExport, name).ready() for name in optional_slots)
+    assert opDataExport.WorkingDirectory.upstream_slot is opProjectDir.Output
+    assert opDataExport.WorkingDirectory.value == "/project"
+    assert opDataExport.OutputFilenameFormat.value == "{nickname}_default.h5"
+    assert opDataExport.OutputFormat.value == "hdf5"
+
+
+def test_watched_job_resubmitted_while_running(tmp_path, shell, serve):
+    shell.workflow.batchProcessingApplet.unblocked.clear()
+    job_path = tmp_path / "job1.json"
+    status_path = tmp_path / "job1.status.json"
+    job_path.write_text(json.dumps({"input": "a.h5"}))
+    serve(watch_dir=tmp_path)
+    wait_for(lambda: status_path.exists() and json.loads(status_path.read_text())["state"] == BatchJob.RUNNING)
+
+    # The same job file again: it waits for the running job, instead of failing over its status
+    job_path.write_text(json.dumps({"input": "b.h5"}))
+    time.sleep(0.1)
+    assert json.loads(status_path.read_text())["state"] == BatchJob.RUNNING
+    assert job_path.exists()
+
+    shell.workflow.batchProcessingApplet.unblocked.set()
+    wait_for(lambda: len(shell.workflow.batchProcessingApplet.exports) == 2)
+    wait_for(lambda: json.loads(status_path.read_text())["state"] == BatchJob.DONE)
+    assert [inputs for inputs, _, _ in shell.workflow.batchProcessingApplet.exports] == [["a.h5"], ["b.h5"]]
+
+
+def test_only_loopback_addresses(shell):
+    server = HeadlessBatchServer(shell)
+    with pytest.raises(ValueError):
+        server.serve(address=("0.0.0.0", 0))
@@ -3,6 +3,7 @@ import shutil
 import subprocess
 import logging
 import tempfile
+import importlib.util
 import json
 import os
 from typing import Dict, Optional
@@ -21,12 +22,7 @@ logger.setLevel(logging.DEBUG)
 
 pytest_plugins = ["pytester"]
 
-try:
-    from lazyflow.distributed.TaskOrchestrator import TaskOrchestrator
-
-    MPI_DEPENDENCIES_MET = bool(shutil.which("mpiexec"))
-except ImportError:
-    MPI_DEPENDENCIES_MET = False
+MPI_DEPENDENCIES_MET = importlib.util.find_spec("mpi4py") is not None and bool(shutil.which("mpiexec"))
 
 
 @pytest.fixture
@@ -111,6 +107,15 @@ def run_headless_pixel_classification(
         )
 
 
+def run_headless(testdir, *args):
+    """Runs headless ilastik with the given arguments, e.g. several datasets"""
+    result = testdir.run("python", "-m", "ilastik", "--headless", *[str(arg) for arg in args])
+    if result.ret != 0:
+        raise FailedHeadlessExecutionException(
+            "===STDOUT===\n\n" + result.stdout.str() + "\n\n===STDERR===\n\n" + result.stderr.str()
+        )
+
+
 def test_headless_2d3c_with_same_raw_data_axis(testdir, pixel_classification_ilp_2d3c: Path, tmp_path: Path):
     raw_100x100y3c: Path = create_h5(numpy.random.rand(100, 100, 3), axiskeys="yxc")
     output_path = tmp_path / "out_100x100y3c.h5"
@@ -173,6 +178,32 @@ def test_headless_2d3c_with_permuted_raw_data_axis_use_h5_tags(
     )
 
 
+def test_parallel_batch_lanes_results_are_identical_to_serial_results(
+    testdir, pixel_classification_ilp_2d3c: Path, tmp_path: Path
+):
+    raw_data = [create_h5(numpy.random.rand(100, 100, 3), axiskeys="yxc") for _ in range(5)]
+
+    outputs = {}
+    for batch_parallel_lanes in (1, 3):
+        output_dir = tmp_path / f"parallel_lanes_{batch_parallel_lanes}"
+        output_dir.mkdir()
+        run_headless(
+            testdir,
+            f"--project={pixel_classification_ilp_2d3c}",
+            f"--output_filename_format={output_dir / '{nickname}.h5'}",
+            f"--batch-parallel-lanes={batch_parallel_lanes}",
+            "--raw-data",
+            *raw_data,
+        )
+        outputs[batch_parallel_lanes] = []
+        for path in raw_data:
+            with h5py.File(output_dir / f"{path.parent.stem}-{path.name}.h5", "r") as f:
+                outputs[batch_parallel_lanes].append(f["exported_data"][()])
+
+    for serial_out_data, parallel_out_data in zip(outputs[1], outputs[3]):
+        assert (serial_out_data == parallel_out_data).all()
+
+
 @pytest.mark.skipif(not MPI_DEPENDENCIES_MET, reason="Must have mpi4py and mpiexec installed fot this test")
 def test_distributed_results_are_identical_to_single_process_results(
     testdir, pixel_classification_ilp_2d3c: Path, tmp_path: Path
@@ -224,3 +255,38 @@ def test_distributed_results_are_identical_to_single_process_results(
         distributed_50x50block_data = dataset[()]
 
     assert (single_process_out_data == distributed_50x50block_data).all()
+
+
+def test_local_distributed_results_are_identical_to_single_process_results(
+    testdir, pixel_classification_ilp_2d3c: Path, tmp_path: Path
+):
+    raw_100x100y3c: Path = create_h5(numpy.random.rand(100, 100, 3), axiskeys="yxc")
+
+    single_process_output_path = tmp_path / "single_process_out_100x100y3c.h5"
+    run_headless_pixel_classification(
+        testdir,
+        project=pixel_classification_ilp_2d3c,
+        raw_data=raw_100x100y3c,
+        output_filename_format=str(single_process_output_path),
+    )
+
+    with h5py.File(single_process_output_path, "r") as f:
+        single_process_out_data = f["exported_data"][()]
+
+    distributed_output_path = tmp_path / "distributed_out_100x100y3c.n5"
+    run_headless(
+        testdir,
+        f"--project={pixel_classification_ilp_2d3c}",
+        f"--output_filename_format={distributed_output_path}",
+        "--output_format=n5",
+        "--distributed-backend=local",
+        "--workers=2",
+        "--distributed-block-roi",
+        str({"x": 50, "y": 50}),
+        f"--raw-data={raw_100x100y3c}",
+    )
+
+    with z5py.File(distributed_output_path, "r") as f:
+        distributed_out_data = f["exported_data"][()]
+
+    assert (single_process_out_data == distributed_out_data).all()
@@ -0,0 +1,65 @@
+import numpy
+import pytest
+
+from lazyflow.classifiers import (
+    CompiledTreeEnsemble,
+    compileTreeEnsemble,
+    ParallelVigraRfLazyflowClassifierFactory,
+    VigraRfLazyflowClassifierFactory,
+    SklearnLazyflowClassifierFactory,
+)
+
+
+@pytest.fixture
+def training_data():
+    rng = numpy.random.RandomState(0)
+    X = rng.normal(size=(500, 6)).astype(numpy.float32)
+    y = (X[:, 0] > 0).astype(numpy.uint32) + 2 * (X[:, 1] * X[:, 2] > 0) + 1
+    X_test = rng.normal(size=(2000, 6)).astype(numpy.float32)
+    return X, y, X_test
+
+
+def test_parallel_vigra_rf_single_forest(training_data):
+    X, y, X_test = training_data
+    classifier = ParallelVigraRfLazyflowClassifierFactory(20, num_forests=1).create_and_train(X, y)
+    ensemble = compileTreeEnsemble(classifier)
+    assert isinstance(ensemble, CompiledTreeEnsemble)
+    assert ensemble.tree_count == 20
+    numpy.testing.assert_array_equal(ensemble.predict_probabilities(X_test), classifier.predict_probabilities(X_test))
+
+
+def test_parallel_vigra_rf(training_data):
+    X, y, X_test = training_data
+    classifier = ParallelVigraRfLazyflowClassifierFactory(20, num_forests=4).create_and_train(X, y)
+    ensemble = compileTreeEnsemble(classifier)
+    numpy.testing.assert_array_equal(ensemble.predict_probabilities(X_test), classifier.predict_probabilities(X_test))
+    assert compileTreeEnsemble(classifier) is ensemble
+
+
+def test_vigra_rf(training_data):
+    X, y, X_test = training_data
+    classifier = VigraRfLazyflowClassifierFactory(10).create_and_train(X, y)
+    ensemble = compileTreeEnsemble(classifier)
+    numpy.testing.assert_array_equal(ensemble.predict_probabilities(X_test), classifier.predict_probabilities(X_test))
+
+
+def test_sklearn_rf(training_data):
+    ensemble_module = pytest.importorskip("sklearn.ensemble")
+    X, y, X_test = training_data
+    for classifier_type in (ensemble_module.RandomForestClassifier, ensemble_module.ExtraTreesClassifier):
+        factory = SklearnLazyflowClassifierFactory(classifier_type, 10, random_state=0)
+        classifier = factory.create_and_train(X, y)
+        ensemble = compileTreeEnsemble(classifier)
+        probabilities = classifier.predict_probabilities(X_test)
+        numpy.testing.assert_array_equal(ensemble.predict_probabilities(X_test), probabilities)
+
+
+def test_unsupported_data_and_classifiers(training_data):
+    X, y, X_test = training_data
+    ensemble = compileTreeEnsemble(ParallelVigraRfLazyflowClassifierFactory(4).create_and_train(X, y))
+    assert ensemble.canPredict(X_test)
+    assert not ensemble.canPredict(X_test[:, :5])
+    X_test[3, 2] = numpy.nan
+    assert not ensemble.canPredict(X_test)
+
+    assert compileTreeEnsemble(object()) is None
@@ -0,0 +1,105 @@
+import pickle
+import threading
+
+import numpy
+from lazyflow.classifiers import IncrementalVigraRfLazyflowClassifierFactory, ParallelVigraRfLazyflowClassifier
+
+
+class TestIncrementalVigraRfLazyflowClassifier(object):
+    def setup_method(self, method):
+        # Classic XOR problem:
+        # 2 features:
+        # - negative product ==> class 1
+        # - non-negative product ==> class 2
+        feature_grid = numpy.mgrid[-5:5, -5:5]
+        feature_matrix = numpy.concatenate(feature_grid.transpose())
+
+        labels = (feature_matrix.prod(axis=-1) >= 0).astype(numpy.uint32) + 1
+        labels = labels.flat[:]
+
+        unseen_data = [[1.5, 2.5], [-1.5, -2.5], [3.4, -4.0], [-1.2, 2.0]]
+        expected_classes = (numpy.prod(unseen_data, axis=-1) > 0).astype(numpy.uint32) + 1
+
+        self.training_feature_matrix = feature_matrix
+        self.training_labels = labels
+        self.prediction_data = unseen_data
+        self.expected_classes = expected_classes
+
+    def test_basic(self):
+        factory = IncrementalVigraRfLazyflowClassifierFactory(20, num_forests=4)
+        classifier = factory.create_and_train(self.training_feature_matrix, self.training_labels)
+        assert isinstance(classifier, ParallelVigraRfLazyflowClassifier)
+        assert list(classifier.known_classes) == [1, 2]
+
+        probabilities = classifier.predict_probabilities(self.prediction_data)
+        assert probabilities.shape == (4, 2)
+        assert (numpy.argmax(probabilities, axis=-1) + 1 == self.expected_classes).all()
+
+    def test_incremental_update(self):
+        factory = IncrementalVigraRfLazyflowClassifierFactory(
+            20, num_forests=4, retrain_fraction=0.5, full_rebuild_interval=100
+        )
+        first = factory.create_and_train(self.training_feature_matrix, self.training_labels)
+
+        # Unchanged training data: the classifier is reused
+        assert factory.create_and_train(self.training_feature_matrix, self.training_labels) is first
+
+        # New training data: only the two oldest forests are retrained
+        more_features = numpy.concatenate((self.training_feature_matrix, [[4.5, 4.5], [-4.5, 4.5]]))
+        more_labels = numpy.concatenate((self.training_labels, [2, 1]))
+        second = factory.create_and_train(more_features, more_labels)
+        assert second is not first
+        assert second._forests[:2] == first._forests[2:]
+        assert not set(second._forests[2:]) & set(first._forests)
+        assert second._num_trees == 20
+
+        # New label class: full training
+        third = factory.create_and_train(
+            numpy.concatenate((more_features, [[10.0, 10.0]])), numpy.concatenate((more_labels, [3]))
+        )
+        assert list(third.known_classes) == [1, 2, 3]
+        assert not set(third._forests) & set(second._forests)
+
+    def test_background_rebuild(self):
+        factory = IncrementalVigraRfLazyflowClassifierFactory(
+            20, num_forests=4, retrain_fraction=0.25, full_rebuild_interval=1
+        )
+        rebuilt = threading.Event()
+        factory.classifierChanged.subscribe(rebuilt.set)
+
+        first = factory.create_and_train(self.training_feature_matrix, self.training_labels)
+        more_features = numpy.concatenate((self.training_feature_matrix, [[4.5, 4.5]]))
+        more_labels = numpy.concatenate((self.training_labels, [2]))
+        updated = factory.create_and_train(more_features, more_labels)
+        assert rebuilt.wait(timeout=10.0)
+
+        # The rebuilt classifier is returned for the same training data, without reusing any old forest
+        classifier = factory.create_and_train(more_features, more_labels)
+        assert classifier is not updated
+        assert not set(classifier._forests) & (set(first._forests) | set(updated._forests))
+        probabilities = classifier.predict_probabilities(self.prediction_data)
+        assert (numpy.argmax(probabilities, axis=-1) + 1 == self.expected_classes).all()
+
+    def test_pickle_fields(self):
+        """
+        Only the parameters of the factory are pickled, not its training state.
+        If this test fails, update IncrementalVigraRfLazyflowClassifierFactory.VERSION
+        (see TestParallelVigraRfLazyflowClassifier.test_pickle_fields).
+        """
+        factory = IncrementalVigraRfLazyflowClassifierFactory(10, num_forests=5)
+        factory.create_and_train(self.training_feature_matrix, self.training_labels)
+
+        assert IncrementalVigraRfLazyflowClassifierFactory.VERSION == 1
+        assert set(factory.__getstate__().keys()) == {
+            "VERSION",
+            "_num_trees",
+            "_num_forests",
+            "_retrain_fraction",
+            "_full_rebuild_interval",
+            "_kwargs",
+        }
+
+        restored = pickle.loads(pickle.dumps(factory, 0))
+        assert restored == factory
+        assert restored.VERSION == IncrementalVigraRfLazyflowClassifierFactory.VERSION
+        assert restored._classifier is None
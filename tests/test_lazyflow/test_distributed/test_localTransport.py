@@ -0,0 +1,84 @@
+import functools
+import os
+
+import pytest
+
+from lazyflow.distributed.localTransport import LocalTransport
+from lazyflow.distributed.TaskOrchestrator import TaskOrchestrator
+
+
+# Worker entry points must be importable by name from the worker processes.
+def _square_worker(output_dir, num_workers):
+    orchestrator = TaskOrchestrator(LocalTransport(num_workers))
+
+    def process(unit_of_work, rank):
+        with open(os.path.join(output_dir, str(unit_of_work)), "w") as f:
+            f.write(f"{unit_of_work ** 2} {rank}")
+
+    # Like the orchestrator, the workers run one round of work after the other
+    orchestrator.start_as_worker(process)
+    orchestrator.start_as_worker(process)
+
+
+def _rounds_worker(output_dir, num_workers, num_rounds):
+    orchestrator = TaskOrchestrator(LocalTransport(num_workers))
+
+    def process(round_, unit_of_work, rank):
+        with open(os.path.join(output_dir, unit_of_work), "w") as f:
+            f.write(f"{round_} {rank}")
+
+    for round_ in range(num_rounds):
+        orchestrator.start_as_worker(functools.partial(process, round_))
+
+
+def _failing_worker(num_workers):
+    orchestrator = TaskOrchestrator(LocalTransport(num_workers))
+
+    def process(unit_of_work, rank):
+        raise ValueError("intentional")
+
+    orchestrator.start_as_worker(process)
+
+
+def test_orchestrate(tmp_path):
+    orchestrator = TaskOrchestrator(LocalTransport(2, functools.partial(_square_worker, str(tmp_path), 2)))
+    assert orchestrator.rank == 0
+    try:
+        done = []
+        orchestrator.orchestrate(range(10), on_done=done.append)
+        assert sorted(done) == list(range(10))
+        # No work at all
+        orchestrator.orchestrate([], on_done=done.append)
+        assert len(done) == 10
+    finally:
+        orchestrator.close()
+
+    results = {int(path.name): path.read_text().split() for path in tmp_path.iterdir()}
+    assert {unit: int(square) for unit, (square, _) in results.items()} == {i: i ** 2 for i in range(10)}
+    assert {int(rank) for _, rank in results.values()} <= {1, 2}
+
+
+def test_rounds(tmp_path):
+    """Every worker finishes a round before it takes units of work of the next round"""
+    rounds = [[f"0-{i}" for i in range(8)], [], [], ["3-0"], [f"4-{i}" for i in range(8)]]
+    orchestrator = TaskOrchestrator(LocalTransport(3, functools.partial(_rounds_worker, str(tmp_path), 3, len(rounds))))
+    try:
+        for units in rounds:
+            orchestrator.orchestrate(units)
+    finally:
+        orchestrator.close()
+
+    results = {path.name: path.read_text().split() for path in tmp_path.iterdir()}
+    assert sorted(results) == sorted(unit for units in rounds for unit in units)
+    for unit, (round_, _) in results.items():
+        assert unit.split("-")[0] == round_
+
+
+def test_failing_worker(monkeypatch):
+    monkeypatch.setattr(LocalTransport, "POLL_INTERVAL", 0.1)
+    orchestrator = TaskOrchestrator(LocalTransport(1, functools.partial(_failing_worker, 1)))
+    try:
+        with pytest.raises(RuntimeError):
+            orchestrator.orchestrate(range(3))
+    finally:
+        orchestrator.close()
@@ -0,0 +1,82 @@
+import pytest
+
+from lazyflow.operators.cacheEvictionPolicies import (
+    CostPolicy,
+    GreedyDualSizePolicy,
+    LRUPolicy,
+    SizePolicy,
+    policies,
+)
+
+
+def drain(policy):
+    keys = []
+    key = policy.pop()
+    while key is not None:
+        keys.append(key)
+        key = policy.pop()
+    return keys
+
+
+@pytest.mark.parametrize("policy_class", list(policies.values()))
+def test_equal_entries_are_evicted_in_lru_order(policy_class):
+    policy = policy_class()
+    for key in "abcd":
+        policy.add(key, size=100, cost=1.0)
+    policy.touch("a")
+    policy.touch("unknown")
+    policy.remove("c")
+    policy.remove("unknown")
+
+    assert len(policy) == 3
+    assert drain(policy) == ["b", "d", "a"]
+    assert len(policy) == 0
+
+
+def test_lru_ignores_size_and_cost():
+    policy = LRUPolicy()
+    policy.add("expensive", size=1, cost=100.0)
+    policy.add("cheap", size=1000, cost=0.0)
+    assert drain(policy) == ["expensive", "cheap"]
+
+
+def test_size_policy_evicts_large_entries_first():
+    policy = SizePolicy()
+    policy.add("small", size=10)
+    policy.add("large", size=1000)
+    assert drain(policy) == ["large", "small"]
+
+
+def test_cost_policy_keeps_expensive_entries():
+    policy = CostPolicy()
+    policy.add("expensive", size=1000, cost=5.0)
+    policy.add("cheap", size=10, cost=0.01)
+    assert drain(policy) == ["cheap", "expensive"]
+
+
+def test_gds_weights_cost_by_size():
+    policy = GreedyDualSizePolicy()
+    policy.add("feature_block", size=1000, cost=2.0)
+    policy.add("raw_block", size=1000, cost=0.001)
+    policy.add("tiny_block", size=1, cost=0.01)
+    assert drain(policy) == ["raw_block", "feature_block", "tiny_block"]
+
+
+def test_gds_ages_out_unused_entries():
+    policy = GreedyDualSizePolicy()
+    policy.add("old", size=1, cost=2.5)
+    for i in range(2):
+        policy.add(i, size=1, cost=1.0)
+        assert policy.pop() == i
+    # evictions raised the inflation value, fresh cheap entries now outrank the old one
+    policy.add("new", size=1, cost=1.0)
+    assert drain(policy) == ["old", "new"]
+
+
+def test_gds_heap_stays_bounded():
+    policy = GreedyDualSizePolicy()
+    policy.add("a", size=1, cost=1.0)
+    for _ in range(1000):
+        policy.touch("a")
+    assert len(policy._heap) < 100
+    assert drain(policy) == ["a"]
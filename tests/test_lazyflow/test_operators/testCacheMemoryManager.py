@@ -40,7 +40,7 @@ from lazyflow.utility import BigRequestStreamer
 from lazyflow.operators.cacheMemoryManager import _CacheMemoryManager
 from lazyflow.utility import Memory
 from lazyflow.operators.cacheMemoryManager import default_refresh_interval
-from lazyflow.operators.opCache import Cache
+from lazyflow.operators.opCache import Cache, ManagedBlockedCache
 from lazyflow.operators.opBlockedArrayCache import OpBlockedArrayCache
 from lazyflow.operators.opSplitRequestsBlockwise import OpSplitRequestsBlockwise
 from lazyflow.operators.filterOperators import OpGaussianSmoothing
@@ -63,6 +63,52 @@ Cache.register(NonRegisteredCache)
 assert issubclass(NonRegisteredCache, Cache)
 
 
+class FakeBlockedCache(ManagedBlockedCache):
+    """
+    blocked cache that stores nothing but block sizes, reporting block events if requested
+    """
+
+    def __init__(self, name, mgr, reportsBlockEvents=True):
+        self.name = name
+        self.reportsBlockEvents = reportsBlockEvents
+        self._mgr = mgr
+        self._blocks = {}
+
+    def store(self, block_id, size, cost):
+        self._blocks[block_id] = (size, time.time())
+        if self.reportsBlockEvents:
+            self._mgr.blockStored(self, block_id, size, cost)
+
+    def access(self, block_id):
+        size, _ = self._blocks[block_id]
+        self._blocks[block_id] = (size, time.time())
+        if self.reportsBlockEvents:
+            self._mgr.blockAccessed(self, block_id)
+
+    def usedMemory(self):
+        return sum(size for size, _ in self._blocks.values())
+
+    def fractionOfUsedMemoryDirty(self):
+        return 0.0
+
+    def getBlockAccessTimes(self):
+        return [(block_id, t) for block_id, (_, t) in self._blocks.items()]
+
+    def freeBlock(self, block_id):
+        size, _ = self._blocks.pop(block_id)
+        if self.reportsBlockEvents:
+            self._mgr.blockFreed(self, block_id)
+        return size
+
+    def freeMemory(self):
+        used = self.usedMemory()
+        self._blocks = {}
+        return used
+
+    def freeDirtyMemory(self):
+        return 0.0
+
+
 class TestCacheMemoryManager:
     def teardown_method(self, method):
         # reset cleanup frequency to sane value
@@ -193,6 +239,71 @@ class TestCacheMemoryManager:
         c = pipe.accessCount
         assert c > b, "did not clean up"
 
+    @pytest.mark.parametrize(
+        "policy,survivors",
+        [("gds", {"features0", "features1"}), ("lru", {"raw1", "features1"}), ("size", {"raw0", "raw1"})],
+    )
+    def testEvictionPolicy(self, policy, survivors):
+        mgr = _CacheMemoryManager()
+        mgr.disable()
+        mgr.setEvictionPolicy(policy)
+
+        raw = FakeBlockedCache("raw", mgr)
+        features = FakeBlockedCache("features", mgr)
+        mgr.addFirstClassCache(raw)
+        mgr.addFirstClassCache(features)
+
+        # raw blocks are cheap to recompute, feature blocks are larger and expensive
+        raw.store("raw0", 100, cost=0.01)
+        features.store("features0", 200, cost=5.0)
+        raw.store("raw1", 100, cost=0.01)
+        features.store("features1", 200, cost=5.0)
+
+        Memory.setAvailableRamCaches(550)
+        mgr._cleanup()
+
+        remaining = {block_id for cache in (raw, features) for block_id, _ in cache.getBlockAccessTimes()}
+        assert survivors <= remaining
+        assert raw.usedMemory() + features.usedMemory() <= 0.9 * 550
+        mgr.stop()
+
+    @pytest.mark.parametrize("max_pending_accesses", [0, 10000])
+    def testQueuedAccessesAreApplied(self, monkeypatch, max_pending_accesses):
+        monkeypatch.setattr(_CacheMemoryManager, "MAX_PENDING_ACCESSES", max_pending_accesses)
+        mgr = _CacheMemoryManager()
+        mgr.disable()
+        mgr.setEvictionPolicy("lru")
+
+        cache = FakeBlockedCache("cache", mgr)
+        mgr.addFirstClassCache(cache)
+        for i in range(4):
+            cache.store(i, 100, cost=1.0)
+        cache.access(0)
+        cache.access(1)
+
+        Memory.setAvailableRamCaches(250)
+        mgr._cleanup()
+
+        assert {block_id for block_id, _ in cache.getBlockAccessTimes()} == {0, 1}
+        mgr.stop()
+
+    def testEvictionOfUnreportedBlocks(self):
+        mgr = _CacheMemoryManager()
+        mgr.disable()
+        mgr.setEvictionPolicy("lru")
+
+        cache = FakeBlockedCache("unreported", mgr, reportsBlockEvents=False)
+        mgr.addFirstClassCache(cache)
+        for i in range(4):
+            cache.store(i, 100, cost=1.0)
+            time.sleep(0.01)
+
+        Memory.setAvailableRamCaches(250)
+        mgr._cleanup()
+
+        assert [block_id for block_id, _ in cache.getBlockAccessTimes()] == [2, 3]
+        mgr.stop()
+
     def testBadMemoryConditions(self):
         """
         TestCacheMemoryManager.testBadMemoryConditions
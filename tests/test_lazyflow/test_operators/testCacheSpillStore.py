@@ -0,0 +1,74 @@
+import os
+
+import numpy
+import pytest
+
+from lazyflow.operators.cacheSpillStore import SpillStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SpillStore(str(tmp_path), max_bytes=10000)
+
+
+def test_roundtrip(store):
+    compressible = numpy.zeros((20, 30), dtype=numpy.float32)
+    random = numpy.random.random((10, 10))
+    assert store.put("a", compressible, cost=2.5)
+    assert store.put("b", random)
+
+    data, cost = store.get("a")
+    assert cost == 2.5
+    assert data.dtype == numpy.float32
+    numpy.testing.assert_array_equal(data, compressible)
+    assert not data.flags.writeable
+
+    data, cost = store.get("b")
+    numpy.testing.assert_array_equal(data, random)
+    assert store.get("c") is None
+
+    # the zeros compress well, the random numbers are stored raw
+    assert store.usedBytes() < compressible.nbytes + random.nbytes
+    assert store.usedBytes() >= random.nbytes
+
+
+def test_budget_evicts_least_recently_used(store, tmp_path):
+    blocks = {key: numpy.random.random(500) for key in "abc"}  # 4000 bytes each
+    store.put("a", blocks["a"])
+    store.put("b", blocks["b"])
+    store.get("a")
+    store.put("c", blocks["c"])
+
+    assert "b" not in store
+    assert "a" in store and "c" in store
+    assert store.usedBytes() <= store.maxBytes
+    assert len(os.listdir(tmp_path)) == 2
+
+    assert not store.put("huge", numpy.random.random(2000))
+    assert "huge" not in store
+
+
+def test_unsupported_arrays_are_not_stored(store):
+    assert not store.put("masked", numpy.ma.masked_array(numpy.zeros(3), mask=[0, 1, 0]))
+    assert not store.put("objects", numpy.array([None, 1], dtype=object))
+    assert not store.put("empty", numpy.zeros((0, 3)))
+    assert len(store) == 0
+
+
+def test_replace_and_discard(store, tmp_path):
+    store.put("a", numpy.random.random(100))
+    store.put("a", numpy.ones(100))
+    numpy.testing.assert_array_equal(store.get("a")[0], numpy.ones(100))
+    assert len(os.listdir(tmp_path)) == 1
+
+    store.put(("ns1", 1), numpy.random.random(10))
+    store.put(("ns2", 1), numpy.random.random(10))
+    store.discardAll(lambda key: key[0] == "ns1")
+    assert ("ns1", 1) not in store and ("ns2", 1) in store
+
+    store.discard("a")
+    store.discard("a")
+    store.clear()
+    assert len(store) == 0
+    assert store.usedBytes() == 0
+    assert os.listdir(tmp_path) == []
@@ -966,3 +966,13 @@ class TestOpCompressedCache(object):
 
         assert op.Output.ready()
         assert_array_equal(op.Output.meta.ideal_blockshape, blockShape)
+
+
+class TestOpCompressedCacheNumpyStore(TestOpCompressedCache):
+    """
+    Run all tests above with blocks kept in CompressedArray buffers instead of hdf5 files.
+    """
+
+    @pytest.fixture(autouse=True)
+    def numpy_block_store(self, monkeypatch):
+        monkeypatch.setattr(OpCompressedCache, "block_store", "numpy")
@@ -5,6 +5,17 @@ import vigra
 from lazyflow.graph import Graph
 from lazyflow.operators.opFeatureMatrixCache import OpFeatureMatrixCache
 from lazyflow.operators.opBlockedArrayCache import OpBlockedArrayCache
+from lazyflow.operators import OpArrayPiper
+
+
+class OpRecordingPiper(OpArrayPiper):
+    def __init__(self, *args, **kwargs):
+        super(OpRecordingPiper, self).__init__(*args, **kwargs)
+        self.requested_rois = []
+
+    def execute(self, slot, subindex, roi, result):
+        self.requested_rois.append((tuple(roi.start), tuple(roi.stop)))
+        super(OpRecordingPiper, self).execute(slot, subindex, roi, result)
 
 
 class TestOpFeatureMatrixCache(object):
@@ -51,3 +62,37 @@ class TestOpFeatureMatrixCache(object):
         # Just check that all features are present, regardless of order.
         for feature_vec in [[10.5, 10.5], [10.5, 11.5], [20.5, 20.5], [20.5, 21.5]]:
             assert feature_vec in labels_and_features[:, 1:]
+
+    def testScatteredLabels(self):
+        features = numpy.indices((64, 64, 64)).astype(numpy.float32)
+        features = numpy.rollaxis(features, 0, 4)
+        features = vigra.taggedView(features, "zyxc")
+
+        labels = numpy.zeros((64, 64, 64, 1), dtype=numpy.uint8)
+        labels = vigra.taggedView(labels, "zyxc")
+        # Two short strokes in opposite corners of a single block
+        labels[2, 2, 2:6] = 1
+        labels[60, 60, 56:62] = 2
+
+        graph = Graph()
+        opLabelCache = OpBlockedArrayCache(graph=graph)
+        opLabelCache.BlockShape.setValue((64, 64, 64, 1))
+        opLabelCache.Input.setValue(labels)
+
+        opFeatures = OpRecordingPiper(graph=graph)
+        opFeatures.Input.setValue(features)
+
+        opFeatureMatrixCache = OpFeatureMatrixCache(graph=graph)
+        opFeatureMatrixCache.LabelImage.connect(opLabelCache.Output)
+        opFeatureMatrixCache.FeatureImage.connect(opFeatures.Output)
+        opFeatureMatrixCache.LabelImage.setDirty()
+
+        labels_and_features = opFeatureMatrixCache.LabelAndFeatureMatrix.value
+        assert labels_and_features.shape == (10, 4)
+        expected = [[1, 2, 2, x] for x in range(2, 6)] + [[2, 60, 60, x] for x in range(56, 62)]
+        assert sorted(labels_and_features.tolist()) == expected
+
+        # Features were only requested around the strokes, not for the bounding box of both
+        assert len(opFeatures.requested_rois) == 2
+        requested_shapes = sorted(numpy.subtract(stop, start).tolist() for start, stop in opFeatures.requested_rois)
+        assert requested_shapes == [[1, 1, 4, 3], [1, 1, 6, 3]]
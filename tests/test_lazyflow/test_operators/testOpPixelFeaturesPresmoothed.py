@@ -1,4 +1,5 @@
 import numpy
+import pytest
 import vigra
 
 from lazyflow.graph import Graph
@@ -75,3 +76,59 @@ class TestOpPixelFeaturesPresmoothed(object):
 
         assert computed_whole.shape == computed_per_slice.shape
         assert numpy.allclose(computed_whole, computed_per_slice), abs(computed_whole - computed_per_slice).max()
+
+    @pytest.mark.parametrize("compute_in_2d", [False, True])
+    def test_fused_derivative_features(self, monkeypatch, compute_in_2d):
+        feature_ids = [
+            "GaussianSmoothing",
+            "LaplacianOfGaussian",
+            "StructureTensorEigenvalues",
+            "HessianOfGaussianEigenvalues",
+            "GaussianGradientMagnitude",
+            "DifferenceOfGaussians",
+        ]
+
+        def compute(fuse, key):
+            monkeypatch.setattr(OpPixelFeaturesPresmoothed, "FUSE_DERIVATIVE_FEATURES", fuse)
+            op = OpPixelFeaturesPresmoothed(graph=Graph())
+            op.Scales.setValue([0.7, 1, 1.6])
+            op.FeatureIds.setValue(feature_ids)
+            op.SelectionMatrix.setValue(numpy.ones((len(feature_ids), 3), dtype=bool))
+            op.ComputeIn2d.setValue([compute_in_2d] * 3)
+            op.Input.setValue(self.data)
+            assert any(op.derivativeOps) == fuse
+            return op.Output[key].wait()
+
+        # all of it, and some channels starting in the middle of a multi-channel feature
+        for key in [slice(None), (slice(1, 2), slice(20, 47), slice(2, 9), slice(3, 15), slice(4, 20))]:
+            fused = compute(True, key)
+            separate = compute(False, key)
+            numpy.testing.assert_allclose(fused, separate, rtol=1e-5, atol=1e-5)
+
+    def test_channel_subset_presmooths_only_needed_scales(self, monkeypatch):
+        op = OpPixelFeaturesPresmoothed(graph=Graph())
+        op.Scales.setValue([0.7, 1.0, 1.6])
+        op.FeatureIds.setValue(["GaussianSmoothing", "HessianOfGaussianEigenvalues"])
+        op.SelectionMatrix.setValue(numpy.array([[True, True, True], [False, True, True]]))
+        op.ComputeIn2d.setValue([False] * 3)
+        op.Input.setValue(self.data)
+        expected = op.Output[:].wait()
+
+        smoothing_sigmas = []
+        compute_smoothing = op._computeGaussianSmoothing
+
+        def record_smoothing(vol, sigma, roi, in2d):
+            smoothing_sigmas.append(sigma)
+            return compute_smoothing(vol, sigma, roi, in2d)
+
+        monkeypatch.setattr(op, "_computeGaussianSmoothing", record_smoothing)
+
+        # channels: Gaussian smoothing at the three scales (3 input channels each), then the Hessian eigenvalues
+        gaussian_07 = op.Output[:, 0:3].wait()
+        numpy.testing.assert_allclose(gaussian_07, expected[:, 0:3], rtol=1e-6)
+        assert set(smoothing_sigmas) == {0.7}
+
+        smoothing_sigmas.clear()
+        hessian_16 = op.Output[:, 18:27].wait()
+        numpy.testing.assert_allclose(hessian_16, expected[:, 18:27], rtol=1e-6)
+        assert set(smoothing_sigmas) == {numpy.sqrt(1.6 ** 2 - 1.0)}
@@ -1,6 +1,9 @@
 from builtins import range
 from builtins import object
+import threading
+
 import numpy as np
+import pytest
 import vigra
 
 from lazyflow.request import RequestPool
@@ -168,3 +171,154 @@ class TestOpUnblockedArrayCacheCache(object):
         cache_data = opCache.Output(*inner_roi).wait()
         assert (cache_data == data[roiToSlice(*inner_roi)]).all()
         assert opDataProvider.accessCount == 0
+
+
+def test_demoted_blocks_are_read_back_from_spill_store(cacheMemoryManager, tmp_path):
+    from lazyflow.operators.cacheSpillStore import SpillStore
+
+    cacheMemoryManager.setSpillStore(SpillStore(str(tmp_path), max_bytes=10 * 2 ** 20))
+
+    graph = Graph()
+    opDataProvider = OpArrayPiperWithAccessCount(graph=graph)
+    opCache = OpUnblockedArrayCache(graph=graph)
+
+    data = np.random.random((100, 100, 100)).astype(np.float32)
+    opDataProvider.Input.setValue(vigra.taggedView(data, "zyx"))
+    opCache.Input.connect(opDataProvider.Output)
+
+    roi = ((30, 30, 30), (50, 50, 50))
+    block_roi = opCache._standardize_roi(*roi)
+    opCache.Output(*roi).wait()
+    assert opDataProvider.accessCount == 1
+
+    assert opCache.demoteBlock(block_roi) == 20 ** 3 * 4
+    assert opCache.CleanBlocks.value == []
+    assert opCache.usedMemory() == 0
+
+    # Data comes back from disk, not from upstream
+    cache_data = opCache.Output(*roi).wait()
+    assert (cache_data == data[roiToSlice(*roi)]).all()
+    assert opDataProvider.accessCount == 1
+    assert opCache.CleanBlocks.value == [roiToSlice(*roi)]
+
+    # Dirty blocks must not be read back
+    opCache.demoteBlock(block_roi)
+    opDataProvider.Input.setDirty((30, 30, 30), (31, 31, 31))
+    cache_data = opCache.Output(*roi).wait()
+    assert (cache_data == data[roiToSlice(*roi)]).all()
+    assert opDataProvider.accessCount == 2
+    assert len(cacheMemoryManager.getSpillStore()) == 0
+
+
+def test_dirty_roi_frees_only_intersecting_blocks():
+    graph = Graph()
+    opDataProvider = OpArrayPiperWithAccessCount(graph=graph)
+    opCache = OpUnblockedArrayCache(graph=graph)
+
+    data = np.random.random((40, 40, 40)).astype(np.float32)
+    opDataProvider.Input.setValue(vigra.taggedView(data, "zyx"))
+    opCache.Input.connect(opDataProvider.Output)
+
+    block_rois = [((z, y, 0), (z + 10, y + 10, 40)) for z in range(0, 40, 10) for y in range(0, 40, 10)]
+    for roi in block_rois:
+        opCache.Output(*roi).wait()
+    assert opDataProvider.accessCount == 16
+
+    opDataProvider.Input.setDirty((5, 5, 0), (15, 6, 1))
+    expected = [roi for roi in block_rois if not (roi[0][0] < 15 and roi[0][1] == 0)]
+    assert opCache.CleanBlocks.value == [roiToSlice(*roi) for roi in sorted(expected)]
+
+    # Inner rois of the remaining blocks are still served from memory
+    inner_roi = ((31, 21, 5), (39, 29, 35))
+    cache_data = opCache.Output(*inner_roi).wait()
+    assert (cache_data == data[roiToSlice(*inner_roi)]).all()
+    assert opDataProvider.accessCount == 16
+
+
+@pytest.mark.parametrize("precision,tolerance", [("float16", 1e-3), ("uint16", 1e-4), ("uint8", 1e-2)])
+def test_reduced_storage_precision(precision, tolerance):
+    graph = Graph()
+    opDataProvider = OpArrayPiperWithAccessCount(graph=graph)
+    opCache = OpUnblockedArrayCache(graph=graph)
+    opCache.StoragePrecision.setValue(precision)
+
+    # channels with very different ranges
+    data = np.random.random((20, 20, 3)).astype(np.float32) * np.array([1, 100, 0], dtype=np.float32)
+    opDataProvider.Input.setValue(vigra.taggedView(data, "yxc"))
+    opCache.Input.connect(opDataProvider.Output)
+
+    roi = ((0, 0, 0), (20, 20, 3))
+    # the first request gets the data from upstream
+    assert (opCache.Output(*roi).wait() == data).all()
+    assert opCache.usedMemory() < data.nbytes / 1.9
+
+    inner_roi = ((5, 5, 1), (15, 15, 3))
+    cache_data = opCache.Output(*inner_roi).wait()
+    assert opDataProvider.accessCount == 1
+    assert cache_data.dtype == np.float32
+    value_range = np.ptp(data, axis=(0, 1))[1:]
+    assert (np.abs(cache_data - data[roiToSlice(*inner_roi)]) <= tolerance * (value_range + 1)).all()
+
+    # changing the precision discards the stored blocks
+    opCache.StoragePrecision.setValue("full")
+    assert opCache.usedMemory() == 0
+    assert (opCache.Output(*inner_roi).wait() == data[roiToSlice(*inner_roi)]).all()
+    assert opDataProvider.accessCount == 2
+
+
+class OpBlockingPiper(OpArrayPiperWithAccessCount):
+    """
+    array piper that signals when it is executed and waits for permission to finish
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(OpBlockingPiper, self).__init__(*args, **kwargs)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def execute(self, slot, subindex, roi, result):
+        self.started.set()
+        assert self.release.wait(10)
+        super(OpBlockingPiper, self).execute(slot, subindex, roi, result)
+
+
+def test_overlapping_requests_are_coalesced():
+    graph = Graph()
+    opDataProvider = OpBlockingPiper(graph=graph)
+    opCache = OpUnblockedArrayCache(graph=graph)
+
+    data = np.random.random((100, 100, 100)).astype(np.float32)
+    opDataProvider.Input.setValue(vigra.taggedView(data, "zyx"))
+    opCache.Input.connect(opDataProvider.Output)
+
+    outer_roi = ((30, 30, 30), (50, 50, 50))
+    inner_roi = ((35, 35, 35), (45, 45, 45))
+    outer_req = opCache.Output(*outer_roi)
+    outer_req.submit()
+    assert opDataProvider.started.wait(10)
+
+    # Signals requests that missed the cache and look for an upstream request in flight
+    joining = threading.Semaphore(0)
+    join_pending_fetch = opCache._join_pending_fetch
+
+    def signalling_join_pending_fetch(request_roi, result):
+        joining.release()
+        return join_pending_fetch(request_roi, result)
+
+    opCache._join_pending_fetch = signalling_join_pending_fetch
+
+    # These requests arrive while the upstream request for outer_roi is in flight
+    inner_reqs = [opCache.Output(*inner_roi) for _ in range(3)] + [opCache.Output(*outer_roi)]
+    for req in inner_reqs:
+        req.submit()
+    for _ in inner_reqs:
+        assert joining.acquire(timeout=10)
+    opDataProvider.release.set()
+
+    assert (outer_req.wait() == data[roiToSlice(*outer_roi)]).all()
+    for req in inner_reqs[:3]:
+        assert (req.wait() == data[roiToSlice(*inner_roi)]).all()
+    assert (inner_reqs[3].wait() == data[roiToSlice(*outer_roi)]).all()
+
+    assert opDataProvider.accessCount == 1
+    assert opCache.coalescingStatistics() == {"upstream": 1, "coalesced": 4}
@@ -0,0 +1,135 @@
+import numpy
+import vigra
+
+from lazyflow.graph import Graph
+from lazyflow.operators import OpArrayPiper, OpValueCache
+from lazyflow.operators.classifierOperators import OpTrainClassifierBlocked, OpVectorwiseClassifierPredict
+from lazyflow.classifiers import VigraRfLazyflowClassifierFactory
+
+
+class OpRecordingPiper(OpArrayPiper):
+    def __init__(self, *args, **kwargs):
+        super(OpRecordingPiper, self).__init__(*args, **kwargs)
+        self.requested_rois = []
+
+    def execute(self, slot, subindex, roi, result):
+        self.requested_rois.append((tuple(roi.start), tuple(roi.stop)))
+        super(OpRecordingPiper, self).execute(slot, subindex, roi, result)
+
+
+def test_tiled_prediction(monkeypatch):
+    features = numpy.random.RandomState(0).random_sample((20, 30, 40, 3)).astype(numpy.float32)
+    features = vigra.taggedView(features, "zyxc")
+    labels = numpy.zeros((20, 30, 40, 1), dtype=numpy.uint8)
+    labels = vigra.taggedView(labels, "zyxc")
+    labels[5, 5:10, 5:10] = 1
+    labels[15, 20:25, 20:25] = 2
+
+    graph = Graph()
+    opFeatures = OpRecordingPiper(graph=graph)
+    opFeatures.Input.setValue(features)
+
+    opTrain = OpTrainClassifierBlocked(graph=graph)
+    opTrain.ClassifierFactory.setValue(VigraRfLazyflowClassifierFactory(10))
+    opTrain.Images.resize(1)
+    opTrain.Labels.resize(1)
+    opTrain.nonzeroLabelBlocks.resize(1)
+    opTrain.Images[0].setValue(features)
+    opTrain.Labels[0].setValue(labels)
+    opTrain.nonzeroLabelBlocks[0].setValue(0)
+    opTrain.MaxLabel.setValue(2)
+    opTrain.Labels[0].setDirty()
+
+    # Train only once
+    opClassifierCache = OpValueCache(graph=graph)
+    opClassifierCache.Input.connect(opTrain.Classifier)
+
+    opPredict = OpVectorwiseClassifierPredict(graph=graph)
+    opPredict.Image.connect(opFeatures.Output)
+    opPredict.LabelsCount.setValue(2)
+    opPredict.Classifier.connect(opClassifierCache.Output)
+
+    classifier = opClassifierCache.Output.value
+    expected = classifier.predict_probabilities(features[2:12].reshape(-1, 3)).reshape((10, 30, 40, 2))
+
+    # Features of at most 5 y-rows of a z-slice per tile
+    monkeypatch.setattr(OpVectorwiseClassifierPredict, "TILE_FEATURE_BYTES", 5 * 40 * 3 * 4)
+    predictions = opPredict.PMaps[2:12].wait()
+    numpy.testing.assert_array_equal(predictions, expected)
+
+    assert len(opFeatures.requested_rois) == 10 * 6
+    for start, stop in opFeatures.requested_rois:
+        assert numpy.subtract(stop, start).tolist() == [1, 5, 40, 3]
+
+    # Without a limit, the block is predicted at once
+    opFeatures.requested_rois = []
+    monkeypatch.setattr(OpVectorwiseClassifierPredict, "TILE_FEATURE_BYTES", 2**30)
+    opPredict.PMaps.setDirty()
+    numpy.testing.assert_array_equal(opPredict.PMaps[2:12].wait(), expected)
+    assert opFeatures.requested_rois == [((2, 0, 0, 0), (12, 30, 40, 3))]
+
+
+class OpHaloPiper(OpRecordingPiper):
+    def setupOutputs(self):
+        super(OpHaloPiper, self).setupOutputs()
+        self.Output.meta.halo = {"y": 4, "x": 4}
+        self.Output.meta.halo_ram_usage_per_pixel = 4.0
+
+
+def test_tiles_include_halo(monkeypatch):
+    rng = numpy.random.RandomState(0)
+    features = vigra.taggedView(rng.random_sample((20, 30, 40, 3)).astype(numpy.float32), "zyxc")
+    X = rng.random_sample((100, 3)).astype(numpy.float32)
+    y = (X[:, 0] > 0.5).astype(numpy.uint32) + 1
+    classifier = VigraRfLazyflowClassifierFactory(10).create_and_train(X, y)
+
+    graph = Graph()
+    opFeatures = OpHaloPiper(graph=graph)
+    opFeatures.Input.setValue(features)
+    opPredict = OpVectorwiseClassifierPredict(graph=graph)
+    opPredict.Image.connect(opFeatures.Output)
+    opPredict.LabelsCount.setValue(2)
+    opPredict.Classifier.setValue(classifier)
+
+    # A z-slice (14400 bytes of features, plus 4800 bytes of input read around it) doesn't fit.
+    # The split goes along z first (no halo). Of the y-x tilings that fit, 3 tiles along x read the least input.
+    monkeypatch.setattr(OpVectorwiseClassifierPredict, "TILE_FEATURE_BYTES", 8000)
+    predictions = opPredict.PMaps[2:12].wait()
+
+    expected = classifier.predict_probabilities(features[2:12].reshape(-1, 3)).reshape((10, 30, 40, 2))
+    numpy.testing.assert_array_equal(predictions, expected)
+    assert len(opFeatures.requested_rois) == 10 * 3
+    for start, stop in opFeatures.requested_rois:
+        assert numpy.subtract(stop, start).tolist() == [1, 30, 14, 3]
+
+    # The RAM estimate includes the halo of such tiles
+    tile_bytes = 30 * 14 * 3 * 4 + 30 * 22 * 4
+    assert opPredict.PMaps.meta.ram_usage_per_requested_pixel > tile_bytes / (30 * 14)
+
+
+def test_coarse_prediction(monkeypatch):
+    # Features are constant (class 1) in the upper half of the volume (z < 10),
+    # the lower half is split into class 1 and class 2 along x.
+    rng = numpy.random.RandomState(0)
+    features = numpy.zeros((20, 32, 32, 2), dtype=numpy.float32)
+    features[10:, :, 16:] = rng.uniform(0.5, 1.0, size=(10, 32, 16, 2))
+    features = vigra.taggedView(features, "zyxc")
+
+    X = numpy.concatenate([numpy.zeros((50, 2)), rng.uniform(0.5, 1.0, size=(50, 2))]).astype(numpy.float32)
+    y = numpy.array([1] * 50 + [2] * 50, dtype=numpy.uint32)
+    classifier = VigraRfLazyflowClassifierFactory(10).create_and_train(X, y)
+
+    graph = Graph()
+    opPredict = OpVectorwiseClassifierPredict(graph=graph)
+    opPredict.Image.setValue(features)
+    opPredict.LabelsCount.setValue(2)
+    opPredict.Classifier.setValue(classifier)
+    opPredict.CoarsePredictionTolerance.setValue(0.05)
+
+    # One tile per z-slice
+    monkeypatch.setattr(OpVectorwiseClassifierPredict, "TILE_FEATURE_BYTES", 32 * 32 * 2 * 4)
+    predictions = opPredict.PMaps[:].wait()
+
+    expected = classifier.predict_probabilities(features.reshape(-1, 2)).reshape((20, 32, 32, 2))
+    numpy.testing.assert_array_equal(predictions, expected)
+    assert opPredict.coarsePredictionStatistics() == {"tiles": 20, "skipped": 10}
@@ -26,8 +26,10 @@ import tempfile
 import shutil
 import platform
 
+import h5py
 import numpy
 import vigra
+import z5py
 
 from lazyflow.graph import Graph
 from lazyflow.utility import PathComponents
@@ -78,6 +80,96 @@ class TestOpExportSlot(object):
         finally:
             opRead.cleanUp()
 
+    def testBasic_Hdf5Pyramid(self):
+        data = numpy.random.random((100, 100)).astype(numpy.float32)
+        data = vigra.taggedView(data, vigra.defaultAxistags("xy"))
+
+        graph = Graph()
+        opPiper = OpArrayPiper(graph=graph)
+        opPiper.Input.setValue(data)
+
+        opExport = OpExportSlot(graph=graph)
+        opExport.Input.connect(opPiper.Output)
+        opExport.OutputFormat.setValue("hdf5")
+        opExport.OutputFilenameFormat.setValue(self._tmpdir + "/test_export_pyramid")
+        opExport.OutputInternalPath.setValue("volume/data")
+        opExport.PyramidLevels.setValue(2)
+        opExport.run_export()
+
+        with h5py.File(self._tmpdir + "/test_export_pyramid.h5", "r") as f:
+            assert f["volume/data/s1"].shape == (50, 50)
+            assert f["volume/data/s2"].shape == (25, 25)
+
+        # The image group can be read like a dataset: its full resolution level is read
+        opRead = OpInputDataReader(graph=graph)
+        try:
+            opRead.FilePath.setValue(opExport.ExportPath.value)
+            read_data = opRead.Output[:].wait()
+            assert (read_data == data.view(numpy.ndarray)).all(), "Read data didn't match exported data!"
+        finally:
+            opRead.cleanUp()
+
+    def testBasic_Hdf5Resumable(self):
+        data = numpy.random.random((100, 100)).astype(numpy.float32)
+        data = vigra.taggedView(data, vigra.defaultAxistags("xy"))
+
+        graph = Graph()
+        opPiper = OpArrayPiper(graph=graph)
+        opPiper.Input.setValue(data)
+
+        opExport = OpExportSlot(graph=graph)
+        opExport.Input.connect(opPiper.Output)
+        opExport.OutputFormat.setValue("hdf5")
+        opExport.OutputFilenameFormat.setValue(self._tmpdir + "/test_export_resumable")
+        opExport.OutputInternalPath.setValue("volume/data")
+        opExport.ResumableExport.setValue(True)
+        opExport.run_export()
+
+        # The completed blocks were recorded next to the export, until it was complete
+        assert not os.path.exists(self._tmpdir + "/test_export_resumable.h5.volume_data.manifest")
+        with h5py.File(self._tmpdir + "/test_export_resumable.h5", "r") as f:
+            assert (f["volume/data"][...] == data.view(numpy.ndarray)).all()
+
+        # A complete export is exported again from scratch
+        opPiper.Input.setValue(data * 2)
+        opExport.run_export()
+        with h5py.File(self._tmpdir + "/test_export_resumable.h5", "r") as f:
+            assert (f["volume/data"][...] == data.view(numpy.ndarray) * 2).all()
+
+    def testBasic_Zarr(self):
+        data = numpy.random.random((30, 40, 2)).astype(numpy.float32)
+        data = vigra.taggedView(data, vigra.defaultAxistags("yxc"))
+
+        graph = Graph()
+        opPiper = OpArrayPiper(graph=graph)
+        opPiper.Input.setValue(data)
+
+        opExport = OpExportSlot(graph=graph)
+        opExport.Input.connect(opPiper.Output)
+        opExport.OutputFormat.setValue("compressed zarr")
+        opExport.OutputFilenameFormat.setValue(self._tmpdir + "/test_export")
+        opExport.OutputInternalPath.setValue("image")
+
+        assert opExport.ExportPath.ready()
+        assert opExport.ExportPath.value == self._tmpdir + "/test_export.zarr/image"
+        opExport.run_export()
+
+        # Written as OME-Zarr image, with channels first
+        with z5py.ZarrFile(self._tmpdir + "/test_export.zarr", "r") as f:
+            multiscales = f["image"].attrs["multiscales"]
+            assert [axis["name"] for axis in multiscales[0]["axes"]] == ["c", "y", "x"]
+            assert multiscales[0]["datasets"][0]["path"] == "s0"
+            assert f["image/s0"].shape == (2, 30, 40)
+
+        opRead = OpInputDataReader(graph=graph)
+        try:
+            opRead.FilePath.setValue(opExport.ExportPath.value)
+            assert opRead.Output.meta.getAxisKeys() == ["c", "y", "x"]
+            read_data = opRead.Output[:].wait()
+            numpy.testing.assert_array_equal(read_data, data.withAxes("cyx").view(numpy.ndarray))
+        finally:
+            opRead.cleanUp()
+
     def testBasic_Npy(self):
         data = numpy.random.random((100, 100)).astype(numpy.float32)
         data = vigra.taggedView(data, vigra.defaultAxistags("xy"))
@@ -22,9 +22,12 @@ from builtins import object
 # 		   http://ilastik.org/license/
 ###############################################################################
 from lazyflow.operators.opArrayPiper import OpArrayPiper
-from lazyflow.operators.ioOperators import OpH5N5WriterBigDataset
+from lazyflow.operators.ioOperators import OpH5N5WriterBigDataset, OpStreamingH5N5Reader
+from lazyflow.utility.multiscales import downsample, read_ngff_multiscales
 from shutil import rmtree
+import json
 import numpy
+import pytest
 import vigra
 import h5py
 import z5py
@@ -233,3 +236,131 @@ class TestOpH5N5WriterBigDataset_3(object):
         assert (numpy.all(n5_dataset[...] == self.testData.view(numpy.ndarray)[...])).all()
         hdf5File.close()
         n5File.close()
+
+
+@pytest.mark.parametrize("extension", [".h5", ".n5", ".zarr"])
+@pytest.mark.parametrize("dtype,method", [(numpy.float32, "mean"), (numpy.uint8, "mode"), (numpy.uint8, "stride")])
+def test_pyramid(tmp_path, graph, extension, dtype, method):
+    data = numpy.random.RandomState(0).randint(0, 4, size=(9, 70, 61, 2)).astype(dtype)
+    data = vigra.taggedView(data, "zyxc")
+
+    opPiper = OpArrayPiper(graph=graph)
+    opPiper.Input.setValue(data)
+    # Force many blocks, which must be reduced separately
+    opPiper.Output.meta.ram_usage_per_requested_pixel = 1000000.0
+
+    with OpStreamingH5N5Reader.get_h5_n5_file(str(tmp_path / f"pyramid{extension}"), "w") as f:
+        opWriter = OpH5N5WriterBigDataset(graph=graph)
+        opWriter.h5N5File.setValue(f)
+        opWriter.h5N5Path.setValue("volume/image")
+        opWriter.PyramidLevels.setValue(5)
+        opWriter.PyramidMethod.setValue(method)
+        opWriter.Image.connect(opPiper.Output)
+        assert opWriter.WriteImage.value
+        opWriter.cleanUp()
+
+        # Levels stop once z, y and x can't be reduced any further
+        axiskeys, levels = read_ngff_multiscales(f["volume/image"].attrs)
+        assert axiskeys == "zyxc"
+        assert [level["path"] for level in levels] == ["s0", "s1", "s2", "s3", "s4", "s5"]
+        assert levels[2]["scale"] == (4, 4, 4, 1)
+
+        expected = data.view(numpy.ndarray)
+        numpy.testing.assert_array_equal(f["volume/image/s0"][...], expected)
+        for level in range(1, 6):
+            factors = [2 if size > 1 else 1 for size in expected.shape[:3]] + [1]
+            expected = downsample(expected, factors, method)
+            numpy.testing.assert_array_equal(f[f"volume/image/s{level}"][...], expected)
+        assert f["volume/image/s5"].shape == (1, 3, 2, 2)
+
+
+@pytest.mark.parametrize("compression", [False, True])
+@pytest.mark.parametrize("direct_chunk_writes", [False, True])
+def test_direct_chunk_writes(tmp_path, graph, monkeypatch, compression, direct_chunk_writes):
+    data = numpy.random.RandomState(0).randint(0, 10, size=(21, 170, 151, 2)).astype(numpy.uint16)
+    data = vigra.taggedView(data, "zyxc")
+    monkeypatch.setattr(OpH5N5WriterBigDataset, "DIRECT_CHUNK_WRITES", direct_chunk_writes)
+    # Let compute threads wait for the writer
+    monkeypatch.setattr(OpH5N5WriterBigDataset, "WRITE_QUEUE_CHUNKS_PER_WORKER", 1)
+
+    opPiper = OpArrayPiper(graph=graph)
+    opPiper.Input.setValue(data)
+    # Force small blocks, which are rounded up to whole chunks
+    opPiper.Output.meta.ram_usage_per_requested_pixel = 1000000.0
+
+    with h5py.File(tmp_path / "direct.h5", "w") as f:
+        opWriter = OpH5N5WriterBigDataset(graph=graph)
+        opWriter.h5N5File.setValue(f)
+        opWriter.h5N5Path.setValue("volume/data")
+        opWriter.CompressionEnabled.setValue(compression)
+        opWriter.Image.connect(opPiper.Output)
+        assert opWriter.WriteImage.value
+        opWriter.cleanUp()
+
+    with h5py.File(tmp_path / "direct.h5", "r") as f:
+        dataset = f["volume/data"]
+        assert dataset.compression == ("gzip" if compression else None)
+        numpy.testing.assert_array_equal(dataset[...], data.view(numpy.ndarray))
+
+
+class OpFailingPiper(OpArrayPiper):
+    """Fails for requests that reach beyond z = fail_from, like an export that is interrupted"""
+
+    fail_from = None
+
+    def execute(self, slot, subindex, roi, result):
+        if self.fail_from is not None and roi.stop[0] > self.fail_from:
+            raise RuntimeError("interrupted")
+        super().execute(slot, subindex, roi, result)
+
+
+@pytest.mark.parametrize("extension", [".h5", ".n5"])
+def test_resume_from_manifest(tmp_path, graph, extension):
+    data = numpy.random.RandomState(0).randint(1, 10, size=(21, 170, 151)).astype(numpy.uint16)
+    data = vigra.taggedView(data, "zyx")
+    manifest_path = str(tmp_path / "export.manifest")
+
+    def export(image, compression=True, identity="project 1", fail_from=None):
+        opPiper = OpFailingPiper(graph=graph)
+        opPiper.fail_from = fail_from
+        opPiper.Input.setValue(image)
+        opPiper.Output.meta.ram_usage_per_requested_pixel = 1000000.0
+        with OpStreamingH5N5Reader.get_h5_n5_file(str(tmp_path / f"export{extension}"), "a") as f:
+            opWriter = OpH5N5WriterBigDataset(graph=graph)
+            try:
+                opWriter.h5N5File.setValue(f)
+                opWriter.h5N5Path.setValue("volume/data")
+                opWriter.ManifestPath.setValue(manifest_path)
+                opWriter.ManifestIdentity.setValue({"project": identity})
+                opWriter.CompressionEnabled.setValue(compression)
+                opWriter.Image.connect(opPiper.Output)
+                assert opWriter.WriteImage.value
+            finally:
+                opWriter.cleanUp()
+            return f["volume/data"][...]
+
+    def recorded_blocks():
+        with open(manifest_path) as f:
+            rois = [json.loads(line) for line in f.readlines()[1:]]
+        assert rois
+        return [tuple(slice(a, b) for a, b in zip(start, stop)) for start, stop in rois]
+
+    with pytest.raises(RuntimeError):
+        export(data, fail_from=10)
+    completed = recorded_blocks()
+
+    # Only the blocks that are not recorded are written again. The manifest is removed once the export is complete.
+    resumed = export(data * 2)
+    expected = data.view(numpy.ndarray) * 2
+    for block in completed:
+        expected[block] = data.view(numpy.ndarray)[block]
+    numpy.testing.assert_array_equal(resumed, expected)
+    assert not os.path.exists(manifest_path)
+
+    # An export with other settings or of another project starts over
+    with pytest.raises(RuntimeError):
+        export(data, fail_from=10)
+    numpy.testing.assert_array_equal(export(data * 3, compression=False), data.view(numpy.ndarray) * 3)
+    with pytest.raises(RuntimeError):
+        export(data, fail_from=10)
+    numpy.testing.assert_array_equal(export(data * 3, identity="project 2"), data.view(numpy.ndarray) * 3)
@@ -0,0 +1,81 @@
+import numpy
+import pytest
+import z5py
+
+from lazyflow.operators.ioOperators import OpInputDataReader, OpStreamingZarrReader
+from lazyflow.utility.multiscales import ngff_multiscales_attrs
+from lazyflow.request import Request
+
+
+@pytest.fixture
+def data():
+    return numpy.random.RandomState(0).randint(0, 255, size=(3, 40, 50)).astype(numpy.uint8)
+
+
+@pytest.fixture
+def zarr_path(tmp_path):
+    return str(tmp_path / "test.zarr")
+
+
+def test_plain_dataset(graph, data, zarr_path):
+    with z5py.ZarrFile(zarr_path, "a") as f:
+        f.create_dataset("volume/data", data=data, chunks=(1, 16, 16))
+
+    op = OpInputDataReader(graph=graph)
+    try:
+        op.FilePath.setValue(zarr_path)
+        assert op.Output.meta.getAxisKeys() == ["z", "y", "x"]
+        assert op.Output.meta.ideal_blockshape == (1, 16, 16)
+        numpy.testing.assert_array_equal(op.Output[:].wait(), data)
+        numpy.testing.assert_array_equal(op.Output[1:3, 5:37, 7:45].wait(), data[1:3, 5:37, 7:45])
+    finally:
+        op.cleanUp()
+
+
+def test_ome_zarr_multiscales(graph, data, zarr_path):
+    with z5py.ZarrFile(zarr_path, "a") as f:
+        image = f.create_group("image")
+        image.create_dataset("s0", data=data, chunks=(1, 8, 8))
+        image.create_dataset("s1", data=data[:, ::2, ::2], chunks=(1, 8, 8))
+        image.attrs.update(ngff_multiscales_attrs("cyx", ["s0", "s1"], [[1, 1, 1], [1, 2, 2]]))
+
+    op = OpInputDataReader(graph=graph)
+    try:
+        op.FilePath.setValue(zarr_path + "/image")
+        assert op.Output.meta.getAxisKeys() == ["c", "y", "x"]
+        numpy.testing.assert_array_equal(op.Output[:].wait(), data)
+    finally:
+        op.cleanUp()
+
+    with z5py.ZarrFile(zarr_path, "r") as f:
+        opReader = OpStreamingZarrReader(graph=graph)
+        opReader.ZarrFile.setValue(f)
+        opReader.InternalPath.setValue("image")
+        assert [level["path"] for level in opReader.AvailableScales.value] == ["s0", "s1"]
+        assert opReader.AvailableScales.value[1]["scale"] == (1, 2, 2)
+
+        opReader.Scale.setValue(1)
+        assert opReader.OutputImage.meta.shape == (3, 20, 25)
+        numpy.testing.assert_array_equal(opReader.OutputImage[:].wait(), data[:, ::2, ::2])
+
+        with pytest.raises(OpStreamingZarrReader.DatasetReadError):
+            opReader.Scale.setValue(2)
+
+
+def test_parallel_chunk_reads(graph, data, zarr_path, monkeypatch):
+    with z5py.ZarrFile(zarr_path, "a") as f:
+        f.create_dataset("data", data=data, chunks=(1, 4, 4))
+
+    with z5py.ZarrFile(zarr_path, "r") as f:
+        opReader = OpStreamingZarrReader(graph=graph)
+        opReader.ZarrFile.setValue(f)
+        opReader.InternalPath.setValue("data")
+
+        # Read blocks are whole chunks, the roi is split into not many more blocks than allowed
+        monkeypatch.setattr(OpStreamingZarrReader, "MAX_READS_PER_WORKER", 2)
+        blockshape = opReader._readBlockshape((3, 40, 50))
+        assert (blockshape % (1, 4, 4) == 0).all()
+        max_blocks = 2 * max(1, Request.global_thread_pool.num_workers)
+        assert numpy.prod(numpy.ceil(numpy.divide((3, 40, 50), blockshape))) <= max_blocks
+
+        numpy.testing.assert_array_equal(opReader.OutputImage[:, 3:37, 5:47].wait(), data[:, 3:37, 5:47])
@@ -24,12 +24,12 @@ import threading
 
 import pytest
 
-from lazyflow.request.threadPool import ThreadPool
+from lazyflow.request.threadPool import ThreadPool, WorkStealingThreadPool
 
 
-@pytest.fixture
-def pool():
-    p = ThreadPool(num_workers=4)
+@pytest.fixture(params=[ThreadPool, WorkStealingThreadPool])
+def pool(request):
+    p = request.param(num_workers=4)
     yield p
     p.stop()
 
@@ -123,3 +123,67 @@ def test_generator_executes_in_same_thread(pool):
 
     # Release tasks that occupy workers, so that the thread pool can stop.
     test_finished.set()
+
+
+def test_work_stealing_tasks_submitted_from_busy_worker_are_stolen():
+    pool = WorkStealingThreadPool(num_workers=4)
+    release_parent = threading.Event()
+    children_done = threading.Barrier(4, timeout=5)
+    thread_ids = set()
+
+    class ChildTask:
+        def __lt__(self, other):
+            return False
+
+        def __call__(self):
+            thread_ids.add(threading.current_thread().ident)
+            children_done.wait()
+
+    def parent():
+        # These land on the parent's own heap; the parent stays busy, so they must be stolen.
+        for _i in range(3):
+            pool.wake_up(ChildTask())
+        children_done.wait()
+        release_parent.set()
+
+    try:
+        pool.wake_up(parent)
+        assert release_parent.wait(timeout=5)
+        assert len(thread_ids) == 3
+    finally:
+        pool.stop()
+
+
+def test_work_stealing_respects_priority():
+    pool = WorkStealingThreadPool(num_workers=1)
+    blocker_started = threading.Event()
+    release_blocker = threading.Event()
+    all_done = threading.Event()
+    order = []
+
+    class PrioTask:
+        def __init__(self, priority):
+            self.priority = priority
+
+        def __lt__(self, other):
+            return self.priority < other.priority
+
+        def __call__(self):
+            order.append(self.priority)
+            if len(order) == 5:
+                all_done.set()
+
+    def blocker():
+        blocker_started.set()
+        release_blocker.wait()
+
+    try:
+        pool.wake_up(blocker)
+        assert blocker_started.wait(timeout=1)
+        for priority in [3, 1, 4, 0, 2]:
+            pool.wake_up(PrioTask(priority))
+        release_blocker.set()
+        assert all_done.wait(timeout=1)
+        assert order == [0, 1, 2, 3, 4]
+    finally:
+        pool.stop()
@@ -0,0 +1,102 @@
+import functools
+import time
+
+import numpy
+import pytest
+
+from lazyflow.operator import Operator
+from lazyflow.request import Request
+from lazyflow.request import processPool
+from lazyflow.request.processPool import ProcessPool
+
+
+# Tasks must be importable by name from the worker processes.
+def _add(a, b):
+    return a + b, {"sum": float(a.sum())}
+
+
+def _fill(value, out):
+    out[...] = value
+
+
+def _fail():
+    raise KeyError("intentional")
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+class Kernels:
+    @Operator.runInProcessPool
+    @staticmethod
+    def square(data):
+        return data ** 2
+
+
+@pytest.fixture
+def pool():
+    p = ProcessPool(2)
+    yield p
+    p.stop()
+
+
+def test_arrays_are_passed_through_shared_memory(pool):
+    a = numpy.arange(100, dtype=numpy.float32)
+    result, info = pool.run(_add, a, numpy.ones_like(a))
+    numpy.testing.assert_array_equal(result, a + 1)
+    assert result.dtype == numpy.float32
+    assert info == {"sum": float(a.sum())}
+
+
+def test_out_buffer_is_copied_back(pool):
+    out = numpy.zeros((10, 10), dtype=numpy.uint8)
+    assert pool.run(_fill, 7, out=out) is None
+    assert (out == 7).all()
+
+
+def test_exception_is_raised_in_caller(pool):
+    with pytest.raises(KeyError):
+        pool.run(_fail)
+
+
+def test_run_from_request(pool):
+    data = numpy.arange(10)
+    req = Request(functools.partial(pool.run, _add, data, data))
+    result, _ = req.wait()
+    numpy.testing.assert_array_equal(result, 2 * data)
+
+
+def test_cancelled_request_terminates_task(pool):
+    req = Request(functools.partial(pool.run, _sleep, 60))
+    req.submit()
+    while not any(w.task is not None for w in pool._workers):
+        time.sleep(0.01)
+
+    req.cancel()
+    assert req.finished_event.wait(timeout=10)
+    assert req.cancelled
+
+    # Worker processes were replaced and can take new work.
+    start = time.time()
+    assert pool.run(_sleep, 0) == 0
+    assert time.time() - start < 30
+
+
+def test_decorated_function_without_pool_runs_inline(monkeypatch):
+    monkeypatch.setattr(processPool, "global_process_pool", None)
+    numpy.testing.assert_array_equal(Kernels.square(numpy.arange(3)), [0, 1, 4])
+
+
+def test_decorated_function_uses_global_pool(monkeypatch, pool):
+    monkeypatch.setattr(processPool, "global_process_pool", pool)
+    numpy.testing.assert_array_equal(Kernels.square(numpy.arange(3)), [0, 1, 4])
+
+
+def test_local_functions_are_rejected():
+    def local(x):
+        return x
+
+    with pytest.raises(ValueError):
+        processPool.runInProcessPool(local)
@@ -266,6 +266,74 @@ def test_cancels_child_requests(cancelled_work):
     assert work_rq.child_requests == set()
 
 
+class TestChildRequestFastPath:
+    @staticmethod
+    def run_in_worker(fn):
+        req = Request(fn)
+        req.submit()
+        return req.wait()
+
+    def test_child_runs_in_parent_greenlet(self):
+        def parent_fn():
+            parent = Request._current_request()
+            child = Request(Request._current_request)
+            assert child.parent_request is parent
+            assert child.wait() is child
+            assert child.execution_complete and child.greenlet is None
+            # the parent is the current request again
+            return Request._current_request() is parent and parent.greenlet.owning_requests == [parent]
+
+        assert self.run_in_worker(parent_fn)
+
+    def test_child_exception_propagates(self):
+        def broken():
+            raise TExc()
+
+        def parent_fn():
+            child = Request(broken)
+            with pytest.raises(TExc):
+                child.wait()
+            assert child.finished and child.exception is not None
+            return True
+
+        with mock.patch("sys.excepthook") as excepthook:
+            assert self.run_in_worker(parent_fn)
+        excepthook.assert_not_called()
+
+    def test_callbacks_after_completion(self):
+        recv = mock.Mock()
+
+        def parent_fn():
+            child = Request(lambda: 42)
+            assert child.wait() == 42
+            child.notify_finished(recv)
+            child.add_done_callback(recv)
+            return True
+
+        assert self.run_in_worker(parent_fn)
+        assert recv.call_count == 2
+        recv.assert_any_call(42)
+
+    def test_finished_event(self):
+        req = Request(lambda: 42)
+        finished_event = req.finished_event
+        assert not finished_event.is_set()
+        req.submit()
+        assert finished_event.wait(timeout=10)
+        assert req.wait() == 42
+
+    def test_attributes_can_be_attached(self):
+        req = Request(lambda: 42)
+        req.custom_attribute = 1
+        assert req.wait() == 42
+        assert req.custom_attribute == 1
+
+    def test_finished_event_after_completion(self):
+        req = Request(lambda: 42)
+        assert req.wait() == 42
+        assert req.finished_event.is_set()
+
+
 class TestRequestWithValue:
     def test_return_value(self):
         req = Request.with_value(None)
@@ -0,0 +1,79 @@
+import json
+
+import numpy
+import pytest
+import vigra
+
+from lazyflow.operators import OpArrayPiper
+from lazyflow.request import Request
+from lazyflow.request.requestTracer import RequestTracer
+
+
+@pytest.fixture
+def piper_chain(graph):
+    data = vigra.taggedView(numpy.zeros((10, 20), dtype=numpy.uint8), "yx")
+    op1 = OpArrayPiper(graph=graph)
+    op1.name = "first"
+    op1.Input.setValue(data)
+    op2 = OpArrayPiper(graph=graph)
+    op2.name = "second"
+    op2.Input.connect(op1.Output)
+    return op2
+
+
+def test_tracer_is_inactive_by_default():
+    assert Request._tracer is None
+
+
+def test_records_every_execution(piper_chain):
+    with RequestTracer() as tracer:
+        piper_chain.Output[:5, :].wait()
+
+    assert Request._tracer is None
+    records = {r.operator: r for r in tracer.records}
+    assert set(records) == {"first", "second"}
+    assert records["second"].roi_shape == (5, 20)
+    assert records["second"].nbytes == 100
+    assert records["second"].slot == "Output"
+    # The downstream operator waited for the upstream one.
+    assert records["second"].child_time > 0
+    assert records["second"].self_time <= records["second"].duration
+
+
+def test_nothing_recorded_after_stop(piper_chain):
+    tracer = RequestTracer()
+    tracer.start()
+    tracer.stop()
+    piper_chain.Output[:].wait()
+    assert tracer.records == []
+
+
+def test_chrome_trace_export(piper_chain, tmp_path):
+    with RequestTracer() as tracer:
+        piper_chain.Output[:].wait()
+
+    path = tmp_path / "trace.json"
+    tracer.write_chrome_trace(str(path))
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+
+    assert sorted(e["name"] for e in events) == ["first.Output", "second.Output"]
+    for e in events:
+        assert e["ph"] == "X"
+        assert e["dur"] >= 0
+        assert e["args"]["bytes"] == 200
+
+
+def test_summary_aggregates_per_operator(piper_chain):
+    with RequestTracer() as tracer:
+        for _ in range(3):
+            piper_chain.Output[:].wait()
+
+    summary = tracer.summary()
+    assert {row["operator"] for row in summary} == {"first", "second"}
+    assert all(row["calls"] == 3 for row in summary)
+    assert all(row["bytes"] == 600 for row in summary)
+
+    table = tracer.summary_table()
+    assert "first.Output" in table
+    assert "second.Output" in table
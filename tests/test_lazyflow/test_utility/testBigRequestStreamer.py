@@ -158,3 +158,19 @@ def test_pool_results_discarded():
     # Now check that ALL results are truly lost.
     for ref in result_refs:
         assert ref() is None, "Some data was not discarded."
+
+
+def test_skip_roi():
+    op = OpArrayPiper(graph=Graph())
+    op.Input.setValue(numpy.indices((100, 100)).sum(0))
+
+    requested = []
+    progress = []
+    batch = BigRequestStreamer(op.Output, [(0, 0), (100, 100)], (10, 10), skipRoi=lambda roi: roi[0][0] >= 20)
+    batch.resultSignal.subscribe(lambda roi, result: requested.append(tuple(map(tuple, roi))))
+    batch.progressSignal.subscribe(progress.append)
+    batch.execute()
+
+    assert sorted(requested) == sorted(((y, x), (y + 10, x + 10)) for y in (0, 10) for x in range(0, 100, 10))
+    # Progress refers to the blocks that are not skipped
+    assert progress[-2:] == [100, 100]
@@ -0,0 +1,73 @@
+import json
+import os
+
+import pytest
+
+from lazyflow.utility.exportManifest import ExportManifest
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "export.h5.data.manifest")
+
+
+def test_completed_blocks(path):
+    manifest = ExportManifest(path, shape=(25, 30), grid=(10, 10), dtype="uint8")
+    assert manifest.empty
+
+    # Blocks at the upper border are clipped to the shape
+    manifest.add(((20, 0), (25, 30)))
+    manifest.add(((0, 0), (10, 10)))
+    assert not manifest.empty
+    assert manifest.is_complete(((20, 0), (25, 30)))
+    assert manifest.is_complete(((21, 5), (23, 30)))
+    assert manifest.is_complete(((0, 0), (10, 10)))
+    assert not manifest.is_complete(((0, 0), (10, 20)))
+
+    # Cells that are only partially covered by a block are not complete
+    manifest.add(((10, 0), (15, 30)))
+    assert not manifest.is_complete(((10, 0), (11, 1)))
+    manifest.close()
+
+    with open(path) as f:
+        assert json.loads(f.readline()) == {"shape": [25, 30], "grid": [10, 10], "dtype": "uint8"}
+        assert [json.loads(line) for line in f] == [[[20, 0], [25, 30]], [[0, 0], [10, 10]], [[10, 0], [15, 30]]]
+
+
+def test_resume(path):
+    manifest = ExportManifest(path, shape=(25, 30), grid=(10, 10), dtype="uint8")
+    manifest.add(((0, 0), (10, 30)))
+    manifest.close()
+
+    # A line that was cut off by a crash is ignored
+    with open(path, "a") as f:
+        f.write("[[10, 0], [20,")
+
+    resumed = ExportManifest(path, shape=(25, 30), grid=(10, 10), dtype="uint8")
+    assert resumed.is_complete(((0, 0), (10, 30)))
+    assert not resumed.is_complete(((10, 0), (20, 30)))
+    resumed.close()
+
+    # The manifest of an export with other settings is discarded
+    other = ExportManifest(path, shape=(25, 30), grid=(10, 10), dtype="float32")
+    assert other.empty
+    other.close()
+    assert not ExportManifest(path, shape=(25, 30), grid=(10, 10), dtype="uint8").is_complete(((0, 0), (10, 30)))
+
+
+def test_finish(path):
+    manifest = ExportManifest(path, shape=(25, 30), grid=(10, 10), identity={"inputs": [["/data/raw.h5", 1.5]]})
+    manifest.add(((0, 0), (10, 30)))
+    manifest.close()
+
+    # Another input: the blocks are not reused
+    other = ExportManifest(path, shape=(25, 30), grid=(10, 10), identity={"inputs": [["/data/raw.h5", 2.5]]})
+    assert other.empty
+
+    other.finish()
+    assert not os.path.exists(path)
+
+
+def test_sidecar_path():
+    assert ExportManifest.sidecar_path("/tmp/out.h5", "/volume/data") == "/tmp/out.h5.volume_data.manifest"
+    assert ExportManifest.sidecar_path("/tmp/out.n5/", "") == "/tmp/out.n5.manifest"
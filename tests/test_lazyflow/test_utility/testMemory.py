@@ -104,3 +104,15 @@ class TestMemory(unittest.TestCase):
         (mant, exp) = sci(x, base=10, expstep=3)
         assert_equal(mant, 223)
         assert_equal(exp, 3)
+
+    def testComputationShares(self):
+        Memory.setAvailableRam(4000)
+        Memory.setAvailableRamCaches(1000)
+        assert Memory.getAvailableRamComputation() == 3000
+        try:
+            Memory.setComputationShares(3)
+            assert Memory.getComputationShares() == 3
+            assert Memory.getAvailableRamComputation() == 1000
+            assert Memory.getAvailableRamCaches() == 1000
+        finally:
+            Memory.setComputationShares(1)
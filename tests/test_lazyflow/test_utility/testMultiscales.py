@@ -0,0 +1,84 @@
+import json
+
+import numpy
+import pytest
+
+from lazyflow.metaDict import MetaDict
+from lazyflow.utility.multiscales import (
+    downsample,
+    ngff_axis_order,
+    ngff_multiscales_attrs,
+    pyramid_factors,
+    pyramid_method,
+    read_ngff_multiscales,
+)
+
+
+def test_downsample_mean():
+    data = numpy.arange(15, dtype=numpy.float32).reshape(3, 5)
+    expected = numpy.array([[3.0, 5.0, 6.5], [10.5, 12.5, 14.0]], dtype=numpy.float32)
+    numpy.testing.assert_array_equal(downsample(data, (2, 2), "mean"), expected)
+
+    # Integers are rounded
+    assert downsample(numpy.array([1, 2, 4], dtype=numpy.uint8), (2,), "mean").tolist() == [2, 4]
+
+
+def test_downsample_mode():
+    data = numpy.array(
+        [
+            [1, 2, 2, 3, 5],
+            [1, 1, 2, 4, 6],
+            [7, 7, 0, 9, 9],
+        ],
+        dtype=numpy.uint32,
+    )
+    # Ties are resolved by the first pixel of the window
+    assert downsample(data, (2, 2), "mode").tolist() == [[1, 2, 5], [7, 0, 9]]
+
+
+def test_downsample_stride():
+    data = numpy.arange(15).reshape(3, 5)
+    numpy.testing.assert_array_equal(downsample(data, (2, 1), "stride"), data[::2])
+
+
+def test_pyramid_factors():
+    assert pyramid_factors("tzyxc", (3, 1, 5, 8, 2), 5) == [
+        ((1, 1, 2, 2, 1), (3, 1, 3, 4, 2)),
+        ((1, 1, 2, 2, 1), (3, 1, 2, 2, 2)),
+        ((1, 1, 2, 2, 1), (3, 1, 1, 1, 2)),
+    ]
+    assert pyramid_factors("yx", (5, 8), 0) == []
+
+
+def test_pyramid_method():
+    # Integer intensities are averaged, too
+    assert pyramid_method("auto", MetaDict(dtype=numpy.float32)) == "mean"
+    assert pyramid_method("auto", MetaDict(dtype=numpy.uint8, display_mode="grayscale")) == "mean"
+    assert pyramid_method("auto", MetaDict(dtype=numpy.uint32, display_mode="random-colortable")) == "mode"
+    assert pyramid_method("auto", MetaDict(dtype=numpy.uint8, display_mode="binary-mask")) == "mode"
+    assert pyramid_method("stride", MetaDict(dtype=numpy.float32)) == "stride"
+    with pytest.raises(AssertionError):
+        pyramid_method("median", MetaDict(dtype=numpy.float32))
+
+
+def test_ngff_metadata():
+    assert ngff_axis_order("zyxc") == "czyx"
+
+    attrs = ngff_multiscales_attrs("cyx", ["s0", "s1"], [(1, 1, 1), (1, 2, 2)], name="image")
+    assert attrs["multiscales"][0]["axes"] == [
+        {"name": "c", "type": "channel"},
+        {"name": "y", "type": "space"},
+        {"name": "x", "type": "space"},
+    ]
+    expected = ("cyx", [{"path": "s0", "scale": (1, 1, 1)}, {"path": "s1", "scale": (1, 2, 2)}])
+    assert read_ngff_multiscales(attrs) == expected
+    # hdf5 stores the metadata as json string
+    assert read_ngff_multiscales({"multiscales": json.dumps(attrs["multiscales"])}) == expected
+
+    # Older versions of the spec
+    v02 = {"multiscales": [{"version": "0.2", "datasets": [{"path": "0"}]}]}
+    assert read_ngff_multiscales(v02) == ("tczyx", [{"path": "0", "scale": None}])
+    v03 = {"multiscales": [{"version": "0.3", "axes": ["z", "y", "x"], "datasets": [{"path": "0"}]}]}
+    assert read_ngff_multiscales(v03)[0] == "zyx"
+
+    assert read_ngff_multiscales({}) is None
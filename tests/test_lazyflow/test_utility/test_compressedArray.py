@@ -0,0 +1,103 @@
+import h5py
+import numpy
+import pytest
+
+from lazyflow.request import Request, RequestPool
+from lazyflow.utility.compressedArray import CompressedArray, CompressedBlock, copyToHdf5
+
+
+@pytest.fixture
+def array_pair():
+    data = numpy.random.randint(0, 10, size=(10, 13, 7)).astype(numpy.float32)
+    array = CompressedArray(data.shape, data.dtype, chunks=(4, 5, 3))
+    array[...] = data
+    return array, data
+
+
+def test_unwritten_chunks_are_zero():
+    array = CompressedArray((10, 10), numpy.uint8, chunks=(3, 3))
+    assert array[()].shape == (10, 10)
+    assert (array[()] == 0).all()
+    assert array.storageSize() == 0
+
+
+@pytest.mark.parametrize(
+    "key",
+    [
+        (),
+        Ellipsis,
+        slice(None),
+        (slice(2, 9), slice(4, 5), slice(0, 7)),
+        (slice(1, 3),),
+        (3, slice(None), 2),
+        (Ellipsis, 6),
+        (slice(5, 5),),
+    ],
+)
+def test_read_matches_numpy(array_pair, key):
+    array, data = array_pair
+    numpy.testing.assert_array_equal(array[key], data[key])
+
+
+@pytest.mark.parametrize(
+    "key", [(slice(2, 9), slice(4, 12), slice(1, 2)), (3, slice(None), 2), (Ellipsis, 6), (slice(0, 4),)]
+)
+def test_partial_writes(array_pair, key):
+    array, data = array_pair
+    value = numpy.random.random(data[key].shape)
+    array[key] = value
+    data[key] = value
+    numpy.testing.assert_array_equal(array[()], data)
+
+    array[key] = 0
+    data[key] = 0
+    numpy.testing.assert_array_equal(array[()], data)
+
+
+def test_compression():
+    array = CompressedArray((1000, 1000), numpy.uint8, chunks=(100, 100))
+    array[...] = 1
+    assert array.storageSize() < array.size / 20
+
+
+def test_parallel_reads(array_pair):
+    array, data = array_pair
+    results = {}
+
+    def read(i):
+        results[i] = array[i]
+
+    pool = RequestPool()
+    for i in range(data.shape[0]):
+        pool.add(Request(lambda i=i: read(i)))
+    pool.wait()
+
+    for i in range(data.shape[0]):
+        numpy.testing.assert_array_equal(results[i], data[i])
+
+
+def test_block_hdf5_roundtrip(array_pair, tmp_path):
+    array, data = array_pair
+    block = CompressedBlock()
+    block.copy(array, "data")
+    block.create_dataset("fill_value", shape=(), dtype=numpy.float32)
+    block["fill_value"][()] = 42
+    assert block["/"] is block
+    assert "data" in block
+
+    with h5py.File(tmp_path / "block.h5", "w") as f:
+        copyToHdf5(block, f, "masked")
+        copyToHdf5(block["data"], f, "plain")
+
+        numpy.testing.assert_array_equal(f["plain"][()], data)
+        numpy.testing.assert_array_equal(f["masked/data"][()], data)
+        assert f["masked/fill_value"][()] == 42
+
+        imported = CompressedBlock()
+        imported.copy(f["plain"], "data")
+        numpy.testing.assert_array_equal(imported["data"][()], data)
+
+    del block["data"]
+    assert "data" not in block
+    block.close()
+    assert len(block) == 0
@@ -0,0 +1,51 @@
+import numpy
+import pytest
+
+from lazyflow.utility.quantizedArray import QuantizedArray
+
+
+@pytest.fixture
+def data():
+    # channel 1 has a much larger range than channel 0, channel 2 is constant
+    rng = numpy.random.default_rng(0)
+    data = rng.random((4, 3, 10, 12), dtype=numpy.float32)
+    data[:, 1] *= 1000
+    data[:, 2] = -3.5
+    return data
+
+
+@pytest.mark.parametrize("precision,levels", [("uint8", 255), ("uint16", 65535)])
+def test_quantization_error_per_channel(data, precision, levels):
+    quantized = QuantizedArray(data, precision, channel_axis=1)
+    assert quantized.dtype == numpy.dtype(precision)
+    assert quantized.nbytes < data.nbytes
+
+    restored = quantized[:]
+    assert restored.dtype == numpy.float32
+    assert restored.shape == data.shape
+    for c in range(data.shape[1]):
+        value_range = data[:, c].max() - data[:, c].min()
+        max_error = numpy.abs(restored[:, c] - data[:, c]).max()
+        assert max_error <= value_range / levels / 2 * 1.01 + 1e-6
+    assert (restored[:, 2] == -3.5).all()
+
+
+@pytest.mark.parametrize("precision", ["float16", "uint8"])
+def test_indexing_matches_full_array(data, precision):
+    quantized = QuantizedArray(data, precision, channel_axis=1)
+    restored = quantized[:]
+    for key in [(slice(1, 3), slice(1, 3), slice(2, 5)), (2, slice(None), 3), (slice(None), 1), 0]:
+        numpy.testing.assert_array_equal(quantized[key], restored[key])
+
+
+def test_can_store():
+    floats = numpy.ones((3, 3), dtype=numpy.float32)
+    assert QuantizedArray.canStore(floats, "uint8")
+    assert QuantizedArray.canStore(floats, "float16")
+    assert not QuantizedArray.canStore(floats, "full")
+    assert not QuantizedArray.canStore(floats.astype(numpy.uint8), "uint8")
+    assert not QuantizedArray.canStore(floats.astype(numpy.float16), "uint8")
+
+    floats[0, 0] = numpy.nan
+    assert not QuantizedArray.canStore(floats, "uint8")
+    assert QuantizedArray.canStore(floats, "float16")
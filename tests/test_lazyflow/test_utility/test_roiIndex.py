@@ -0,0 +1,104 @@
+import itertools
+import random
+
+import pytest
+
+from lazyflow.roi import containing_rois, getIntersection
+from lazyflow.utility.roiIndex import RoiIndex
+
+
+def _grid_rois(shape, block_shape):
+    rois = []
+    for start in itertools.product(*(range(0, s, b) for s, b in zip(shape, block_shape))):
+        stop = tuple(min(a + b, s) for a, b, s in zip(start, block_shape, shape))
+        rois.append((tuple(start), stop))
+    return rois
+
+
+def _random_roi(shape, rng):
+    start = tuple(rng.randrange(0, s) for s in shape)
+    stop = tuple(rng.randrange(a + 1, s + 1) for a, s in zip(start, shape))
+    return start, stop
+
+
+def test_empty_index():
+    index = RoiIndex()
+    assert len(index) == 0
+    assert index.containing(((0, 0), (1, 1))) == []
+    assert index.intersecting(((0, 0), (1, 1))) == []
+
+
+@pytest.mark.parametrize("max_cells", [64, 0])
+def test_queries_match_linear_scan(max_cells, monkeypatch):
+    monkeypatch.setattr(RoiIndex, "max_cells_per_roi", max_cells)
+    rng = random.Random(0)
+    shape = (50, 60, 3)
+    rois = _grid_rois(shape, (10, 10, 3)) + [_random_roi(shape, rng) for _ in range(20)]
+    index = RoiIndex()
+    for roi in rois:
+        index.add(roi)
+    assert len(index) == len(set(rois))
+
+    for _ in range(200):
+        query = _random_roi(shape, rng)
+        expected = {
+            (tuple(map(int, start)), tuple(map(int, stop))) for start, stop in containing_rois(rois, query)
+        }
+        assert set(index.containing(query)) == expected
+
+        expected = {roi for roi in rois if getIntersection(roi, query, assertIntersect=False) is not None}
+        assert set(index.intersecting(query)) == expected
+
+
+def test_remove_and_clear():
+    index = RoiIndex()
+    rois = _grid_rois((20, 20), (10, 10)) + [((0, 0), (20, 20))]
+    for roi in rois:
+        index.add(roi)
+    # adding twice has no effect
+    index.add(rois[0])
+    assert len(index) == 5
+
+    index.remove(((0, 0), (20, 20)))
+    index.remove(((0, 0), (3, 3)))  # unknown rois are ignored
+    assert index.containing(((2, 2), (5, 5))) == [((0, 0), (10, 10))]
+    assert index.containing(((5, 5), (15, 15))) == []
+
+    index.remove(((0, 0), (10, 10)))
+    assert ((0, 0), (10, 10)) not in index
+    assert index.containing(((2, 2), (5, 5))) == []
+    assert len(index) == 3
+
+    index.clear()
+    assert len(index) == 0
+    assert index.containing(((12, 2), (15, 5))) == []
+    assert index.intersecting(((0, 0), (20, 20))) == []
+
+
+def test_large_rois_are_found():
+    index = RoiIndex()
+    index.add(((0, 0), (2, 2)))
+    huge = ((0, 0), (1000, 1000))
+    index.add(huge)
+    assert index.containing(((500, 500), (600, 600))) == [huge]
+    assert set(index.intersecting(((1, 1), (3, 3)))) == {((0, 0), (2, 2)), huge}
+
+
+def test_cell_shape_follows_roi_shapes():
+    index = RoiIndex()
+    # the first roi determines the initial cell shape
+    index.add(((0, 0), (1, 1)))
+    rois = _grid_rois((200, 200), (10, 10))
+    for roi in rois:
+        index.add(roi)
+
+    cell_shape, cells = index._grid
+    assert cell_shape == (10, 10)
+    assert not cells.get(None)
+    assert set(index.containing(((0, 0), (1, 1)))) == {((0, 0), (1, 1)), ((0, 0), (10, 10))}
+    assert index.containing(((12, 12), (15, 15))) == [((10, 10), (20, 20))]
+
+    for roi in rois:
+        index.remove(roi)
+    assert index.containing(((0, 0), (1, 1))) == [((0, 0), (1, 1))]
+    assert index.intersecting(((0, 0), (200, 200))) == [((0, 0), (1, 1))]